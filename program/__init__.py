@@ -12,3 +12,24 @@
 #from .progress import *
 #from .fixFTDNAbam import *
 #from .fixFTDNAvcf import *
+#from .bincoverage import *
+#from .depthhist import *
+#from .statsbundle import *
+#from .bodysample import *
+#from .statscache import *
+#from .jobqueue import *
+#from .pipeline import *
+#from .fastqshard import *
+#from .nrunscan import *
+#from .kitshards import *
+#from .liftover import *
+#from .refcatalog import *
+#from .refident import *
+#from .refdownload import *
+#from .vcf_parser import *
+#from .vcfkit import *
+#from .fastqstats import *
+#from .jobprogress import *
+#from .runhistory import *
+#from .resourceplan import *
+#from .bgzf import *
@@ -1,6 +1,6 @@
 # coding: utf8
 # Copyright (C) 2018-2020 City Farmer
-# Copyright (C) 2020-2023 Randy Harr
+# Copyright (C) 2020-2024 Randy Harr
 #
 # License: GNU General Public License v3 or later
 # A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
@@ -8,134 +8,70 @@
 import sys
 import os.path
 import platform
+import json
+import zipfile
+
+import numpy as np
 
 """"###################################################################################################################
     Module aconv (autosomal microarray file converter / creator)
 
     Currently setup as a standalone called module not relying on wgse system.
-    Assumes have already called microarray to create CombinedKit file of all possible SNPs
-    This module is then called for each individual file format you wish to create from the CombinedKit TSV table file
-    Todo need to inline this code with microarry.py module; can use WGSE Settings module then
+    Assumes have already called microarray to create CombinedKit file of all possible SNPs.  Then creates every
+    requested file format from it in one run: the CombinedKit called genotypes are read once into a position sorted
+    array keyed by (chromosome code, position); each template body (or part of one) is then read once and looked up
+    in that array with np.searchsorted.  Each result is written straight into its ZIP file (zipfile); no uncompressed
+    copy and no zip command.  Previously this module was run once per format and re-read the whole CombinedKit into a
+    dict for each template part (5 for Ancestry_V2).
+    The template lines are not parsed each run either.  Each template body is compiled once into a binary index
+    (raw_file_templates/index/; chromosome codes, positions and the offsets of each line in the body) that is memory
+    mapped and joined to the CombinedKit as arrays.  It is recompiled when the template changes.
+    Output lines are the template line with the called genotype (or no-call) added as a last, tab separated column.
 """
 
-# Globals used in this module; leftover from original implementation Todo should remove need for globals here
-target_file_without_suffix_all = None
-target_file_without_suffix = None
-target_type_suffix = None
-target_type_name_all = None
-target_type_name = None
-f_source_file_called = None     # type:
-source_file_called = None
-f_targetfile = None
-num_target_files = None
-last_called_line_read = None
-called_chrom = None
-called_pos = None
-called_result = None
-templ_chrom = None
-templ_pos = None
-templ_id = None
-templates_oFP = None
-
-
-def get_template_elements(template_line):
-    global target_type_name_all
-    global templ_chrom, templ_pos, templ_id
-    template_line = template_line.replace('"', '')      # Remove double quotes; do not have WGSE utilities function here
-    
-    if target_type_name_all in ["FTDNA_V1_Affy", "FTDNA_V2",  "FTDNA_V3",  "MyHeritage_V1", "MyHeritage_V2"]:
-        line_elements = template_line.split(",")
-        templ_chrom = line_elements[1]
-        templ_pos = int(line_elements[2])
-        templ_id = line_elements[0]
-    elif target_type_name_all == "23andMe_SNPs_API":
-        line_elements = template_line.split("\t")
-        templ_chrom = line_elements[0]
-        templ_chrom = templ_chrom.replace("chr", "")
-        templ_pos = int(line_elements[1])
-        templ_id = line_elements[2].strip()   
-    elif target_type_name_all in ["LDNA_V1",  "LDNA_V2"] or \
-            "Ancestry" in target_type_name_all or "23andMe" in target_type_name_all:
-        line_elements = template_line.split("\t")
-        templ_chrom = line_elements[1]
-        templ_pos = int(line_elements[2])
-        templ_id = line_elements[0]
-
-
-def chrconv(chrom_to_convert):
-    global target_type_name_all
-    if target_type_name_all in ["Ancestry_V1", "Ancestry_V2"]:
-        if chrom_to_convert not in ["MT", "M", "X", "XY", "Y"]:
-            chrom_to_convert = int(chrom_to_convert)
-        if chrom_to_convert == 23 or chrom_to_convert == 25:
-            chrom_to_convert = "X"
-        elif chrom_to_convert == 24:
-            chrom_to_convert = "Y"
-        elif chrom_to_convert == 26:
-            chrom_to_convert = "MT"
-
-    if chrom_to_convert in ["MT", "M"]:
-        return 23
-    elif chrom_to_convert in ["X", "XY"]:
-        return 24
-    elif chrom_to_convert in ["Y"]:
-        return 25
-    else:
-        return int(chrom_to_convert)
+parts_per_kit = {"23andMe_V4": 2, "23andMe_V5": 2, "Ancestry_V1": 4, "Ancestry_V2": 5, "FTDNA_V3": 3}
+csv_kits = ["FTDNA_V1_Affy", "FTDNA_V2",  "FTDNA_V3",  "MyHeritage_V1", "MyHeritage_V2"]
 
 
-def pos1_smaller_than_pos2(chr1, pos1, chr2, pos2):
-    if chrconv(chr1) < chrconv(chr2):
-        return True
-    elif chrconv(chr1) > chrconv(chr2):
-        return False
-    elif chrconv(chr1) == chrconv(chr2):
-        return pos1 < pos2
+def get_target_type_suffix(target_type_name_all):
+    """ File suffix of a format (kit); None if not one we can create """
+    if target_type_name_all in csv_kits:
+        return ".csv"
+    elif target_type_name_all in ["LDNA_V1", "LDNA_V2"] \
+            or "23andMe" in target_type_name_all or "Ancestry" in target_type_name_all:
+        return ".txt"
+    return None
 
 
-def pos1_equal_to_pos2(chr1, pos1, chr2, pos2):
-    if chrconv(chr1) != chrconv(chr2):
-        return False
-    else:
-        return pos1 == pos2
-
-
-def pos1_bigger_than_pos2(chr1, pos1, chr2, pos2):
-    if chrconv(chr1) > chrconv(chr2):
-        return True
-    elif chrconv(chr1) < chrconv(chr2):
-        return False
-    elif chrconv(chr1) == chrconv(chr2):
-        return pos1 > pos2
-
-
-def get_next_called_vars():
-    global f_source_file_called, called_chrom, called_pos, called_result, last_called_line_read
-
-    called_line = ""
-    for called_line in f_source_file_called:
-        if '#' in called_line:
-            continue                # Skip comment lines
-        # print (called_line)
-        break
-    if called_line:
-        line_columns = called_line.split("\t")
-        called_chrom = line_columns[1]
-        called_pos = int(line_columns[2])
-        called_result = line_columns[3].strip()
-    else:
-        last_called_line_read = True
+def no_call(target_type_name_all):
+    return "00" if "Ancestry" in target_type_name_all else "--"
+
 
+def get_template_elements(target_type_name_all, template_line):
+    """ (id, chrom, pos) of a template body line (bytes) """
+    template_line = template_line.replace(b'"', b'')      # Remove double quotes
 
-def write_line_output_file(output_result):
-    global f_targetfile, target_type_name_all
-    global templ_chrom, templ_pos, templ_id
+    if target_type_name_all in csv_kits:
+        line_elements = template_line.split(b",")
+        return line_elements[0], line_elements[1], int(line_elements[2])
+    elif target_type_name_all == "23andMe_SNPs_API":
+        line_elements = template_line.split(b"\t")
+        return line_elements[2].strip(), line_elements[0].replace(b"chr", b""), int(line_elements[1])
+    elif target_type_name_all in ["LDNA_V1",  "LDNA_V2"] or \
+            "Ancestry" in target_type_name_all or "23andMe" in target_type_name_all:
+        line_elements = template_line.split(b"\t")
+        return line_elements[0], line_elements[1], int(line_elements[2])
+    return None, None, None
 
+
+def format_line(target_type_name_all, templ_id, templ_chrom, templ_pos, output_result):
+    """ Output line composed from the template elements (only used for template lines without a position) """
+    prefix = ""
     if target_type_name_all in ["FTDNA_V1_Affy", "MyHeritage_V2"]:
         output_line = f'"{templ_id}","{templ_chrom!s}","{templ_pos!s}","{output_result}"'       # quote, comma-sep
     elif target_type_name_all == "FTDNA_V2":
         if templ_id == "rs5939319":
-            f_targetfile.write("RSID,CHROMOSOME,POSITION,RESULT\n".encode())
+            prefix = "RSID,CHROMOSOME,POSITION,RESULT\n"
         output_line = f'"{templ_id}","{templ_chrom!s}","{templ_pos!s}","{output_result}"'       # quote, comma-sep
     elif target_type_name_all == "FTDNA_V3":
         output_line = f'{templ_id},{templ_chrom!s},{templ_pos!s},{output_result}'               # comma-sep
@@ -148,7 +84,7 @@ def write_line_output_file(output_result):
         if output_result == "CT":
             output_result = "TC"
         elif output_result == "GT":
-            output_result = "TG"          
+            output_result = "TG"
         output_line = f'"{templ_id}","{templ_chrom!s}","{templ_pos!s}","{output_result}"'       # quote, comma-sep
     elif "Ancestry" in target_type_name_all:
         if output_result == "--":
@@ -157,117 +93,170 @@ def write_line_output_file(output_result):
             output_result = "TC"
         if output_result == "GT":
             output_result = "TG"
-        # if output_result == '.':
-        #    output_result = "00"
         output_line = f'{templ_id}\t{templ_chrom!s}\t{templ_pos!s}\t{output_result[0]}\t{output_result[1]}'  # tab-sep
     else:
         output_line = ''
-    f_targetfile.write(f'{output_line}\n'.encode())
-
-
-def get_target_type_suffix():
-    """ Get the file suffix type for the GLOBAL parameter target_type_name_all. """
-    global target_type_name_all
-    if target_type_name_all in ["FTDNA_V1_Affy", "FTDNA_V2", "FTDNA_V3", "MyHeritage_V1", "MyHeritage_V2"]:
-        return ".csv"
-    elif target_type_name_all in ["LDNA_V1", "LDNA_V2"] \
-            or "23andMe" in target_type_name_all or "Ancestry" in target_type_name_all:
-        return ".txt"
-
-
-def concat_files():
-    """ Create target file by concatinating the header and one or more tail files. Using global paramters. """
-    global target_type_name_all, target_file_without_suffix_all, target_type_suffix, num_target_files
-
-    # Read header
-    template_head_oFN = f'{templates_oFP}head/{base2}{target_type_suffix}'
-    with open(template_head_oFN, "r") as f_template_head:
-        head = f_template_head.read()
-
-    # Write output; starting with header
-    targetfile_oFN = f'{target_file_without_suffix_all}_{target_type_name_all}{target_type_suffix}'
-    with open(targetfile_oFN, "wb") as f_targetfile:
-        f_targetfile.write(head.encode())
-
-        # For each target file, open to read, concat into targetfile
-        for i in range(num_target_files):
-            i_str = str(i+1)
-            target_type_name = f'{target_type_name_all}_{i_str}'
-            target_file_without_suffix = f'{target_file_without_suffix_all}_{i_str}'
-            partfilename_oFN = f'{target_file_without_suffix}_{target_type_name}{target_type_suffix}'
-            with open(partfilename_oFN, "r") as f_part:
-                part = f_part.read()
-            os.remove(partfilename_oFN)
-            f_targetfile.write(part.encode())
-
-
-# Heavily relies on global values passed in and out instead of parameters
-def convert_adna():
-    global f_source_file_called, f_targetfile
-    global called_chrom, called_pos, called_result, last_called_line_read
-    global templ_chrom, templ_pos, templ_id
-    global source_file_called, templates_oFP, num_target_files
-    global target_file_without_suffix, target_type_name, target_type_suffix
-    global target_type_name_all
-
-    # Parameters are all in globals; reset before each call
-    # 4 simultaneous open files; so not using with-as to avoid hideous indentation
-    targetfile_oFN = f'{target_file_without_suffix}_{target_type_name}{target_type_suffix}'
-    f_targetfile = open(targetfile_oFN, "wb")
-
-    # Write header if this is the first/only target file
-    if num_target_files == 1:
-        template_head_oFN = f'{templates_oFP}head/{target_type_name}{target_type_suffix}'
-        with open(template_head_oFN, "r") as f_template_head:
-            head = f_template_head.read()
-        f_targetfile.write(head.encode())
-
-    # Initialize for reading called variants
-    f_source_file_called = open(source_file_called, "r")
-    last_called_line_read = False
-    get_next_called_vars()
-
-    # Create a dictionary to store ALL variants from WGS
-    called_variants = {}
-    
-    # Read all variants into memory
-    while not last_called_line_read:
-        if called_chrom not in called_variants:
-            called_variants[called_chrom] = {}
-        called_variants[called_chrom][called_pos] = called_result
-        get_next_called_vars()
-
-    # Process template file
-    template_body_oFN = f'{templates_oFP}body/{target_type_name}{target_type_suffix}'
-    with open(template_body_oFN, "r") as f_template_body:
-        for template_line in f_template_body:
-            # Get template position
-            get_template_elements(template_line)    # Side effect: sets global templ_chrom, templ_pos, templ_id
-            
-            # Skip invalid template entries
-            if templ_chrom == 0 or templ_pos == 0:
-                write_line_output_file("00" if "Ancestry" in target_type_name_all else "--")
-                continue
-
-            # Look up the variant in our dictionary
-            chrom_variants = called_variants.get(templ_chrom, {})
-            result = chrom_variants.get(templ_pos)
-            
-            if result is not None:
-                # Write the original template line plus the result
-                template_no_newline = template_line.rstrip('\n\r')
-                output = f"{template_no_newline}\t{result}\n"
-                f_targetfile.write(output.encode())
-            else:
-                # Write the original template line plus default value
-                template_no_newline = template_line.rstrip('\n\r')
-                default_value = "00" if "Ancestry" in target_type_name_all else "--"
-                output = f"{template_no_newline}\t{default_value}\n"
-                f_targetfile.write(output.encode())
-
-    # Close files
-    f_source_file_called.close()
-    f_targetfile.close()
+    return f'{prefix}{output_line}\n'.encode()
+
+
+class CalledGenotypes:
+    """
+    The CombinedKit (ID, CHROM, POS, genotype; tab separated) as sorted int64 keys of chromosome code (upper 32 bits)
+    and position; with the genotypes in the same order.  Chromosome codes are simply numbered in order of appearance;
+    so a template chromosome name matches only when it is the same string (as with the dict this replaced).
+    """
+
+    def __init__(self, combinedkit_oFN):
+        self.codes = {}
+        with open(combinedkit_oFN, "rb") as f:
+            rows = [line.split(b"\t") for line in f.read().splitlines() if line and b"#" not in line]
+        chroms = np.array([self.codes.setdefault(row[1], len(self.codes)) for row in rows], dtype=np.int64)
+        positions = np.array([int(row[2]) for row in rows], dtype=np.int64)
+        genotypes = np.array([row[3].strip() for row in rows], dtype=object)
+
+        keys = (chroms << 32) | positions
+        order = np.argsort(keys, kind="stable")
+        keys = keys[order]
+        last = np.append(keys[1:] != keys[:-1], True)    # Of repeated positions, the last one read wins
+        self.keys = keys[last]
+        self.genotypes = genotypes[order][last]
+
+    def key(self, chrom, pos):
+        return (self.codes.get(chrom, -1) << 32) | pos
+
+    def lookup(self, keys, default):
+        """ Genotypes of the keys (an int64 array); default where not called """
+        if not len(self.keys):
+            return np.full(len(keys), default, dtype=object)
+        index = np.minimum(np.searchsorted(self.keys, keys), len(self.keys) - 1)
+        return np.where(self.keys[index] == keys, self.genotypes[index], default)
+
+
+index_dtype = np.dtype([("chrom", np.uint16), ("pos", np.int64), ("start", np.int64), ("end", np.int64)])
+index_version = 1
+
+
+def compile_template(target_type_name_all, template_body):
+    """
+    Template body (bytes) to its index: an array of (chromosome code, position, start and end offset of the line in
+    the body) per line, and the chromosome names (bytes) the codes are indices of.  None if not a format we parse.
+    """
+    if not get_target_type_suffix(target_type_name_all):
+        return None
+    chroms = {}
+    index = np.empty(len(template_body.splitlines()), dtype=index_dtype)
+    start = 0
+    for row, line in enumerate(template_body.splitlines(keepends=True)):
+        content = line.rstrip(b"\r\n")
+        _, chrom, pos = get_template_elements(target_type_name_all, content)
+        index[row] = (chroms.setdefault(chrom, len(chroms)), pos, start, start + len(content))
+        start += len(line)
+    return index, list(chroms)
+
+
+def template_index(target_type_name_all, body_oFN):
+    """
+    The compiled index of a template body file; cached in index/ next to body/ as a .npy (memory mapped here) and a
+    .json with the chromosome names and the size and time of the template it was made from.  Recompiled when the
+    template changes.  If the cache cannot be written, the index is simply used from memory.
+    """
+    index_oFP = os.path.join(os.path.dirname(os.path.dirname(body_oFN)), "index")
+    index_oFPB = os.path.join(index_oFP, os.path.basename(body_oFN))
+    stats = os.stat(body_oFN)
+    source = {"version": index_version, "format": target_type_name_all, "size": stats.st_size,
+              "mtime": stats.st_mtime_ns}
+    try:
+        with open(f'{index_oFPB}.json', "r") as f:
+            description = json.load(f)
+        if all(description.get(key) == value for key, value in source.items()):
+            index = np.load(f'{index_oFPB}.npy', mmap_mode="r")
+            if index.dtype == index_dtype:
+                return index, [chrom.encode("latin-1") for chrom in description["chroms"]]
+    except (OSError, ValueError, KeyError):
+        pass
+
+    with open(body_oFN, "rb") as f:
+        compiled = compile_template(target_type_name_all, f.read())
+    if compiled:
+        try:
+            os.makedirs(index_oFP, exist_ok=True)
+            np.save(f'{index_oFPB}.npy', compiled[0])
+            with open(f'{index_oFPB}.json', "w") as f:      # Written last; so only describes a complete .npy
+                json.dump(dict(source, chroms=[chrom.decode("latin-1") for chrom in compiled[1]]), f)
+        except OSError:
+            pass
+    return compiled
+
+
+def convert_indexed(target_type_name_all, template_body, index, chroms, called):
+    """ Output (bytes) for one template body (bytes) with its index against the CombinedKit genotypes """
+    codes = np.array([called.codes.get(chrom, -1) for chrom in chroms] or [-1], dtype=np.int64)
+    keys = (codes[index["chrom"]] << 32) | index["pos"]
+    default = no_call(target_type_name_all).encode()
+    results = called.lookup(keys, default)
+
+    # Interleave the template lines with their added column; so one join (no per line concatenation)
+    output = [None] * (2 * len(index))
+    output[0::2] = template_body.splitlines()
+    output[1::2] = (b"\t" + results + b"\n").tolist()
+    for row in np.flatnonzero(index["pos"] == 0):      # Invalid template entry
+        templ_id, templ_chrom, templ_pos = get_template_elements(
+            target_type_name_all, template_body[index["start"][row]:index["end"][row]])
+        output[2 * row] = format_line(target_type_name_all, templ_id.decode(), templ_chrom.decode(), templ_pos,
+                                      default.decode())
+        output[2 * row + 1] = b""
+    return b"".join(output)
+
+
+def convert_body(target_type_name_all, template_body, called):
+    """ Output (bytes) for one template body (bytes) against the CombinedKit genotypes; all no-call if unknown """
+    compiled = compile_template(target_type_name_all, template_body)
+    if not compiled:
+        default = no_call(target_type_name_all).encode()
+        return b"".join(line + b"\t" + default + b"\n" for line in template_body.splitlines())
+    return convert_indexed(target_type_name_all, template_body, *compiled, called)
+
+
+def generate_kits(kits, combinedkit_oFN, target_oFPB, templates_oFP):
+    """
+    Create {target_oFPB}_{kit}.zip (holding {target_FB}_{kit}{suffix}) for each of the kits from the CombinedKit;
+    the templates are in templates_oFP (head/ and body/).  Returns the list of ZIP files written.
+    """
+    called = CalledGenotypes(combinedkit_oFN)
+    target_FB = os.path.basename(target_oFPB)
+    created = []
+    for kit in kits:
+        suffix = get_target_type_suffix(kit)
+        if not suffix:
+            print(f'***ERROR: No template for microarray format {kit}; skipped.', file=sys.stderr, flush=True)
+            continue
+        print(f'Generating microarray file for format {kit}', flush=True)
+
+        with open(f'{templates_oFP}head/{kit}{suffix}', "rb") as f:
+            content = [f.read().replace(b"\r\n", b"\n").replace(b"\r", b"\n")]     # As read in text mode
+        parts = parts_per_kit.get(kit, 1)
+        for part in [f'{kit}_{index}' for index in range(1, parts + 1)] if parts > 1 else [kit]:
+            body_oFN = f'{templates_oFP}body/{part}{suffix}'
+            index, chroms = template_index(kit, body_oFN)
+            with open(body_oFN, "rb") as f:
+                content.append(convert_indexed(kit, f.read(), index, chroms, called))
+
+        zip_oFN = f'{target_oFPB}_{kit}.zip'
+        with zipfile.ZipFile(zip_oFN, "w", compression=zipfile.ZIP_DEFLATED) as zipf:
+            zipf.writestr(f'{target_FB}_{kit}{suffix}', b"".join(content))
+        created.append(zip_oFN)
+    return created
+
+
+def compile_templates(templates_oFP):
+    """ (Re)compile the index of every template body we can parse (normally done on first use); returns the count """
+    compiled = 0
+    for body_FBS in sorted(os.listdir(f'{templates_oFP}body')):
+        name, suffix = os.path.splitext(body_FBS)
+        kit = name.rsplit("_", 1)[0] if name.rsplit("_", 1)[0] in parts_per_kit else name
+        if get_target_type_suffix(kit) == suffix and template_index(kit, f'{templates_oFP}body/{body_FBS}'):
+            compiled += 1
+    return compiled
 
 
 #####################################################################################################################
@@ -276,15 +265,15 @@ def convert_adna():
 
 if __name__ == '__main__':
 
-    if len(sys.argv) != 5:
-        print(f'usage: aconv vendor_version source target microarray_reference_dir')
+    if not (len(sys.argv) == 5 or (len(sys.argv) == 3 and sys.argv[1] == "compile")):
+        print(f'usage: aconv vendor_version[,vendor_version...] source target microarray_reference_dir')
+        print(f'   creates target_vendor_version.zip for each')
+        print(f'       aconv compile microarray_reference_dir')
+        print(f'   (re)creates the template indices in raw_file_templates/index/')
         exit()
 
     # Simple command line argument capture; only an internal script. File paths are quoted in shell and so still here
-    target_type_name_all = sys.argv[1]
-    source_file_called = sys.argv[2].strip('"')
-    target_file_without_suffix_all = sys.argv[3].strip('"')
-    cma_FP = sys.argv[4].strip('"')     # Had to pass in non-OS version on Windows else backslashes would be removed
+    cma_FP = sys.argv[-1].strip('"')    # Had to pass in non-OS version on Windows else backslashes would be removed
 
     # Designed as stand-alone program and called as such.  No tie in to wgse directly. So must recreate some values.
 
@@ -302,29 +291,7 @@ if __name__ == '__main__':
     else:
         templates_oFP = templates_FP
 
-    target_type_suffix = get_target_type_suffix()
-
-    if target_type_name_all in ["23andMe_V4", "23andMe_V5"]:
-        num_target_files = 2
-    elif target_type_name_all == "Ancestry_V1":
-        num_target_files = 4
-    elif target_type_name_all == "Ancestry_V2":
-        num_target_files = 5
-    elif target_type_name_all == "FTDNA_V3":
-        num_target_files = 3
-    else:
-        num_target_files = 1
-
-    if num_target_files == 1:
-        target_file_without_suffix = target_file_without_suffix_all
-        target_type_name = target_type_name_all
-        convert_adna()
+    if len(sys.argv) == 3:
+        print(f'Compiled {compile_templates(templates_oFP)} template indices')
     else:
-        base1 = target_file_without_suffix_all
-        base2 = target_type_name_all
-        for i in range(num_target_files):
-            i_str = str(i + 1)
-            target_file_without_suffix = f'{base1}_{i_str}'
-            target_type_name = f'{base2}_{i_str}'
-            convert_adna()
-        concat_files()
+        generate_kits(sys.argv[1].split(","), sys.argv[2].strip('"'), sys.argv[3].strip('"'), templates_oFP)
@@ -18,7 +18,12 @@ from math import sqrt       # for process_bam_body
 
 from utilities import DEBUG, is_legal_path, nativeOS, universalOS, unquote, Error, Warning, wgse_message, check_exists
 from commandprocessor import run_bash_script
+from jobqueue import DONE
 from fastqfiles import determine_sequencer
+from fastqstats import read_sidecar
+from bincoverage import header_sequences, depth_command, parallel_depth_commands, merge_bincvg_parts
+from statscache import StatsCache, bam_fingerprint
+from refident import header_records, identify_reference, reference_index
 import settings as wgse
 
 
@@ -77,6 +82,7 @@ class BAMFile:
 
         self.Header    = ""      # Will save complete BAM Header in text form (samtools view -H)
         self.file_stats = None   # File Stat result (for file size and other items)
+        self.fingerprint = None  # Content fingerprint (size plus hash of head and tail) keying the stats cache
         self.relfsize  = None    # Relative file size (to 45 GB) (to scale time values)
 
         self.Refgenome = None    # {hg,GRCh}{19/37,38}, hs37d5, hs38DH (not all combinations valid)
@@ -166,8 +172,11 @@ class BAMFile:
 
         # Do a bunch of quick things, custom here, that lets us characterize the BAM a bit. May pop-out witha Raise ...
         wgse.BAM = self                 # May need within the below calls, so setup global setting now
-        self.process_bam_header()       # Quick but may have error exceptions
-        self.process_bam_body()         # Little longer (10 seconds max) but key ones like read length, etc.
+        self.fingerprint = bam_fingerprint(self.file_oFN)
+        if not self.restore_cached_stats():     # A file seen before has all its derived values in the stats cache
+            self.process_bam_header()       # Quick but may have error exceptions
+            self.process_bam_body()         # Little longer (10 seconds max) but key ones like read length, etc.
+            self.save_cached_stats()
 
         # We have three stats commands we can run. We try the get_samtools_idxstats call as it enables the rest of
         # the GUI buttons (change_status_of_actiona_buttons). But it will only actually run the stats command if
@@ -215,7 +224,7 @@ class BAMFile:
 
         self.determine_reference_genome()       # Only need header to determine reference_genome or if unaligned BAM
 
-    def process_bam_body(self, reentrant=None):
+    def process_bam_body(self, reentrant=None, sampled=False):
         """
         Processes the BAM body.  Operate on first 100K sequence entries (2 million if Nanopore).
         Called internally from the "Show Stats" button as well.
@@ -234,7 +243,14 @@ class BAMFile:
         But found it too buggy for the variety of BAMs we see (Nebula, FTDNA BigY, Nanopore from minimap2, etc).
         So went back to all hand-grown code but in python here. As do not have idxstats and a total read count.
         cannot subsample with something like samtools view -s because we do not know what fraction to ask for.
+
+        If sampled, the sample files were already written by the one pass stats bundle (get_stats_bundle); so no
+        samtools run here.  The second, long read sample is then in its own file.
         """
+        # With an index, sample evenly spaced regions across the whole genome instead of the start of the file
+        if reentrant is None and not sampled and self.process_bam_body_regions():
+            return
+
         # This routine is re-entrant. We need to save intermediate calculations to continue to build upon.
         # Instead of class global, we overload the parameter to either be None by default or a list of
         # saved, intermediate values that are passed in. Ugly?
@@ -253,7 +269,8 @@ class BAMFile:
         head = wgse.headx_qFN
         tail = wgse.tailx_qFN
         bamfile = self.file_qFN
-        flagfile_qFN = f'"{wgse.tempf.FP}flags.tmp"'        # To hold BAM samples from body
+        flagfile_qFN = f'"{wgse.tempf.FP}flags.tmp"' if first_time or not sampled else \
+                       f'"{wgse.tempf.FP}flagslong.tmp"'  # To hold BAM samples from body
 
         if self.file_type == "CRAM":
             if self.Refgenome and wgse.reflib.missing_refgenome(self.Refgenome_qFN):
@@ -270,7 +287,9 @@ class BAMFile:
         lonsamp = numsamp * 29      # Nanopore long read BAMs need more samples; have more variance
         nstep = numsamp // 10
         lstep = lonsamp // 10
-        if first_time:
+        if sampled:
+            pass        # Stats bundle already saved both samples in one pass
+        elif first_time:
             commands = f'{samtools} view {cram_opt} {bamfile} | {head} -{numsamp} > {flagfile_qFN} \n'
             run_bash_script('ButtonBAMStats2', commands)  # not running stats again; so simply do it
         else:
@@ -356,7 +375,7 @@ class BAMFile:
         if first_time and lenmean > 410 and "Nanopore" in self.Sequencer:    # Increased len check for ySeq 400 bp single-end read
             #  Although often less total reads when longer read length, need at least 2 million it seems
             DEBUG("Long Read BAM ... reprocessing to get the read length using more read samples")
-            self.process_bam_body(reentrant=[readtyp, lencnt, lenmean, lenM2, sizcnt, sizmean, sizM2])
+            self.process_bam_body(reentrant=[readtyp, lencnt, lenmean, lenM2, sizcnt, sizmean, sizM2], sampled=sampled)
             return      # Rest of settings will be done in second run only
 
         # Calculate final standard deviation (sqrt of final variance) for read length and insert size
@@ -374,6 +393,112 @@ class BAMFile:
             self.insert_size = sizmean
             self.insert_stddev = sizstd
 
+    def process_bam_body_regions(self):
+        """
+        Index based (random access) body sampling.  Instead of the first reads of the file (mostly chromosome 1),
+        take a fixed size batch of reads from each of many small regions spread evenly (by mapped reads per idxstats,
+        else by length) across the primary sequences.  Each round samples new, interleaved regions (all read by one
+        samtools view of a BED file); we stop as soon as the read length and insert size mean and standard deviation
+        converge.  Long read files simply take more rounds.  The batches are parsed as columns (bodysample module).
+        Sets the same values and raises the same errors as process_bam_body().  Returns False (nothing set) when the
+        file cannot be sampled this way.
+        """
+        if not (self.Indexed and self.Sorted and self.Aligned and "@SQ\tSN:" in self.Header):
+            return False
+        if self.file_type == "CRAM" and (not self.Refgenome or wgse.reflib.missing_refgenome(self.Refgenome_qFN)):
+            return False    # Let process_bam_body() report the error
+
+        import numpy as np
+        from bodysample import plan_sample_regions, parse_sam_columns, Welford
+
+        samtools = wgse.samtoolsx_qFN
+        bamfile = self.file_qFN
+        cram_opt = f'-T {self.Refgenome_qFN}' if self.file_type == "CRAM" else ""
+        flagfile_qFN = f'"{wgse.tempf.FP}flags.tmp"'
+        flagfile_oFN = nativeOS(unquote(flagfile_qFN))
+        regionfile_qFN = f'"{wgse.tempf.FP}regions.bed"'
+        regionfile_oFN = nativeOS(unquote(regionfile_qFN))
+
+        regions = 100               # Regions per round
+        batch = 200                 # Reads per region; so same 20,000 reads per round as the first process_bam_body run
+        window = 20000              # Region size in bp
+        max_rounds = 30             # Same 600,000 read cap as process_bam_body for long read files
+        tolerance = 0.005           # Relative change in mean and stddev between rounds considered converged
+
+        # Weight the primary sequences by mapped reads (index only idxstats is quick on a BAM), else by length
+        weights = {sname: length for sname, length in header_sequences(self.Header)}
+        if self.file_type == "BAM":
+            idxsamp_qFN = f'"{wgse.tempf.FP}idxsample.tmp"'
+            run_bash_script("ButtonBAMStats", f'{samtools} idxstats {bamfile} > {idxsamp_qFN} \n')
+            try:
+                with open(nativeOS(unquote(idxsamp_qFN)), "r") as idx_file:
+                    weights = {cols[0]: int(cols[2]) for cols in (line.split("\t") for line in idx_file)
+                               if len(cols) > 3 and cols[0] in weights}
+            except (OSError, ValueError):
+                return False
+        primaries = [(sname, length, weights.get(sname, 0)) for sname, length in header_sequences(self.Header)
+                     if sname.upper().replace("CHR", "") in wgse.valid_autos + wgse.valid_somal]
+        if not primaries or sum(weight for _, _, weight in primaries) == 0:
+            return False
+
+        readtyp = 0
+        lenstat = Welford()
+        sizstat = Welford()
+        previous = None
+        for round_num in range(max_rounds):
+            # One samtools view over all the regions of the round (-M: each read once, in file order); capped after
+            round_regions = plan_sample_regions(primaries, regions, round_num, window)
+            with open(regionfile_oFN, "w") as region_file:
+                region_file.writelines(f'{sname}\t{start - 1}\t{end}\n' for sname, start, end in round_regions)
+            run_bash_script('ButtonBAMStats2',
+                            f'{samtools} view -M -L {regionfile_qFN} {cram_opt} {bamfile} > {flagfile_qFN} \n')
+            if not os.path.exists(flagfile_oFN):
+                raise BAMContentErrorFile('errBAMNoFlagsFile', flagfile_oFN)
+            with open(flagfile_oFN, "rb") as flags_file:
+                data = flags_file.read()
+
+            columns = parse_sam_columns(data, round_regions, batch)
+            keep = (columns["flag"] & 0xB00) == 0       # Same filters as process_bam_body
+            if round_num == 0:
+                if keep.sum() < regions * batch // 4:
+                    return False        # Too sparse (targeted or small subset); read the start of the file instead
+                readtyp = int(np.where(columns["flag"][keep] & 0x1, 1, -1).sum())
+                qname = data[:data.find(b"\t")].decode(errors="replace")
+                self.Sequencer = determine_sequencer(qname).replace("6xxx", qname[6:10] + " bad") \
+                    if qname else "Unknown"
+                DEBUG(f'Sequencer: {self.Sequencer} (ID: {qname})')
+            lenstat.add_batch(columns["seqlen"][keep & (columns["seqlen"] > 1)])
+            tlen = columns["tlen"][keep & columns["rnext_eq"]]
+            sizstat.add_batch(tlen[(tlen > 0) & (tlen < 50000)])
+            DEBUG(f'@Round {round_num}: {lenstat.count} - Read Avg: {lenstat.mean:,.0f}, {lenstat.stddev:,.0f}; '
+                  f'Insert Avg: {sizstat.mean:,.0f}, {sizstat.stddev:,.0f}')
+
+            current = ((lenstat.mean, lenstat.stddev), (sizstat.mean, sizstat.stddev))
+            if previous and lenstat.converged(previous[0], tolerance) and sizstat.converged(previous[1], tolerance):
+                break
+            previous = current
+
+        nstep = regions * batch // 10
+        self.ReadType = "Paired" if readtyp > nstep else "Single" if readtyp < -nstep else "Unknown"
+        DEBUG(f'Read Segment Type: {self.ReadType}-end (scale:{readtyp})')
+        if self.ReadType == "Unknown":
+            raise BAMContentWarning('warnBAMBadReadType')
+        if self.ReadType == "Paired" and sizstat.count == 0 and self.Aligned:
+            raise BAMContentErrorFile('errBAMInconsistentReadType', flagfile_oFN)
+
+        if lenstat.count > 2:
+            DEBUG(f'Read Length: {lenstat.mean:,.0f}, stddev={lenstat.stddev:,.0f}')
+            self.avg_read_length = lenstat.mean
+            self.avg_read_stddev = lenstat.stddev
+        else:
+            raise BAMContentError('errBAMBadReadLength')
+
+        if self.ReadType == "Paired" and sizstat.count > 2:
+            DEBUG(f'Insert Size: {sizstat.mean:,.0f}, stddev={sizstat.stddev:,.0f}')
+            self.insert_size = sizstat.mean
+            self.insert_stddev = sizstat.stddev
+        return True
+
     def get_samtools_idxstats(self, button_directly=False):
         """
             Called immediately after (re)setting a BAM file to update the main window summary results display;
@@ -405,17 +530,23 @@ class BAMFile:
             # So either Stats button was hit directly (and not run yet) or in a new, indexed BAM so will run it as if
             #  button hit directly (quick run) to enable full table stats so can enable rest of GUI buttons
 
-            # Create and run Samtools idxstats command on the BAM file
-            samtools = wgse.samtoolsx_qFN
-            bamfile = self.file_qFN
+            # Without a BAM index, idxstats is a full decode of the file. So run the stats bundle instead which
+            #  gets the body sample and both bin coverage tables out of that same single decode.  Only if sorted;
+            #  samtools depth fails on an unsorted file.
+            if not bam_with_index_exists and self.Sorted and wgse.outdir and wgse.outdir.FPB:
+                self.get_stats_bundle(idxfile_qFN)
+            else:
+                # Create and run Samtools idxstats command on the BAM file
+                samtools = wgse.samtoolsx_qFN
+                bamfile = self.file_qFN
 
-            commands = f'{samtools} idxstats {bamfile} > {idxfile_qFN} \n'
+                commands = f'{samtools} idxstats {bamfile} > {idxfile_qFN} \n'
 
-            # Seconds to minutes to hours ....
-            title = "ButtonBAMStats" if self.Sorted and self.Indexed and self.file_type == "BAM" else \
-                    "ButtonBAMNoIndex" if self.Sorted else \
-                    "ButtonBAMNoSort"
-            run_bash_script(title, commands)
+                # Seconds to minutes to hours ....
+                title = "ButtonBAMStats" if self.Sorted and self.Indexed and self.file_type == "BAM" else \
+                        "ButtonBAMNoIndex" if self.Sorted else \
+                        "ButtonBAMNoSort"
+                run_bash_script(title, commands)
 
             # If still not there then report an error as could not create it when wanted to
             if not (os.path.isfile(idxfile_oFN) and os.path.getsize(idxfile_oFN) > 480):
@@ -423,6 +554,66 @@ class BAMFile:
 
         self.process_samtools_idxstats(idxfile_oFN)
 
+    def get_stats_bundle(self, idxfile_qFN, window=None):
+        """
+        One decode of the BAM / CRAM for the whole stats session. The file is read once into an uncompressed BAM
+        stream that is tee'd (via named pipes) to samtools depth | depthhist.py for the WGS (and, if we have the BED
+        file, WES) bin coverage tables, and to samtools view | statsbundle.py for the idxstats table and body samples.
+        Writes the very same files the separate runs did; so all the existing reuse and process_ routines apply.
+        Only for a sorted file (samtools depth needs one).  If any branch fails (depth, statsbundle, or the tee when
+        one of them stops reading) all the outputs are removed; none is left truncated to be taken as a result.
+        """
+        samtools = wgse.samtoolsx_qFN
+        python = wgse.python3x_qFN
+        statsbundle = f'"{wgse.prog_FP}statsbundle.py"'
+        bamfile = self.file_qFN
+        cram_opt = f'-T {self.Refgenome_qFN}' if self.file_type == "CRAM" else ""
+        if self.file_type == "CRAM" and wgse.reflib.missing_refgenome(self.Refgenome_qFN):
+            return
+
+        flags_qFN = f'"{wgse.tempf.FP}flags.tmp"'
+        flagslong_qFN = f'"{wgse.tempf.FP}flagslong.tmp"'
+        numsamp = 20000                 # Same sample sizes as process_bam_body
+        lonsamp = numsamp * 29
+
+        # Each bin coverage table gets its own named pipe off the tee; only once outdir set (where they are saved)
+        bedfile = wgse.reflib.get_wes_bed_file_qFN(self.Build, self.SNTypeC, self.Yonly) if self.Build else ""
+        branches = [("WGS", "-aa", f'{wgse.outdir.FPB}_bincvg')]
+        if bedfile and os.path.isfile(nativeOS(unquote(bedfile))):
+            branches.append(("WES", f'-a -b {bedfile}', f'{wgse.outdir.FPB}_wescvg'))
+
+        # Each depth branch in a subshell so its exit status is that of its whole pipe; checked with wait
+        commands = "set -o pipefail\npids=\n"
+        fifos = ""
+        outputs = [idxfile_qFN, flags_qFN, flagslong_qFN]
+        for scantype, subopts, cvg_FPB in branches:
+            fifo_FN = f'{wgse.tempf.FP}bundle_{scantype}.fifo'
+            commands += f'rm -f "{fifo_FN}" ; mkfifo "{fifo_FN}"\n'
+            depth = depth_command(f'"{fifo_FN}"', subopts, f'{cvg_FPB}.npz', f'{cvg_FPB}.csv')
+            commands += f'( {depth} ) &\n'
+            commands += 'pids="$pids $!"\n'
+            fifos += f' "{fifo_FN}"'
+            outputs += [f'"{cvg_FPB}.npz"', f'"{cvg_FPB}.csv"']
+        commands += (
+            f'{samtools} view -u -h --no-PG {cram_opt} {bamfile} | tee{fifos} | {samtools} view -h - | '
+            f'  {python} {statsbundle} - {idxfile_qFN} {flags_qFN} {flagslong_qFN} {numsamp} {lonsamp}\n'
+            f'status=$?\n'
+            f'for pid in $pids ; do wait $pid || status=1 ; done\n'
+            f'if [ $status -ne 0 ] ; then rm -f {" ".join(outputs)} ; exit 1 ; fi\n'
+        )
+
+        job = run_bash_script("StatsBundle", commands, parent=window or wgse.window)
+        if job.status != DONE:          # Killed or cancelled before the script could clean up itself
+            for output in outputs:
+                if os.path.isfile(nativeOS(unquote(output))):
+                    os.remove(nativeOS(unquote(output)))
+            DEBUG(f'Stats bundle failed ({job.status}); outputs removed')
+            return
+
+        # Redo the body stats from the bundle sample so read length, etc. come from the same pass as the counts
+        if os.path.isfile(nativeOS(unquote(flags_qFN))) and os.path.getsize(nativeOS(unquote(flags_qFN))) > 0:
+            self.process_bam_body(sampled=True)
+
     def process_samtools_idxstats(self, idxfile_oFN):
         """
         Only called from one place and only if the file exists and likely good. Passed the samtools idxstats result
@@ -603,6 +794,7 @@ class BAMFile:
             self.long_read = True
 
         self.Stats = True
+        self.save_cached_stats()
 
     def get_coverage_stats(self, window, button_directly=False):    # DEPRECATED; use get_bincvg_stats with bam_type="WGS"
         """
@@ -775,7 +967,7 @@ class BAMFile:
     def get_bincvg_stats(self, window, scantype="WGS", button_directly=True):
         """
         Very similar to get_WEScvg_stats except doing a full WGS (-aa) instead of using a BED file.  Same
-        samtools depth command with same awk script post-processing.  If you change it here, change it there.
+        samtools depth command but post-processed by our depthhist.py engine (same table the awk script generated).
         Note: Can only be called after regular idxstats run so certain parameters available
         """
         covfile_qFN = f'"{wgse.outdir.FPB}_bincvg.csv"' if scantype == 'WGS' else \
@@ -799,8 +991,6 @@ class BAMFile:
 
             # Run samtools depth to get Bin Coverage values
             # The normal samtools coverage does not accept range of bins
-            samtools = wgse.samtoolsx_qFN
-            awk = wgse.awkx_qFN
             bamfile = self.file_qFN
 
             # Use BED file if WES scan type.  If Y (or Y and MT) only BAM; use special "Poz" non-exome BED file
@@ -811,26 +1001,26 @@ class BAMFile:
                 # or (cramopts and wgse.reflib.missing_refgenome(self.Refgenome_qFN)):
                 return
 
-            # Because the depth file is so large; we process it via a pipe and awk; save per chromosome for user perusal
-            # Expanded to include buckets 0, 1-3, 4-7, 8+ (inclusive)
-            script = """'{ names[$1]=$1 ; if($3==0){zero[$1]++} else {nz[$1]++ ; sumnz[$1]+=$3 ; 
-              if($3>7){nI[$1]++ ; sumnI[$1]+=$3} else {if($3>3){n7[$1]++ ; sumn7[$1]+=$3} else 
-              {n3[$1]++ ; sumn3[$1]+=$3} } } } END {
-              printf("%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\t%s\\n",
-                "chr","zero","nonzero","sum nz","fract nz","avg nz","avg all",
-                "TotalBC","Bet1-3","sum Bet1-3","Bet4-7","sum Bet4-7","Gtr7","sum Gtr7");
-              for (x in names) { totalbc = zero[x]+nz[x]+1 ; 
-                printf("%s\\t%d\\t%d\\t%d\\t%f\\t%f\\t%f\\t%d\\t%d\\t%d\\t%d\\t%d\\t%d\\t%d\\n",
-                x,zero[x],nz[x],sumnz[x],nz[x]/totalbc,sumnz[x]/(nz[x]+1),sumnz[x]/totalbc,
-                totalbc-1,n3[x],sumn3[x],n7[x],sumn7[x],nI[x],sumnI[x]) } }'"""
-
+            # Because the depth file is so large; we process it via a pipe; save per chromosome for user perusal.
+            # Was an awk script; now our NumPy depthhist.py engine. Buckets 0, 1-3, 4-7, 8+ (inclusive) in the table
+            # and the full per sequence depth histogram saved alongside (.npz) for other bucket edges later.
             subopts = "-aa" if scantype == "WGS" else f'-a -b {bedfile}'
             # Per John Bonfield (https://github.com/samtools/samtools/issues/1643#issuecomment-1111133582)
             # no need for a reference spec when a CRAM file supplied to the samtools depth command.
-            commands = f'{samtools} depth {subopts} {bamfile} | {awk} {script} > {covfile_qFN}'
+            commands = depth_command(bamfile, subopts, f'{os.path.splitext(unquote(covfile_qFN))[0]}.npz',
+                                     unquote(covfile_qFN)) + '\n'
+
+            # Split WGS run into per region samtools depth runs across the available threads, if we can seek the file
+            parts = None
+            if self._parallel_bincvg_ok(scantype):
+                sequences = header_sequences(self.Header)
+                commands, parts = parallel_depth_commands(bamfile, sequences, wgse.os_threads, wgse.tempf.FP)
 
             run_bash_script("CoverageStatsBIN", commands, parent=window)
 
+            if parts and not merge_bincvg_parts(parts, covfile_oFN, sequences) and os.path.isfile(covfile_oFN):
+                os.remove(covfile_oFN)      # A worker failed; do not leave a partial table to be reused later
+
         # Check if coverage file generated properly
         if not (os.path.isfile(covfile_oFN) and os.path.getsize(covfile_oFN) > 120):     # header-only is 107 bytes
             # if os.path.isfile(covfile_oFN):
@@ -841,6 +1031,14 @@ class BAMFile:
         else:
             self.process_bincvg_stats(covfile_oFN, scantype)
 
+    def _parallel_bincvg_ok(self, scantype):
+        """
+        Parallel (per region) samtools depth runs need a coordinate sorted, indexed file, a samtools depth that uses the
+        index with a BED file (1.13 rewrite), more than one thread available, and the model sequences in the header.
+        """
+        return scantype == "WGS" and self.Sorted and self.check_for_bam_index() and wgse.os_threads > 1 and \
+            tuple(wgse.samtools_version[:2]) >= (1, 13) and "@SQ\tSN:" in self.Header
+
     def process_bincvg_stats(self, bincov_oFN, scantype="WGS"):
         """
         Processes both WGS bincvg and WEScvg file (both same format from samtools depth piped to awk script)
@@ -967,6 +1165,7 @@ class BAMFile:
                 self.raw_avg_read_depth_WES = round(self.raw_avg_read_depth_WES)
             self.mapped_avg_read_depth_WES = self.raw_avg_read_depth_WES    # By definition, there are no unmapped bases
             self.coverage_WES              = nonzero_bases_cnt / total_bases
+        self.save_cached_stats()
 
     def determine_reference_genome(self):
         """
@@ -983,24 +1182,13 @@ class BAMFile:
          19 if old style hg with Yoruba, 37 if build 37 model lengths, 38 if Build 38 model lengths, ditto T2T 99
          Number of Sequence Names in the header is a good indicator of class and other model characteristics
 
-        NOTE: Much of this code is duplicated in the VCFFiles class call of the same name.  Should likely pull out
-        just the differences and make a single, generic call that adopts to the differences.  Maybe simply extract
-        the SN/ID and LN/length fields into separate entry and process that generically?
+        The header SQ records are parsed once and identified by refident (shared with VCFFile): a single lookup of
+        their catalog signature (md5 of the SN / LN fields as for the DICT file) in the reference library index; the
+        Build / model rules on the lengths and names if not catalogued (e.g. a subset header).
         """
 
-        # Determine SN names as given as opposed to relying on reference model to determine
-        accession = ["@SQ\tSN:CM0", "@SQ\tSN:CP", "@SQ\tSN:J0", "@SQ\tSN:NC_"]
-        self.SNTypeC = "Chr" if "@SQ\tSN:chr" in self.Header else \
-                       "Num" if "@SQ\tSN:1\t" in self.Header else \
-                       "Acc" if any(x in self.Header for x in accession) else \
-                       "Unk"
-
-        self.SNTypeM = "MT" if "@SQ\tSN:MT" in self.Header or "@SQ\tSN:chrMT" in self.Header else \
-                       "M"  if "@SQ\tSN:M" in self.Header or "@SQ\tSN:chrM" in self.Header else \
-                       "Unk"
-
-        self.SNCount = self.Header.count('@SQ\tSN:')   # Almost sufficient for an analysis model determination
-
+        ident = identify_reference(header_records(self.Header), reference_index(wgse.reflib.gen_oFP), self.Header)
+        self.SNTypeC, self.SNTypeM, self.SNCount = ident["SNTypeC"], ident["SNTypeM"], ident["SNCount"]
         DEBUG(f"SN: {self.SNTypeC}, {self.SNTypeM}; SN Count:{self.SNCount}")
 
         # If unaligned BAM, simply return and set unknowns. Checks only apply to SAM/BAM; not CRAM. uBAMs used with
@@ -1010,104 +1198,18 @@ class BAMFile:
         if self.SNCount == 0 and not self.Sorted:
             DEBUG(f"Unaligned BAM: no reference model, etc.")
             self.Aligned = False
-            self.SNTypeM = "Unk"
             self.SNTypeM, self.Build, self.RefMito = ("Unk", 0, "Unknown")
             self.Refgenome = self.RefgenomeNew = "Unaligned"
             return
 
         self.Aligned = True
-
-        # Possible that header has been shortened if a subset BAM file? So only use chr1, Y and X to check length
-        # If only MT or Unmapped (*) in header, then cannot tell RefGenome
-        self.Build, self.RefMito = \
-            (99, "Custom") if any(x in self.Header for x in ["LN:248387561", "LN:248387328", "LN:248387497",
-                        "LN:248415701", "LN:62456832", "LN:62460029", "LN:62480187", "LN:154343774", "LN:25843790",
-                        "LN:154259566", "LN:154259625", "LN:154269076", "LN:154349815", "LN:154434329"]) else \
-            (38, "rCRS")   if any(x in self.Header for x in ["LN:248956422", "LN:57227415", "LN:156040895"]) else \
-            (37, "rCRS")   if any(x in self.Header for x in ["LN:249250621", "LN:59373566", "LN:155270560"]) else \
-            (18, "Yoruba") if any(x in self.Header for x in ["LN:247249719", "LN:57772954", "LN:154913754"]) else \
-            (17, "Yoruba") if any(x in self.Header for x in ["LN:245522847", "LN:57701691", "LN:154824264"]) else \
-            (16, "Yoruba") if any(x in self.Header for x in ["LN:246127941", "LN:50286555", "LN:153692391"]) else \
-            (15, "Yoruba") if any(x in self.Header for x in ["LN:245203898", "LN:50961097", "LN:152634166"]) else \
-            ( 0, "Unknown")
-
-        # Modify Mitochondria model based on its length if Build 37 (only one with both types in releases)
-        if self.Build == 37 and any(x in self.Header for x in ["M\tLN:16571", "MT\tLN:16571"]):
-            self.Build, self.RefMito = (19, "Yoruba")
-        # Todo handling RSRS model -- look for spacers?
-
+        self.Build, self.RefMito = ident["Build"], ident["RefMito"]
         DEBUG(f"Build: {self.Build:3d}")
         DEBUG(f"Ref Genome Mito: {self.RefMito}")
-
-        # New form is based on Major / Class mechanism in Reference Genome study: https://bit.ly/34CO0vj
-        #  Used to rely on SNCount.  But oddball, unrecognized ref genomes in BAMs may have something close set by user.
-        #  So, rely more on key items found in special ref genomes. Keep patching this.  Need to use the MD5sum method.
-        if self.Build == 99:        # Used chr1, chrX or chrY lengths to determine Build99 earlier
-            # Use X and Y length to determine T2T / HPP model
-            if "LN:62456832" in self.Header and "LN:154343774" in self.Header:  # CHM13 v1.1 & HG002 v2 XY
-                self.Refgenome = self.RefgenomeNew = "THGv20"
-            elif "LN:62460029" in self.Header and "LN:154349815" in self.Header:  # CHM13 v1.1 & HG002 v2.7 XY
-                self.Refgenome = self.RefgenomeNew = "THGv27"
-            elif "LN:62480187" in self.Header and "LN:154434329" in self.Header:  # HG01243 v3 PR1 "Puerto Rican"
-                self.Refgenome = self.RefgenomeNew = "THG1243v3"
-            elif "LN:57277415" in self.Header and "LN:154259566" in self.Header:  # CHM13 v1.1 & GRCh38 Y
-                self.Refgenome = self.RefgenomeNew = "HPPv11"
-            elif "LN:57277415" in self.Header and "LN:154259625" in self.Header:  # CHM13 v1 X & GRCh38 Y
-                self.Refgenome = self.RefgenomeNew = "HPPv1"
-            elif "LN:62456832" in self.Header and "LN:156040895" in self.Header:  # GRCh38 w/ HG002 v2 Y  (ySeq)
-                self.Refgenome = self.RefgenomeNew = "THGySeqp"
-            elif "LN:62460029" in self.Header and "LN:154259566" in self.Header:  # CHM13 v1.1 & HG002 v2.7 Y
-                self.Refgenome = self.RefgenomeNew = "T2Tv20"
-            elif "LN:154259566" in self.Header:  # Must be plain CHM13 v1.1 as special Y not found
-                self.Refgenome = self.RefgenomeNew = "T2Tv11"
-            elif "LN:154259625" in self.Header:  # Must be plain CHM13 v1 as special Y not found
-                self.Refgenome = self.RefgenomeNew = "T2Tv10"
-            elif "LN:154259664" in self.Header:  # Must be plain CHM13 v0.9
-                self.Refgenome = self.RefgenomeNew = "T2Tv09"
-            else:  # Think it is T2T / HPP build but cannot recognize Y or X length
-                DEBUG(f'Unrecognized T2T model; no matching X or Y length in BAM to known models.')
-        elif self.SNCount in [85, 86] and "SN:NC_007605" in self.Header:
-            # hs37 class have SN:NC007605 (EBV in Numeric naming) sans human_g1k / GRCh37.primary_assembly models
-            # human_1kg model is 84 and one less SN than hs37.fa.gz; hs37d5 is 86 and one more than hs37 (hs37d5 decoy)
-            self.Refgenome = "hs37d5" if "@SQ\tSN:hs37d5" in self.Header else "hs37"
-            self.RefgenomeNew = "1k37g"
-        elif self.SNCount in [85, 298] and "SN:chrEBV" in self.Header:
-            self.Refgenome = None     # 1KGenome analysis models in NCBI Genbank Archive or UCSC; but not handled yet
-            self.RefgenomeNew = "1k37h"
-        elif self.SNCount == 84:      # human_g1k (if Num), GRCh37.primary_assembly.genome (if Chr)
-            self.Refgenome = "hs37-" if self.SNTypeC == "Num" else \
-                             "GRCh37-" if self.SNTypeC == "Chr" else None
-            self.RefgenomeNew = "1K37g" if self.SNTypeC == "Num" else \
-                                "EBI37h" if self.SNTypeC == "Chr" else None
-        elif self.SNCount in [195, 456, 2580, 2581, 2841, 3366] and \
-             ("SN:chrEBV" in self.Header or "SN:EBV" in self.Header):
-            # hs38DH is 3366 SN count and has SN:HLA- unique; hs38 is 195 and hs38a is 456; all uniquely have chrEBV
-            # hs38d1s is sequencing.com model made by hs38d1 with 22_KI270879v1_alt added
-            self.Refgenome = "hs38DH"  if "SN:chr22_KI270879v1_alt" in self.Header and self.SNCount == 3366 else \
-                             "hs38d1a" if self.SNCount == 2841 else \
-                             "hs38d1s" if self.SNCount == 2581 and "SN:22_KI270879v1_alt" in self.Header else \
-                             "hs38d1"  if self.SNCount == 2580 else \
-                             "hs38a"   if self.SNCount == 456 else \
-                             "hs38"  # if self.SNCount == 195
-            self.RefgenomeNew = "1k38" + ("pg" if self.Refgenome == "hs38d1s" else "h")
-            if self.SNCount == 2580 and \
-               ("M5:a491618313b78cdca84ae9513e4f4844" in self.Header or "Verily" in self.Header):
-                self.Refgenome = "hs38d1v"      # Special Google Verily model; cannot be distinguished without M5 field;
-                self.RefgenomeNew = "1k38ph"    # but has very different m5 signature on each SN than hs38d1
-        elif self.SNCount in [93, 297, 455, 639]:    # SNCounts of 6 hg/ebi models; 2 duplicated
-            # Handle the hg (UCSC) and GRCh (EBI) models here
-            self.Refgenome = "hg" if self.SNTypeC == "Chr" else "GRCh"     # 297 & 639 are Patch 13 GRCh models
-            self.Refgenome += str(self.Build)   # Build already takes into account mito for 19/37 differentiation
-            self.RefgenomeNew = self.Refgenome.replace("GRCh", "EBI") + ("g" if self.SNTypeC == "Chr" else "h")
-        elif self.SNCount == 25:        # T2T models of this size already captured with LN fields above
-            self.Refgenome = "hg37w"   # Odd WGSE v1/2 25 SN hg19 model with EBI primaries
-            self.RefgenomeNew = "EBI37ph"
+        if ident["Refgenome"] or ident["RefgenomeNew"]:
+            self.Refgenome, self.RefgenomeNew = ident["Refgenome"], ident["RefgenomeNew"]
         DEBUG(f'Ref Genome: {self.Refgenome}, by New nomenclature: {self.RefgenomeNew}')
 
-        # Using the MD5 on the BAM header, see if we know the refgenome more refined (actual model file); for CRAM
-        # Note: MD5 method requires full WGS header with all FASTA model SNs defined there; not subsetted in header
-        pass  # Todo implement code to lookup MD5Sum on BAM Header of SN & LN fields
-
         # We give up if still not set, simply ask the user
         if not self.Refgenome:  # not set yet: and (self.chrom_types["A"] > 1 or self.chrom_types["Y"] > 1):
             wgse.reflib.ask_reference_genome(inBAM=True)      # Ignore return value as setup self.Refgenome in call
@@ -1118,6 +1220,40 @@ class BAMFile:
         tempFN = unquote(self.Refgenome_qFN)
         DEBUG(f'Ref Genome File: {tempFN}')
 
+    # Derived values kept in the stats cache; everything but the file names, file system state and run time settings
+    CACHED_ATTRS = (
+        "Header", "Sorted", "Aligned", "Refgenome", "RefgenomeNew", "RefMito", "SNTypeC", "SNTypeM", "SNCount", "Build",
+        "ReadType", "Content", "Yonly", "Monly", "Primary", "Sequencer", "gender", "low_coverage", "long_read",
+        "raw_gigabases", "raw_avg_read_depth_WES", "raw_avg_read_depth_full", "raw_avg_read_depth_NoN", "raw_segs_read",
+        "mapped_gbases", "mapped_avg_read_depth_WES", "mapped_avg_read_depth_full", "mapped_avg_read_depth_NoN",
+        "mapped_segs_read", "mapped_reads_percent", "avg_read_length", "avg_read_stddev", "insert_size",
+        "insert_stddev", "Stats", "coverage", "coverage_WES", "stats_chroms", "stats_bin", "stats_binwes",
+        "chrom_types")
+
+    def restore_cached_stats(self):
+        """ Restore all derived values from the stats cache if this file (by content fingerprint) was seen before """
+        cached = StatsCache(wgse.statscache_oFN).get(self.fingerprint) if wgse.statscache_oFN else None
+        if not cached or any(attr not in cached for attr in self.CACHED_ATTRS):
+            return False
+        for attr in self.CACHED_ATTRS:
+            setattr(self, attr, cached[attr])
+        self.Indexed = self.check_for_bam_index()       # Index may have been created (or removed) since
+        self.Refgenome_qFN = wgse.reflib.get_refgenome_qFN(self.Refgenome)    # Reference library may have moved
+        DEBUG(f'BAM stats restored from cache ({self.fingerprint}); Ref Genome: {self.Refgenome}')
+
+        # Same warnings a stats run posts
+        if self.low_coverage:
+            wgse_message("warning", 'LowCoverageWindowTitle', False, 'LowCoverageWarning')
+        if self.long_read:
+            wgse_message("warning", 'LongReadSequenceTitle', False, 'LongReadSequenceWarning')
+        return True
+
+    def save_cached_stats(self):
+        """ Save (update) all derived values in the stats cache; called after each stage that sets some """
+        if wgse.statscache_oFN:
+            StatsCache(wgse.statscache_oFN).put(self.fingerprint, self.file_FN,
+                                                {attr: getattr(self, attr) for attr in self.CACHED_ATTRS})
+
     def chrom_types_str(self):
         """
         Create a string of comma-separated BAM SN components: Auto(somes), X, Y, Mito, etc of BAM / CRAM for stats
@@ -1236,35 +1372,34 @@ class BAMFile:
         disk space to reuse. Helpful especially when we start saving and restore BAM library stats.
         """
         paired = self.ReadType == "Paired"
-        # todo checking dates and sizes
 
         # First check if names have been set in this BAM class already
         if self.R1fastq_FN and (not paired or self.R2fastq_FN):
-            if os.path.exists(nativeOS(self.R1fastq_FN)) and (not paired or os.path.exists(nativeOS(self.R2fastq_FN))):
+            if self._FASTQs_fit(self.R1fastq_FN, self.R2fastq_FN if paired else None):
                 return True
 
         # First look in output directory and BAM directory for ones we create (our naming convention)
         if wgse.outdir.FPB and paired:      # Look in Output Directory
             r1fastq_FN = f'{wgse.outdir.FPB}_R1.fastq.gz'
             r2fastq_FN = f'{wgse.outdir.FPB}_R2.fastq.gz'
-            if os.path.exists(nativeOS(r1fastq_FN)) and os.path.exists(nativeOS(r2fastq_FN)):
+            if self._FASTQs_fit(r1fastq_FN, r2fastq_FN, ours=True):
                 self.R1fastq_FN = r1fastq_FN
                 self.R2fastq_FN = r2fastq_FN
                 return True
             r1fastq_FN = f'{self.file_FPB}_R1.fastq.gz'
             r2fastq_FN = f'{self.file_FPB}_R2.fastq.gz'
-            if os.path.exists(nativeOS(r1fastq_FN)) and os.path.exists(nativeOS(r2fastq_FN)):
+            if self._FASTQs_fit(r1fastq_FN, r2fastq_FN, ours=True):
                 self.R1fastq_FN = r1fastq_FN
                 self.R2fastq_FN = r2fastq_FN
                 return True
 
         if wgse.outdir.FPB and not paired:
             fastq_FN = f'{wgse.outdir.FPB}.fastq.gz'
-            if os.path.exists(nativeOS(fastq_FN)):
+            if self._FASTQs_fit(fastq_FN, ours=True):
                 self.R1fastq_FN = fastq_FN
                 return True
             fastq_FN = f'{self.file_FPB}.fastq.gz'
-            if os.path.exists(nativeOS(fastq_FN)):
+            if self._FASTQs_fit(fastq_FN, ours=True):
                 self.R1fastq_FN = fastq_FN
                 return True
 
@@ -1272,19 +1407,19 @@ class BAMFile:
         if paired:
             r1fastq_FN = f'{self.file_FPB}_1.fq.gz'
             r2fastq_FN = f'{self.file_FPB}_2.fq.gz'
-            if os.path.exists(nativeOS(r1fastq_FN)) and os.path.exists(nativeOS(r2fastq_FN)):
+            if self._FASTQs_fit(r1fastq_FN, r2fastq_FN):
                 self.R1fastq_FN = r1fastq_FN
                 self.R2fastq_FN = r2fastq_FN
-                return True  # todo checking dates and sizes
+                return True
 
         # Now look in BAM directory for common test company names: Dante Labs
         if paired:
             r1fastq_FN = f'{self.file_FPB}_SA_L001_R1_001.fastq.gz'
             r2fastq_FN = f'{self.file_FPB}_SA_L001_R2_001.fastq.gz'
-            if os.path.exists(nativeOS(r1fastq_FN)) and os.path.exists(nativeOS(r2fastq_FN)):
+            if self._FASTQs_fit(r1fastq_FN, r2fastq_FN):
                 self.R1fastq_FN = r1fastq_FN
                 self.R2fastq_FN = r2fastq_FN
-                return True  # todo checking dates and sizes
+                return True
 
         # Now look in BAM directory for common test company names: ySeq (does not provide FASTQ's ?)
 
@@ -1292,10 +1427,10 @@ class BAMFile:
         if paired:
             r1fastq_FN = f'{self.file_FPB}.1.fq.gz'
             r2fastq_FN = f'{self.file_FPB}.2.fq.gz'
-            if os.path.exists(nativeOS(r1fastq_FN)) and os.path.exists(nativeOS(r2fastq_FN)):
+            if self._FASTQs_fit(r1fastq_FN, r2fastq_FN):
                 self.R1fastq_FN = r1fastq_FN
                 self.R2fastq_FN = r2fastq_FN
-                return True  # todo checking dates and sizes
+                return True
 
         # Now look in BAM directory for common test company names: Full Genomes Corp
 
@@ -1304,6 +1439,27 @@ class BAMFile:
         self.R1fastq_FN = self.R2fastq_FN = None
         return False
 
+    def _FASTQs_fit(self, r1fastq_FN, r2fastq_FN=None, ours=False):
+        """
+        The FASTQ (pair) found for find_FASTQs() exists and fits this BAM: each file of some size; a pair of similar
+        sizes and, when their .wgsestats sidecars have counted them, the same number of reads.  Ours (made from this
+        BAM) must not be older than the BAM.
+        """
+        fastq_oFNs = [nativeOS(fastq_FN) for fastq_FN in (r1fastq_FN, r2fastq_FN) if fastq_FN]
+        if not all(os.path.isfile(fastq_oFN) and os.path.getsize(fastq_oFN) > 1000000 for fastq_oFN in fastq_oFNs):
+            return False
+        if ours and any(os.path.getmtime(fastq_oFN) < os.path.getmtime(self.file_oFN) for fastq_oFN in fastq_oFNs):
+            return False
+        if len(fastq_oFNs) == 2:
+            sizes = [os.path.getsize(fastq_oFN) for fastq_oFN in fastq_oFNs]
+            if max(sizes) > 2 * min(sizes):
+                return False
+            records = [read_sidecar(fastq_oFN) for fastq_oFN in fastq_oFNs]
+            if all(record and record.get("stats", {}).get("exact") for record in records) and \
+                    records[0]["stats"]["reads"] != records[1]["stats"]["reads"]:
+                return False
+        return True
+
     def find_VCFs(self):
         """
         A special to search for commonly-named VCFs from a vendor for the loaded BAM file.  As a precursor to creating
@@ -1316,7 +1472,7 @@ class BAMFile:
 
         # First check if names have already been set in this BAM class
         if not (self.VCFs and len(self.VCFs) > 0):
-            self.VCFs = VCFs = {}
+            self.VCFs, VCFs = {}, {}
 
             # First look in output directory for VCFs we create (our naming convention)
             if wgse.outdir and wgse.outdir.FPB:
@@ -0,0 +1,75 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+BGZF (blocked gzip; as bgzip) compression for the modules that write it: refdownload.py (reference genomes, with
+their .gzi index) and fastqshard.py (FASTQ shards).  Blocks are compressed concurrently on a pool of threads.
+"""
+
+import os
+import zlib
+import struct
+from concurrent.futures import ThreadPoolExecutor
+
+BLOCK_SIZE = 0xff00             # Uncompressed bytes in a BGZF block (as bgzip)
+BATCH_BLOCKS = 64               # BGZF blocks compressed concurrently
+BGZF_EOF = bytes.fromhex("1f8b08040000000000ff0600424302001b0003000000000000000000")
+
+
+def bgzf_block(data):
+    """ One BGZF block (gzip member with the BC extra field holding the block size) of up to BLOCK_SIZE bytes """
+    cdata = _deflate(data, 6)
+    if len(cdata) > 0x10000 - 26:   # Incompressible; stored instead
+        cdata = _deflate(data, 0)
+    header = struct.pack("<4BI2BH2BHH", 0x1f, 0x8b, 8, 4, 0, 0, 0xff, 6, ord("B"), ord("C"), 2, len(cdata) + 25)
+    return header + cdata + struct.pack("<II", zlib.crc32(data), len(data))
+
+
+def _deflate(data, level):
+    compressor = zlib.compressobj(level, zlib.DEFLATED, -15)
+    return compressor.compress(data) + compressor.flush()
+
+
+class BGZFWriter:
+    """
+    BGZF compress to an open (binary) file; the blocks of a batch concurrently (in pool, a ThreadPoolExecutor shared by
+    several writers, if given).  index is as bgzip -i keeps it.
+    """
+
+    def __init__(self, out_file, threads=None, pool=None):
+        self.out_file = out_file
+        self.buffer = bytearray()
+        self.caddr = self.uaddr = 0
+        self.index = []             # (compressed, uncompressed) offset of each block start but the first
+        self.own_pool = pool is None
+        self.pool = pool or ThreadPoolExecutor(threads or os.cpu_count() or 1)     # zlib releases the GIL
+
+    def write(self, data):
+        self.buffer += data
+        if len(self.buffer) >= BLOCK_SIZE * BATCH_BLOCKS:
+            self._flush(len(self.buffer) - len(self.buffer) % BLOCK_SIZE)
+
+    def _flush(self, length):
+        blocks = [bytes(self.buffer[start:start + BLOCK_SIZE]) for start in range(0, length, BLOCK_SIZE)]
+        del self.buffer[:length]
+        for data, block in zip(blocks, self.pool.map(bgzf_block, blocks)):
+            if self.caddr:
+                self.index.append((self.caddr, self.uaddr))
+            self.out_file.write(block)
+            self.caddr += len(block)
+            self.uaddr += len(data)
+
+    def close(self):
+        self._flush(len(self.buffer))
+        self.out_file.write(BGZF_EOF)
+        if self.own_pool:
+            self.pool.shutdown()
+
+
+def write_gzi(gzi_oFN, index):
+    with open(gzi_oFN, "wb") as gzi_file:
+        gzi_file.write(struct.pack("<Q", len(index)))
+        gzi_file.write(b"".join(struct.pack("<QQ", caddr, uaddr) for caddr, uaddr in index))
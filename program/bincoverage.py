@@ -0,0 +1,110 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Bin Coverage engine (module bincoverage).  Support for the BAMFile.get_bincvg_stats() "samtools depth | awk" run.
+    Originally a single samtools depth -aa over the whole genome piped into a single awk process; ~3 billion lines
+    through one core for two hours.  Here we split the model into regions (whole sequences, pieces of the large
+    primary sequences, and groups of the small alt contigs) using the header model lengths, pack them into one
+    BED file per worker (sized by os_threads), run each worker as its own samtools depth | depthhist.py pipe, and then
+    merge the per-worker partial histograms back into the very same _bincvg.csv table that process_bincvg_stats() reads.
+
+    Only usable on a coordinate sorted and indexed BAM / CRAM (so samtools depth can seek to each region).  Per base
+    depth histograms are additive across regions so the merged table is identical to the single pipe result.
+"""
+
+import os
+
+from utilities import DEBUG, nativeOS
+import settings as wgse
+
+
+MIN_CHUNK = 5 * 10**6       # Do not split a sequence into regions smaller than this (bp)
+CHUNKS_PER_WORKER = 4       # Aim for a few regions per worker so the longest processing time first packing balances
+
+
+def header_sequences(header):
+    """ Return list of (SN, LN) tuples for each @SQ line in a SAM header (text form; as stored in BAMFile.Header) """
+    sequences = []
+    for line in header.splitlines():
+        if not line.startswith("@SQ"):
+            continue
+        fields = dict(field.split(":", 1) for field in line.split("\t")[1:] if ":" in field)
+        if "SN" in fields and "LN" in fields:
+            sequences.append((fields["SN"], int(fields["LN"])))
+    return sequences
+
+
+def plan_depth_regions(sequences, workers, min_chunk=MIN_CHUNK):
+    """
+    Split the model sequences [(SN, LN), ...] into at most "workers" lists of BED style (SN, start, end) regions of
+    roughly equal total length.  Large sequences are cut into pieces; small alt contigs simply get packed in together.
+    Each worker list is kept in the original header order so samtools depth moves forward through the index.
+    """
+    total = sum(length for _, length in sequences)
+    workers = max(1, min(workers, len(sequences) * CHUNKS_PER_WORKER))
+    chunk = max(min_chunk, -(-total // (workers * CHUNKS_PER_WORKER)))
+
+    regions = []
+    for sname, length in sequences:
+        for start in range(0, length, chunk):
+            regions.append((sname, start, min(length, start + chunk)))
+
+    # Longest processing time first: place each region (largest first) into the currently lightest loaded worker
+    loads = [[0, worker, []] for worker in range(workers)]
+    for order in sorted(range(len(regions)), key=lambda r: regions[r][2] - regions[r][1], reverse=True):
+        lightest = min(loads)
+        lightest[0] += regions[order][2] - regions[order][1]
+        lightest[2].append(order)
+
+    return [[regions[order] for order in sorted(load[2])] for load in sorted(loads, key=lambda ld: ld[1]) if load[2]]
+
+
+def depth_command(bamfile_qFN, subopts, npz_FN, csv_FN=None):
+    """ Return a samtools depth command piped into our depthhist.py histogram engine (instead of the awk script) """
+    python = wgse.python3x_qFN
+    depthhist = f'"{wgse.prog_FP}depthhist.py"'
+    csv_opt = f' "{csv_FN}"' if csv_FN else ""
+    return f'{wgse.samtoolsx_qFN} depth {subopts} {bamfile_qFN} | {python} {depthhist} - "{npz_FN}"{csv_opt}'
+
+
+def parallel_depth_commands(bamfile_qFN, sequences, workers, work_FP):
+    """
+    Write the per-worker BED files into work_FP and return (commands, part_oFNs).  The commands start one
+    samtools depth | depthhist.py pipe per worker in the background and wait for all of them to finish.
+    """
+    commands = ""
+    part_oFNs = []
+    for worker, regions in enumerate(plan_depth_regions(sequences, workers)):
+        bed_FN = f'{work_FP}bincvg_{worker:03d}.bed'
+        part_FN = f'{work_FP}bincvg_{worker:03d}.npz'
+        with open(nativeOS(bed_FN), "w") as bed_file:
+            bed_file.writelines(f'{sname}\t{start}\t{end}\n' for sname, start, end in regions)
+        part_oFNs.append(nativeOS(part_FN))
+        commands += depth_command(bamfile_qFN, f'-a -b "{bed_FN}"', part_FN) + ' &\n'
+    commands += 'wait\n'
+
+    DEBUG(f'Bin Coverage split into {len(part_oFNs)} parallel samtools depth runs')
+    return commands, part_oFNs
+
+
+def merge_bincvg_parts(part_oFNs, covfile_oFN, sequences=None):
+    """
+    Sum the per-worker partial histograms and write the standard bin coverage table (and its full histogram .npz
+    alongside).  Rows are in header (sequences) order if given. Returns the number of sequences written; zero if any
+    part is missing (i.e. a worker failed).
+    """
+    from depthhist import DepthHistogram
+
+    merged = DepthHistogram()
+    for part_oFN in part_oFNs:
+        if not os.path.isfile(part_oFN):
+            DEBUG(f'***ERROR: Bin Coverage part file missing: {part_oFN}')
+            return 0
+        merged.merge(DepthHistogram.load(part_oFN))
+
+    merged.save(f'{os.path.splitext(covfile_oFN)[0]}.npz')
+    return merged.write_bincvg(covfile_oFN, [sname for sname, _ in sequences] if sequences else None)
@@ -0,0 +1,130 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Body sampling engine (module bodysample) for BAMFile.process_bam_body_regions().  The original process_bam_body()
+    takes the first 20,000 reads (then 580,000 more for Nanopore) of the file; basically only chromosome 1.  With an
+    index we can instead seek to many small, evenly spaced (by mapped read count) regions across all the primary
+    sequences, take a fixed size batch of reads from each, and stop as soon as the read length and insert size
+    mean and standard deviation stop moving.  Faster for long read files and statistically representative.
+
+    All the regions of a round are read by one samtools view (a BED file with the multi-region iterator; so in file
+    order and each read once).  The reads are parsed as columns (NumPy arrays) from the SAM text; not split line by
+    line in Python.  Each read is put in its region by RNAME and POS, and only the first batch of each region is kept.
+    Batch statistics are merged into the running (Welford) values with the parallel form of the algorithm (Chan).
+"""
+
+import numpy as np
+
+from depthhist import parse_int_fields
+
+GOLDEN = 0.6180339887498949     # Phase step between rounds so each round samples new (interleaved) positions
+
+
+def plan_sample_regions(primaries, count, round_num, window):
+    """
+    Return "count" (SN, start, end) regions (1-based, inclusive like samtools) spread evenly over the cumulative
+    weight of the primaries [(SN, LN, weight), ...].  Each round is offset by a different phase.
+    """
+    weights = np.array([max(weight, 0) for _, _, weight in primaries], dtype=np.float64)
+    if weights.sum() <= 0:
+        return []
+    edges = np.concatenate(([0.0], np.cumsum(weights) / weights.sum()))
+    phase = (round_num * GOLDEN) % 1.0
+    regions = []
+    for u in (np.arange(count) + phase) / count:
+        index = min(int(np.searchsorted(edges, u, side="right")) - 1, len(primaries) - 1)
+        sname, length, _ = primaries[index]
+        within = (u - edges[index]) / max(edges[index + 1] - edges[index], 1e-12)
+        start = int(within * max(length - window, 1)) + 1
+        regions.append((sname, start, min(length, start + window - 1)))
+    return regions
+
+
+def parse_sam_columns(data, regions=None, batch=None):
+    """
+    Columnar parse of a block of SAM body lines.  Returns a dict of arrays: flag, tlen, rnext_eq (RNEXT is '='),
+    seqlen (length of SEQ; 1 if '*').  Only the first 10 tabs of each line are used so optional tags do not matter.
+    With regions [(SN, start, end), ...] (as from plan_sample_regions) and lines sorted as samtools view -M writes
+    them, only the first batch lines of each region are kept (each line is in the first region not ending before
+    its POS); lines in none of the regions are dropped.
+    """
+    buf = np.frombuffer(data, dtype=np.uint8)
+    eol = np.flatnonzero(buf == 10)
+    if len(eol) == 0:
+        return {"flag": np.zeros(0, np.int64), "tlen": np.zeros(0, np.int64),
+                "rnext_eq": np.zeros(0, bool), "seqlen": np.zeros(0, np.int64)}
+    tabs = np.flatnonzero(buf == 9)
+    line_starts = np.concatenate(([0], eol[:-1] + 1))
+    first = np.searchsorted(tabs, line_starts)
+    tab = [tabs[np.minimum(first + k, len(tabs) - 1)] for k in range(10)]
+
+    negative = buf[tab[7] + 1] == ord("-")
+    tlen = parse_int_fields(buf, tab[7] + 1 + negative, tab[8])
+    columns = {
+        "flag": parse_int_fields(buf, tab[0] + 1, tab[1]),
+        "tlen": np.where(negative, -tlen, tlen),
+        "rnext_eq": (tab[6] - tab[5] == 2) & (buf[tab[5] + 1] == ord("=")),
+        "seqlen": (tab[9] - tab[8] - 1).astype(np.int64),
+    }
+    if regions is None:
+        return columns
+
+    # RNAME of each line as a fixed width bytes array; so compared with each SN at once
+    width = max(int((tab[2] - tab[1] - 1).max()), 1)
+    place = tab[1][:, None] + 1 + np.arange(width)
+    rname = np.where(place < tab[2][:, None], buf[np.minimum(place, len(buf) - 1)], 0)
+    rname = np.ascontiguousarray(rname, dtype=np.uint8).view(f'S{width}').ravel()
+    pos = parse_int_fields(buf, tab[2] + 1, tab[3])
+
+    group = np.full(len(eol), -1, dtype=np.int64)
+    ordered = sorted(regions, key=lambda region: (region[0], region[2]))
+    offset = 0
+    for sname in dict.fromkeys(sname for sname, _, _ in ordered):
+        ends = np.array([end for name, _, end in ordered if name == sname])
+        lines = np.flatnonzero(rname == sname.encode())
+        within = np.searchsorted(ends, pos[lines])          # First region not ending before POS
+        group[lines] = np.where(within < len(ends), offset + within, -1)
+        offset += len(ends)
+
+    order = np.argsort(group, kind="stable")                # File order kept within each region
+    starts = np.searchsorted(group[order], group[order])
+    rank = np.empty(len(group), dtype=np.int64)
+    rank[order] = np.arange(len(group)) - starts
+    keep = (group >= 0) & (rank < (batch if batch is not None else len(group)))
+    return {name: column[keep] for name, column in columns.items()}
+
+
+class Welford:
+    """ Running count, mean and sum of squared differences (M2); batches merged with Chan's parallel algorithm """
+
+    def __init__(self, count=0, mean=0.0, M2=0.0):
+        self.count = count
+        self.mean = mean
+        self.M2 = M2
+
+    def add_batch(self, values):
+        if len(values) == 0:
+            return
+        values = np.asarray(values, dtype=np.float64)
+        bcount = len(values)
+        bmean = float(values.mean())
+        bM2 = float(((values - bmean) ** 2).sum())
+        delta = bmean - self.mean
+        total = self.count + bcount
+        self.mean += delta * bcount / total
+        self.M2 += bM2 + delta * delta * self.count * bcount / total
+        self.count = total
+
+    @property
+    def stddev(self):
+        return (self.M2 / (self.count - 1)) ** 0.5 if self.count > 2 else 0.0
+
+    def converged(self, previous, tolerance):
+        """ True if mean and stddev moved less than tolerance (relative) from the previous (mean, stddev) """
+        prev_mean, prev_std = previous
+        return abs(self.mean - prev_mean) <= tolerance * max(abs(self.mean), 1.0) and \
+            abs(self.stddev - prev_std) <= tolerance * max(self.stddev, 1.0)
@@ -7,9 +7,15 @@
 
 """###################################################################################################################
     Module commandprocessor.  Main handling of subprocess calls -- currently all are bash shell runs.
-    Will eventually expand to async multiprocessor handling with a list of processes.  To allow queue'ed calls and
-    the main program window to be non-blocking.  Handles new ProcessWait pop-up with timer to terminate errant
-    subprocess calls. Still not terminate for running call though.
+    All runs go through a job queue (jobqueue module) that runs submitted scripts concurrently within the platform
+    thread and memory limits; with a time budget per job from the expected_time table.  run_bash_script() still
+    blocks the caller but keeps the Tk main loop (and Please Wait pop-up) alive; closing the pop-up kills the job.
+    submit_bash_script() queues a script and returns at once; status changes are posted to its callback.
+    Each job carries a progress monitor (jobprogress module); its input read, rate, time left (or no progress at all)
+    shown in the Please Wait window and, if the user created it, appended to the ~/.wgseprogress.jsonl log.
+    Each finished job is recorded in the run history (runhistory module); the times learned from it (by input size
+    and threads) replace the expected_time table for the Please Wait window, the job time budgets and the order
+    ready pipeline stages are started in.
 
     v1 /v2 was 50% BATCH and 50% BASH calls.  Moving to all BASH, code is more OS
     independent (as long as Win10 environment has BASH/Unix calls available) and internal file / path handling easier
@@ -23,6 +29,7 @@ import os           # os.chmod()
 import stat         # stat.S_IXxxx flags
 import time         # time.time()
 import subprocess   # Popen, run, etc
+import itertools    # count()
 import platform
 if platform.uname().system != "Linux":
     from wakepy import keep   # Ugly, but cannot import on Ubuntu / Linux aparently
@@ -35,6 +42,9 @@ else:
 from tkinter import Toplevel, Label
 
 from utilities import DEBUG, wgse_message, time_label
+from jobqueue import Job, JobQueue, RUNNING, DONE, FAILED, CANCELLED, TIMEOUT
+from jobprogress import ProgressMonitor
+from runhistory import RunHistory
 import settings as wgse
 
 
@@ -42,6 +52,14 @@ import settings as wgse
 # Command Execution Subsection
 
 pleaseWaitWindow = None         # Purely for tkinter pleaseWaitWindow created then destroyed; loop if put in mainwindow
+progressLabel = None            # Progress line of the Please Wait window
+jobQueue = None                 # The JobQueue all commands run through (job_queue())
+waitingJobs = []                # Jobs the Please Wait window is waiting on (cancelled if it is closed)
+waitingPipeline = None          # Pipeline the Please Wait window is waiting on (cancelled if it is closed)
+scriptCount = itertools.count(1)    # Unique script file names for queued jobs
+TIMEOUT_FACTOR = 4              # Jobs killed after this multiple of their expected time (only if wgse.job_time_limit)
+TABLE_BYTES = 57 * 10**9        # Input size and threads the expected_time table was measured with (see settings)
+TABLE_THREADS = 2
 
 
 def is_command_available(command, opt, internal=True):
@@ -107,70 +125,242 @@ def simple_command(command_and_opts):
         return result.stdout.decode('utf-8', errors='ignore').strip()   # Windows WSL2 generates errors
 
 
-def run_external_program(script_FBS, command):
+def job_queue():
+    """ The one job queue (jobqueue module) all our commands run through; limits from the platform threads / memory """
+    global jobQueue
+
+    if jobQueue is None:
+        jobQueue = JobQueue(max_threads=wgse.os_threads, max_mem=wgse.os_totmem)
+    return jobQueue
+
+
+def input_size(inputs=()):
+    """ Bytes of input of a job: its input files if given; else the loaded BAM (as the expected_time table assumes) """
+    if inputs:
+        return sum(os.path.getsize(inp) for inp in inputs if os.path.isfile(inp))
+    return wgse.BAM.file_stats.st_size if wgse.BAM and getattr(wgse.BAM, "file_stats", None) else 0
+
+
+def expected_time(script_FBS, size=0, threads=None):
+    """ Seconds a run is expected to take; learned from the run history if it can be, else the expected_time table """
+    history = RunHistory(wgse.runhistory_oFN) if wgse.runhistory_oFN else None
+    learned = history.predict(script_FBS, size, threads or wgse.os_threads) if history else None
+    return learned if learned is not None else wgse.expected_time.get(script_FBS)
+
+
+def job_timeout(script_FBS, etime=None, size=0, threads=None):
+    """
+        Time budget for a job; only if the user opted in (wgse.job_time_limit), else jobs are never killed (a stalled
+        one is reported in the Please Wait window).  A multiple of its expected time; but never less than from the
+        expected_time table scaled up to the input size and down to the threads (a learned time may come from smaller
+        or faster runs and a killed job is worse than a late one).  No limit if neither is known.
+    """
+    if not wgse.job_time_limit:
+        return None
+    table = wgse.expected_time.get(script_FBS)
+    if table:
+        table *= max(1, size / TABLE_BYTES) * max(1, TABLE_THREADS / (threads or wgse.os_threads))
+    etimes = [etime for etime in (etime, table) if etime]
+    return max(etimes) * TIMEOUT_FACTOR if etimes else None
+
+
+def _job(script_FBS, command, threads, mem, callback, inputs):
+    """ Job with its input size, expected time (and time budget from it) and progress monitor """
+    size = input_size(inputs)
+    etime = expected_time(script_FBS, size, threads)
+    return Job(script_FBS, command, threads=threads, mem=mem, timeout=job_timeout(script_FBS, etime, size, threads),
+               callback=callback, monitor=job_monitor(inputs), size=size, expected=etime)
+
+
+def job_monitor(inputs=()):
+    """ Progress monitor for a job reading the input files; events logged only if the user created the log file """
+    log_oFN = wgse.progresslog_oFN if wgse.progresslog_oFN and os.path.isfile(wgse.progresslog_oFN) else None
+    return ProgressMonitor(inputs, log_oFN)
+
+
+def progress_text(event):
+    """ Progress line for the Please Wait window from a progress event (jobprogress module) """
+    if not event:
+        return ""
+    if event["stalled"]:
+        return wgse.lang.i18n["ProgressStalled"].replace("{{time}}", time_label(round(event["idle"])))
+    parts = []
+    if event["percent"] is not None:
+        parts.append(f'{event["percent"]:.1%} {wgse.lang.i18n["ProgressDone"]}')
+    if event["rate"]:
+        parts.append(f'{event["rate"] / 10**6:.1f} MB/s')
+    if event["eta"] is not None:
+        parts.append(f'{time_label(event["eta"]).strip()} {wgse.lang.i18n["ProgressLeft"]}')
+    return ", ".join(parts)
+
+
+def _show_progress():
+    """ Latest progress of the running jobs being waited on into the Please Wait window """
+    if progressLabel and progressLabel.winfo_exists():
+        lines = [progress_text(job.monitor.latest) for job in waitingJobs
+                 if getattr(job, "monitor", None) and job.status == RUNNING]
+        progressLabel.configure(text="\n".join(line for line in lines if line))
+
+
+def _job_status(job, status):
+    """ Default job callback; start / stop messages to the command screen as we always did """
+    command_str = job.title
+    for parm in job.command:                        # Search for the first BASH command script in the args
+        if ".sh" in parm:                           # BASH scripts end in .sh
+            command_str = os.path.basename(parm)
+            break
+
+    if status == RUNNING:
+        if wgse.gui or wgse.DEBUG_MODE:             # Only in GUI or DEBUG_MODE print the start and stop messages
+            print(f'--- STARTING: {command_str: <22} at {time.ctime(job.start_time)}')
+    elif status == DONE or status == FAILED:
+        if wgse.gui or wgse.DEBUG_MODE:
+            print(f'--- FINISHED: {command_str: <22} at {time.ctime(job.end_time)} '
+                  f'({time_label(round(job.elapsed))} to run)')
+        if wgse.runhistory_oFN:
+            RunHistory(wgse.runhistory_oFN).record(job.title, job.size, job.threads, job.mem, job.elapsed,
+                                                   job.expected, status, job.start_time)
+    elif status == TIMEOUT:
+        DEBUG(f"--- *FAILED*: {command_str: <22} did not finish before timeout {time_label(job.timeout)} "
+              f"(@ {time.ctime(job.end_time)}) ---")
+    elif status == CANCELLED:
+        DEBUG(f"--- *CANCELLED*: {command_str: <22} (@ {time.ctime()}) ---")
+
+
+def run_external_program(script_FBS, command, parent=None, inputs=()):
     """ Run an external batch program with a time-limit from our global table.
         Start with an array of args / parms for the command so shell GLOB processing is not needed.
         Will allows be a single command (single line).  Unlike scripts which may be multiple commands.
+        Now runs through the job queue asking for the whole machine (as our scripts use all the threads); but
+        waits here while keeping the Please Wait window (and so the Tk main loop) alive so it can cancel the job.
+        Progress is measured against the inputs (files) if given; else the largest file the job reads.
     """
+    job = _job(script_FBS, command, wgse.os_threads, 0, _job_status, inputs)
+    wait_jobs([job_queue().submit(job)], parent)
+    return job
 
-    # Due to adding the "Direct" mode to run_bash_script, script may not be first entry in command list
-    command_str = " ".join(command).strip()         # Default is all if we cannot find the BASH command
-    for parm in command:                            # Search for the first BASH command script in the args
-        if ".sh" in parm:                           # BASH scripts end in .sh
-            command_str = os.path.basename(parm)
-            break
 
-    # Rough std deviation (max) from expected time (x2); more robust for table out-of-date
-    maxtime = wgse.expected_time.get(script_FBS, 3600) * 2
+def submit_bash_script(script_title, script_contents, callback=None, threads=1, mem=0, direct=False, inputs=()):
+    """
+        Non-blocking form of run_bash_script.  Queue the script to run as soon as the declared threads and memory
+        (bytes) fit beside what is already running.  Returns the Job; callback(job, status) is called on each change
+        (from the Tk main loop when waiting with wait_jobs(), or when job_queue().poll() is called).  So independent
+        extractions (e.g. Y only BAM, mito VCF, unmapped reads) can run at the same time.
+    """
+    command = script_contents if direct else _write_bash_script(script_title, script_contents, unique=True)
 
-    # Only in GUI or DEBUG_MODE should we print the start and stop messages to the command screen
-    print_start_stop = wgse.gui or wgse.DEBUG_MODE
+    def status_change(job, status):
+        _job_status(job, status)
+        if callback:
+            callback(job, status)
 
-    if print_start_stop:
-        start_time = time.time()
-        start_ctime = time.ctime()
-        print(f'--- STARTING: {command_str: <22} at {start_ctime}')
+    return job_queue().submit(_job(script_title, command, threads, mem, status_change, inputs))
 
-    # Blocking subprocess call (by using p.comminucate() )
-    try:
-        # subprocess.run(command_to_run_and_args, timeout=maxtime*2)
-        with subprocess.Popen(command) as p:  # , stderr=subprocess.STDOUT, stdout=subprocess.PIPE, text=True) as p:
-            # stdout, stderr = p.communicate(timeout=maxtime)
-            stdout, stderr = p.communicate()
-    except subprocess.TimeoutExpired:   # Todo This specific exception not being caught here?
-        # Todo need to see if due to a timeout and handle appropriately; also user initiated abort
-        p.kill()
-        stdout, stderr = p.communicate()
-        stop_ctime = time.ctime()
-        tlabel = time_label(maxtime)
-        DEBUG(f"--- *FAILED*: {command_str: <22} did not finish before timeout {tlabel} (@ {stop_ctime}) ---")
-        raise
-    except subprocess.CalledProcessError:
-        # Todo need to handle different process termination conditions
-        DEBUG(f"--- *FAILED*: {command_str: <22} executed with error ---")
-        raise
-
-    if print_start_stop:
-        stop_ctime = time.ctime()
-        tlabel = time_label(round(time.time() - start_time))
-        print(f'--- FINISHED: {command_str: <22} at {stop_ctime} ({tlabel} to run)')
-
-
-def show_please_wait_window(reason, parent):
-    global pleaseWaitWindow
+
+def wait_jobs(jobs, parent=None):
+    """ Block until all the jobs finish while keeping the GUI alive; closing the Please Wait window cancels them """
+    global waitingJobs
+
+    waitingJobs = jobs
+    if wgse.window and wgse.dnaImage and parent:
+        show_please_wait_window(jobs[0].title, parent, jobs[0].expected)
+
+    def idle():
+        if pleaseWaitWindow and pleaseWaitWindow.winfo_exists():
+            _show_progress()
+            pleaseWaitWindow.update()
+
+    # Keepawake on Linux requires elevated (SUDO) privileges. No way to request a drop of elevated.
+    # elevate(show_console=True)  # Request elevated privilages from the user on Linux
+    if wgse.os_plat != "Linux":     # and etime > 3600 and os.getuid() != 0:
+        with keep.running():
+            job_queue().wait(jobs, idle)
+    else:
+        job_queue().wait(jobs, idle)
+    waitingJobs = []
+
+    if wgse.window and wgse.dnaImage and parent:
+        finishWait()
+
+
+class LocalExecutor:
+    """
+        Where run_pipeline() runs the stages of a pipeline.  This stand-in runs them on this machine through the job
+        queue.  Any other executor (e.g. a pool of hosts sharing the output directory, for the shards of a sharded
+        alignment) need only provide submit(stage, script) returning an object with finished and status like a Job.
+    """
+
+    def submit(self, stage, script):
+        return submit_bash_script(stage.title, script, threads=stage.threads, mem=stage.mem, inputs=stage.inputs)
+
+
+def run_pipeline(pipeline, parent=None, executor=None):
+    """
+        Run a pipeline (pipeline module) of bash script stages through the executor (default: the local job queue);
+        blocks like run_bash_script with one Please Wait window (titled by the pipeline name) for the whole run.
+        Closing it cancels the pipeline and kills its running stages.  Returns True if all the needed stages completed.
+    """
+    global waitingJobs, waitingPipeline
+
+    executor = executor or LocalExecutor()
+
+    started = []
+
+    def submit(stage, script):
+        DEBUG(f'Pipeline {pipeline.name} starting stage {stage.name}')
+        started.append(stage)
+        return executor.submit(stage, script)
+
+    def estimate(stage):
+        return expected_time(stage.title, input_size(stage.inputs), stage.threads)
+
+    def idle():
+        if pleaseWaitWindow and pleaseWaitWindow.winfo_exists():
+            _show_progress()
+            pleaseWaitWindow.update()
+        job_queue().poll()
+
+    # The whole pipeline is learned as well; by the size of the inputs no stage of it makes
+    produced = {out for stage in pipeline.stages for out in stage.outputs}
+    size = input_size({inp for stage in pipeline.stages for inp in stage.inputs if inp not in produced})
+    etime = expected_time(pipeline.name, size)
+    start_time = time.time()
+
+    waitingJobs = pipeline.jobs         # Same list object; so always the currently running stages
+    waitingPipeline = pipeline
+    parent = parent or wgse.window
+    if wgse.window and wgse.dnaImage and parent:
+        show_please_wait_window(pipeline.name, parent, etime)
+
+    if wgse.os_plat != "Linux":
+        with keep.running():
+            success = pipeline.run(submit, idle, estimate=estimate)
+    else:
+        success = pipeline.run(submit, idle, estimate=estimate)
+    job_queue().poll()
+    waitingJobs = []
+    waitingPipeline = None
+    # Only a run of every stage is a whole-pipeline time; a resumed or partial one is not (its stages still count)
+    if success and len(started) == len(pipeline.stages) and wgse.runhistory_oFN:
+        RunHistory(wgse.runhistory_oFN).record(pipeline.name, size, wgse.os_threads, 0, time.time() - start_time,
+                                               etime, DONE, start_time)
+
+    if wgse.window and wgse.dnaImage and parent:
+        finishWait()
+    if pipeline.failed:
+        DEBUG(f'Pipeline {pipeline.name} stopped; stage {pipeline.failed.name} failed')
+    return success
+
+
+def show_please_wait_window(reason, parent, etime=None):
+    global pleaseWaitWindow, progressLabel
 
     # Make code more robust to errors; external language file and expected time table may not be up-to-date
-    etime = wgse.expected_time.get(reason, 0)
-    # etime = round(min(1.5, etime * wgse.BAM.relfsize)) # See note below on adjusting time relative to 60 GB nominal
-    tlabel = time_label(etime) if etime else f"unknown ({reason}?)"
+    # The expected time passed in is learned from the run history; by input size and threads (expected_time())
+    etime = etime or wgse.expected_time.get(reason, 0)
+    tlabel = time_label(round(etime)) if etime else f"unknown ({reason}?)"
     verbose_reason = wgse.lang.i18n.get(reason, f"(Internal Translation Error: {reason} unknown)")
     DEBUG(f'In Please Wait: {verbose_reason}, Expected Wait: {tlabel}, Start')
-    """
-        We will adjust expected wait time by amount relative to nominal 45 GB 30x WGS file size. Floor of 0.01 adj.
-        Using linear but likely not linear.  Idea is smaller, subsetted BAMs may take less time? True for operations
-        that have to scan the whole file but not others?  Need to study this further and drop if nonsense.
-        Does not seem to work as written; commenting out for now
-    """
 
     font = wgse.fonts.table if wgse and wgse.fonts else \
         {'14': ("Times New Roman", 14), '28b': ("Arial Black", 28, "Bold")}
@@ -190,6 +380,8 @@ def show_please_wait_window(reason, parent):
     Label(pleaseWaitWindow, text=f'{wgse.lang.i18n["ExpectedWait"]} {tlabel}.').grid(column=0, row=2, padx=1, pady=1)
     time_now = time.ctime()
     Label(pleaseWaitWindow, text=f'{wgse.lang.i18n["StartedAt"]} {time_now}').grid(column=0, row=3, padx=1, pady=1)
+    progressLabel = Label(pleaseWaitWindow, text="")        # Filled in from the job progress events while waiting
+    progressLabel.grid(column=0, row=4, padx=1, pady=1)
     # TODO add user abort button that is caught, kills job waiting on, and takes one back where?
     pleaseWaitWindow.update()
     pleaseWaitWindow.grab_set()
@@ -198,9 +390,14 @@ def show_please_wait_window(reason, parent):
 def cancelWait():
     global pleaseWaitWindow
 
-    # DEBUG("cancelWait; unfortunately not yet implemented!")
-    # TODO Setup exception that can be caught by threads executing pleaseWait
-    pleaseWaitWindow.destroy()
+    # Closing the Please Wait window cancels (kills) the job(s) being waited on
+    if waitingPipeline:
+        waitingPipeline.cancel()
+    for job in list(waitingJobs):
+        job_queue().cancel(job)
+    if pleaseWaitWindow and pleaseWaitWindow.winfo_exists():
+        pleaseWaitWindow.destroy()
+    pleaseWaitWindow = None
 
 
 def abortWait():
@@ -210,51 +407,43 @@ def abortWait():
 
 
 def finishWait():
-    # Todo implement finishWait()
-    # DEBUG("finishWait called; not yet implemented.")
-    cancelWait()
+    global pleaseWaitWindow
 
+    if pleaseWaitWindow and pleaseWaitWindow.winfo_exists():
+        pleaseWaitWindow.destroy()
+    pleaseWaitWindow = None
 
-def run_bash_script(script_title, script_contents, parent=wgse.window, direct=False):
-    """
-        Main entry point for commandprocessor module.  Two modes: Direct or not.  In Direct, the
-        script_contents is a shlex like list of a single, parsed command line.  No need for quotes, etc.
-        In not Direct, we create a BASH script file in Temp from the supplied (multi-line) command string,
-        then run the newly created bash script.
-    """
-    if not direct:
-        script_oFN = f'{wgse.tempf.oFP}{script_title}.sh'
 
-        if os.path.isfile(script_oFN):
-            os.remove(script_oFN)
+def _write_bash_script(script_title, script_contents, unique=False):
+    """ Write the BASH script file in Temp; return the command list to run it. Unique names for queued jobs. """
+    script_FB = f'{script_title}_{os.getpid()}_{next(scriptCount)}' if unique else script_title
+    script_oFN = f'{wgse.tempf.oFP}{script_FB}.sh'
 
-        with open(script_oFN, "wb") as f:          # 15 Mar 2020 REH Changed to binary write to keep Unix \n format
-            f.write("#!/usr/bin/env bash\n".encode())   # env with bash -x parameter not supported universally
-            f.write(script_contents.encode())
-        os.chmod(script_oFN, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)  # Historic; needed as sourced by BASH now?
+    if os.path.isfile(script_oFN):
+        os.remove(script_oFN)
 
-        # Full path specified so do not need to pre-pend './' for Linux; Windows needs BASH command to start .sh files
-        # BASH script file. So no need to parse script content using shlex. We create our own parsed list here
-        if wgse.DEBUG_MODE:
-            command = [wgse.bashx_oFN, "-x", script_oFN]    # if wgse.os_plat == "Windows" else [script_oFN]
-        else:
-            command = [wgse.bashx_oFN, script_oFN]          # if wgse.os_plat == "Windows" else [script_oFN]
+    with open(script_oFN, "wb") as f:          # 15 Mar 2020 REH Changed to binary write to keep Unix \n format
+        f.write("#!/usr/bin/env bash\n".encode())   # env with bash -x parameter not supported universally
+        f.write(script_contents.encode())
+    os.chmod(script_oFN, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)  # Historic; needed as sourced by BASH now?
 
-    else:
-        command = script_contents  # Already passed as a single command list
+    # Full path specified so do not need to pre-pend './' for Linux; Windows needs BASH command to start .sh files
+    # BASH script file. So no need to parse script content using shlex. We create our own parsed list here
+    if wgse.DEBUG_MODE:
+        return [wgse.bashx_oFN, "-x", script_oFN]    # if wgse.os_plat == "Windows" else [script_oFN]
+    return [wgse.bashx_oFN, script_oFN]              # if wgse.os_plat == "Windows" else [script_oFN]
 
-    DEBUG(f'Starting command: {" ".join(command).strip()}')
 
-    if wgse.window and wgse.dnaImage:       # if windowing system created and setup (for outside, command line calls)
-        show_please_wait_window(script_title, parent)
+def run_bash_script(script_title, script_contents, parent=wgse.window, direct=False, inputs=()):
+    """
+        Main entry point for commandprocessor module.  Two modes: Direct or not.  In Direct, the
+        script_contents is a shlex like list of a single, parsed command line.  No need for quotes, etc.
+        In not Direct, we create a BASH script file in Temp from the supplied (multi-line) command string,
+        then run the newly created bash script.  Blocks until done (see submit_bash_script for the queued form).
+        inputs: the file(s) the script reads through, for its progress (default: the largest file it reads).
+    """
+    command = script_contents if direct else _write_bash_script(script_title, script_contents)
 
-    # Keepawake on Linux requires elevated (SUDO) privileges. No way to request a drop of elevated.
-    # elevate(show_console=True)  # Request elevated privilages from the user on Linux
-    if wgse.os_plat != "Linux":     # and etime > 3600 and os.getuid() != 0:
-        with keep.running():
-            run_external_program(script_title, command)
-    else:
-        run_external_program(script_title, command)
+    DEBUG(f'Starting command: {" ".join(command).strip()}')
 
-    if wgse.window and wgse.dnaImage:
-        finishWait()
+    return run_external_program(script_title, command, parent or wgse.window, inputs)
@@ -20,6 +20,8 @@ Due to rounding errors, the last bucket may not be the same size of base-pairs a
 
 Detects if a FASTQ instead of FASTA and reports error. Skips any sequence where the name is not found in the
 DICT file read in to start.  Key is not just the SN but also LN fields in the DICT file.
+
+Superseded by the NumPy, multi-process nrunscan.py (same outputs); kept as the reference for its benchmark.
 """
 
 import sys
@@ -0,0 +1,198 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) to replace the awk post-processor of "samtools depth" in the bin coverage
+stats (bamfiles.get_bincvg_stats).  The awk script parsed every text column of ~3 billion lines to increment its
+bucket counters.  Here the depth stream is read in large binary chunks, the position and depth columns are parsed with
+NumPy vector operations, and a full per-sequence depth histogram (0 to DEPTH_CAP, last entry catching everything
+deeper, with a separate sum of those deep values) is accumulated with np.bincount.
+
+Because the whole histogram is kept (and saved in a small .npz), the fixed 0, 1-3, 4-7, 8+ table that
+process_bincvg_stats() reads is simply one view of it. Any other bucket edges can be produced later from the saved
+histogram without another pass over the BAM (see bucket_table() and the "rebucket" command below).
+
+    samtools depth -aa x.bam | python3 depthhist.py - x_bincvg.npz [x_bincvg.csv]      (histogram, optional table)
+    python3 depthhist.py merge out.npz out.csv part1.npz part2.npz ...                  (sum partial histograms)
+    python3 depthhist.py rebucket x_bincvg.npz 1,10,20,30,50                           (table with other edges)
+"""
+
+import sys
+import os
+
+import numpy as np
+
+DEPTH_CAP = 1024            # Histogram slots 0 .. DEPTH_CAP-1 are exact; slot DEPTH_CAP collects all deeper positions
+CHUNK_SIZE = 64 * 2**20     # Bytes read from the depth stream at a time
+DEFAULT_EDGES = (1, 4, 8)   # Buckets 0, 1-3, 4-7, 8+ of the original awk script
+
+BINCVG_HEADER = ("chr", "zero", "nonzero", "sum nz", "fract nz", "avg nz", "avg all",
+                 "TotalBC", "Bet1-3", "sum Bet1-3", "Bet4-7", "sum Bet4-7", "Gtr7", "sum Gtr7")
+
+
+def parse_int_fields(buf, begin, end):
+    """ Vectorized decimal parse of the digit fields buf[begin[i]:end[i]] (all arrays); one pass per digit place """
+    length = end - begin
+    value = np.zeros(len(end), dtype=np.int64)
+    for place in range(int(length.max()) if len(length) else 0):
+        digit = buf[np.maximum(end - 1 - place, 0)].astype(np.int64) - 48
+        value += np.where(place < length, digit, 0) * 10 ** place
+    return value
+
+
+class DepthHistogram:
+    """
+    Per sequence depth histograms.  Sequence names are kept in the order first seen (samtools depth output order).
+    hist[name] is an int64 array of DEPTH_CAP+1 counts; deep[name] the sum of the depths counted in the last slot.
+    """
+
+    def __init__(self):
+        self.hist = {}
+        self.deep = {}
+
+    def _add(self, name, depth):
+        if name not in self.hist:
+            self.hist[name] = np.zeros(DEPTH_CAP + 1, dtype=np.int64)
+            self.deep[name] = 0
+        self.hist[name] += np.bincount(np.minimum(depth, DEPTH_CAP), minlength=DEPTH_CAP + 1)
+        self.deep[name] += int(depth[depth >= DEPTH_CAP].sum())
+
+    def add_lines(self, data):
+        """ Add a bytes block of complete "name<tab>pos<tab>depth<newline>" lines (samtools depth, single file) """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        eol = np.flatnonzero(buf == 10)
+        tabs = np.flatnonzero(buf == 9)
+        if len(eol) == 0:
+            return
+        if len(tabs) != 2 * len(eol):
+            raise ValueError("depth stream is not three tab separated columns")
+        tabs = tabs.reshape(-1, 2)
+        pos = parse_int_fields(buf, tabs[:, 0] + 1, tabs[:, 1])
+        depth = parse_int_fields(buf, tabs[:, 1] + 1, eol)
+
+        # Sequence names can only change where the position does not simply step by one (new sequence or BED region)
+        # or the name field changes its length, byte sum or last character. Only those (few) lines are decoded.
+        line_starts = np.concatenate(([0], eol[:-1] + 1))
+        name_len = tabs[:, 0] - line_starts
+        name_sum = np.add.reduceat(buf, np.stack((line_starts, tabs[:, 0]), axis=1).ravel(), dtype=np.int64)[::2]
+        name_end = buf[tabs[:, 0] - 1]
+        changed = (np.diff(pos) != 1) | (np.diff(name_len) != 0) | (np.diff(name_sum) != 0) | (np.diff(name_end) != 0)
+        segments = []       # (name, first line) for each run of lines with the same sequence name
+        for line in np.concatenate(([0], np.flatnonzero(changed) + 1)):
+            name = data[line_starts[line]:tabs[line, 0]].decode()
+            if not segments or segments[-1][0] != name:
+                segments.append((name, int(line)))
+        for index, (name, first) in enumerate(segments):
+            last = segments[index + 1][1] if index + 1 < len(segments) else len(eol)
+            self._add(name, depth[first:last])
+
+    def add_stream(self, stream, chunk_size=CHUNK_SIZE):
+        """ Read a binary depth stream (e.g. sys.stdin.buffer) in large chunks; only whole lines parsed at a time """
+        remainder = b""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            data = remainder + chunk
+            cut = data.rfind(b"\n") + 1
+            self.add_lines(data[:cut])
+            remainder = data[cut:]
+        if remainder.strip():
+            self.add_lines(remainder + b"\n")
+
+    def merge(self, other):
+        """ Sum another (partial; e.g. other regions of the same sequences) histogram into this one """
+        for name in other.hist:
+            if name in self.hist:
+                self.hist[name] += other.hist[name]
+                self.deep[name] += other.deep[name]
+            else:
+                self.hist[name] = other.hist[name].copy()
+                self.deep[name] = other.deep[name]
+
+    def save(self, npz_oFN):
+        names = list(self.hist)
+        np.savez_compressed(npz_oFN, names=np.array(names, dtype=str),
+                            hist=np.array([self.hist[name] for name in names]).reshape(len(names), DEPTH_CAP + 1),
+                            deep=np.array([self.deep[name] for name in names], dtype=np.int64))
+
+    @classmethod
+    def load(cls, npz_oFN):
+        histogram = cls()
+        with np.load(npz_oFN) as saved:
+            for name, hist, deep in zip(saved["names"], saved["hist"], saved["deep"]):
+                histogram.hist[str(name)] = hist.astype(np.int64)
+                histogram.deep[str(name)] = int(deep)
+        return histogram
+
+    def bucket_table(self, name, edges=DEFAULT_EDGES):
+        """
+        Return (counts, sums) for buckets [0, edges[0]), [edges[0], edges[1]), ... [edges[-1], inf) of one sequence.
+        Edges must be increasing and not above DEPTH_CAP.
+        """
+        hist = self.hist[name]
+        depths = np.arange(DEPTH_CAP + 1, dtype=np.int64)
+        weighted = hist * depths
+        weighted[DEPTH_CAP] = self.deep[name]
+        bounds = [0] + list(edges) + [DEPTH_CAP + 1]
+        counts = [int(hist[lo:hi].sum()) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        sums = [int(weighted[lo:hi].sum()) for lo, hi in zip(bounds[:-1], bounds[1:])]
+        return counts, sums
+
+    def write_bincvg(self, csv_oFN, order=None):
+        """ Write the standard _bincvg.csv / _wescvg.csv table; same columns and number formats as the awk script """
+        names = [name for name in order if name in self.hist] if order else []
+        listed = set(names)
+        names += [name for name in self.hist if name not in listed]
+        with open(csv_oFN, "w") as covfile:
+            covfile.write("\t".join(BINCVG_HEADER) + "\n")
+            for name in names:
+                (zero, n3, n7, nI), (_, sumn3, sumn7, sumnI) = self.bucket_table(name)
+                nz = n3 + n7 + nI
+                sumnz = sumn3 + sumn7 + sumnI
+                totalbc = zero + nz + 1
+                covfile.write(f'{name}\t{zero}\t{nz}\t{sumnz}\t{nz / totalbc:f}\t{sumnz / (nz + 1):f}\t'
+                              f'{sumnz / totalbc:f}\t{totalbc - 1}\t{n3}\t{sumn3}\t{n7}\t{sumn7}\t{nI}\t{sumnI}\n')
+        return len(names)
+
+    def write_buckets(self, out, edges):
+        """ Write a table of user specified bucket edges (count and fraction of positions per bucket) """
+        labels = [f'{lo}-{hi - 1}' for lo, hi in zip([0] + list(edges), list(edges))] + [f'{edges[-1]}+']
+        out.write("chr\ttotal\t" + "\t".join(f'{label}\tfract {label}' for label in labels) + "\n")
+        for name in self.hist:
+            counts, _ = self.bucket_table(name, edges)
+            total = sum(counts)
+            out.write(f'{name}\t{total}\t' + "\t".join(f'{cnt}\t{cnt / max(total, 1):f}' for cnt in counts) + "\n")
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) >= 3 and sys.argv[1] == "rebucket":
+        bucket_edges = [int(edge) for edge in sys.argv[3].split(",")] if len(sys.argv) > 3 else list(DEFAULT_EDGES)
+        DepthHistogram.load(sys.argv[2]).write_buckets(sys.stdout, bucket_edges)
+    elif len(sys.argv) >= 4 and sys.argv[1] == "merge":
+        merged = DepthHistogram()
+        for part_oFN in sys.argv[4:]:
+            merged.merge(DepthHistogram.load(part_oFN))
+        merged.save(sys.argv[2])
+        merged.write_bincvg(sys.argv[3])
+    elif 3 <= len(sys.argv) <= 4:
+        histogram = DepthHistogram()
+        if sys.argv[1] == "-":
+            histogram.add_stream(sys.stdin.buffer)
+        else:
+            with open(sys.argv[1], "rb") as depth_file:
+                histogram.add_stream(depth_file)
+        histogram.save(sys.argv[2])
+        if len(sys.argv) == 4:
+            histogram.write_bincvg(sys.argv[3])
+    else:
+        print(f'***ERROR: Wrong parameters for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} depth_file out.npz [out.csv]      (depth_file can be "-" for stdin)',
+              file=sys.stderr, flush=True)
+        print(f'   python3 {module} merge out.npz out.csv part.npz ...', file=sys.stderr, flush=True)
+        print(f'   python3 {module} rebucket in.npz edge1,edge2,...', file=sys.stderr, flush=True)
+        exit(1)
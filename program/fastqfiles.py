@@ -13,67 +13,35 @@
 
 import os       # for path, stat
 import re
-import gzip
-from math import sqrt
 
 from utilities import DEBUG, is_legal_path, nativeOS, universalOS, unquote, Error, Warning, wgse_message
 from commandprocessor import run_bash_script
+from fastqstats import sidecar_stats
 import settings as wgse
 
 
-def process_FASTQ(fastq_FN, paired=True):
+def process_FASTQ(fastq_FN, paired=True, exact=False):
     """
     Pseudo FASTQ stats processing like for BAM module process_BAM_header and process_BAM_body.
     No FASTQ module yet so used with the alignment command for now.
     Takes in the name of the primary FASTQ file and if paired (simply doubles result if paired)
     Returns the number of segments and avg read length of the FASTQ (so RAW gbases can be calculated as well)
     As well as tries to identify the sequencer.
+    The stats come from the fastqstats engine: by default its quick mode (reads sampled across the whole file; the
+    segment count estimated from them), with exact every read counted (in parallel worker processes).  Kept in a
+    .wgsestats sidecar next to the FASTQ; so only the first call scans the file.
     """
 
     fastq_oFN = nativeOS(fastq_FN)
-    line_cnt = char_cnt = 0
-    seqid = ""
-    rcnt = rlen = rmean = rM2 = 0
-    with gzip.open(fastq_oFN, 'rt') as f:
-        for line in f:
-            if line_cnt % 4 == 2:       # more common case; checking length of sequencer read
-                rlen += len(line)
-                if rlen > 1:
-                    rcnt += 1
-                    rdelta = rlen - rmean
-                    rmean += rdelta / rcnt
-                    rdelta2 = rlen - rmean
-                    rM2 += rdelta * rdelta2
-            elif line_cnt == 0:         # Only at start; while skipping header or to read first sequncer ID
-                if line[0] == '#':      # Skip header; do not count (new spec coming out with header)
-                    continue
-                else:   # line[0] == '@':   # First line and sequencer label
-                    seqid = determine_sequencer(line.strip().split("\t")[0][1:])
-                    line_cnt = 1
-            elif line_cnt > 20000:      # Only at end; Average first 5K segments (4 lines per segment)
-                line_cnt -= 1
-                break
-            char_cnt += len(line)
-            line_cnt += 1
-
-    avg_read_length = avg_read_stddev = 0
-    if rcnt > 2:
-        rstd = sqrt(rM2 / (rcnt - 1))
-        avg_read_length = rmean
-        avg_read_stddev = rstd
-
-    # Counting all the lines; even as a wc -l subprocess, is just too long. So do a quick estimate based on the
-    #  character count in the first 10,000 lines above (2500 read segments) divided into the file size
-    numsegs = 0
-    fastq_stats = os.stat(fastq_oFN)
-    if fastq_stats.st_size > 0:
-        numsegs = int(fastq_stats.st_size / (char_cnt / (line_cnt / 4)))
-        numsegs *= 2 if paired else 1
+    stats = sidecar_stats(fastq_oFN, exact=exact)
+    seqid = determine_sequencer(stats.seqid.strip().split("\t")[0]) if stats.seqid else ""
+    numsegs = stats.reads * (2 if paired else 1)
 
     DEBUG(
-        f'FASTQ Stats: ID - "{seqid}, # segs - {numsegs},' 
-        f' avg read length - {avg_read_length}, read len stddev - {avg_read_stddev}')
-    return seqid, numsegs, avg_read_length          # e.g. return "Illumima", 660000000, 150
+        f'FASTQ Stats: ID - "{seqid}, # segs - {numsegs}{"" if stats.exact else " (est)"},'
+        f' avg read length - {stats.avg_read_length}, read len stddev - {stats.read_length_stddev},'
+        f' GC - {stats.gc:.3f}, Q30 - {stats.q30:.3f}')
+    return seqid, numsegs, stats.avg_read_length    # e.g. return "Illumima", 660000000, 150
 
 
 def determine_sequencer(seqid):
@@ -0,0 +1,139 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) to split a FASTQ file into shards for the sharded alignment mode of
+button_align_BAM (align_mode "Sharded").  The FASTQ (gzip'ed or not) is cut into blocks of BLOCK_READS whole reads;
+block i goes to shard i % shards.  The FASTQ is read (decompressed) once and the blocks dealt round-robin to one
+BGZF file per shard (prefix_shardNN.fastq.gz; compressed on a pool of threads).  As blocks are counted in reads, not
+bytes, splitting the R1 and R2 files of a pair gives the same read pairs in the same order in each shard:
+
+    python3 fastqshard.py R1.fastq.gz 8 sample_R1 ; python3 fastqshard.py R2.fastq.gz 8 sample_R2
+    bwa mem ref.fa sample_R1_shard03.fastq.gz sample_R2_shard03.fastq.gz | ...
+
+Line ends are found with NumPy on large chunks so the split costs little more than the decompression of the file
+and the compression of the shards.  Each shard is then aligned and coordinate sorted on its own (so with a fraction
+of the sort memory) and the sorted shards merged.  A failed shard can be aligned again by itself.
+
+    python3 fastqshard.py fastq_file shards out_prefix [block_reads]
+"""
+
+import sys
+import os
+import gzip
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+from bgzf import BGZFWriter
+
+BLOCK_READS = 100000        # Reads (4 line records) per block dealt round-robin to the shards
+CHUNK_SIZE = 16 * 2**20     # Bytes read from the (decompressed) FASTQ at a time
+SHARD_BYTES = 4 * 10**9     # Target compressed FASTQ bytes per shard when choosing the number of shards
+MAX_SHARDS = 32             # Merge opens every shard at once; stay well below the MacOS open file limit
+
+
+def shard_count(fastq_size):
+    """ Number of shards for FASTQ(s) of fastq_size (compressed) bytes; at least 2 """
+    return max(2, min(MAX_SHARDS, -(-fastq_size // SHARD_BYTES)))
+
+
+def open_fastq(fastq_oFN):
+    """ Open a plain or gzip'ed (including bgzip'ed) FASTQ for binary reading; decided by the magic bytes """
+    with open(fastq_oFN, "rb") as probe:
+        magic = probe.read(2)
+    return gzip.open(fastq_oFN, "rb") if magic == b'\x1f\x8b' else open(fastq_oFN, "rb")
+
+
+class FASTQBlocks:
+    """ Reads a FASTQ stream in blocks of whole records (4 lines each) """
+
+    def __init__(self, fastq_file):
+        self.file = fastq_file
+        self.rest = b''             # Read from the file but past the end of the last block returned
+
+    def read(self, records):
+        """ Next block of (up to) records FASTQ records as bytes; b'' at the end.  ValueError if not FASTQ. """
+        need = records * 4
+        parts, found = [], 0
+        data = self.rest
+        while True:
+            newlines = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)
+            if found + len(newlines) >= need:
+                cut = int(newlines[need - found - 1]) + 1
+                parts.append(data[:cut])
+                self.rest = data[cut:]
+                break
+            parts.append(data)
+            found += len(newlines)
+            data = self.file.read(CHUNK_SIZE)
+            if not data:
+                self.rest = b''
+                break
+
+        block = b''.join(parts)
+        if block and not block.endswith(b'\n'):     # Last line of the file without a line end
+            block += b'\n'
+        if block and (block[:1] != b'@' or block.count(b'\n') % 4):
+            raise ValueError("Not FASTQ or truncated: block does not hold whole 4 line records")
+        return block
+
+
+def shard_names(out_FPB, shards):
+    """ File names of the shards split_fastq writes for out_FPB (path and file base) """
+    return [f'{out_FPB}_shard{shard:02d}.fastq.gz' for shard in range(shards)]
+
+
+def split_fastq(fastq_oFN, out_oFNs, block_reads=BLOCK_READS, threads=None):
+    """
+    Deal the blocks of the FASTQ round-robin to the shard files out_oFNs (BGZF) in one pass over the FASTQ; returns
+    the number of blocks written to each.  On an error the shard files written so far are removed.
+    """
+    written = [0] * len(out_oFNs)
+    out_files = []
+    try:
+        with open_fastq(fastq_oFN) as fastq_file, ThreadPoolExecutor(threads or os.cpu_count() or 1) as pool:
+            for out_oFN in out_oFNs:
+                out_files.append(open(out_oFN, "wb"))
+            writers = [BGZFWriter(out_file, pool=pool) for out_file in out_files]
+            blocks = FASTQBlocks(fastq_file)
+            index = 0
+            while True:
+                block = blocks.read(block_reads)
+                if not block:
+                    break
+                writers[index % len(writers)].write(block)
+                written[index % len(writers)] += 1
+                index += 1
+            for writer in writers:
+                writer.close()
+    except (OSError, ValueError):
+        for out_file in out_files:
+            out_file.close()
+        for out_oFN in out_oFNs:
+            if os.path.exists(out_oFN):
+                os.remove(out_oFN)
+        raise
+    finally:
+        for out_file in out_files:
+            out_file.close()
+    return written
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) in (4, 5) and all(arg.isdigit() for arg in sys.argv[2:3] + sys.argv[4:]) and int(sys.argv[2]):
+        try:
+            split_fastq(sys.argv[1], shard_names(sys.argv[3], int(sys.argv[2])),
+                        int(sys.argv[4]) if len(sys.argv) == 5 else BLOCK_READS)
+        except (OSError, ValueError) as err:
+            print(f'***ERROR: {module}: {err}', file=sys.stderr, flush=True)
+            exit(1)
+    else:
+        print(f'***ERROR: Wrong parameters for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} fastq_file shards out_prefix [block_reads]   (writes out_prefix_shardNN.fastq.gz)',
+              file=sys.stderr, flush=True)
+        exit(1)
@@ -0,0 +1,446 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+FASTQ statistics engine (module fastqstats) for fastqfiles.process_FASTQ: the read count, read length distribution,
+base composition and quality histogram of a plain, gzip'ed or bgzip'ed (BGZF) FASTQ file.  Two modes:
+
+  exact:  every read is counted.  A BGZF file is cut into ranges of TASK_BYTES of (independent) BGZF blocks each
+          decompressed in a worker process; a gzip'ed file (one deflate stream) is decompressed here and its chunks
+          handed to the workers.  The lines of a piece are found with a NumPy flatnonzero of its newlines and their
+          lengths and byte counts gathered with np.bincount; by line number mod 4 as the piece need not start at a
+          read.  The pieces come back in order, so which of the four is the sequence and which the quality line
+          follows from the newline count before it; the line cut at a piece boundary is put together here.
+  quick:  SAMPLES places spread over the (compressed) file are read; each by seeking to the next BGZF block (or any
+          byte of a plain file) and syncing to the next read.  The read count is estimated from the reads per file
+          byte in the samples.  A gzip'ed file cannot be entered in the middle; its start is sampled instead.
+
+The stats of a scan are kept next to the FASTQ in a file.fastq.gz.wgsestats sidecar: a JSON line (the key, the read
+count, read length, etc.) followed by the histograms as a binary blob.  The key is the FASTQ size and mtime; and
+when only the mtime differs (a copy), the content fingerprint of statscache (a hash of its head and tail).  So later
+users (align, fastp, FastQC, BAMFile.find_FASTQs) read it back instead of scanning the FASTQ again.  The reports
+made from a FASTQ (fastp, FastQC) are recorded in it too; they are current as long as the FASTQ is unchanged.
+
+    python3 fastqstats.py [-e] [-p processes] file.fastq.gz        (print the stats; -e exact)
+"""
+
+import sys
+import os
+import re
+import json
+import zlib
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+from fastqshard import open_fastq
+from statscache import bam_fingerprint     # The same head / tail content hash serves for a FASTQ
+
+TASK_BYTES = 32 * 2**20     # Compressed bytes of BGZF blocks per worker task (exact mode)
+CHUNK_SIZE = 16 * 2**20     # Decompressed bytes per worker task of a gzip'ed or plain FASTQ (exact mode)
+SAMPLES = 64                # Places sampled in the quick mode
+SAMPLE_BYTES = 2**19        # Compressed (or plain) bytes read at each sample
+SIDECAR_FS = ".wgsestats"   # Stats sidecar file extension (added to the FASTQ file name)
+SIDECAR_VERSION = 1
+HISTOGRAMS = ("lengths", "bases", "quals")      # FASTQStats arrays in the sidecar blob; in this order
+BGZF_HEADER = re.compile(rb'\x1f\x8b\x08\x04.{6}\x06\x00BC\x02\x00', re.DOTALL)
+
+
+def fastq_kind(fastq_oFN):
+    """ "bgzf", "gzip" or "plain" by the magic bytes of the file """
+    with open(fastq_oFN, "rb") as f:
+        head = f.read(18)
+    return "bgzf" if BGZF_HEADER.match(head) else "gzip" if head[:2] == b'\x1f\x8b' else "plain"
+
+
+def line_stats(data):
+    """
+    (newlines, head, tail, lengths, counts) of a piece of FASTQ; head is up to and including the first newline (the
+    end of a line begun before the piece), tail what follows the last newline.  lengths[k] and counts[k] are the
+    line length and byte histograms of the whole lines in between whose number (from 0) is k mod 4.
+    """
+    array = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(array == 10)
+    if len(ends) < 2:
+        return len(ends), bytes(data[:int(ends[0]) + 1]) if len(ends) else data, \
+            bytes(data[int(ends[0]) + 1:]) if len(ends) else b'', None, None
+    first, last = int(ends[0]) + 1, int(ends[-1]) + 1
+    body, ends = array[first:last], ends[1:] - first
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    lengths = ends - starts - (body[np.maximum(ends - 1, 0)] == 13)     # Without the line end (\n or \r\n)
+    labels = np.repeat((np.arange(len(ends)) % 4).astype(np.int16), ends - starts + 1)
+    counts = np.bincount(labels * 256 + body, minlength=1024).reshape(4, 256)
+    return len(ends) + 1, bytes(data[:first]), bytes(data[last:]), [np.bincount(lengths[k::4]) for k in range(4)], \
+        counts
+
+
+class FASTQStats:
+    """
+    Read statistics of a FASTQ file (see module).  reads is the read count (estimated unless exact); lengths the
+    read length histogram, bases the byte counts of the sequence lines and quals of the quality lines; of all the
+    reads (exact) or of the sampled ones.  seqid is the name line (without the @) of the first read.
+    """
+
+    def __init__(self):
+        self.reads, self.sampled, self.exact, self.seqid = 0, 0, False, ""
+        self.lengths = np.zeros(1, dtype=np.int64)
+        self.bases = np.zeros(256, dtype=np.int64)
+        self.quals = np.zeros(256, dtype=np.int64)
+        self._lines, self._pending = 0, b''
+
+    def _lengths(self, histogram):
+        if len(histogram) > len(self.lengths):
+            self.lengths = np.concatenate((self.lengths, np.zeros(len(histogram) - len(self.lengths), np.int64)))
+        self.lengths[:len(histogram)] += histogram
+
+    def _line(self, line, number):
+        """ Add one whole line (without line end) that is line number of the file """
+        line = line.rstrip(b'\r')
+        if number == 0:
+            self.seqid = line[1:].decode(errors="replace")
+        elif number % 4 == 1:
+            self._lengths(np.bincount([len(line)]))
+            self.bases += np.bincount(np.frombuffer(line, dtype=np.uint8), minlength=256)
+        elif number % 4 == 3:
+            self.quals += np.bincount(np.frombuffer(line, dtype=np.uint8), minlength=256)
+
+    def _merge(self, lengths, counts, first):
+        """ Add the line_stats histograms whose group 0 is line number first of the file """
+        for group in range(4):
+            if (first + group) % 4 == 1:
+                self._lengths(lengths[group])
+                self.bases += counts[group]
+            elif (first + group) % 4 == 3:
+                self.quals += counts[group]
+        self.bases[[10, 13]] = self.quals[[10, 13]] = 0
+
+    def add(self, result):
+        """ Add the line_stats of the next piece of the file """
+        newlines, head, tail, lengths, counts = result
+        if not newlines:
+            self._pending += head
+            return
+        self._line(self._pending + head[:-1], self._lines)
+        if newlines > 1:
+            self._merge(lengths, counts, self._lines + 1)
+        self._lines += newlines
+        self._pending = tail
+
+    def finish(self):
+        """ After the last piece; the read count of an exact scan """
+        if self._pending.strip():           # Last line without a line end
+            self._line(self._pending, self._lines)
+            self._lines += 1
+        self.reads = self.sampled = self._lines // 4
+        self.exact = True
+        return self
+
+    def add_records(self, piece):
+        """ Add the sampled whole reads of piece (starts at a read); returns their number """
+        newlines, head, _, lengths, counts = line_stats(piece)
+        if newlines > 1:
+            self._merge(lengths, counts, 1)
+        self.sampled += newlines // 4
+        return newlines // 4
+
+    @property
+    def avg_read_length(self):
+        total = self.lengths.sum()
+        return float(np.dot(np.arange(len(self.lengths)), self.lengths) / total) if total else 0
+
+    @property
+    def read_length_stddev(self):
+        total = self.lengths.sum()
+        if total < 2:
+            return 0
+        deviation = np.arange(len(self.lengths)) - self.avg_read_length
+        return float(np.sqrt(np.dot(deviation * deviation, self.lengths) / (total - 1)))
+
+    @property
+    def gc(self):
+        """ Fraction of G and C of the called (A, C, G, T) bases """
+        acgt = sum(int(self.bases[ord(base)] + self.bases[ord(base.lower())]) for base in "ACGT")
+        gc = sum(int(self.bases[ord(base)] + self.bases[ord(base.lower())]) for base in "GC")
+        return gc / acgt if acgt else 0
+
+    def quality_histogram(self, offset=33):
+        """ Base count per Phred quality value (index) """
+        return self.quals[offset:]
+
+    @property
+    def q30(self):
+        """ Fraction of the bases with quality 30 or more """
+        quals = self.quality_histogram()
+        return float(quals[30:].sum() / quals.sum()) if quals.sum() else 0
+
+
+def _bgzf_range(fastq_oFN, start, end):
+    """ line_stats of the BGZF blocks beginning in the file byte range start to end """
+    parts = []
+    with open(fastq_oFN, "rb") as f:
+        f.seek(start)
+        window = f.read(2**17)
+        match = BGZF_HEADER.search(window)
+        while match is None and len(window) > 18 and start < end:      # Block headers are at most 64 KiB apart
+            start += len(window) - 17
+            f.seek(start)
+            window = f.read(2**17)
+            match = BGZF_HEADER.search(window)
+        offset = start + match.start() if match else end
+        f.seek(offset)
+        while offset < end:
+            header = f.read(18)
+            if len(header) < 18:
+                break
+            bsize = int.from_bytes(header[16:18], "little") + 1
+            parts.append(zlib.decompress(f.read(bsize - 18)[:-8], -15))
+            offset += bsize
+    return line_stats(b''.join(parts))
+
+
+def _chunks(fastq_oFN, kind):
+    """ Worker tasks (function, arguments) of an exact scan, in file order """
+    if kind == "bgzf":
+        size = os.path.getsize(fastq_oFN)
+        for start in range(0, size, TASK_BYTES):
+            yield _bgzf_range, (fastq_oFN, start, min(start + TASK_BYTES, size))
+    else:
+        with open_fastq(fastq_oFN) as f:
+            while True:
+                data = f.read(CHUNK_SIZE)
+                if not data:
+                    break
+                yield line_stats, (data,)
+
+
+def _sync(data):
+    """ Offset of the first whole read in data (a name, sequence, + and quality line of the same length); or -1 """
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8) == 10)[:12].tolist()
+    starts = [0] + [end + 1 for end in ends]
+    for line in range(1, len(starts) - 4):      # The first line may be cut; never taken
+        name, seq, plus, qual, after = starts[line:line + 5]
+        if data[name:name + 1] == b'@' and data[plus:plus + 1] == b'+' and plus - seq == after - qual:
+            return name
+    return -1
+
+
+def _whole_reads(data):
+    """ The whole reads of a sampled piece of FASTQ; b'' if none """
+    start = _sync(data)
+    if start < 0:
+        return b''
+    ends = np.flatnonzero(np.frombuffer(data, dtype=np.uint8)[start:] == 10)
+    return data[start:start + int(ends[len(ends) // 4 * 4 - 1]) + 1] if len(ends) >= 4 else b''
+
+
+def _samples(fastq_oFN, kind, size):
+    """ (decompressed piece, file bytes it took) at SAMPLES places of a BGZF or plain file; at the start of gzip """
+    with open(fastq_oFN, "rb") as f:
+        if kind == "gzip":
+            decompressor, data, used = zlib.decompressobj(31), b'', 0
+            while used < SAMPLES * SAMPLE_BYTES and not decompressor.eof:
+                compressed = f.read(2**16)
+                if not compressed:
+                    break
+                data += decompressor.decompress(compressed)
+                used += len(compressed)
+            yield data, used
+            return
+        covered = 0             # File read up to here; a small file has fewer samples, none overlapping
+        for offset in range(0, size, max(1, size // SAMPLES)):
+            if offset < covered:
+                continue
+            f.seek(offset)
+            raw = f.read(SAMPLE_BYTES + (2**16 if kind == "bgzf" else 0))     # At least one whole (64 KiB) block
+            if kind == "plain":
+                covered = offset + len(raw)
+                yield raw, len(raw)
+                continue
+            match = BGZF_HEADER.search(raw)
+            if match is None:
+                continue
+            parts, pos = [], match.start()
+            while pos - match.start() < SAMPLE_BYTES and pos + 18 <= len(raw):
+                bsize = int.from_bytes(raw[pos + 16:pos + 18], "little") + 1
+                if pos + bsize > len(raw):
+                    break
+                parts.append(zlib.decompress(raw[pos + 18:pos + bsize - 8], -15))
+                pos += bsize
+            covered = offset + pos
+            yield b''.join(parts), pos - match.start()
+
+
+def fastq_stats(fastq_oFN, exact=False, processes=None):
+    """ FASTQStats of the FASTQ file; exact counts every read (in worker processes), else quick (see module) """
+    kind, size = fastq_kind(fastq_oFN), os.path.getsize(fastq_oFN)
+    stats = FASTQStats()
+    if exact or size <= SAMPLES * SAMPLE_BYTES:         # Small enough to read it all
+        processes = processes or os.cpu_count() or 1
+        with Pool(processes) as pool:
+            waiting = deque()       # Results in file order; at most two per process queued to bound memory
+            for function, args in _chunks(fastq_oFN, kind):
+                waiting.append(pool.apply_async(function, args))
+                while len(waiting) > 2 * processes or (waiting and waiting[0].ready()):
+                    stats.add(waiting.popleft().get())
+            while waiting:
+                stats.add(waiting.popleft().get())
+        return stats.finish()
+
+    with open_fastq(fastq_oFN) as f:
+        stats._line(f.readline().rstrip(b'\n'), 0)
+    reads = used = 0
+    for data, taken in _samples(fastq_oFN, kind, size):
+        piece = _whole_reads(data)
+        if piece:
+            reads += stats.add_records(piece)
+            used += taken * len(piece) / len(data)
+    stats.reads = round(size * reads / used) if used else 0
+    return stats
+
+
+def _key(fastq_oFN, fingerprint=True):
+    """ Sidecar key of the FASTQ file: size, mtime (ns) and (if fingerprint) content fingerprint """
+    status = os.stat(fastq_oFN)
+    return {"size": status.st_size, "mtime": status.st_mtime_ns,
+            "fingerprint": bam_fingerprint(fastq_oFN) if fingerprint else None}
+
+
+def _load_sidecar(fastq_oFN, histograms):
+    """ The sidecar record of the FASTQ file as saved (with the histogram arrays if asked); None if none (usable) """
+    try:
+        with open(fastq_oFN + SIDECAR_FS, "rb") as sidecar:
+            record = json.loads(sidecar.readline())
+            if record.get("version") != SIDECAR_VERSION:
+                return None
+            if histograms and "stats" in record:
+                for name, length in zip(HISTOGRAMS, record["stats"]["histograms"]):
+                    record[name] = np.frombuffer(sidecar.read(length * 8), dtype="<i8").astype(np.int64)
+    except (OSError, ValueError):
+        return None
+    return record
+
+
+def _record_stats(record):
+    """ FASTQStats of a sidecar record loaded with its histograms """
+    stats = FASTQStats()
+    stats.lengths, stats.bases, stats.quals = (record[name] for name in HISTOGRAMS)
+    stats.reads, stats.sampled, stats.exact, stats.seqid = \
+        (record["stats"][name] for name in ("reads", "sampled", "exact", "seqid"))
+    return stats
+
+
+def read_sidecar(fastq_oFN, histograms=False):
+    """
+    The sidecar record (dict) of the FASTQ file if it is there and still for this file; else None.  With histograms,
+    the FASTQStats arrays of the blob are added to it (by name).  Size and mtime the same is taken as current;
+    with only the mtime changed, the content fingerprint decides (and the new mtime is saved).
+    """
+    record = _load_sidecar(fastq_oFN, histograms)
+    try:
+        key = _key(fastq_oFN, fingerprint=False)
+    except OSError:
+        return None
+    if not record or key["size"] != record["key"]["size"]:
+        return None
+    if key["mtime"] != record["key"]["mtime"]:
+        if bam_fingerprint(fastq_oFN) != record["key"]["fingerprint"]:
+            return None
+        record["key"]["mtime"] = key["mtime"]
+        full = record if histograms else _load_sidecar(fastq_oFN, True)
+        full["key"]["mtime"] = key["mtime"]
+        write_sidecar(fastq_oFN, full)
+    return record
+
+
+def write_sidecar(fastq_oFN, record, stats=None):
+    """
+    Save the sidecar record of the FASTQ file; with the FASTQStats stats if given, else those of the record (loaded
+    with its histograms).  Quietly not if it cannot be written.
+    """
+    record = dict(record, version=SIDECAR_VERSION)
+    record.setdefault("key", _key(fastq_oFN))
+    if stats is None and "stats" in record:
+        stats = _record_stats(record)
+    for name in HISTOGRAMS:
+        record.pop(name, None)
+    if stats is not None:
+        record["stats"] = {
+            "reads": stats.reads, "sampled": stats.sampled, "exact": stats.exact, "seqid": stats.seqid,
+            "avg_read_length": stats.avg_read_length, "read_length_stddev": stats.read_length_stddev,
+            "gc": stats.gc, "q30": stats.q30, "histograms": [len(getattr(stats, name)) for name in HISTOGRAMS]}
+    temp_oFN = f'{fastq_oFN}{SIDECAR_FS}.tmp'
+    try:
+        with open(temp_oFN, "wb") as sidecar:
+            sidecar.write(json.dumps(record).encode() + b"\n")
+            if stats is not None:
+                for name in HISTOGRAMS:
+                    sidecar.write(getattr(stats, name).astype("<i8").tobytes())
+        os.replace(temp_oFN, fastq_oFN + SIDECAR_FS)
+    except OSError:
+        pass        # A cache; a read only FASTQ folder just means scanning again next time
+
+
+def sidecar_stats(fastq_oFN, exact=False, processes=None):
+    """ FASTQStats of the FASTQ file from its sidecar; else from a fastq_stats scan (then saved in the sidecar) """
+    record = read_sidecar(fastq_oFN, histograms=True)
+    if record and "stats" in record and (record["stats"]["exact"] or not exact):
+        return _record_stats(record)
+    stats = fastq_stats(fastq_oFN, exact, processes)
+    write_sidecar(fastq_oFN, dict(record or {}, key=_key(fastq_oFN)), stats)
+    return stats
+
+
+def report_current(fastq_oFNs, tool, report_oFN):
+    """
+    True if the tool report_oFN was made from these very FASTQ files (as recorded in their sidecars).  A report
+    from before the sidecars (none recorded for the tool) is taken, and recorded, if newer than the FASTQ files.
+    """
+    try:
+        made = os.path.getmtime(report_oFN)
+    except OSError:
+        return False
+    legacy = []
+    for fastq_oFN in fastq_oFNs:
+        record = read_sidecar(fastq_oFN)
+        if record is None and os.path.exists(fastq_oFN + SIDECAR_FS):
+            return False                # The FASTQ changed since
+        recorded = record.get("reports", {}).get(tool) if record else None
+        if recorded is None and os.path.isfile(fastq_oFN) and os.path.getmtime(fastq_oFN) < made:
+            legacy.append(fastq_oFN)
+        elif recorded != [os.path.abspath(report_oFN), made]:
+            return False
+    record_report(legacy, tool, report_oFN)
+    return True
+
+
+def record_report(fastq_oFNs, tool, report_oFN):
+    """ Record in the sidecars of the FASTQ files that the tool made report_oFN from them """
+    if not os.path.isfile(report_oFN):
+        return
+    for fastq_oFN in fastq_oFNs:
+        record = read_sidecar(fastq_oFN, histograms=True) or {"key": _key(fastq_oFN)}
+        record.setdefault("reports", {})[tool] = [os.path.abspath(report_oFN), os.path.getmtime(report_oFN)]
+        write_sidecar(fastq_oFN, record)
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    args, exact_scan, workers = sys.argv[1:], False, None
+    if args and args[0] == "-e":
+        exact_scan, args = True, args[1:]
+    if len(args) >= 2 and args[0] == "-p" and args[1].isdigit():
+        workers, args = int(args[1]), args[2:]
+    if len(args) != 1:
+        print(f'Usage: python3 {module} [-e] [-p processes] file.fastq.gz', file=sys.stderr, flush=True)
+        exit(1)
+    result = sidecar_stats(args[0], exact_scan, workers)
+    print(f'Reads:\t{result.reads}{"" if result.exact else " (estimated)"}')
+    print(f'First read:\t{result.seqid}')
+    print(f'Read length:\t{result.avg_read_length:.1f} (stddev {result.read_length_stddev:.1f}; '
+          f'{int(np.flatnonzero(result.lengths)[0]) if result.lengths.any() else 0} to {len(result.lengths) - 1})')
+    print(f'GC:\t{result.gc:.2%}')
+    print(f'Q30 bases:\t{result.q30:.2%}')
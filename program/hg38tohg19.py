@@ -8,15 +8,13 @@
 import sys      # for argv[] if called as separate process / program
 import os.path  # for os.remove, os.path.exists
 
-from pyliftover import LiftOver     # Main heavyweight lifter
-
 #  Needed WGSE environment as if sub-module; but will call wgse.init() in __main__ if called standalone
-from utilities import DEBUG, nativeOS, universalOS
-from commandprocessor import run_bash_script
+from utilities import DEBUG, nativeOS
+from liftover import ChainMap, LiftoverCache    # Batched replacement of PyLiftover (same results)
 import settings as wgse
 
 """###################################################################################################################
-  Wrapper for PyLiftover which is itself based on the UCSC Liftover code and liftover reference file.
+  Liftover of the CombinedKit (module liftover; same results as PyLiftover, the UCSC Liftover code, it replaced).
     Called by module microarray on BAM extracted CombinedKit that was based on reference model Build38.
     Replaces file it is called with (inplace); often an ~50 MB, 2+million SNP file is extracted from a WGS BAM.
     Although currently called as stand-alone, was recreating and using some settings like WGS Extract (e.g. temp dir)
@@ -25,84 +23,74 @@ import settings as wgse
 # Todo need to inline this code with main microarray.py file so does not create new environment
 
 
-def my_hg38tohg19(combined_file_oFPB, ref="hg38"):
-    """ Glue and single call for current use based on HG38 to HG19 liftover of CombinedKit TSV file. """
+def chrom_order(chrom):
+    """ Sort key of a (liftover result) chromosome name as sort -V orders them: numbers first, then MT, X, Y """
+    return (0, int(chrom), b"") if chrom.isdigit() else (1, 0, chrom)
+
 
-    # Setup main and intermediate file names (should have been passed the CombinedKit TSV
-    combined_txt_oFN        = f'{combined_file_oFPB}.txt'         # Input and eventual output (replaced)
-    combined_tmp_oFN        = f'{combined_file_oFPB}.tmp'         # Intermediate; after liftover
-    combined_sorted_txt_oFN = f'{combined_file_oFPB}-sorted.txt'  # Intermediate; after liftover then sort
+def my_hg38tohg19(combined_file_oFPB, ref="hg38", chain_oFN=None, targets_oFN=None):
+    """
+    Glue and single call for current use based on HG38 to HG19 liftover of CombinedKit TSV file.  All positions of a
+    chromosome are lifted at once (liftover.ChainMap), then sorted and written with the header in memory; no temp
+    files or sort / cat commands.  chain_oFN for other than the Build 38 to HG19 chain (e.g. T2T to HG19).
+    targets_oFN is the CombinedKit target list the file was called on; its liftover is then looked up in the result
+    cache kept with it (liftover.LiftoverCache) instead of loading the chain file each time.
+    """
 
-    combined_file_FPB       = universalOS(combined_file_oFPB)     # Prepare for quoted, universalOS versions
-    combined_txt_qFN        = f'"{combined_file_FPB}.txt"'
-    combined_tmp_qFN        = f'"{combined_file_FPB}.tmp"'
-    combined_sorted_txt_qFN = f'"{combined_file_FPB}-sorted.txt"'
+    combined_txt_oFN = f'{combined_file_oFPB}.txt'         # Input and eventual output (replaced)
 
     if not os.path.exists(combined_txt_oFN):
         print(f"*** Fatal error. File to liftover does not exist: {combined_txt_oFN}")
         exit()
 
-    print("Converting Microarray Build38 to HG19 positions to maintain compatibility...")
-    # Instantiates Liftover class from PyLiftover  # Todo could auto download reference in pyliftover; or reference library?
-    lo = LiftOver(wgse.reflib.liftover_chain_oFN)
-
-    # Do liftover with combined_txt as input, combined_tmp as output
+    print(f"Converting Microarray {ref} to HG19 positions to maintain compatibility...")
+    chain_oFN = chain_oFN or wgse.reflib.liftover_chain_oFN
+    if targets_oFN and os.path.isfile(targets_oFN):
+        chains = LiftoverCache(chain_oFN, targets_oFN)
+    else:
+        chains = ChainMap(chain_oFN)
+
+    # Group the SNPs by (UCSC named) chromosome; so each is lifted in one call
+    snps = {}
+    with open(combined_txt_oFN, "rb") as f_source:
+        for source_line in f_source:
+            line_tabs = source_line.split(b"\t")
+            if source_line.strip() and not source_line.strip().startswith(b"#"):  # Ignore comment lines / header
+                oldchrom = ("chr" + line_tabs[1].decode()).replace("chrMT", "chrM")
+                snps.setdefault(oldchrom, []).append((line_tabs[0], int(line_tabs[2]), line_tabs[3]))
+
+    # Actual liftover; keeping only results on the primary 25 sequences
     bad_chrom = 0
     bad_pos = 0
-    header = []
-    with open(combined_tmp_oFN, "wb") as f_sink:
-        with open(combined_txt_oFN, "r") as f_source:
-            for source_line in f_source:
-                line_tabs = source_line.strip().split("\t")     # strip leading white space; split by tabs
-                if '#' != line_tabs[0][0]:      # Ignore comment lines / header (assumes # as first character)
-                    line_tabs = source_line.split("\t")
-                    oldid = line_tabs[0]
-                    oldchrom = ("chr" + line_tabs[1]).replace("chrMT", "chrM")
-                    oldpos = line_tabs[2]
-                    resultforsnp = line_tabs[3]
-
-                    # Actual call to pyliftover to convert positions
-                    newcoord = lo.convert_coordinate(oldchrom, int(oldpos))
-
-                    if newcoord and len(newcoord) > 0:
-                        newchrom = newcoord[0][0]
-                        newpos = newcoord[0][1]
-                        if newchrom in wgse.valid_chromosomes:  # Only liftover the primary 25 sequences
-                            newchrom = newchrom.replace("chrM", "chrMT").replace("chr", "")
-                            f_sink.write(f'{oldid}\t{newchrom}\t{str(newpos)}\t{resultforsnp}'.encode())
-                        else:
-                            bad_chrom += 1
-                            DEBUG(f'Invalid chromosome from liftover: old: {oldchrom}, {oldpos}; new: {newchrom}, {newpos}')
-                    else:
-                        bad_pos += 1
-                        stripped = resultforsnp.strip()   # For some reason, newline was not stripped from line
-                        DEBUG(f'Cannot liftover HG38 position (ignoring): {oldid}, {oldchrom}, {str(oldpos)}, {stripped}')
-                else:
-                    header.append(source_line)
+    valid = {chrom: chrom.replace("chrM", "chrMT").replace("chr", "").encode() for chrom in wgse.valid_chromosomes}
+    lifted = []
+    for oldchrom, rows in snps.items():
+        codes, newpos = chains.convert(oldchrom, [oldpos for _, oldpos, _ in rows])
+        for (oldid, oldpos, resultforsnp), code, pos in zip(rows, codes.tolist(), newpos.tolist()):
+            if code < 0:
+                bad_pos += 1
+                DEBUG(f'Cannot liftover {ref} position (ignoring): {oldid.decode()}, {oldchrom}, {oldpos}, '
+                      f'{resultforsnp.decode().strip()}')
+            elif chains.targets[code] not in valid:
+                bad_chrom += 1
+                DEBUG(f'Invalid chromosome from liftover: old: {oldchrom}, {oldpos}; '
+                      f'new: {chains.targets[code]}, {pos}')
+            else:
+                newchrom = valid[chains.targets[code]]
+                line = oldid + b"\t" + newchrom + b"\t" + str(pos).encode() + b"\t" + resultforsnp
+                lifted.append((chrom_order(newchrom), pos, line))
 
     if bad_chrom or bad_pos:
         print(f'Some positions failed to lift over ({bad_chrom} to AltContig, {bad_pos} not in new model)')
 
-    # Going to overwrite the original input file so just delete now
-    os.remove(combined_txt_oFN) if os.path.exists(combined_txt_oFN) else ''         # Final file to use
-
-    # Sort the resultant output and pre-pend with a header before making final CombinedKit file
-    # Todo Could a more efficient sort be done with BCFTools on the TSV file?
-
+    # Sort the result (as sort -t $'\t' -k2,3 -V did) and pre-pend with a header to make the final CombinedKit file.
     # CombinedKit is made with 23andMe v3 header (probably should work to use header original in case that changes)
-    header_qFN = f'"{wgse.reflib.cma_FP}raw_file_templates/head/23andMe_V3.txt"'
-
-    commands = (
-        f"{wgse.sortx_qFN} -t $'\\t' -k2,3 -V {combined_tmp_qFN} > {combined_sorted_txt_qFN}\n"
-        f"{wgse.catx_qFN} {header_qFN} {combined_sorted_txt_qFN} > {combined_txt_qFN}\n"
-    )
-
-    run_bash_script("LiftoverCleanup", commands)
-
-    os.remove(combined_tmp_oFN)
-    os.remove(combined_sorted_txt_oFN)
-
-    # Final liftover result is in original source file; replaced the content in combined_txt_oFN
+    lifted.sort()
+    with open(nativeOS(f'{wgse.reflib.cma_FP}raw_file_templates/head/23andMe_V3.txt'), "rb") as f_header:
+        header = f_header.read()
+    with open(combined_txt_oFN, "wb") as f_sink:     # Replaces the content of the original source file
+        f_sink.write(header)
+        f_sink.write(b"".join(line for _, _, line in lifted))
 
 
 if __name__ == '__main__':
@@ -112,8 +100,10 @@ if __name__ == '__main__':
     # Process command line arguments
     combined_file_oFPB = nativeOS(sys.argv[1])          # passed as FPB; note in Output and not Temp directory
     source_ref         = sys.argv[2].strip()
+    chain_file_oFN     = nativeOS(sys.argv[3]) if len(sys.argv) > 3 and sys.argv[3] else None
+    targets_oFN        = nativeOS(sys.argv[4]) if len(sys.argv) > 4 else None
 
-    my_hg38tohg19(combined_file_oFPB, source_ref)
+    my_hg38tohg19(combined_file_oFPB, source_ref, chain_file_oFN, targets_oFN)
 
 #
 # Todo how is this liftover working for the Build38 files supplied it?  Should be broken ...
@@ -0,0 +1,204 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Progress of running jobs (module jobprogress) for commandprocessor.  Until now only BWA reported progress (via
+    progress.py on its stderr); every other step (sort, markdup, mpileup, depth, unalign, CRAM conversion) showed just
+    the fixed expected_time.  A ProgressMonitor attached to a Job (jobqueue) follows the processes the job started and
+    measures what they actually do:
+
+    - Input consumed: the read offset of the job's input files (psutil open_files; /proc/<pid>/fdinfo on Linux).  The
+      inputs can be declared; else the largest file the job has open for reading is taken as its input.
+    - Storage bytes read (/proc/<pid>/io read_bytes) and CPU seconds of each process; for the rate when no offset can
+      be had, and to tell a stuck job (no I/O, no CPU) from a slow one.
+    - Tool progress: percent lines on the job's stderr (e.g. from progress.py); relayed to the console unchanged.
+
+    Each sample is a progress event; a dict with time, job, title, status, elapsed, bytes, total, percent, rate
+    (bytes/s), eta (seconds), cpu, idle (seconds without I/O or CPU) and stalled.  The latest is kept for the GUI and
+    they are appended (every LOG_INTERVAL and at the end) to an optional JSON lines log.
+
+    No tkinter or settings dependency here; commandprocessor supplies the log file and shows the events.
+"""
+
+import os
+import re
+import sys
+import json
+import time
+import threading
+from collections import deque
+
+import psutil
+
+SAMPLE_INTERVAL = 2         # Seconds between looks at the processes of a running job
+LOG_INTERVAL = 30           # Seconds between events written to the JSON lines log (plus the first and last)
+RATE_WINDOW = 60            # Seconds of samples the rate is taken over
+STALL_TIME = 300            # Seconds without any I/O or CPU use before a job is reported stalled
+TOOL_TAIL = 4096            # Bytes of stderr kept to find the latest tool progress line in
+TOOL_PROGRESS = (
+    re.compile(rb'(\d+\.\d+)% aligned'),                                    # progress.py on bwa mem stderr
+    re.compile(rb'\[BWTIncConstructFromPacked\]\s*(\d+\.\d+)% indexed'),    # progress.py on bwa index stderr
+)
+
+_log_lock = threading.Lock()        # Jobs run concurrently and may share the log
+
+
+class ProgressMonitor:
+    """ Samples the processes of one running job into progress events; keeps the latest and logs them """
+
+    def __init__(self, inputs=(), log_oFN=None):
+        self.inputs = {os.path.realpath(inp): 0 for inp in inputs if inp}     # Input -> furthest offset read
+        self.log_oFN = log_oFN
+        self.latest = None              # Latest progress event
+        self.tool_percent = None        # Latest percent done the tool itself reported (as a fraction)
+        self._sizes = {}                # Input -> size
+        self._main = None               # Largest file seen open for reading; the input if none declared
+        self._tail = b""
+        self._io = {}                   # pid -> storage bytes read; so processes that exited still count
+        self._cpu = {}                  # pid -> CPU seconds
+        self._samples = deque()         # (time, bytes) over the RATE_WINDOW
+        self._activity = None
+        self._active_time = None
+        self._next_sample = 0
+        self._next_log = 0
+
+    def feed(self, data):
+        """ Take a piece of the job's stderr; note the latest tool progress in it """
+        self._tail = (self._tail + data)[-TOOL_TAIL:]
+        for pattern in TOOL_PROGRESS:
+            found = pattern.findall(self._tail)
+            if found:
+                self.tool_percent = min(1.0, float(found[-1]) / 100)
+
+    def poll(self, job):
+        """ Called often from the job's watcher thread; samples every SAMPLE_INTERVAL """
+        if time.time() >= self._next_sample:
+            self._next_sample = time.time() + SAMPLE_INTERVAL
+            self.sample(job)
+
+    def finish(self, job, status):
+        """ Final event of the job (status done, failed, cancelled or timeout) """
+        return self.sample(job, status)
+
+    def sample(self, job, status="running"):
+        now = time.time()
+        pid = job._process.pid if job._process else None
+        for process in _processes(pid) if status == "running" else []:
+            self._look(process)
+
+        consumed, total = self._consumed()
+        measured = consumed if total else sum(self._io.values())
+        self._samples.append((now, measured))
+        while len(self._samples) > 2 and now - self._samples[1][0] >= RATE_WINDOW:
+            self._samples.popleft()
+        first_time, first_bytes = self._samples[0]
+        rate = (measured - first_bytes) / (now - first_time) if now > first_time else None
+
+        if status == "done":
+            percent = 1.0
+        elif self.tool_percent is not None:
+            percent = self.tool_percent
+        else:
+            percent = min(1.0, consumed / total) if total else None
+        eta = None
+        if status == "running" and percent is not None:
+            if total and self.tool_percent is None and rate:
+                eta = max(0, total - consumed) / rate
+            elif percent > 0:
+                eta = job.elapsed * (1 - percent) / percent
+
+        cpu = sum(self._cpu.values())
+        activity = (round(cpu, 1), sum(self._io.values()), consumed, self.tool_percent)
+        if activity != self._activity:
+            self._activity, self._active_time = activity, now
+        idle = now - self._active_time
+
+        event = {"time": round(now, 1), "job": job.id, "title": job.title, "status": status,
+                 "elapsed": round(job.elapsed, 1), "bytes": measured, "total": total or None,
+                 "percent": None if percent is None else round(percent, 4),
+                 "rate": None if rate is None else round(rate), "eta": None if eta is None else round(eta),
+                 "cpu": round(cpu, 1), "idle": round(idle, 1), "stalled": status == "running" and idle >= STALL_TIME}
+        self.latest = event
+        if self.log_oFN and (now >= self._next_log or status != "running"):
+            self._next_log = now + LOG_INTERVAL
+            _log(self.log_oFN, event)
+        return event
+
+    def _look(self, process):
+        """ Add what one process of the job has read, its CPU time and the offsets in its input files """
+        try:
+            with process.oneshot():
+                times = process.cpu_times()
+                self._cpu[process.pid] = times.user + times.system
+                if hasattr(process, "io_counters"):         # Not on macOS
+                    self._io[process.pid] = max(self._io.get(process.pid, 0), process.io_counters().read_bytes)
+                files = process.open_files()
+        except psutil.Error:
+            return                                          # Exited meanwhile (or not ours to look at)
+        for file in files:
+            position = getattr(file, "position", None)     # Offsets only on Linux
+            if position is None or getattr(file, "mode", "r") != "r" or file.path.endswith(".sh"):
+                continue
+            path = os.path.realpath(file.path)
+            if path not in self._sizes:
+                try:
+                    self._sizes[path] = os.path.getsize(path)
+                except OSError:
+                    continue
+            if self.inputs:
+                if path in self.inputs:
+                    self.inputs[path] = max(self.inputs[path], position)
+            elif self._main is None or self._sizes[path] > self._sizes[self._main[0]]:
+                self._main = (path, position)
+            elif path == self._main[0]:
+                self._main = (path, max(self._main[1], position))
+
+    def _consumed(self):
+        """ Bytes read of the job's input(s) and their total size; (0, 0) when not known """
+        if self.inputs:
+            for path in self.inputs:
+                if path not in self._sizes and os.path.isfile(path):
+                    self._sizes[path] = os.path.getsize(path)
+            return sum(self.inputs.values()), sum(self._sizes.get(path, 0) for path in self.inputs)
+        if self._main:
+            return self._main[1], self._sizes[self._main[0]]
+        return 0, 0
+
+
+def _processes(pid):
+    """ The process pid and all its descendants (a bash script and the pipeline it runs) """
+    try:
+        process = psutil.Process(pid)
+        return [process] + process.children(recursive=True)
+    except (psutil.Error, ValueError, TypeError):
+        return []
+
+
+def _log(log_oFN, event):
+    with _log_lock:
+        try:
+            with open(log_oFN, "a") as log:
+                log.write(json.dumps(event) + "\n")
+        except OSError:
+            pass                        # The log is optional; never fail a job over it
+
+
+def relay(stream, monitor, console=None):
+    """ Copy a job's stderr pipe to the console as is (progress.py \r lines too) while feeding the monitor """
+    console = console or getattr(sys.stderr, "buffer", None)
+    while True:
+        data = os.read(stream.fileno(), 65536)
+        if not data:
+            break
+        monitor.feed(data)
+        if console:
+            try:
+                console.write(data)
+                console.flush()
+            except (OSError, ValueError):
+                console = None
+    stream.close()
+
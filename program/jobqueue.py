@@ -0,0 +1,188 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Job scheduler (module jobqueue) behind commandprocessor.  Submitted commands (generally our bash scripts) wait in
+    a FIFO queue and are started as soon as the threads and memory they declare fit in what is still free of the
+    platform totals (wgse.os_threads, wgse.os_totmem).  A job asking for more than the whole machine still runs; just
+    alone.  Each job can be cancelled, or is killed (with the whole process group so pipelines go too) once past its
+    time budget.  Status changes are posted to the job callback; delivered by poll() in the caller's (Tk main loop)
+    thread as tkinter is not thread safe.  The processes themselves are watched from a small thread per job; which
+    also samples the job's progress monitor (jobprogress module), if it has one, with the job's stderr relayed to it.
+
+    No tkinter or settings dependency here; commandprocessor supplies the limits, budgets and the GUI pumping.
+"""
+
+import os
+import signal
+import subprocess
+import threading
+import time
+import itertools
+from collections import deque
+
+from jobprogress import relay
+
+QUEUED, RUNNING, DONE, FAILED, CANCELLED, TIMEOUT = "queued", "running", "done", "failed", "cancelled", "timeout"
+POLL_INTERVAL = 0.1         # Seconds between checks of a running process (and GUI pumps while waiting)
+
+
+class Job:
+    """ One submitted command: its resource declaration, time budget, status and result """
+    _ids = itertools.count(1)
+
+    def __init__(self, title, command, threads=1, mem=0, timeout=None, callback=None, monitor=None, size=0,
+                 expected=None):
+        self.id = next(Job._ids)
+        self.title = title
+        self.command = command          # Popen argument list
+        self.threads = threads
+        self.mem = mem                  # Bytes
+        self.timeout = timeout          # Seconds; None is no limit
+        self.callback = callback        # callback(job, status) on each status change
+        self.monitor = monitor          # jobprogress.ProgressMonitor; None is no progress followed
+        self.size = size                # Bytes of input; for the run history (runhistory module)
+        self.expected = expected        # Seconds the run is expected to take; None if not known
+        self.status = QUEUED
+        self.returncode = None
+        self.error = None               # Exception that stopped the job being started or followed; if any
+        self.start_time = None
+        self.end_time = None
+        self._process = None
+        self._cancel = threading.Event()
+
+    @property
+    def finished(self):
+        return self.status in (DONE, FAILED, CANCELLED, TIMEOUT)
+
+    @property
+    def elapsed(self):
+        return ((self.end_time or time.time()) - self.start_time) if self.start_time else 0
+
+    def __repr__(self):
+        return f'Job({self.id}, {self.title}, {self.status})'
+
+
+class JobQueue:
+    """ FIFO queue of Jobs run concurrently within a thread and memory budget """
+
+    def __init__(self, max_threads=1, max_mem=0):
+        self.max_threads = max(1, max_threads)
+        self.max_mem = max_mem          # 0 is no memory limit
+        self._queue = deque()
+        self._running = []
+        self._events = deque()          # (callback, job, status) waiting for poll()
+        self._lock = threading.Lock()
+
+    def submit(self, job):
+        with self._lock:
+            self._queue.append(job)
+            self._post(job)
+        self._schedule()
+        return job
+
+    def cancel(self, job):
+        """ Remove a queued job or kill a running one """
+        with self._lock:
+            if job in self._queue:
+                self._queue.remove(job)
+                self._finish(job, CANCELLED)
+                return
+        job._cancel.set()
+
+    def cancel_all(self):
+        for job in list(self._queue) + list(self._running):
+            self.cancel(job)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._running) + list(self._queue)
+
+    def wait(self, jobs, idle=None):
+        """ Block until all the jobs finish; calling poll() and the idle function (e.g. a GUI update) meanwhile """
+        while not all(job.finished for job in jobs):
+            self.poll()
+            if idle:
+                idle()
+            time.sleep(POLL_INTERVAL)
+        self.poll()
+
+    def poll(self):
+        """ Deliver pending status callbacks in the calling thread """
+        while self._events:
+            callback, job, status = self._events.popleft()
+            callback(job, status)
+
+    def _post(self, job):
+        if job.callback:
+            self._events.append((job.callback, job, job.status))
+
+    def _fits(self, job):
+        if not self._running:
+            return True                 # Always run something; even if it asks for more than the whole machine
+        threads = sum(running.threads for running in self._running) + job.threads
+        mem = sum(running.mem for running in self._running) + job.mem
+        return threads <= self.max_threads and (not self.max_mem or mem <= self.max_mem)
+
+    def _schedule(self):
+        """ Start queued jobs in order while they fit; strict FIFO so a large job is not starved by small ones """
+        with self._lock:
+            while self._queue and self._fits(self._queue[0]):
+                job = self._queue.popleft()
+                job.status = RUNNING
+                job.start_time = time.time()
+                self._running.append(job)
+                self._post(job)
+                threading.Thread(target=self._run, args=(job,), daemon=True).start()
+
+    def _finish(self, job, status):
+        job.status = status
+        job.end_time = time.time()
+        self._post(job)
+
+    def _run(self, job):
+        status = FAILED
+        monitor = job.monitor
+        try:
+            job._process = subprocess.Popen(job.command, start_new_session=(os.name == "posix"),
+                                            stderr=subprocess.PIPE if monitor else None)
+            if monitor:
+                threading.Thread(target=relay, args=(job._process.stderr, monitor), daemon=True).start()
+            while job._process.poll() is None:
+                if job._cancel.wait(POLL_INTERVAL) or (job.timeout and job.elapsed > job.timeout):
+                    _kill(job._process)
+                    status = CANCELLED if job._cancel.is_set() else TIMEOUT
+                    break
+                if monitor:
+                    monitor.poll(job)
+            job.returncode = job._process.wait()
+            if job.returncode == 0 and status == FAILED:
+                status = DONE
+        except Exception as err:        # Could not start the command (or follow it); FAILED, never left RUNNING
+            job.error = err
+            status = FAILED
+            if job._process and job._process.poll() is None:
+                _kill(job._process)
+        if monitor:
+            try:
+                monitor.finish(job, status)
+            except Exception:
+                pass                    # Progress is only for show; the job is finished all the same
+        with self._lock:
+            self._running.remove(job)
+            self._finish(job, status)
+        self._schedule()
+
+
+def _kill(process):
+    """ Kill the process and (on POSIX, where it leads its own session) every process in its group """
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except OSError:
+        pass
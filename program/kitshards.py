@@ -0,0 +1,125 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Region sharding (module kitshards) for the parallel CombinedKit (microarray._button_CombinedKit).  The old parallel
+mode ran one mpileup / call per chromosome of valid_chromosomes.  It silently dropped every target on other sequences
+(alt, decoy and unplaced contigs; and the MT / chrM naming mix-ups) and was badly unbalanced (chr1 vs chrY).  Here
+the target list (All_SNPs_*_ref.tab.gz) itself is split into shards holding the same number of target sites.  The
+sequences are taken in BAM header order (the order the serial mpileup streams them) and every one with targets is
+covered; the small ones are grouped.  Each shard is one regions file; mpileup jumps to those regions (-R) and
+still filters on the full target list (-T), so every site sees the same reads as in the serial run.  Concatenating
+the shards in order gives the serial record order.
+
+Also the verification harness: compare_vcfs() diffs the records (not the headers, which name the regions) of the
+merged shards against the serial result.  The parallel mode is only used once they proved identical for a reference
+model and target list (settings.kit_parallel_verified).
+
+    python3 kitshards.py plan All_SNPs_xxx_ref.tab.gz shards [bam_header.sam]     (print the shard regions)
+    python3 kitshards.py compare serial.vcf.gz parallel.vcf.gz                    (verify; exit 1 if different)
+"""
+
+import sys
+import os
+import gzip
+from itertools import zip_longest
+
+import numpy as np
+
+
+def target_sites(tab_oFN):
+    """ Sorted target positions per sequence (in file order) of a (gzip'ed) CHROM POS ... tab file """
+    positions = {}
+    with gzip.open(tab_oFN, "rt") if tab_oFN.endswith("gz") else open(tab_oFN, "r") as tab:
+        for line in tab:
+            if line.startswith("#"):
+                continue
+            fields = line.split("\t", 2)
+            if len(fields) >= 2:
+                positions.setdefault(fields[0], []).append(int(fields[1]))
+    return {chrom: np.unique(np.array(sites, dtype=np.int64)) for chrom, sites in positions.items()}
+
+
+def header_sequences(header):
+    """ Sequence names of the @SQ lines of a SAM header, in order """
+    return [field[3:] for line in header.splitlines() if line.startswith("@SQ")
+            for field in line.split("\t") if field.startswith("SN:")]
+
+
+def plan_shards(sites, sequences, shards):
+    """
+    Split the target sites into (up to) shards lists of (SN, start, end) regions (1-based, inclusive) holding the same
+    number of sites each.  Every sequence of the BAM header (in its order) with targets; targets on sequences not in
+    the BAM cannot have reads in the serial run either.  Without sequences, all of the target file in its order.
+    """
+    order = [sn for sn in sequences if sn in sites] if sequences else list(sites)
+    total = sum(len(sites[sn]) for sn in order)
+    if not total:
+        return []
+    per_shard = -(-total // max(1, shards))
+
+    plan, current, room = [], [], per_shard
+    for sn in order:
+        positions, first = sites[sn], 0
+        while first < len(positions):
+            last = min(first + room, len(positions))
+            current.append((sn, int(positions[first]), int(positions[last - 1])))
+            room -= last - first
+            first = last
+            if room == 0:
+                plan.append(current)
+                current, room = [], per_shard
+    if current:
+        plan.append(current)
+    return plan
+
+
+def write_regions(regions, regions_oFN):
+    """ bcftools regions file (CHROM, BEG, END; 1-based inclusive) for one shard """
+    with open(regions_oFN, "w") as regions_file:
+        for sn, start, end in regions:
+            regions_file.write(f'{sn}\t{start}\t{end}\n')
+
+
+def vcf_records(vcf_oFN):
+    """ Data lines of a (bgzip'ed) VCF """
+    with gzip.open(vcf_oFN, "rt") if vcf_oFN.endswith("gz") else open(vcf_oFN, "r") as vcf:
+        for line in vcf:
+            if not line.startswith("#"):
+                yield line.rstrip("\n")
+
+
+def compare_vcfs(serial_oFN, parallel_oFN, show=5):
+    """ (number of record lines that differ, in order; first few differences as (serial, parallel) line pairs) """
+    differ, examples = 0, []
+    for serial, parallel in zip_longest(vcf_records(serial_oFN), vcf_records(parallel_oFN)):
+        if serial != parallel:
+            differ += 1
+            if len(examples) < show:
+                examples.append((serial, parallel))
+    return differ, examples
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) in (4, 5) and sys.argv[1] == "plan" and sys.argv[3].isdigit():
+        bam_sequences = []
+        if len(sys.argv) == 5:
+            with open(sys.argv[4], "r") as header_file:
+                bam_sequences = header_sequences(header_file.read())
+        for index, shard in enumerate(plan_shards(target_sites(sys.argv[2]), bam_sequences, int(sys.argv[3]))):
+            print(f'{index}\t' + ",".join(f'{sn}:{start}-{end}' for sn, start, end in shard))
+    elif len(sys.argv) == 4 and sys.argv[1] == "compare":
+        count, diffs = compare_vcfs(sys.argv[2], sys.argv[3])
+        for serial_line, parallel_line in diffs:
+            print(f'< {serial_line}\n> {parallel_line}')
+        print(f'{count} records differ')
+        exit(1 if count else 0)
+    else:
+        print(f'***ERROR: Wrong parameters for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} plan targets.tab.gz shards [bam_header.sam]', file=sys.stderr, flush=True)
+        print(f'   python3 {module} compare serial.vcf.gz parallel.vcf.gz', file=sys.stderr, flush=True)
+        exit(1)
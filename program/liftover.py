@@ -0,0 +1,184 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Batched liftover engine (module liftover) for UCSC .over.chain files (gzip'ed or not); any chain in the reference
+library (hg38ToHg19, the T2T chm13v2 ones, ...).  Same results as pyliftover's LiftOver.convert_coordinate (the best
+scoring chain when blocks overlap; 0-based positions) but the chain file is loaded once into sorted arrays per source
+sequence and a whole array of positions is mapped with one np.searchsorted.
+
+Overlapping blocks (of different chains) are resolved when loading: the source sequence is cut at every block start
+and end, and each piece is given the highest scoring block covering it (the first in the file on a tie).
+
+LiftoverCache: the CombinedKit target list is fixed per reference library release; so the result for each of its
+~2 million sites is too.  It is saved once (next to the target list) as arrays of the old position, new position and
+new sequence code of every site (code -1 for those that cannot be lifted).  Later liftovers are then a lookup in
+those arrays; no chain file loaded.  The SHA-256 of the chain file and target list are kept in it; if either changes,
+the cache is rebuilt.
+
+    python3 liftover.py chain_file chrom pos [pos ...]      (print the lifted positions; 0-based like pyliftover)
+"""
+
+import sys
+import os
+import gzip
+import hashlib
+
+import numpy as np
+
+from kitshards import target_sites
+
+
+class ChainMap:
+    """ The blocks of a chain file as arrays; convert() maps arrays of positions """
+
+    def __init__(self, chain_oFN):
+        self.targets = []           # Target sequence names; convert() returns indices into this list
+        self.sources = {}           # Source name -> (piece starts, block of each piece (-1 none), block arrays)
+        target_codes = {}
+        blocks = {}                 # Source name -> list of (sfrom, sto, tfrom, target, tsize, minus, score, order)
+
+        with gzip.open(chain_oFN, "rb") if chain_oFN.endswith("gz") else open(chain_oFN, "rb") as chain_file:
+            lines = chain_file.read().splitlines()
+        chain, order = None, 0
+        for line in lines:
+            fields = line.split()
+            if not fields or line.startswith(b"#"):
+                continue
+            if fields[0] == b"chain":
+                score, source, sfrom = int(fields[1]), fields[2].decode(), int(fields[5])
+                target, tsize, minus, tfrom = fields[7].decode(), int(fields[8]), fields[9] == b"-", int(fields[10])
+                code = target_codes.setdefault(target, len(target_codes))
+                chain = blocks.setdefault(source, [])
+                continue
+            size = int(fields[0])
+            if size > 0:            # Zero length blocks are ignored (as pyliftover does)
+                chain.append((sfrom, sfrom + size, tfrom, code, tsize, minus, score, order))
+                order += 1
+            if len(fields) == 3:
+                sfrom += size + int(fields[1])
+                tfrom += size + int(fields[2])
+        self.targets = list(target_codes)
+
+        for source, source_blocks in blocks.items():
+            arrays = np.array(source_blocks, dtype=np.int64).T
+            sfrom, sto, score, order = arrays[0], arrays[1], arrays[6], arrays[7]
+            bounds = np.unique(np.concatenate((sfrom, sto)))
+            first, last = np.searchsorted(bounds, sfrom), np.searchsorted(bounds, sto)
+
+            # Every (piece, block covering it) pair; then the best block of each piece
+            counts = last - first
+            pair_block = np.repeat(np.arange(len(sfrom)), counts)
+            pair_piece = np.repeat(first - np.cumsum(counts) + counts, counts) + np.arange(counts.sum())
+            best = np.lexsort((order[pair_block], -score[pair_block], pair_piece))
+            keep = np.append(True, pair_piece[best][1:] != pair_piece[best][:-1])
+            piece_block = np.full(len(bounds), -1, dtype=np.int64)
+            piece_block[pair_piece[best][keep]] = pair_block[best][keep]
+            self.sources[source] = (bounds, piece_block, arrays[:6])
+
+    def convert(self, chrom, positions):
+        """ (target index into self.targets or -1 if not lifted, new position) arrays for the positions on chrom """
+        positions = np.asarray(positions, dtype=np.int64)
+        if chrom not in self.sources:
+            return np.full(len(positions), -1, dtype=np.int64), positions.copy()
+        bounds, piece_block, (sfrom, _, tfrom, code, tsize, minus) = self.sources[chrom]
+        piece = np.searchsorted(bounds, positions, side="right") - 1
+        block = np.where(piece >= 0, piece_block[np.maximum(piece, 0)], -1)
+        lifted = block >= 0
+        block = np.maximum(block, 0)
+        new = tfrom[block] + (positions - sfrom[block])
+        new = np.where(minus[block] == 1, tsize[block] - 1 - new, new)
+        return np.where(lifted, code[block], -1), np.where(lifted, new, positions)
+
+
+def file_hash(file_oFN):
+    sha = hashlib.sha256()
+    with open(file_oFN, "rb") as f:
+        for chunk in iter(lambda: f.read(2**20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+
+def ucsc_name(chrom):
+    """ Sequence name as in the chain files (chrN, chrM) for a target list name (N, chrN, M, MT, chrM) """
+    name = chrom.replace("chr", "")
+    return "chrM" if name in ("M", "MT") else f'chr{name}'
+
+
+class LiftoverCache:
+    """ Liftover result of every site of a target list (see module description); convert() as ChainMap.convert() """
+
+    def __init__(self, chain_oFN, targets_oFN):
+        self.chain_oFN = chain_oFN
+        self.chains = None          # Only loaded if asked for a site not in the target list
+        names = [os.path.basename(file_oFN).split(".")[0] for file_oFN in (targets_oFN, chain_oFN)]
+        self.cache_oFN = os.path.join(os.path.dirname(targets_oFN), f'{names[0]}_{names[1]}.liftover.npz')
+        hashes = np.array([file_hash(chain_oFN), file_hash(targets_oFN)])
+        try:
+            with np.load(self.cache_oFN) as cache:
+                if not np.array_equal(cache["hashes"], hashes):
+                    raise ValueError("Chain file or target list changed")
+                arrays = {name: cache[name] for name in cache.files}
+        except (OSError, ValueError, KeyError):
+            arrays = self._build(targets_oFN, hashes)
+
+        self.targets = arrays["targets"].tolist()
+        self.sources = {}           # Source name -> (old positions, new codes, new positions)
+        bounds = np.searchsorted(arrays["source"], np.arange(len(arrays["sources"]) + 1))
+        for code, source in enumerate(arrays["sources"].tolist()):
+            part = slice(bounds[code], bounds[code + 1])
+            self.sources[source] = (arrays["old"][part], arrays["code"][part], arrays["new"][part])
+
+    def _build(self, targets_oFN, hashes):
+        self.chains = ChainMap(self.chain_oFN)
+        sites = {}
+        for chrom, positions in target_sites(targets_oFN).items():
+            sites[ucsc_name(chrom)] = np.union1d(sites.get(ucsc_name(chrom), []), positions).astype(np.int64)
+        sources = sorted(sites)
+        results = [self.chains.convert(source, sites[source]) for source in sources]
+        arrays = {
+            "hashes": hashes, "sources": np.array(sources), "targets": np.array(self.chains.targets),
+            "source": np.repeat(np.arange(len(sources), dtype=np.uint8), [len(sites[source]) for source in sources]),
+            "old": np.concatenate([sites[source] for source in sources]).astype(np.int32),
+            "code": np.concatenate([codes for codes, _ in results]).astype(np.int16),
+            "new": np.concatenate([new for _, new in results]).astype(np.int32),
+        }
+        try:
+            temp_oFN = self.cache_oFN + ".tmp.npz"
+            np.savez(temp_oFN, **arrays)
+            os.replace(temp_oFN, self.cache_oFN)      # A partial cache is never left behind
+        except OSError:
+            pass                    # Reference library not writable; still have the result for this run
+        return arrays
+
+    def unliftable(self):
+        """ (source name, old position) of every target site that cannot be lifted """
+        return [(source, int(pos)) for source, (old, codes, _) in self.sources.items() for pos in old[codes < 0]]
+
+    def convert(self, chrom, positions):
+        positions = np.asarray(positions, dtype=np.int64)
+        old, codes, new = self.sources.get(chrom, (np.zeros(0, dtype=np.int32),) * 3)
+        index = np.searchsorted(old, positions)
+        found = index < len(old)
+        found[found] = old[index[found]] == positions[found]
+        result_codes, result_new = np.full(len(positions), -1, dtype=np.int64), positions.copy()
+        result_codes[found], result_new[found] = codes[index[found]], new[index[found]]
+        if not found.all():         # Not a target site; lift it the long way (same chain so same target codes)
+            if self.chains is None:
+                self.chains = ChainMap(self.chain_oFN)
+            result_codes[~found], result_new[~found] = self.chains.convert(chrom, positions[~found])
+        return result_codes, result_new
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) < 4 or not all(pos.isdigit() for pos in sys.argv[3:]):
+        print(f'Usage: python3 {module} chain_file chrom pos [pos ...]', file=sys.stderr, flush=True)
+        exit(1)
+    chains = ChainMap(sys.argv[1])
+    codes, lifted = chains.convert(sys.argv[2], [int(pos) for pos in sys.argv[3:]])
+    for pos, code, new in zip(sys.argv[3:], codes, lifted):
+        print(f'{sys.argv[2]}\t{pos}\t' + (f'{chains.targets[code]}\t{new}' if code >= 0 else "-"))
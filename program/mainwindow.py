@@ -54,7 +54,11 @@ except (ImportError, TypeError):
 # Local modules from WGSE
 from utilities import DEBUG, nativeOS, universalOS, unquote, wgse_message, is_legal_path, check_exists, FontTypes
 
-from commandprocessor import run_bash_script
+from commandprocessor import run_bash_script, run_pipeline, job_queue
+from resourceplan import plan_sort
+from pipeline import Pipeline, Stage, quickcheck
+from fastqshard import shard_count, shard_names
+from fastqstats import report_current, record_report
 from bamfiles import BAMFile, BAMContentError, BAMContentErrorFile, BAMContentWarning
 from microarray import button_select_autosomal_formats, _button_CombinedKit
 from fastqfiles import process_FASTQ
@@ -83,7 +87,7 @@ global haplogroupYButton, haplogroupMtButton, exportUnmappedReadsButton
 global bamAlignButton, bamUnalignButton, fastqFastpButton, fastqFastqcButton
 global SNPVCFButton, InDelVCFButton, CNVVCFButton, SVVCFButton, AnnotateVCFButton, FilterVCFButton, VarQCButton
 # Debug_MODE only buttons
-global wslbwaButton, runMicroParallelButton, subsetBAMButton
+global wslbwaButton, alignModeButton, runMicroParallelButton, subsetBAMButton
 global maxsettingsLabel, maxmemButton, maxmemLabel, maxthreadButton, maxthreadLabel
 global fontsetLabel, fontsizeButton, fontfaceButton, wresetButton
 
@@ -954,66 +958,45 @@ def button_header_BAM():
     result_window_simple(wgse.BAM.file_FBS + " Header", wgse.BAM.Header, "header", '12', top=True, wwrap="none")
 
 
-def _adjust_mem_threads(file_size, file_type, sort_type):
+def _sort_temp_dirs():
     """
-    Mainly for adjusting the os_mem and os_threads for MacOS which has a limit of 256 open files per process.
-    samtools sort creates temporary files equal to 1/2.3 of the memory per thread.  But if that
-    memory size will create more than 256 temporary files, sort will fail. So adjust memory per thread
-    up and # of threads down, as needed, to keep the temporary files under 240. Multiplier is based on BAM file
-    size.  Adjust if CRAM file size given.  Name sort is ~50% larger total temp files than coordinate sort.
-
-    Remember: file_size and os_totmem are in bytes; os_mem is in millions of bytes and a string
+    (FP, oFP) of the temporary directories a sort may use: the one set by the user and, if different, the default
+    one in the installation.  Our PID subdirectory of the default is made on first use and cleaned up at the end.
     """
+    dirs = [(wgse.tempf.FP, wgse.tempf.oFP)]
+    if wgse.tempf.set and wgse.tempf.default_FP and os.path.isdir(nativeOS(wgse.tempf.default_FP)):
+        default_FP = f'{wgse.tempf.default_FP}{wgse.os_pid}/'
+        default_oFP = nativeOS(default_FP)
+        if default_oFP not in wgse.tempf.list:
+            try:
+                os.makedirs(default_oFP, exist_ok=True)
+                wgse.tempf.list.append(default_oFP)
+            except OSError:
+                return dirs
+        dirs.append((default_FP, default_oFP))
+    return dirs
 
-    DEBUG(f'In Adjust_Mem for Sort with File Size: {file_size // 10 ** 9} GB, {file_type}, "{sort_type}" Sort')
-
-    # Constant values / multipliers to help adjust values
-    temp_mult = 2.3         # If memory per thread is x, then actual temp file size per thread is x/2.3
-    cram_mult = 1.95 if file_type == "CRAM" else 1       # Adjust file size to likely BAM file size if CRAM to start
-    name_mult = 1.45 if sort_type == "Name" else 1       # Name sorting needs more temp file space than coordinate
-    files_max = 256 - 10 + wgse.os_threads               # For MacOS, max 256 open files per process. Less as some
-    #                                   opened by process. More as # threads mem blocks kept out of temp file space
-
-    # Calculate minimum mem per thread on MacOS to avoid exceeding 250 maximum open files during sort
-    min_mpt = int(file_size * temp_mult * cram_mult * name_mult / files_max)  # Minimum mem per thread on MacOS
-    if min_mpt == 0:      # Cannot adjust parameters if an (near) empty BAM file is being used to sort
-        return "0M", 0
-
-    # Let user know how much free file space we need; giving them a chance to make it available or cancel out
-    app = f'{sort_type} Sort'
-    isize = file_size * cram_mult / 10**9               # Nominal size of final BAM (in GB)
-    tempsize = str(int(isize * name_mult + isize))      # Size of raw BAM from aligner + coord sorted BAM pre-final (GB)
-    outsize = str(int(isize))                           # Size of final BAM (assume BAM always for worst case) (GB)
-    message = wgse.lang.i18n["infoFreeSpace"].replace(
-        "{{APP}}", app).replace("{{SIZE}}", tempsize).replace("{{FINAL}}", outsize)
-    if not wgse_message("okcancel", "infoFreeSpaceTitle", True, message):
-        return "0M", 0
-
-    cur_mpt = wgse.os_totmem // wgse.os_threads     # note: os_mem is a string and in millions; this is in bytes
-
-    if wgse.os_plat == "Darwin" and min_mpt > cur_mpt:
-
-        # We need to adjust the memory per thread (mpt) up and # of threads down to prevent too many temp files in sort
-        os_threads = wgse.os_totmem // min_mpt      # Adjust OS threads downward to allow increase of mem per thread
 
-        # If 0 threads, cannot increase mem per thread to the needed value so print error and error out
-        if os_threads == 0:
-            size = str(round(file_size * cram_mult / 10 ** 9, 0))
-            wgse_message("error", "errNoMemMacOSTitle", True, wgse.lang.i18n["errNoMemMacOS"].replace("{{SIZE}}", size))
-            return "0M", 0
-
-        # We can adjust Mem per thread further upward due to the small, discrete number of processors
-        min_mpt = wgse.os_totmem // os_threads
-
-        os_mem = str((min_mpt // 10 ** 8) * 100 if min_mpt > 10 ** 8 else (min_mpt // 10 ** 6)) + 'M'
-
-        DEBUG(f'*** Adjust "{sort_type}" sort command on MacOS to use memory per thread: {wgse.os_mem} to {os_mem}, '
-              f'(Perf) Threads: {wgse.os_threads} to {os_threads}')
-        return os_mem, os_threads
-
-    else:       # No adjustment necessary; use values set by platform at program startup or override by user earlier
-        DEBUG(f'*** No adjustment. Using memory per thread: {wgse.os_mem} and (Perf) Threads: {wgse.os_threads}')
-        return wgse.os_mem, wgse.os_threads
+def _plan_sort(file_size, file_type, sort_type, out_FP=None, out_bytes=None):
+    """
+    Memory per thread, threads and temporary directory for a samtools sort (resourceplan module); from the real free
+    space of the temporary and output directories, the RAM available now, the open file limit and the jobs already
+    in the queue.  Returns (sort_mem, sort_cpus, tempdir_FP); sort_cpus is 0 (the user told why) if it cannot run.
+    """
+    temp_dirs = _sort_temp_dirs()
+    jobs = job_queue().jobs()
+    plan = plan_sort(file_size, file_type, sort_type, [oFP for _, oFP in temp_dirs], nativeOS(out_FP or wgse.outdir.FP),
+                     wgse.os_threads, wgse.os_totmem, load_threads=sum(job.threads for job in jobs),
+                     load_mem=sum(job.mem for job in jobs), out_bytes=out_bytes)
+    DEBUG(f'Plan for "{sort_type}" sort of {file_size / 10**9:.1f} GB {file_type}: {plan}; temp space '
+          f'{plan.temp_bytes / 10**9:.1f} GB, output {plan.out_bytes / 10**9:.1f} GB')
+    if plan.error:
+        message = wgse.lang.i18n[plan.error]
+        for key, value in plan.values.items():
+            message = message.replace(key, value)
+        wgse_message("error", f'{plan.error}Title', True, message)
+        return "0M", 0, None
+    return plan.mem, plan.threads, temp_dirs[plan.temp][0]
 
 
 def button_sort_BAM():
@@ -1023,7 +1006,6 @@ def button_sort_BAM():
     """
     samtools = wgse.samtoolsx_qFN
     bamfile  = wgse.BAM.file_qFN
-    tempdir  = f'"{wgse.tempf.FP}"'
 
     # Try to avoid adding conflicting names
     out_FPB =  wgse.BAM.file_FPB.replace("_unsorted", "_sorted") if "_unsorted" in wgse.BAM.file_FPB else \
@@ -1038,10 +1020,13 @@ def button_sort_BAM():
         mainwindow_resume()
         return      # Check routine reports error if reference does not exist
 
-    sort_mem, sort_cpus = _adjust_mem_threads(wgse.BAM.file_stats.st_size, wgse.BAM.file_type, "Coord")
-    if sort_cpus == 0:         # Not enough memory to run samtools sort on MacOS; already reported the error
+    # Sorted BAM is written beside the current one
+    sort_mem, sort_cpus, temp_FP = _plan_sort(wgse.BAM.file_stats.st_size, wgse.BAM.file_type, "Coord",
+                                              out_FP=wgse.BAM.file_FP)
+    if sort_cpus == 0:         # Not enough memory or disk space to run samtools sort; already reported the error
         mainwindow_resume()
         return
+    tempdir = f'"{temp_FP}"'
 
     # Samtools sort cannot accept a CRAM and have a reference genome specified so view first and pipe to sort
     # Although not clear if --reference works on sort command; does not complain but does not seem to help
@@ -1053,7 +1038,7 @@ def button_sort_BAM():
         f'  {samtools} sort -T {tempdir} -m {sort_mem} -@ {sort_cpus} -o {out_qFN} \n'
     )
 
-    run_bash_script("GenSortedBAM", commands)
+    run_bash_script("GenSortedBAM", commands, inputs=[wgse.BAM.file_oFN])
 
     set_BAM_file(unquote(out_qFN))     # Replace selected BAM and garbage collect old one
 
@@ -1108,7 +1093,7 @@ def button_CRAM_to_BAM():
         f'{samtools} index {BAM_qFN} \n'
     )
 
-    run_bash_script("CRAMtoBAM", commands)
+    run_bash_script("CRAMtoBAM", commands, inputs=[wgse.BAM.file_oFN])
 
     set_BAM_file(BAM_FN)    # Replace selected BAM and garbage collect old one
 
@@ -1137,7 +1122,7 @@ def button_BAM_to_CRAM():
         f'{samtools} index {CRAM_qFN} \n'
     )
 
-    run_bash_script("BAMtoCRAM", commands)
+    run_bash_script("BAMtoCRAM", commands, inputs=[wgse.BAM.file_oFN])
 
     set_BAM_file(CRAM_FN)   # Replace selected CRAM and garbage collect old one
 
@@ -1157,24 +1142,30 @@ def button_realign_BAM():
 
     save_BAM = wgse.BAM     # Will save current (if it exists) and let it garbage collect on exit if replaced
 
-    # Need FASTQs (unaligned) so simply make button call. Returns FASTQs set in wgse.BAM.Rxfastq variables
-    # Will check if already exist and simply return (FALSE; as did not have to make them) if found.
-    made_new_fastqs = button_unalign_BAM(inRealign=True)
-
-    # This is an 8 hour to 6 day job; split into parts
-    made_new_BAM = button_align_BAM(inRealign=True)  # Will replace newly created BAM/CRAM
+    # Need FASTQs (unaligned). If not already there, making them is the first stage of the alignment pipeline;
+    #  so it overlaps with the reference genome indexing. This is an 8 hour to 6 day job; split into parts
+    fastq_stage, fastqs = unalign_BAM_stage()
+    if fastq_stage is False:
+        mainwindow_resume()
+        return
+    made_new_BAM = button_align_BAM(inRealign=True, fastq_stage=fastq_stage, fastqs=fastqs)  # Replaces BAM/CRAM
+    made_new_fastqs = fastq_stage is not None
+    if made_new_fastqs and os.path.isfile(nativeOS(fastqs[0])):
+        save_BAM.R1fastq_FN, save_BAM.R2fastq_FN = fastqs
 
     # If successfully replaced BAM and made new FASTQs as part of it; then delete FASTQs
     if made_new_fastqs and made_new_BAM and wgse.BAM and save_BAM and wgse.BAM != save_BAM:
         wgse.tempf.list.append(nativeOS(save_BAM.R1fastq_FN));  save_BAM.R1fastq_FN = None
-        wgse.tempf.list.append(nativeOS(save_BAM.R2fastq_FN));  save_BAM.R2fastq_FN = None
+        if save_BAM.R2fastq_FN:
+            wgse.tempf.list.append(nativeOS(save_BAM.R2fastq_FN))
+        save_BAM.R2fastq_FN = None
     # Now will garbage collect old BAM (save_BAM) when exiting here as only stored in local name
     # No need to set the FASTQ file names to none; just leaving it as a reminder.
 
     mainwindow_resume()
 
 
-def button_align_BAM(inRealign=False):
+def button_align_BAM(inRealign=False, fastq_stage=None, fastqs=None):
     """
         Button to align (create) BAM/CRAM/SAM from a reference model and FASTQs.
         If button on GUI, then generate pop-up(s) asking for values (FASTQs, target file name and ref genome)
@@ -1182,11 +1173,16 @@ def button_align_BAM(inRealign=False):
         Knows to use minimap2 on long reads (Oxford Nanopore, single Fastq). If single-read, then 2nd
         FASTQ file variable will be set null.
 
-        Major Steps once parameters are setup (each with its own PleaseWait):
+        Major Steps once parameters are setup (stages of one pipeline run; see pipeline module):
           (a) Index Reference Genome for alignment (if not already) (1+ hour, ~5GB)
           (b) Call ALignment tool on FASTQs to create initial raw BAM (8+ hours, ~50GB)
           (c) Cleanup (fixmate, markdups, sort) and Index new BAM (1 hour, same size, if short-read)
           (d) If needed, convert to CRAM and remove BAM (1 hour)
+        The align_mode setting decides which intermediate BAMs are written between (b) and (c): Staged keeps both the
+        raw and sorted BAMs (restart after either); Checkpoint keeps only the raw one and streams (c) from it; Stream
+        pipes the aligner through (c) with uncompressed BAM so only the final BAM is written (restart from (b));
+        Sharded aligns and sorts pieces of the FASTQs separately (less sort memory; retry per piece) and merges them.
+        In a realign, fastq_stage (if not None) is the stage making the FASTQs (named in fastqs) from the current BAM.
 
         Inspirations for Samtools bioinformatics pipeline used here:
         https://eriqande.github.io/eca-bioinf-handbook/alignment-of-sequence-data-to-a-reference-genome-and-associated-steps.html
@@ -1202,6 +1198,8 @@ def button_align_BAM(inRealign=False):
         else:
             wgse.tempf.list.append(outd_rawalign_oFN)
             wgse.tempf.list.append(outd_sorted_oFN)
+            wgse.tempf.list.extend(shard_oFNs)
+            wgse.tempf.list.extend(nativeOS(shard_FN) for shard_FN in sum(shard_fastq_FNs, []))
             wgse.BAM.R1fastq_FN = f1_FN  # Note: if in realign, and delete FASTQs, need to clear these
             wgse.BAM.R2fastq_FN = f2_FN
 
@@ -1242,10 +1240,10 @@ def button_align_BAM(inRealign=False):
 
     # ---------------------------------------------------------------------------------------------------------------
     # Determine FASTQs to align from and verify exists
-    if inRealign:       # If in Realign then know where to find FASTQs for current BAM
+    if inRealign:       # If in Realign then know where to find (or will make) FASTQs for current BAM
         paired = wgse.BAM.ReadType == "Paired"
-        f1_FN = wgse.BAM.R1fastq_FN
-        f2_FN = wgse.BAM.R2fastq_FN if paired else ""
+        f1_FN, f2_FN = fastqs if fastqs else (wgse.BAM.R1fastq_FN, wgse.BAM.R2fastq_FN)
+        f2_FN = f2_FN if paired else ""
         aligner = "minimap2" if wgse.BAM and wgse.BAM.long_read else \
                   "hisat2" if wgse.BAM and "GRCh" in wgse.BAM.Refgenome else \
                   "bwa"
@@ -1270,15 +1268,15 @@ def button_align_BAM(inRealign=False):
     else:
         f2_oFN = f2_quFN = ""
 
-    # If not (set and f1_FN exists and (not paired or f2_FN exists); also check large enough
-    if not (f1_FN and os.path.isfile(f1_oFN) and os.path.getsize(f1_oFN) > 1000000 and
+    # If not (set and f1_FN exists and (not paired or f2_FN exists); also check large enough. Unless yet to be made.
+    if not fastq_stage and not (f1_FN and os.path.isfile(f1_oFN) and os.path.getsize(f1_oFN) > 1000000 and
             (not paired or (f2_FN and os.path.isfile(f2_oFN) and os.path.getsize(f2_oFN) > 1000000))):
         wgse_message("error", 'errFASTQMissingTitle', True,
                      f'{wgse.lang.i18n["errFASTQMissing"]}'.replace("{{f1}}", f1_FN).replace("{{f2}}", f2_FN))
         return _align_exit()
 
     # wgse.FASTQ = set_FASTQ_file(f1_oFN, f2_oFN)
-    if inRealign and wgse.BAM.Stats:        # Can cheat and use BAM file for needed FASTQ stats
+    if inRealign and (wgse.BAM.Stats or fastq_stage):   # Can cheat and use BAM file for needed FASTQ stats
         sequencer = wgse.BAM.Sequencer
         numsegs_flt = wgse.BAM.raw_segs_read
         read_length = wgse.BAM.avg_read_length
@@ -1286,9 +1284,16 @@ def button_align_BAM(inRealign=False):
         # Only need to process FASTQ if BAM does not already have (rough) info needed
         (sequencer, numsegs_flt, read_length) = process_FASTQ(f1_FN, paired)
 
-    fastq_size = os.path.getsize(f1_oFN) + (os.path.getsize(f2_oFN) if paired else 0) + 1  # for divide by zero
-    sort_mem, sort_cpus = _adjust_mem_threads(fastq_size, "BAM", "Coord")
-    if sort_cpus == 0:          # Not enough memory to run samtools sort on MacOS; already reported error in _adjust...
+    # FASTQs (gzip'ed) are roughly the size of the BAM they are made from
+    fastq_size = wgse.BAM.file_stats.st_size if fastq_stage else \
+        os.path.getsize(f1_oFN) + (os.path.getsize(f2_oFN) if paired else 0) + 1  # for divide by zero
+    align_mode = wgse.align_mode
+    shards = shard_count(fastq_size) if align_mode == "Sharded" and aligner == "bwa" else 1
+    # Each shard sorted alone; but the output directory holds an intermediate (raw, sorted or shard BAMs) and the final
+    #  (and when sharded, the shard FASTQs too)
+    sort_mem, sort_cpus, temp_FP = _plan_sort(fastq_size // shards, "BAM", "Coord",
+                                              out_bytes=(3 if shards > 1 else 2) * fastq_size)
+    if sort_cpus == 0:          # Not enough memory or disk space to run samtools sort; already reported in _plan_sort
         return _align_exit()    # todo Should give a pop-up and let user decide to do the alignment only
 
     # ---------------------------------------------------------------------------------------------------------------
@@ -1354,168 +1359,186 @@ def button_align_BAM(inRealign=False):
     #outd_rawalign_quFN = f'"{universalOS(outd_rawalign_FN,wsl_mode)}"'
     outd_sorted_qFN  = f'"{wgse.outdir.FP}{newBAM_FB}_sorted.bam"'
     outd_sorted_oFN = nativeOS(unquote(outd_sorted_qFN))
+    shard_FNs = [f'{wgse.outdir.FP}{newBAM_FB}_shard{shard:02d}.bam' for shard in range(shards)] if shards > 1 else []
+    shard_oFNs = [nativeOS(shard_FN) for shard_FN in shard_FNs]
+    # The FASTQ (R1 and R2 if paired) split into as many shard FASTQs; [R1 shards, R2 shards]
+    shard_fastq_FPBs = [f'{wgse.outdir.FP}{newBAM_FB}_R{mate}' for mate in ((1, 2) if paired else (1,))] \
+        if shards > 1 else []
+    shard_fastq_FNs = [shard_names(shard_fastq_FPB, shards) for shard_fastq_FPB in shard_fastq_FPBs]
     
-    # For temporary files area in sort and similar commands
-    tempdir_qFN  = f'"{wgse.tempf.FP}"'
-
-    # ------------------------------------------------------------------------------------------
-    # (a) Check for Alignment Index files -- reuse or generate if missing
-    if aligner == "bwa" and os.path.isfile(refgen_oFN + ".bwt") and \
-       os.path.getmtime(refgen_oFN + ".bwt") > os.path.getmtime(refgen_oFN):
-        DEBUG(f'Using previous BWA Indices for RefGenome: {refgen_qFN}')
-
-    elif aligner == "bwa":     # Generate BWA index
-        # Index the Reference Genome (note: does not work if EBI Reference genome)
-        commands = f'{bwa} index {refgen_quFN} \n'      # Should we use "-a bwtsw" instead of default "-a is" ?
-        run_bash_script("CreateAlignIndices", commands)
-        if not os.path.isfile(refgen_oFN + ".bwt"):
-            # Todo report BWA index error generate failed
-            return _align_exit()
-
-    elif aligner == "hisat2":
-        # Todo If EBI reference model, do we need to create a Hisat2 index?
-        pass
-
-    elif aligner == "minimap2":
-        # Todo any prep for minimap2 aligner?
-        pass
-
-    # ------------------------------------------------------------------------------------------
-    # (b) Lets do the alignment ... 4 hours to 6+ days depending on the number of CPU cores
-    # todo add picard and GATK markdup function in place of samtools
-    if os.path.isfile(outd_rawalign_oFN) and \
-       os.path.getmtime(outd_rawalign_oFN) > os.path.getmtime(f1_oFN) and \
-       0.8 < os.path.getsize(outd_rawalign_oFN) / fastq_size < 1.2:
-        DEBUG(f'Found previous RAW alignment to reuse: {outd_rawalign_qFN}')  # Not likely but worth a try
-
-    elif os.path.isfile(f1_oFN):
-        # Run the alignment command; compress the output simply because it is so large otherwise
-        if aligner == "bwa":
-            # If single read, then f2_quFN will be "" ; BWA understands only a single FASTQ file paramter
-            # Note: could be wsl bwa or native bwa; appropriate values should be setup ahead of time
-
-            commands = (
-                f'{bwa} mem -t {cpus} -R {rg} {refgen_quFN} {f1_quFN} {f2_quFN} |'
-                f'  {bgzip} -@ {cpus} > {outd_rawalign_qFN}\n'
-            )
-            # debug_mode = "DEBUG" if wgse.DEBUG_MODE else ""
-            # numsegs = int(round(numsegs_flt, 0))
-            #   f'  2> >({python} {progress} - {numsegs} {debug_mode}) '
-
-        elif aligner == "minimap2":
-
-            # For long read, go directly to making TrueBAM file (no cleanup step (c)). No ref index file either.
-            commands = (
-                f'{minimap2} -ax map-ont -t {cpus} {refgen_quFN} {f1_quFN} |' 
-                f'  {samtools} sort -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} -o {trueBAM_qFN} \n'
-                f'{samtools} index {trueBAM_qFN} \n'
-            )
-
-        else:   # if aligner == "hisat2":
-            # Todo handle hisat2 alignment for GRCh / EBI models; really should error out
-            commands = ""
-
-        # Todo add pbmm aligner for PacBio HiFi CCS long-read FASTQ files; for reprocessing the T2T / HPP files
-
-        run_bash_script("ButtonAlignBAM", commands)
-
-    else:
-        # Todo report error that fastqs to do alignment are not available
-        return _align_exit()
+    # For temporary files area in sort and similar commands (as planned for the sort)
+    tempdir_qFN  = f'"{temp_FP}"'
 
     # ------------------------------------------------------------------------------------------
-    # (c1) Cleanup (fixmate and coordinate sort)
-    if os.path.isfile(outd_sorted_oFN) and os.path.isfile(outd_rawalign_oFN) and \
-       os.path.getmtime(outd_sorted_oFN) > os.path.getmtime(outd_rawalign_oFN) and \
-       0.5 < os.path.getsize(outd_rawalign_oFN) / os.path.getsize(outd_sorted_oFN) < 2:
-        DEBUG(f'Found previous fixmate and sorted BAM to reuse: {outd_sorted_oFN}')
-
-    elif aligner == "bwa":
-
-        if os.path.isfile(outd_rawalign_oFN):
-
-            if sort_cpus == 0:      # Not enough memory for sort; report error (again?)
-                fs_str = str(round(fastq_size / 10 ** 9, 0))
-                wgse_message("error", "errNoMemMacOSTitle", True,
-                             wgse.lang.i18n["errNoMemMacOS"].replace("SIZE", fs_str))
-                return _align_exit()
+    # The steps are stages of a pipeline (pipeline module). Each declares the files it reads and writes; the
+    #  pipeline works out what is already done (manifest kept next to the new BAM), runs only what the final file
+    #  still needs, overlaps independent stages (BWA index with making the FASTQs in a realign) and, after a crash,
+    #  resumes from the last good intermediate file.
+    sort_bytes = int(sort_mem[:-1]) * 10**6 * sort_cpus      # sort_mem is a string in millions of bytes per thread
+    pipeline = Pipeline("ButtonAlignBAM", nativeOS(f'{newBAM_FPB}_pipeline.json'), wgse.tempf.oFP,
+                        check=quickcheck(nativeOS(unquote(wgse.samtoolsx_qFN))))
+    if fastq_stage:
+        pipeline.add(fastq_stage)       # Realign; FASTQs made from the current BAM by the first stage
+
+    if aligner == "bwa":
+        # (a) Alignment Index files for the Reference Genome (1+ hour, ~5GB); reused if there and newer
+        #  (note: does not work if EBI Reference genome).  Should we use "-a bwtsw" instead of default "-a is" ?
+        pipeline.add(Stage("index", "CreateAlignIndices", f'{bwa} index {refgen_quFN} \n',
+                           inputs=[refgen_oFN], outputs=[refgen_oFN + ".bwt"], threads=1, mem=6 * 10**9))
+
+        def markdup_options():
+            # Check if samtools has read-coord option and sequencer has names that can be parsed for optical duplicates
+            valid_markdup = sequencer and any(elem in sequencer for elem in wgse.valid_markdup)
+            if not valid_markdup:
+                return None
+
+            length = 100 if "HiSeq" in sequencer else 2500 if "Novaseq" in sequencer else 300  # for MGI DNB
+            if wgse.samtools_version[1] > 14:
+                read = wgse.sequencers[sequencer][1]
+                order = wgse.sequencers[sequencer][2]
+                coord_opts = f'--read-coords \"{read}\" --coords-order {order}'
+            else:   # Old versions of samtools processed Illumina names with Row/Col specs embedded; no MGI possible
+                coord_opts = ""
+                if "MGI" in sequencer:  # MGI files hang samtools markdup before version 15; so turn off
+                    length = 0
+            # Todo set -l 400 (default is 300bp) to handle ySeq WG400?  What about nanopore? PacBio HiFi   ?
+            return f'-d {length} {coord_opts}'
+
+        def cleanup_commands(source_qFN):
+            # Streamed (c): fixmate, sort and markdup connected by uncompressed (-u) BAM pipes; only the final BAM is
+            #  compressed and written.  source_qFN is the raw BAM or "-" when reading straight from the aligner.
+            markdup_opts = markdup_options()
+            if markdup_opts is None:        # No duplicate marking; sort writes the final BAM
+                cleanup = f'{samtools} sort -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} -o {trueBAM_qFN} - \n'
+            else:
+                cleanup = (
+                    f'{samtools} sort -u -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} - |'
+                    f'  {samtools} markdup -f {markdup_result_FN} {markdup_opts} '
+                    f'  -@ {cpus} -T {tempdir_qFN} - {trueBAM_qFN} \n'
+                )
+            return f'  {samtools} fixmate -u -m {source_qFN} - |  {cleanup}{samtools} index {trueBAM_qFN} \n'
+
+        # (b) Lets do the alignment ... 4 hours to 6+ days depending on the number of CPU cores
+        # If single read, then f2_quFN will be "" ; BWA understands only a single FASTQ file paramter
+        # Note: could be wsl bwa or native bwa; appropriate values should be setup ahead of time
+        # todo add picard and GATK markdup function in place of samtools
+        bwa_mem = f'{bwa} mem -t {cpus} -R {rg} {refgen_quFN} {f1_quFN} {f2_quFN} |'
+        if align_mode == "Sharded":
+            # (b0) Each FASTQ split in one pass into the shard FASTQs (every shards'th block of reads; fastqshard.py)
+            fastqshard = f'{wgse.python3x_qFN} "{wgse.prog_FP}fastqshard.py"'
+            for mate, (fastq_FN, mate_FPB, mate_FNs) in enumerate(zip((f1_FN, f2_FN), shard_fastq_FPBs,
+                                                                       shard_fastq_FNs), 1):
+                pipeline.add(Stage(f'split_R{mate}', "AlignSplit", f'{fastqshard} "{fastq_FN}" {shards} "{mate_FPB}"\n',
+                                   inputs=[nativeOS(fastq_FN)], outputs=[nativeOS(FN) for FN in mate_FNs],
+                                   threads=cpus))
+
+            # (b, c1) Each shard of the FASTQs into its own align, fixmate and coordinate sort; so each sort needs only
+            #  a fraction of the memory and temp space. The shards are independent stages; a failed one is simply run
+            #  again by itself on the next try.
+            for shard, shard_FN in enumerate(shard_FNs):
+                reads = " ".join(f'"{universalOS(mate_FNs[shard], wsl_mode)}"' for mate_FNs in shard_fastq_FNs)
+                shard_temp_qFN = f'"{temp_FP}{newBAM_FB}_shard{shard:02d}"'   # Sort temp file prefix per shard
+                pipeline.add(Stage(f'align_shard{shard:02d}', "AlignShard",
+                                   f'{bwa} mem -t {cpus} -R {rg} {refgen_quFN} {reads} |'
+                                   f'  {samtools} fixmate -u -m - - |'
+                                   f'  {samtools} sort -T {shard_temp_qFN} -m {sort_mem} -@ {sort_cpus} '
+                                   f'-o "{shard_FN}" - \n',
+                                   inputs=[refgen_oFN + ".bwt"] + [nativeOS(mate_FNs[shard])
+                                                                   for mate_FNs in shard_fastq_FNs],
+                                   outputs=[shard_oFNs[shard]],
+                                   threads=cpus, mem=sort_bytes, temp=fastq_size // shards))
+
+            # (c2) Merge the coordinate sorted shards (a merge, not another sort), markdup and index
+            def merge_commands():
+                shards_qFN = " ".join(f'"{shard_FN}"' for shard_FN in shard_FNs)
+                markdup_opts = markdup_options()
+                if markdup_opts is None:
+                    return (f'{samtools} merge -f -c -p -@ {cpus} {trueBAM_qFN} {shards_qFN} \n'
+                            f'{samtools} index {trueBAM_qFN} \n')
+                return (
+                    f'{samtools} merge -u -c -p -@ {cpus} - {shards_qFN} |'
+                    f'  {samtools} markdup -f {markdup_result_FN} {markdup_opts} '
+                    f'  -@ {cpus} -T {tempdir_qFN} - {trueBAM_qFN} \n'
+                    f'{samtools} index {trueBAM_qFN} \n'
+                )
 
-            commands = (
-                f'{samtools} fixmate -m -O bam -@ {cpus} {outd_rawalign_qFN} - |'
-                f'  {samtools} sort -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} -o {outd_sorted_qFN} - \n'
-            )
+            pipeline.add(Stage("merge", "AlignMerge", merge_commands, inputs=shard_oFNs,
+                               outputs=[trueBAM_oFN, trueBAM_oFN + ".bai"], threads=cpus, temp=fastq_size))
 
-            run_bash_script("AlignCleanup", commands)
+        elif align_mode == "Stream":
+            # Aligner output goes straight through cleanup (c) to the final BAM; no intermediate files at all. A
+            #  crash restarts the alignment. Sort spills its temporary files only when out of memory.
+            pipeline.add(Stage("align_stream", "ButtonAlignBAM", lambda: bwa_mem + cleanup_commands("-"),
+                               inputs=[refgen_oFN + ".bwt", f1_oFN, f2_oFN],
+                               outputs=[trueBAM_oFN, trueBAM_oFN + ".bai"],
+                               threads=cpus, mem=sort_bytes, temp=fastq_size))
+        else:
+            # Compress the output simply because it is so large otherwise; it is the restart point for cleanup (c)
+            pipeline.add(Stage("align", "ButtonAlignBAM", f'{bwa_mem}  {bgzip} -@ {cpus} > {outd_rawalign_qFN}\n',
+                               inputs=[refgen_oFN + ".bwt", f1_oFN, f2_oFN], outputs=[outd_rawalign_oFN],
+                               threads=cpus))
+
+        if align_mode == "Checkpoint":
+            # (c) Cleanup (fixmate, sort, markdup) streamed from the raw BAM; no sorted BAM intermediate
+            pipeline.add(Stage("cleanup_stream", "AlignCleanup", lambda: cleanup_commands(outd_rawalign_qFN),
+                               inputs=[outd_rawalign_oFN], outputs=[trueBAM_oFN, trueBAM_oFN + ".bai"],
+                               threads=cpus, mem=sort_bytes, temp=fastq_size))
+
+        elif align_mode == "Staged":
+            # (c1) Cleanup (fixmate and coordinate sort)
             # Note that a coordinate sorted BAM can be smaller than a name or unsorted BAM. Maybe
             #  compression is more effective when the similar sequences are brought closer to each other?
-
-        else:
-            # Todo report error that alignment raw bam not found / created in previous step
-            return _align_exit()
-
-    # elif aligner != "bwa"     # Cleanup built into minimap alignment stage
-
-    # ------------------------------------------------------------------------------------------
-    # (c2) Cleanup2 (markdup and Index new BAM)
-    if os.path.isfile(trueBAM_oFN) and os.path.isfile(outd_sorted_oFN) and \
-       os.path.getmtime(trueBAM_oFN) > os.path.getmtime(outd_sorted_oFN) and \
-       0.5 < (os.path.getsize(trueBAM_oFN) / os.path.getsize(outd_sorted_oFN)) < 1.2:
-        DEBUG(f'Found previous sorted, final BAM to reuse: {trueBAM_FN}')
-
-    elif aligner == "bwa":
-        if os.path.isfile(outd_sorted_oFN):
-
-            # Check if samtools has read-coord option and sequencer has names that can be parsed for optical duplicates
-            valid_markdup = any(elem in sequencer for elem in wgse.valid_markdup)
-            if sequencer and valid_markdup:  # and (wgse.samtools_version[1] < 15 and "BGI" in sequencer):
-
-                length = 100 if "HiSeq" in sequencer else 2500 if "Novaseq" in sequencer else 300  # for MGI DNB
-
-                if wgse.samtools_version[1] > 14:
-                    read = wgse.sequencers[sequencer][1]
-                    order = wgse.sequencers[sequencer][2]
-                    coord_opts = f'--read-coords \"{read}\" --coords-order {order}'
-
-                else:   # Old versions of samtools processed Illumina names with Row/Col specs embedded; no MGI possible
-                    coord_opts = ""
-                    if "MGI" in sequencer:  # MGI files hang samtools markdup before version 15; so turn off
-                        length = 0
-
-                markdup_opts = f'-d {length} {coord_opts}'
-                # Todo set -l 400 (default is 300bp) to handle ySeq WG400?  What about nanopore? PacBio HiFi   ?
-
-                commands = (
+            pipeline.add(Stage("fixmate_sort", "AlignCleanup",
+                               f'{samtools} fixmate -m -O bam -@ {cpus} {outd_rawalign_qFN} - |'
+                               f'  {samtools} sort -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} '
+                               f'-o {outd_sorted_qFN} - \n',
+                               inputs=[outd_rawalign_oFN], outputs=[outd_sorted_oFN],
+                               threads=cpus, mem=sort_bytes, temp=fastq_size))
+
+            # (c2) Cleanup2 (markdup and Index new BAM)
+            def markdup_commands():
+                markdup_opts = markdup_options()
+                if markdup_opts is None:
+                    return f'mv {outd_sorted_qFN} {trueBAM_qFN} \n{samtools} index {trueBAM_qFN} \n'
+                return (
                     f'{samtools} markdup -f {markdup_result_FN} {markdup_opts} '
                     f'  -@ {cpus} -T {tempdir_qFN} {outd_sorted_qFN} {trueBAM_qFN} \n'
+                    f'{samtools} index {trueBAM_qFN} \n'
                 )
 
-            else:
-                commands = ""
-                os.rename(outd_sorted_oFN, trueBAM_oFN)     # Know file exists to rename
-
-            commands += f'{samtools} index {trueBAM_qFN} \n'
+            pipeline.add(Stage("markdup", "AlignCleanup2", markdup_commands, inputs=[outd_sorted_oFN],
+                               outputs=[trueBAM_oFN, trueBAM_oFN + ".bai"], threads=cpus, temp=fastq_size))
 
-            run_bash_script("AlignCleanup2", commands)
-            # Note that a coordinate sorted BAM is smaller than a name or unsorted BAM. Maybe
-            #  compression is more effective when the similar sequences are brought closer to each other?
-
-        else:
-            # todo report that sorted BAM does not exist from post alignment, fixmate stage with bwa
-            return _align_exit()
+    elif aligner == "minimap2":
+        # For long read, go directly to making TrueBAM file (no cleanup step (c)). No ref index file either.
+        # Todo any prep for minimap2 aligner?
+        pipeline.add(Stage("align", "ButtonAlignBAM",
+                           f'{minimap2} -ax map-ont -t {cpus} {refgen_quFN} {f1_quFN} |'
+                           f'  {samtools} sort -T {tempdir_qFN} -m {sort_mem} -@ {sort_cpus} -o {trueBAM_qFN} \n'
+                           f'{samtools} index {trueBAM_qFN} \n',
+                           inputs=[refgen_oFN, f1_oFN], outputs=[trueBAM_oFN, trueBAM_oFN + ".bai"],
+                           threads=cpus, mem=sort_bytes, temp=fastq_size))
+
+    else:   # if aligner == "hisat2":
+        # Todo handle hisat2 alignment for GRCh / EBI models (and a Hisat2 index?); really should error out
+        return _align_exit()
 
-    # elif aligner != "bwa":             # Cleanup built into Long Read FASTQ files turned into BAMs
+    # Todo add pbmm aligner for PacBio HiFi CCS long-read FASTQ files; for reprocessing the T2T / HPP files
 
-    # ------------------------------------------------------------------------------------------
     # (d) Convert to CRAM and remove BAM (if CRAM is actually being requested)
-    if newBAM_FS == ".cram" and os.path.isfile(trueBAM_oFN):
-        # Note: would not find existing CRAM that is newer as we remove old BAM when converted
-        # todo modify CRAM_to_BAM() to accept parameters and simply call that here
-        commands = (
-            f'{samtools} view -Ch -T {refgen_qFN} -@ {cpus} -o {newBAM_qFN} {trueBAM_qFN} \n'
-            f'{samtools} index {newBAM_qFN} \n'
-        )
-        run_bash_script("BAMtoCRAM", commands)
+    # todo modify CRAM_to_BAM() to accept parameters and simply call that here
+    if newBAM_FS == ".cram":
+        pipeline.add(Stage("cram", "BAMtoCRAM",
+                           f'{samtools} view -Ch -T {refgen_qFN} -@ {cpus} -o {newBAM_qFN} {trueBAM_qFN} \n'
+                           f'{samtools} index {newBAM_qFN} \n',
+                           inputs=[trueBAM_oFN, refgen_oFN], outputs=[nativeOS(newBAM_FN), nativeOS(newBAM_FN) + ".crai"],
+                           threads=cpus))
+
+    if not run_pipeline(pipeline):
+        # Todo report which stage failed (pipeline.failed) and that the next run resumes from there
+        return _align_exit()
 
+    if newBAM_FS == ".cram":
         wgse.tempf.list.append(nativeOS(trueBAM_FN))           # Remove previous final BAM ...
         wgse.tempf.list.append(nativeOS(trueBAM_FN + ".bai"))  # and its index
     # No need to rename file as newBAM_FN and trueBAM_FN are identical names when final is a BAM
@@ -1594,9 +1617,12 @@ def button_fastp_FASTQ():
     json = f'"{wgse.outdir.FP}{f1_FB}_fastp.json"'
 
     ohtml = nativeOS(unquote(html))
-    if not os.path.isfile(ohtml):       # Only create file if it does not exist; takes 30-60 minutes so ...
+    fastq_oFNs = [f1_oFN, f2_oFN] if paired else [f1_oFN]
+    # Only create the report if not already made from these FASTQs (sidecar record); takes 30-60 minutes so ...
+    if not report_current(fastq_oFNs, "fastp", ohtml):
         commands = f'{fastp} {fastopt} -h {html} -j {json} -R "{f1_FB} FASTP Report" \n'
         run_bash_script('ButtonFastp', commands)
+        record_report(fastq_oFNs, "fastp", ohtml)
 
     if os.path.isfile(ohtml):           # If file exists (whether just created or not), display it
         webbrowser.open_new(unquote(html))
@@ -1654,8 +1680,8 @@ def button_fastqc_FASTQ():
         fzip2  = f'"{wgse.outdir.FP}{f2_FB}_fastqc.zip"'
         ohtml2 = nativeOS(unquote(fhtml2))
 
-    # Only run fastqc to create report if the report does not already exist; takes 30+ minutes to generate
-    if not(os.path.isfile(ohtml1) and (not paired or os.path.isfile(ohtml2))):
+    # Only run fastqc to create report if not already made from these FASTQs (sidecar record); takes 30+ minutes
+    if not(report_current([f1_oFN], "fastqc", ohtml1) and (not paired or report_current([f2_oFN], "fastqc", ohtml2))):
         fastqc = wgse.fastqcx_qFN
         fastq_FN = f'"{f1_FN}"' + (f' "{f2_FN}"' if paired else "")
         # fastopt = f'-Dfastqc.output_dir={wgse.outdir.oFP} -Djava.io.tmpdir={wgse.tempf.oFP} -Dfastqc.threads=2'
@@ -1676,6 +1702,9 @@ def button_fastqc_FASTQ():
             commands += f'{wgse.mv_qFN} {phtml2} {fhtml2} ; {wgse.mv_qFN} {pzip2} {fzip2}\n'
 
         run_bash_script('ButtonFastqc', commands)
+        record_report([f1_oFN], "fastqc", ohtml1)
+        if paired:
+            record_report([f2_oFN], "fastqc", ohtml2)
 
     # If report still not available, then report error and return
     if not(os.path.isfile(ohtml1) and (not paired or os.path.isfile(ohtml2))):
@@ -1745,56 +1774,71 @@ def button_igv_BAM():
     # Biggest issue has been creating the "SNP - Gene name" / "search" track files for a WGS that is a reasonable size.
 
 
-def button_unalign_BAM(inRealign=False):
+def unalign_BAM_stage():
     """
-    Function to go from BAM / CRAM to FASTQ(s). Assumes BAM already subsetted if only want a subset FASTQ.
-    Looks for result in output area first before acting
+    Pipeline stage to go from the current BAM / CRAM to FASTQ(s); for button_unalign_BAM and the realign pipeline.
+    Returns (stage, (R1, R2 FASTQ file names)). Stage is None if the FASTQs already exist (found in the output area)
+    and False on an error (already reported).  Assumes BAM already subsetted if only want a subset FASTQ.
     """
 
     # Let's check if FASTQ's already exist; BAMfile class can do it and store locally if found
-    missing_FASTQs = not wgse.BAM.find_FASTQs()
-    if missing_FASTQs:         # Could not find FASTQs, so need to make them
-        if wgse.BAM.ReadType == "Paired":
-            r1fastq = f'"{wgse.outdir.FPB}_R1.fastq.gz"'    # File names to create here
-            r2fastq = f'"{wgse.outdir.FPB}_R2.fastq.gz"'
-            sefastq = "/dev/null"
-        else:
-            r1fastq = r2fastq = "/dev/null"
-            sefastq = f'"{wgse.outdir.FPB}.fastq.gz"'       # For single-end BAMs
+    if wgse.BAM.find_FASTQs():
+        return None, (wgse.BAM.R1fastq_FN, wgse.BAM.R2fastq_FN)
 
-        # CRAM file requires reference genome be specified with VIEW command
-        cram_opt = f'-T {wgse.BAM.Refgenome_qFN}' if wgse.BAM.file_type == "CRAM" else ""
-        samtools = wgse.samtoolsx_qFN
-        bamfile  = wgse.BAM.file_qFN
-        tempdir  = f'"{wgse.tempf.FP}"'
+    # Could not find FASTQs, so need to make them
+    if wgse.BAM.ReadType == "Paired":
+        r1fastq = f'"{wgse.outdir.FPB}_R1.fastq.gz"'    # File names to create here
+        r2fastq = f'"{wgse.outdir.FPB}_R2.fastq.gz"'
+        sefastq = "/dev/null"
+        fastqs = (unquote(r1fastq), unquote(r2fastq))
+    else:
+        r1fastq = r2fastq = "/dev/null"
+        sefastq = f'"{wgse.outdir.FPB}.fastq.gz"'       # For single-end BAMs
+        fastqs = (unquote(sefastq), "")
 
-        if wgse.BAM.file_type == "CRAM" and wgse.reflib.missing_refgenome(wgse.BAM.Refgenome_qFN):
-            mainwindow_resume() if not inRealign else ""
-            return False      # Check routine reports error if reference does not exist
+    # CRAM file requires reference genome be specified with VIEW command
+    cram_opt = f'-T {wgse.BAM.Refgenome_qFN}' if wgse.BAM.file_type == "CRAM" else ""
+    samtools = wgse.samtoolsx_qFN
+    bamfile  = wgse.BAM.file_qFN
 
-        sort_mem, sort_cpus = _adjust_mem_threads(wgse.BAM.file_stats.st_size, wgse.BAM.file_type, "Name")
-        if sort_cpus == 0:  # Not enough memory to run samtools sort on MacOS; already reported the error
-            mainwindow_resume()
-            return False
+    if wgse.BAM.file_type == "CRAM" and wgse.reflib.missing_refgenome(wgse.BAM.Refgenome_qFN):
+        return False, None      # Check routine reports error if reference does not exist
 
-        # Sort in name order, then call fastq command to split and write FastQ's
-        # Samtools sort cannot take the reference genome specification so have to view a CRAM first
-        commands = (
-            f'{samtools} view -uh --no-PG {cram_opt} {bamfile} | '
-            f'  {samtools} sort -n -T {tempdir} -m {sort_mem} -@ {sort_cpus} -O sam | '
-            f'  {samtools} fastq -1 {r1fastq} -2 {r2fastq} -0 {sefastq} -s /dev/null -n -@ {wgse.os_threads} \n'
-        )
+    sort_mem, sort_cpus, temp_FP = _plan_sort(wgse.BAM.file_stats.st_size, wgse.BAM.file_type, "Name")
+    if sort_cpus == 0:  # Not enough memory or disk space to run samtools sort; already reported the error
+        return False, None
+    tempdir = f'"{temp_FP}"'
 
-        run_bash_script('ButtonUnalignBAM', commands)
+    # Sort in name order, then call fastq command to split and write FastQ's
+    # Samtools sort cannot take the reference genome specification so have to view a CRAM first
+    commands = (
+        f'{samtools} view -uh --no-PG {cram_opt} {bamfile} | '
+        f'  {samtools} sort -n -T {tempdir} -m {sort_mem} -@ {sort_cpus} -O sam | '
+        f'  {samtools} fastq -1 {r1fastq} -2 {r2fastq} -0 {sefastq} -s /dev/null -n -@ {wgse.os_threads} \n'
+    )
+
+    stage = Stage("unalign", "ButtonUnalignBAM", commands, inputs=[wgse.BAM.file_oFN],
+                  outputs=[nativeOS(fastq) for fastq in fastqs if fastq], threads=wgse.os_threads,
+                  mem=int(sort_mem[:-1]) * 10**6 * sort_cpus, temp=wgse.BAM.file_stats.st_size)
+    return stage, fastqs
+
+
+def button_unalign_BAM(inRealign=False):
+    """
+    Function to go from BAM / CRAM to FASTQ(s). Assumes BAM already subsetted if only want a subset FASTQ.
+    Looks for result in output area first before acting
+    """
+    stage, fastqs = unalign_BAM_stage()
+    if stage is False:
+        mainwindow_resume() if not inRealign else ""
+        return False
+
+    if stage:
+        run_bash_script(stage.title, stage.script())
 
         # Todo error check on return
 
-        if wgse.BAM.ReadType == "Paired":
-            wgse.BAM.R1fastq_FN = unquote(r1fastq)
-            wgse.BAM.R2fastq_FN = unquote(r2fastq)
-        else:
-            wgse.BAM.R1fastq_FN = unquote(sefastq)
-            wgse.BAM.R2fastq_FN = ""
+        wgse.BAM.R1fastq_FN, wgse.BAM.R2fastq_FN = fastqs
 
     mainwindow_resume() if not inRealign else ""
     return True
@@ -2395,7 +2439,6 @@ def button_export_unmapped_reads(internal=False):
 
     samtools = wgse.samtoolsx_qFN
     bamfile = wgse.BAM.file_qFN
-    tempdir = f'"{wgse.tempf.FP}"'
     commands = ""
 
     # Subset BAM to just unmapped; if not already existing
@@ -2432,10 +2475,11 @@ def button_export_unmapped_reads(internal=False):
     if not files_exist:
         # Unmapped should normally be very small.  But just in case it is larger, pretend the unmapped file is 33%
         #  the size of the BAM. Need to make sure enough CPUs / memory to do the name sort on MacOS
-        sort_mem, sort_cpus = _adjust_mem_threads(wgse.BAM.file_stats.st_size // 3, wgse.BAM.file_type, "Name")
-        if sort_cpus == 0:  # Not enough memory to run samtools sort on MacOS; already reported in _adjust call
+        sort_mem, sort_cpus, temp_FP = _plan_sort(wgse.BAM.file_stats.st_size // 3, wgse.BAM.file_type, "Name")
+        if sort_cpus == 0:  # Not enough memory or disk space to run samtools sort; already reported in _plan_sort
             mainwindow_resume()
             return False
+        tempdir = f'"{temp_FP}"'
 
         # bam2fq deprecated in 1.9; now use fastq
         files = f"-1 {r1_qFN} -2 {r2_qFN} -0 /dev/null -s /dev/null" if paired else \
@@ -2533,7 +2577,7 @@ def button_SNP_VCF():
             f'{tabix} -p vcf {final_vcf_qFN}\n'
         )
 
-        run_bash_script("ButtonSNPVCF", commands, parent=wgse.window)
+        run_bash_script("ButtonSNPVCF", commands, parent=wgse.window, inputs=[wgse.BAM.file_oFN])
 
 
 def button_InDel_VCF():
@@ -2561,7 +2605,7 @@ def button_InDel_VCF():
             f'{tabix} -p vcf {final_vcf_qFN}\n'
         )
 
-        run_bash_script("ButtonInDelVCF", commands, parent=wgse.window)
+        run_bash_script("ButtonInDelVCF", commands, parent=wgse.window, inputs=[wgse.BAM.file_oFN])
 
 
 def button_CNV_VCF():
@@ -2978,6 +3022,15 @@ def button_wsl_bwa_patch():
     mainwindow_resume()
 
 
+def button_align_mode():
+    """ Cycle the align_mode setting: which intermediate BAMs the Align pipeline keeps (see button_align_BAM) """
+    global alignModeButton
+
+    wgse.align_mode = wgse.align_modes[(wgse.align_modes.index(wgse.align_mode) + 1) % len(wgse.align_modes)]
+    alignModeButton.configure(text=wgse.lang.i18n[f'AlignMode{wgse.align_mode}'])
+    mainwindow_resume()
+
+
 def mainwindow_init():
     """
     mainWindow (all GUI processing) subsystem.  Not yet a class but preparing for that.  So this is the early __init__.
@@ -3040,7 +3093,7 @@ def mainwindow_setup():
     global bamAlignButton, bamUnalignButton, fastqFastpButton, fastqFastqcButton
     global SNPVCFButton, InDelVCFButton, CNVVCFButton, SVVCFButton, AnnotateVCFButton, FilterVCFButton, VarQCButton
     # Debug_MODE only buttons
-    global wslbwaButton, runMicroParallelButton, subsetBAMButton
+    global wslbwaButton, alignModeButton, runMicroParallelButton, subsetBAMButton
     global maxsettingsLabel, maxmemButton, maxmemLabel, maxthreadButton, maxthreadLabel
     global fontsetLabel, fontsizeButton, fontfaceButton, wresetButton, font
 
@@ -3445,6 +3498,11 @@ def mainwindow_setup():
     wslbwaLabel = Label(debugFrame, text=wgse.lang.i18n['Win10WslBwaOverride'], font=font['14'])
     wslbwaButton = Button(debugFrame, text=wsllabel, font=font['14'], command=button_wsl_bwa_patch)
 
+    # Align pipeline mode: keep the intermediate BAMs (Staged), just the raw aligner output (Checkpoint) or none (Stream)
+    alignModeLabel = Label(debugFrame, text=wgse.lang.i18n['AlignModeSetting'], font=font['14'])
+    alignModeButton = Button(debugFrame, text=wgse.lang.i18n[f'AlignMode{wgse.align_mode}'], font=font['14'],
+                             command=button_align_mode)
+
     # Buttons to set user overrides of total memory and threads available to WGSE
     maxsettingsLabel = Label(debugFrame, text=wgse.lang.i18n["MaxSettings"], font=font['14'])
 
@@ -3494,6 +3552,10 @@ def mainwindow_setup():
         wslbwaLabel.grid(row=crow, column=0, columnspan=3, padx=5, pady=2)
         wslbwaButton.grid(row=crow, column=3, padx=5, pady=2, sticky=W)
 
+        crow += 1
+        alignModeLabel.grid(row=crow, column=0, columnspan=3, padx=5, pady=2)
+        alignModeButton.grid(row=crow, column=3, padx=5, pady=2, sticky=W)
+
         crow += 1
         maxsettingsLabel.grid(row=crow, column=0, padx=5, pady=2)
         maxmemButton.grid(row=crow, column=1, padx=5, pady=2, sticky=E)
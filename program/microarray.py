@@ -13,8 +13,13 @@ try:
 except (ImportError, TypeError):
     from tkinter import Button
 
-from utilities import nativeOS, DEBUG, unquote, wgse_message
-from commandprocessor import run_bash_script
+from utilities import nativeOS, universalOS, DEBUG, unquote, wgse_message
+from commandprocessor import run_bash_script, run_pipeline
+from pipeline import Pipeline, Stage
+from kitshards import target_sites, header_sequences, plan_shards, write_regions, compare_vcfs
+from vcf_parser import VCFParser
+from vcfkit import vcf_kind
+from refident import header_records, identify_reference, reference_index
 # from mainwindow import mainwindow_resume      # Localized inside cancel_autosomal_formats_window() due to loop
 import settings as wgse
 
@@ -27,7 +32,8 @@ import settings as wgse
     complete and unique contribution of the WGS Extract tool.  Grew out of the basic concept in Extract23 that took a
     30x WGS and generated a 23andMe v3 file.  Now based on a generated CombinedKit template file (in 37/38 reference
     format) which is then subsetted for each of 12+ formats (using a new module "aconv" developed here). Also does 
-    a liftover (based on wrapping pyliftover rewrite of UCSC's liftover) from Build 38 to 37.
+    a liftover (module liftover; a batched rewrite of pyliftover, itself a rewrite of UCSC's liftover) from Build 38
+    (or T2T) to 37.
 """
 checkbuttons_results = []
 
@@ -464,16 +470,6 @@ def adna_checkbutton_click(kit):
     generateSelectedFilesButton.configure(state="normal" if number_of_selected_buttons > 0 else "disabled")
 
 
-def get_target_type_suffix(target_type_name_all):
-    if "FTDNA" in target_type_name_all or "MyHeritage" in target_type_name_all:
-        return ".csv"
-    elif "LDNA" in target_type_name_all or "23andMe" in target_type_name_all or "Ancestry" in target_type_name_all:
-        return ".txt"
-    else:
-        return ".err"                             # REH 20Mar2020 Refactor
-    # Todo need to add MTHFR, Genera, meuDNA, 1240K and HOv1
-
-
 def button_generate_selected_autosomal():
     """ Run Microarray format generator (originally based on Extract23) to generate selected formats. """
     global selectAutosomalFormatsWindow, kits
@@ -505,16 +501,14 @@ def button_generate_selected_autosomal():
     if os.path.exists(CombinedKitTXT_oFN) and \
         os.path.getmtime(CombinedKitTXT_oFN) > os.path.getmtime(wgse.BAM.file_oFN) and \
         os.path.getsize(CombinedKitTXT_oFN) > minCbnKitSize:
-        # Now for EACH format selected (other than CombinedKit), add a run of aconv.py (our script)
-        #  to take the CombinedKit content and subset it to create the respective format. Note that we
-        #  are simply running aconv.py as a stand-alone python program; not importing and calling it.
-        # Todo modify below to simply call aconv routine, within same python thread, and use python zip command
+        # Now ONE run of aconv.py (our script) for ALL the formats selected (other than CombinedKit).  It reads the
+        #  CombinedKit once and subsets it to create each format; writing its ZIP file directly.  Run as a stand-alone
+        #  python program (not imported) so the Please Wait window stays responsive.
 
         python = wgse.python3x_qFN
         aconv = f'"{wgse.prog_FP}aconv.py"'
-        cmdzip = wgse.zipx_qFN
 
-        commands = ""
+        formats = []
         stop = len(checkbuttons_results) - (0 if wgse.DEBUG_MODE else 6)    # New formats not quite ready for primetime
         for i in range(stop):
             out_compressed_oFN = f'{out_oFPB}_{kits[i]}.zip'
@@ -522,17 +516,12 @@ def button_generate_selected_autosomal():
                 not (os.path.exists(out_compressed_oFN) and
                      os.path.getmtime(out_compressed_oFN) > os.path.getmtime(CombinedKitTXT_oFN) and
                      os.path.getsize(out_compressed_oFN) > minMicZipsize):
-                # These files only take a minute or two each to create; but if doing all 20, takes awhile. So check
-                suffix = get_target_type_suffix(kits[i])
-                out_uncompressed_qFN = f'"{out_FPB}_{kits[i]}{suffix}"'
-                out_compressed_qFN = f'"{out_FPB}_{kits[i]}.zip"'
-                commands += (
-                    f'echo "Generating microarray file for format {kits[i]}"\n'
-                    f'{python} {aconv} {kits[i]} "{out_FPB_cmbkit}.txt" "{out_FPB}" "{wgse.reflib.cma_FP}"\n'
-                    f'{cmdzip} -mj {out_compressed_qFN} {out_uncompressed_qFN}\n'  # Do a move; delete uncompressed
-                )
-
-        run_bash_script("ButtonMicroarrayDNA", commands, parent=selectAutosomalFormatsWindow)
+                formats.append(kits[i])     # Only a second or two each now; but still no need to recreate
+
+        if formats:
+            commands = (f'{python} {aconv} {",".join(formats)} "{out_FPB_cmbkit}.txt" "{out_FPB}" '
+                        f'"{wgse.reflib.cma_FP}"\n')
+            run_bash_script("ButtonMicroarrayDNA", commands, parent=selectAutosomalFormatsWindow)
 
     # Handle CombinedKit file cleanup based on whether requested and/or reused an existing copy
     wgse.tempf.list.append(CombinedKitTXT_oFN)      # Always delete the uncompressed version;
@@ -554,6 +543,8 @@ def _button_CombinedKit(parent_window, parallel=False):
       Original Extract23 did this only for a single 23andMe v3 template.  Here we created a CombinedKit template
       of the merger of all known formats.  Then wrote our own aconv.py module to subset the CombinedKit for each
       desired file format.
+      parallel (DEBUG tab) verifies our own region sharded parallel call (kitshards.py) against the serial one; once
+      identical for the reference model and target list, it is used from then on (settings.kit_parallel_verified).
     """
 
     out_FPB_cmbkit = f'{wgse.outdir.FPB}_CombinedKit'
@@ -575,15 +566,18 @@ def _button_CombinedKit(parent_window, parallel=False):
     liftover_tohg19 = ""        # Default; no liftover needed
     if wgse.BAM.Build == 38:
         refmod = "hg38" if wgse.BAM.SNTypeC == "Chr" else "GRCh38" if wgse.BAM.SNTypeC == "Num" else "error"
-        liftover_tohg19 = f'{python} {lifthg38} "{out_FPB_cmbkit}" {refmod}\n'
+        liftover_tohg19 = f'{python} {lifthg38} "{out_FPB_cmbkit}" {refmod} "" {refVCFtab_qFN}\n'
         if refmod == "error":
             wgse_message("error", "errBuildUnkSeqNameTitle", True,
                          wgse.lang.i18n["errBuildUnkSeqNameType"].replace("{{SNType}}", wgse.BAM.SNTypeC))
             return
     elif wgse.BAM.Build == 99:
-        wgse_message("error", "errLitfoverUnsupTitle", True,
-                     wgse.lang.i18n["errLoftoverUnsuported"].replace("{{START}}", "T2T").replace("{{END}}", "19"))
-        return
+        chain_oFN = wgse.reflib.get_liftover_chain_oFN(99)      # Same liftover; just a T2T to HG19 chain file
+        if not chain_oFN:
+            wgse_message("error", "errLitfoverUnsupTitle", True,
+                         wgse.lang.i18n["errLoftoverUnsuported"].replace("{{START}}", "T2T").replace("{{END}}", "19"))
+            return
+        liftover_tohg19 = f'{python} {lifthg38} "{out_FPB_cmbkit}" T2T "{universalOS(chain_oFN)}" {refVCFtab_qFN}\n'
 
     # Setup additional filenames and paths
     temp_called_vcf = f'"{wgse.tempf.FP}CombKit_called.vcf.gz"'
@@ -627,6 +621,19 @@ def _button_CombinedKit(parent_window, parallel=False):
         if wgse.reflib.missing_refgenome(refgen_qFN, parent_window):
             return False       # missing_refgenome() reports sn error if reference genome does not exist
 
+        # A vendor gVCF or all-sites VCF already has the calls; the kit straight from it (vcfkit.py) in about a
+        #  minute instead of the hour of mpileup / call.  Not when verifying the parallel call (DEBUG tab).
+        vendor_vcf_oFN = None if parallel else _CombinedKit_vendor_vcf()
+        if vendor_vcf_oFN:
+            commands = (
+                f'{python} "{wgse.prog_FP}vcfkit.py" "{universalOS(vendor_vcf_oFN)}" {refVCFtab_qFN} {refgen_qFN} '
+                f'{temp_head_qFN} "{out_FPB_cmbkit}.txt"\n'
+                f'{liftover_tohg19}'
+                f'{cmdzip} -j "{out_FPB_cmbkit}.zip" "{out_FPB_cmbkit}.txt"\n'
+            )
+            run_bash_script("CombinedKitVCF", commands, parent=parent_window)
+            return False
+
         '''
           Based on the (original) Extract23 Windows script: https://github.com/tkrahn/extract23/blob/master/extract23.sh
           With parallelization extension shown in: https://gist.github.com/tkrahn/ef62cfaab678f447ea53ddee09ce0eb2 
@@ -634,48 +641,17 @@ def _button_CombinedKit(parent_window, parallel=False):
           of the merger of all known formats.  Then wrote our own aconv.py module to subset the CombinedKit for each
           desired file format. Note that CombinedKit only includes valid calls; not no-call indication for ones missing.
         '''
-        if not parallel:
-            # Old versus new pileup command; old using samtools generates a warning that we should switch to new
-            #   {samtools} mpileup -B    -C 50 -r {fchrom} -l {reftab_qFN} -f {refgenome} -hu {bamfile}
-            #   {bcftools} mpileup -B -I -C 50 -r {fchrom} -T {reftab_qFN} -f {refgenome} -Ou {bamfile}
-            # Note -B required for Nanopore long read tools; minimal effect on paired-end sequencer output
-            commands = (
-                f'{bcftools} mpileup -B -I -C 50 -T {refVCFtab_qFN} -f {refgen_qFN} -Ou {bamfile} | '
-                f'  {bcftools} call --ploidy-file {ploidy_qFN} -V indels -m -P 0 --threads {cpus} -Oz -o {temp_called_vcf}\n'
-            )
-        else:
-            # NOTE: Parallelization does NOT WORK on any platform (tried Win10, Ubuntu, MacOS; Intel, AMD, M1)
-            #   Generates about 1% of values in error; especially chr 13-16 and 22 at start. Identical error on all
-            #   platforms. Was true for 1K Genome ref models -- bcftools call clearly makes use of alt contigs.
-            #   Left it available in the DEBUG tab for further experimentation. Maybe works for HG models?
-            commands = (
-                f'set +x\n'  # Turn off command echo; otherwise get echo of echo. Comments are not printed unless -v
-                f'echo "Generating CombinedKit file from BAM (takes upwards of an hour)" \n'
-                f'echo "Parallelizing each chromosome mpileup / variant-call; then will merge the results" \n'
-                f'set -x\n'
-            )
-            # Proper ploidy setting messed up CombinedKit generation for males; so override to avoid warning message
-            #  and later error by using special ploidy.txt to give diploid for now.
-            # ploidy = "GRCh38" if wgse.BAM.Build == 38 else "GRCh37" if wgse.BAM.Build == 37 or wgse.BAM.Build == 19 else "X"
-            for chrom in wgse.valid_chromosomes:    # Using internal list; always same chromosome name convention
-                chrtmp = f'"{wgse.tempf.FP}{chrom}.vcf.gz"'  # Put each chromosome VCF in temp for later cleanup
-                # For GRCh numbering, need to remove "chr" from valid_chromosome name and add T to Mito name
-                fchrom = chrom.replace('chr', '').replace("M", "MT") if wgse.BAM.SNTypeC == "Num" else chrom
-                # Old versus new pileup command; old using samtools generates a warning that we should switch to new
-                #   {samtools} mpileup -B    -C 50 -r {fchrom} -l {reftab_qFN} -f {refgenome} -hu {bamfile}
-                #   {bcftools} mpileup -B -I -C 50 -r {fchrom} -T {reftab_qFN} -f {refgenome} -Ou {bamfile}
-                # Note -B required for Nanopore long read tools; minimal effect on paired-end sequencer output
-                commands += (
-                    f'{bcftools} mpileup -B -I -C 50 -r {fchrom} -T {refVCFtab_qFN} -f {refgen_qFN} -Ou {bamfile} | '
-                    f'  {bcftools} call --ploidy-file {ploidy_qFN} -V indels -m -P 0 --threads {cpus} -Oz -o {chrtmp} &\n'
-                )
-            # Wait for all 25 forked processes to finish; then do a subshell cd otherwise shell line exceeds limit
-            #  when using 25 fully qualified file names; all files are in temp directory and will get deleted at end
-            commands += (
-                f'wait\n'
-                f'(cd {wgse.tempf.FP}; {bcftools} concat -Oz -o {temp_called_vcf} '
-                f' chr[1-9].vcf.gz chr[1-2][0-9].vcf.gz chr[M,X,Y].vcf.gz )\n'
-            )
+        # Old versus new pileup command; old using samtools generates a warning that we should switch to new
+        #   {samtools} mpileup -B    -C 50 -r {fchrom} -l {reftab_qFN} -f {refgenome} -hu {bamfile}
+        #   {bcftools} mpileup -B -I -C 50 -r {fchrom} -T {reftab_qFN} -f {refgenome} -Ou {bamfile}
+        # Note -B required for Nanopore long read tools; minimal effect on paired-end sequencer output
+        # Proper ploidy setting messed up CombinedKit generation for males; so override to avoid warning message
+        #  and later error by using special ploidy.txt to give diploid for now.
+        # ploidy = "GRCh38" if wgse.BAM.Build == 38 else "GRCh37" if wgse.BAM.Build == 37 or wgse.BAM.Build == 19 else "X"
+        call_commands = (
+            f'{bcftools} mpileup -B -I -C 50 -T {refVCFtab_qFN} -f {refgen_qFN} -Ou {bamfile} | '
+            f'  {bcftools} call --ploidy-file {ploidy_qFN} -V indels -m -P 0 --threads {cpus} -Oz -o {temp_called_vcf}\n'
+        )
 
         # Note: liftover_hg38to19 will be Null if not a Build38 BAM so simply puts an empty line when not used
         # Todo more simplication and reduction of intermediate files possible? sed/sort/cat on one line? Avoid more
@@ -685,7 +661,7 @@ def _button_CombinedKit(parent_window, parallel=False):
                            r"s/TA$/AT/; s/TC$/CT/; s/TG$/GT/; s/GA$/AG/; s/GC$/CG/; s/CA$/AC/'")
         tab_pattern = r"$'\t'"
 
-        commands += (
+        kit_commands = (
             f'{tabix} -p vcf {temp_called_vcf}\n'
             f'{bcftools} annotate -Oz -a {refVCFtab_qFN} -c CHROM,POS,ID {temp_called_vcf} > {temp_annotated_vcf}\n'
             f'{tabix} -p vcf {temp_annotated_vcf}\n'
@@ -698,12 +674,107 @@ def _button_CombinedKit(parent_window, parallel=False):
 
         reuse = False
 
+        # Parallel: each region shard (kitshards.py) is an mpileup / call of its own; concatenated in order they are
+        #  the serial called VCF.  The old one per valid_chromosomes entry (-r chrom) was about 1% in error on every
+        #  platform; it dropped the targets on alt and other contigs.  So only used once proven identical for this
+        #  reference model and target list; until then (DEBUG tab button) the serial kit is made as always and the
+        #  merged shards checked against it.
+        parallel_key = f'{wgse.BAM.Refgenome}:{os.path.basename(unquote(refVCFtab_qFN))}'
+        verified = parallel_key in wgse.kit_parallel_verified
+        verify = parallel and not verified
+        if (parallel or verified) and wgse.BAM.Indexed and "@SQ\t" in wgse.BAM.Header:
+            called_oFN = nativeOS(unquote(temp_called_vcf))
+            parallel_FN = f'{wgse.tempf.FP}CombKit_called_parallel.vcf.gz' if verify else unquote(temp_called_vcf)
+            parallel_oFN = nativeOS(parallel_FN)
+            pipeline = Pipeline("ButtonCombinedKit", nativeOS(f'{wgse.tempf.FP}CombKit_pipeline.json'),
+                                wgse.tempf.oFP)
+            if verify:
+                pipeline.add(Stage("call", "ButtonCombinedKit", call_commands,
+                                   inputs=[wgse.BAM.file_oFN], outputs=[called_oFN], threads=cpus))
+            _CombinedKit_shard_stages(pipeline, parallel_FN, refVCFtab_qFN, refgen_qFN, ploidy_qFN, bamfile)
+            pipeline.add(Stage("kit", "ButtonCombinedKit", kit_commands,
+                               inputs=[called_oFN], outputs=[CombinedKitZIP_oFN]))
+            wgse.tempf.list.append(pipeline.manifest_oFN)
+            if not run_pipeline(pipeline, parent_window):
+                return reuse
+
+            if verify:
+                differ, examples = compare_vcfs(called_oFN, parallel_oFN)
+                wgse.tempf.list.append(parallel_oFN)
+                if differ:
+                    DEBUG(f'Parallel CombinedKit differs in {differ} records; first: {examples}')
+                    wgse_message("error", "errKitParallelDiffersTitle", True,
+                                 wgse.lang.i18n["errKitParallelDiffers"].replace("{{COUNT}}", f'{differ:,}'))
+                else:
+                    wgse.kit_parallel_verified.append(parallel_key)
+                    wgse.save_settings()
+                    wgse_message("info", "infoKitParallelVerifiedTitle", True,
+                                 wgse.lang.i18n["infoKitParallelVerified"].replace("{{KEY}}", parallel_key))
+            return reuse
+
+        commands = call_commands + kit_commands
+
     run_bash_script("ButtonCombinedKit", commands, parent=parent_window)
     # Todo really should check if completed OK; but general issue with all run_bash_script calls
 
     return reuse
 
 
+def _CombinedKit_shard_stages(pipeline, called_FN, refVCFtab_qFN, refgen_qFN, ploidy_qFN, bamfile):
+    """
+      Add the region shard mpileup / call stages (kitshards.py; about two per thread so they finish together) and
+      their in order concatenation into called_FN to the CombinedKit pipeline.  -R jumps to the shard regions;
+      -T still filters on the full target list as in the serial run.
+    """
+    bcftools = wgse.bcftoolsx_qFN
+    targets_oFN = nativeOS(unquote(refVCFtab_qFN))
+    plan = plan_shards(target_sites(targets_oFN), header_sequences(wgse.BAM.Header), 2 * wgse.os_threads)
+
+    shard_FNs = []
+    for shard, regions in enumerate(plan):
+        regions_FN = f'{wgse.tempf.FP}CombKit_shard{shard:03d}.regions'
+        shard_FN = f'{wgse.tempf.FP}CombKit_shard{shard:03d}.vcf.gz'
+        write_regions(regions, nativeOS(regions_FN))
+        wgse.tempf.list += [nativeOS(regions_FN), nativeOS(shard_FN)]
+        shard_FNs.append(shard_FN)
+        pipeline.add(Stage(f'shard{shard:03d}', "CombinedKitShard",
+                           f'{bcftools} mpileup -B -I -C 50 -R "{regions_FN}" -T {refVCFtab_qFN} -f {refgen_qFN} '
+                           f'-Ou {bamfile} | '
+                           f'  {bcftools} call --ploidy-file {ploidy_qFN} -V indels -m -P 0 -Oz -o "{shard_FN}"\n',
+                           inputs=[wgse.BAM.file_oFN, nativeOS(regions_FN)], outputs=[nativeOS(shard_FN)]))
+
+    # A list file; all the shard names on one line can exceed the command line limit (on Windows especially)
+    list_FN = f'{wgse.tempf.FP}CombKit_shards.txt'
+    with open(nativeOS(list_FN), "w") as list_file:
+        list_file.write("".join(f'{shard_FN}\n' for shard_FN in shard_FNs))
+    wgse.tempf.list.append(nativeOS(list_FN))
+    pipeline.add(Stage("merge", "CombinedKitMerge", f'{bcftools} concat -f "{list_FN}" -Oz -o "{called_FN}"\n',
+                       inputs=[nativeOS(shard_FN) for shard_FN in shard_FNs], outputs=[nativeOS(called_FN)]))
+
+
+def _CombinedKit_vendor_vcf():
+    """
+      The first vendor VCF found with the BAM (BAMFile.find_VCFs) that the CombinedKit can be made from: a gVCF or
+      all-sites VCF (vcfkit.vcf_kind) of the whole genome on the same build as the BAM (the target list is chosen
+      by it).  None if there is none.
+    """
+    for vcf_FN, (types, chroms) in wgse.BAM.find_VCFs().items():
+        vcf_oFN = nativeOS(vcf_FN)
+        if "SNP" not in types or "A" not in chroms or not os.path.isfile(vcf_oFN):
+            continue
+        try:
+            parser = VCFParser(vcf_oFN)
+            kind = vcf_kind(parser)
+        except (OSError, EOFError, ValueError) as err:
+            DEBUG(f'Cannot read vendor VCF {vcf_oFN}: {err}')
+            continue
+        ident = identify_reference(header_records(parser.header), reference_index(wgse.reflib.gen_oFP), parser.header)
+        if kind and ident["Build"] == wgse.BAM.Build:
+            DEBUG(f'CombinedKit from {kind} vendor VCF {vcf_oFN}')
+            return vcf_oFN
+    return None
+
+
 def cancel_autosomal_formats_window():
     """ Remove Autosomal formats window in preparation for restoring WGSE Main Window """
     from mainwindow import mainwindow_resume   # Have to localize due to import loop
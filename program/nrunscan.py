@@ -0,0 +1,283 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) to replace countingNs.py; same parameters, same RefModel_ncnt.csv and
+RefModel_nbin.csv outputs (see there for what is reported).  countingNs.py walks the FASTA one 60 character line at a
+time through a regex and a pile of globals; splitting lines at the bucket boundaries.  Here each sequence is taken
+whole (the decompressed stream is cut at the ">" header lines with bytes.find), its line ends removed, and the runs
+of N found with a NumPy flatnonzero of where the N mask changes; the 1000 bucket counts follow from the runs with
+np.add.at (no second pass over the bases).  As countingNs.py, the whole run is counted in one bucket: the one its
+first base past the run is in (where countingNs.py closed the run).  Sequences are scanned in parallel worker
+processes while the next ones are read; results are written in FASTA order.
+
+    python3 nrunscan.py RefModel.fa.gz [processes]
+"""
+
+import sys
+import os
+import re
+import math
+import gzip
+from collections import deque
+from multiprocessing import Pool
+
+import numpy as np
+
+NUM_BUCKETS = 1000      # Number of buckets per sequence (seqLN / NUM_BUCKETS == bucksize)
+NRUN_SIZE = 300         # Threshold to record Run of N's data (large vs small); Roughly the insert size
+CHUNK_SIZE = 64 * 2**20     # Bytes of decompressed FASTA read at a time
+WHITESPACE = b' \t\r\n'
+
+
+class FASTQError(ValueError):
+    pass
+
+
+def fasta_sequences(fasta_file, offsets=False):
+    """
+    Yield (SN, body) for each sequence of the binary FASTA stream; body is the raw bytes of its sequence lines (from
+    the end of line of its header).  With offsets, (SN, body, offset of the body in the stream) for FAI indices.
+    """
+    name, parts, offset = None, [], 0
+    pending = b'\n'                 # So a header on the very first line is found as "\n>" too
+    start = -1                      # Stream offset of data[0] (the "\n" added above is not in the stream)
+    while True:
+        chunk = fasta_file.read(CHUNK_SIZE)
+        data = pending + chunk
+        if b'\n+' in data:          # A FASTQ quality separator line; sequencer data, not a reference model
+            raise FASTQError("Appears to be FASTQ sequencer data; not a FASTA reference model.")
+        pos = 0
+        while True:
+            header = data.find(b'\n>', pos)
+            if header < 0 or (chunk and data.find(b'\n', header + 1) < 0):
+                break               # No (complete) header line in what we have
+            parts.append(data[pos:header])
+            if name is not None:
+                yield (name, b''.join(parts), offset) if offsets else (name, b''.join(parts))
+            end = data.find(b'\n', header + 1)
+            end = len(data) if end < 0 else end
+            fields = data[header + 2:end].split()
+            name, parts, offset = fields[0].decode() if fields else "", [], start + end
+            pos = end
+        if not chunk:
+            parts.append(data[pos:])
+            break
+        keep = header if header >= 0 else len(data) - 1     # Keep a partial header line or a last "\n"
+        parts.append(data[pos:keep])
+        pending = data[keep:]
+        start += keep
+    if name is not None:
+        yield (name, b''.join(parts), offset) if offsets else (name, b''.join(parts))
+
+
+def fasta_blocks(fasta_file):
+    """
+    Stream form of fasta_sequences(); a sequence is never held whole.  Yields (SN, offset, None) at each header line
+    (offset as in fasta_sequences) and then (SN, offset, lines) for its sequence lines in pieces of about CHUNK_SIZE.
+    The pieces are whole lines with their line ends; except when a single line is longer than a chunk.
+    """
+    name, offset = None, 0
+    start = 0                       # Stream offset of data[0]
+    pending = b''
+    while True:
+        chunk = fasta_file.read(CHUNK_SIZE)
+        data = pending + chunk
+        if b'\n+' in data:          # A FASTQ quality separator line; sequencer data, not a reference model
+            raise FASTQError("Appears to be FASTQ sequencer data; not a FASTA reference model.")
+        cut = data.rfind(b'\n') + 1 if chunk else len(data)     # Whole lines only; all of it at the end
+        if not cut and not data.startswith(b'>'):
+            cut = len(data)         # Part of a very long sequence line; a header line is kept until complete
+        pos = 0
+        while pos < cut:
+            if data[pos] == ord('>'):
+                end = data.find(b'\n', pos, cut)
+                end = cut if end < 0 else end
+                fields = data[pos + 1:end].split()
+                name, offset = fields[0].decode() if fields else "", start + end
+                yield name, offset, None
+                pos = end + 1
+                continue
+            header = data.find(b'\n>', pos, cut)
+            stop = cut if header < 0 else header + 1
+            if name is not None:
+                yield name, offset, data[pos:stop]
+            pos = stop
+        pending = data[cut:]
+        start += cut
+        if not chunk:
+            break
+
+
+class NRunScanner:
+    """ Runs of N in a sequence fed in pieces (only the runs are kept); result() as scan_sequence() """
+
+    def __init__(self):
+        self.bases = 0
+        self.starts, self.ends = [], []
+        self.open = None            # Start of a run still going at the end of the last piece
+
+    def feed(self, bases):
+        # Runs are where the N mask changes (plus an N at either end); starts and ends alternate
+        mask = np.frombuffer(bases, dtype=np.uint8) == ord('N')
+        if not len(mask):
+            return
+        edges = np.flatnonzero(mask[1:] != mask[:-1]) + 1
+        if mask[0]:
+            edges = np.concatenate(([0], edges))
+        if mask[-1]:
+            edges = np.concatenate((edges, [len(mask)]))
+        starts, ends = edges[0::2] + self.bases, edges[1::2] + self.bases
+        if self.open is not None:
+            if mask[0]:
+                starts[0] = self.open       # The open run goes on into this piece
+            else:
+                self.starts.append(np.array([self.open]))
+                self.ends.append(np.array([self.bases]))
+            self.open = None
+        if mask[-1]:
+            self.open = int(starts[-1])
+            starts, ends = starts[:-1], ends[:-1]
+        self.starts.append(starts)
+        self.ends.append(ends)
+        self.bases += len(mask)
+
+    def result(self, name, seqLN):
+        """ N run stats of the sequence (see countingNs.py); seqLN its LN from the DICT file """
+        if self.open is not None:
+            self.starts.append(np.array([self.open]))
+            self.ends.append(np.array([self.bases]))
+            self.open = None
+        starts = np.concatenate(self.starts).astype(np.int64) if self.starts else np.zeros(0, dtype=np.int64)
+        ends = np.concatenate(self.ends).astype(np.int64) if self.ends else np.zeros(0, dtype=np.int64)
+        lengths = ends - starts
+        large = lengths > NRUN_SIZE
+
+        # Each run counted whole in the bucket of its end (the first base past it; so the next bucket for a run ending
+        #  on a boundary) as countingNs.py closed it there.  A run ending the sequence on a boundary is in no bucket.
+        bucksize = round(seqLN / NUM_BUCKETS)
+        buckets = np.zeros(-(-self.bases // max(bucksize, 1)), dtype=np.int64)
+        index = ends // max(bucksize, 1)
+        np.add.at(buckets, index[index < len(buckets)], lengths[index < len(buckets)])
+
+        return {
+            "SN": name, "LN": seqLN, "bases": self.bases, "bucksize": bucksize,
+            "Ncnt": int(lengths.sum()), "smlNregs": int(np.count_nonzero(~large)),
+            "starts": starts[large].tolist(), "lengths": lengths[large].tolist(),
+            "buckets": [(int(index), int(count))
+                        for index, count in zip(np.flatnonzero(buckets > 1), buckets[buckets > 1])]
+        }
+
+
+def scan_sequence(task):
+    """ N run stats of one sequence body (see countingNs.py); task is (SN, body, LN from the DICT file) """
+    name, body, seqLN = task
+    if b'\n#' in body:              # Comment lines are skipped
+        body = re.sub(rb'\n#[^\n]*', b'', body)
+    scanner = NRunScanner()
+    scanner.feed(body.translate(None, WHITESPACE))
+    return scanner.result(name, seqLN)
+
+
+class NCountWriter:
+    """ Writes the _ncnt.csv and _nbin.csv files exactly as countingNs.py did """
+
+    def __init__(self, fasta_FBS, ncnt_file, nreg_file):
+        self.nf, self.rf = ncnt_file, nreg_file
+        self.totalSN = self.totalLN = self.totalNcnt = self.totalNregs = self.totalsmlNregs = 0
+        print(f'#Processing Ref Model: {fasta_FBS} with >{NRUN_SIZE}bp runs of N and {NUM_BUCKETS} '
+              f'buckets per sequence', file=self.nf)
+        print(f'#Seq\tNumBP\tNumNs\tNumNreg\tNregSizeMean\tNregSizeStdDev\tSmlNreg\tBuckSize\t'
+              f'Bucket Sparse List (bp start, ln value) when nonzero', file=self.nf)
+        print(f'#Processing Ref Model: {fasta_FBS} with >{NRUN_SIZE}bp of N runs', file=self.rf)
+        print(f'#SN\tBinID\tStart\tSize', file=self.rf)
+
+    def sequence(self, result):
+        name, seqLN, seqNcnt = result["SN"], result["LN"], result["Ncnt"]
+        if seqLN != result["bases"]:
+            print(f'***WARNING: {name} FASTA ({result["bases"]}) and DICT ({seqLN}) lengths differ: '
+                  f'{result["bases"]-seqLN}', file=sys.stderr, flush=True)
+
+        lengths = np.array(result["lengths"], dtype=np.float64)
+        seqNregs = len(lengths)
+        seqNmean = lengths.mean() if seqNregs else 0
+        seqNM2 = ((lengths - seqNmean) ** 2).sum() if seqNregs else 0
+        seqNSD = math.sqrt(seqNM2 / (seqNcnt - 1)) if seqNcnt > 2 else 0      # Sic; countingNs.py divides by Ncnt
+
+        for regnum, (start, size) in enumerate(zip(result["starts"], result["lengths"]), 1):
+            print(f'{name}\t{regnum}\t{start:,}\t{size:,}', file=self.rf)
+
+        bucksize = result["bucksize"]
+        sparse = "".join(f'\t{index * bucksize}\t{round(math.log(count))}'
+                         for index, count in result["buckets"] if round(math.log(count)) > 0)
+        print(f'{name}\t{seqLN:,}\t{seqNcnt:,}\t{seqNregs}\t{seqNmean:,.0f}\t{seqNSD:,.0f}\t{result["smlNregs"]}\t'
+              f'{bucksize}{sparse}', file=self.nf)
+
+        self.totalSN += 1
+        self.totalLN += seqLN
+        self.totalNcnt += seqNcnt
+        self.totalNregs += seqNregs
+        self.totalsmlNregs += result["smlNregs"]
+
+    def close(self):
+        print(f'#TOTALS:', file=self.nf)
+        print(f'{self.totalSN}\t{self.totalLN:,}\t{self.totalNcnt:,}\t{self.totalNregs}\t\t\t{self.totalsmlNregs}',
+              file=self.nf)
+
+
+def read_dict(dict_oFN):
+    """ SN -> LN of the @SQ lines of a DICT file """
+    seqdict = {}
+    with open(dict_oFN, "r") as f:
+        for line in f:
+            cols = line.split()
+            if cols and cols[0] == '@SQ':
+                fields = dict(col.split(":", 1) for col in cols[1:] if ":" in col)
+                seqdict[fields["SN"]] = int(fields["LN"])
+    return seqdict
+
+
+def count_Ns(fasta_oFN, processes=None):
+    """ Scan the (gzip'ed) FASTA and write its _ncnt.csv and _nbin.csv files; the DICT file must exist """
+    fasta_FBS = os.path.basename(fasta_oFN)
+    fasta_FPB = fasta_oFN.replace(".fasta.gz", "").replace(".fna.gz", "").replace(".fa.gz", "")
+    seqdict = read_dict(fasta_FPB + ".dict")
+    processes = processes or os.cpu_count() or 1
+
+    with gzip.open(fasta_oFN, "rb") if fasta_oFN.endswith("gz") else open(fasta_oFN, "rb") as fasta_file, \
+            open(fasta_FPB + "_ncnt.csv", "w") as ncnt_file, open(fasta_FPB + "_nbin.csv", "w") as nreg_file, \
+            Pool(processes) as pool:
+        writer = NCountWriter(fasta_FBS, ncnt_file, nreg_file)
+        waiting = deque()           # Results in FASTA order; at most two per process queued to bound memory
+        for name, body in fasta_sequences(fasta_file):
+            if seqdict.get(name, 0) <= 0:
+                print(f'***ERROR: Skipping unrecognized SN ({name}) in FASTA file (not found in DICT).',
+                      file=sys.stderr, flush=True)
+                continue
+            print(f'***INFO: Processing {name} in FASTA file {fasta_FBS}', file=sys.stdout, flush=True)
+            waiting.append(pool.apply_async(scan_sequence, ((name, body, seqdict[name]),)))
+            while len(waiting) > 2 * processes or (waiting and waiting[0].ready()):
+                writer.sequence(waiting.popleft().get())
+        while waiting:
+            writer.sequence(waiting.popleft().get())
+        writer.close()
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) not in (2, 3) or (len(sys.argv) == 3 and not sys.argv[2].isdigit()):
+        print(f'Usage: python3 {module} RefModel.fa.gz [processes]', file=sys.stderr, flush=True)
+        print(f'   RefModel.fasta.gz and RefModel.fna.gz also acceptable', file=sys.stderr, flush=True)
+        print(f'   RefModel.dict file must exist. See "samtools dict" for how to create.', file=sys.stderr, flush=True)
+        print(f'   Output written to RefModel_ncnt.csv and RefModel_nbin.csv', file=sys.stderr, flush=True)
+        exit(1)
+    print(f'***INFO: Processing Ref Model {os.path.basename(sys.argv[1])} for >{NRUN_SIZE}bp runs of N and '
+          f'{NUM_BUCKETS} buckets per sequence', file=sys.stdout, flush=True)
+    try:
+        count_Ns(sys.argv[1], int(sys.argv[2]) if len(sys.argv) == 3 else None)
+    except FASTQError as err:
+        print(f'***ERROR: {err}', file=sys.stderr, flush=True)
+        exit(1)
@@ -0,0 +1,262 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Dependency graph pipeline engine (module pipeline) for the multi-step buttons (align, realign).  Each Stage
+    declares its input and output files and what it needs to run (threads, memory, temp space).  The order, what can
+    run at the same time, and what is already done all follow from those declarations; no more hand-rolled sequence
+    of steps each with its own mtime / size heuristic for reusing an intermediate file.
+
+    A manifest (JSON file next to the outputs) records, for each completed stage, the size and modification time of
+    its inputs and outputs.  A stage is marked started in it before it runs; so the partial outputs of a crash are
+    never taken as done.  A stage is up to date if its outputs are as recorded and its inputs are unchanged; an
+    input that has since been removed (an intermediate we cleaned up) is fine as long as it was the very file the
+    producing stage recorded.  Without a manifest entry (runs from before the manifest), the outputs must be newer
+    than the inputs and pass the stage check (samtools quickcheck for BAM / CRAM; see quickcheck()).  Only what a
+    final (sink) stage needs is (re)run; so a crash resumes from the last good artifact.  Stages run (bash with
+    pipefail) as soon as their inputs are produced and their threads, memory and temp space fit; a stage is done only
+    if its script succeeded and its outputs pass the check.
+
+    No tkinter or settings dependency here; commandprocessor.run_pipeline() supplies the job submission and GUI.
+"""
+
+import os
+import json
+import time
+import shutil
+import subprocess
+
+from jobqueue import DONE
+
+
+class Stage:
+    """
+    One step: a bash script (string, or a function returning it when the stage starts so it can use results of
+    earlier stages) with the files it reads and writes.  title is also the expected_time / language key.  check is
+    an optional function(stage) that says if the outputs are good; default is the pipeline's, else all exist and are
+    not empty.
+    """
+
+    def __init__(self, name, title, commands, inputs=(), outputs=(), threads=1, mem=0, temp=0, check=None):
+        self.name = name
+        self.title = title
+        self.commands = commands
+        self.inputs = [inp for inp in inputs if inp]
+        self.outputs = [out for out in outputs if out]
+        self.threads = threads
+        self.mem = mem                  # Bytes
+        self.temp = temp                # Bytes of temporary space needed while running
+        self.check = check
+
+    def script(self):
+        # A failure anywhere in a pipe fails the stage (not just of its last command)
+        return "set -o pipefail\n" + (self.commands() if callable(self.commands) else self.commands)
+
+    def good(self, check=None):
+        check = self.check or check
+        if check:
+            return check(self)
+        return all(os.path.isfile(out) and os.path.getsize(out) > 0 for out in self.outputs)
+
+    def __repr__(self):
+        return f'Stage({self.name})'
+
+
+def file_signature(file_oFN):
+    """ (size, mtime) of a file or None if it does not exist """
+    try:
+        stats = os.stat(file_oFN)
+    except OSError:
+        return None
+    return [stats.st_size, int(stats.st_mtime)]
+
+
+def quickcheck(samtools_oFN):
+    """
+    Stage check: every output there and not empty, and the BAM / CRAM ones pass samtools quickcheck (a header, and
+    the EOF block a killed or crashed writer leaves off).
+    """
+    def check(stage):
+        if not all(os.path.isfile(out) and os.path.getsize(out) > 0 for out in stage.outputs):
+            return False
+        bams = [out for out in stage.outputs if out.endswith((".bam", ".cram"))]
+        if not bams:
+            return True
+        try:
+            return subprocess.run([samtools_oFN, "quickcheck", *bams], stdout=subprocess.DEVNULL,
+                                  stderr=subprocess.DEVNULL).returncode == 0
+        except OSError:
+            return False
+    return check
+
+
+class Pipeline:
+    """ Set of Stages with a manifest of completed work; run() executes whatever the final stages still need """
+
+    def __init__(self, name, manifest_oFN, temp_oFP=None, check=None):
+        self.name = name
+        self.manifest_oFN = manifest_oFN
+        self.temp_oFP = temp_oFP        # Directory the stage temp space is taken from
+        self.check = check              # Output check of the stages with none of their own (e.g. quickcheck())
+        self.stages = []
+        self.jobs = []                  # Jobs of the running stages (for a cancel from the GUI)
+        self.failed = None              # Stage that failed (if any)
+        self.cancelled = False
+        self.manifest = {}
+        if os.path.isfile(manifest_oFN):
+            try:
+                with open(manifest_oFN, "r") as f:
+                    self.manifest = json.load(f)
+            except (OSError, ValueError):
+                self.manifest = {}
+
+    def add(self, stage):
+        self.stages.append(stage)
+        return stage
+
+    def producer(self, file_oFN):
+        return next((stage for stage in self.stages if file_oFN in stage.outputs), None)
+
+    def dependencies(self, stage):
+        return [dep for dep in (self.producer(inp) for inp in stage.inputs) if dep and dep is not stage]
+
+    def _save_manifest(self):
+        temp_oFN = self.manifest_oFN + ".tmp"
+        with open(temp_oFN, "w") as f:
+            json.dump(self.manifest, f, indent=1)
+        os.replace(temp_oFN, self.manifest_oFN)     # Atomic so a crash never leaves a partial manifest
+
+    def _start(self, stage):
+        """ Mark the stage started (no outputs recorded); until it is recorded done, what it leaves is not used """
+        self.manifest[stage.name] = {"started": time.time()}
+        self._save_manifest()
+
+    def _record(self, stage):
+        self.manifest[stage.name] = {
+            "inputs": {inp: file_signature(inp) for inp in stage.inputs},
+            "outputs": {out: file_signature(out) for out in stage.outputs},
+            "finished": time.time(),
+        }
+        self._save_manifest()
+
+    def inputs_current(self, stage):
+        """ Inputs are as recorded and their producers current; an input removed since (a cleaned up intermediate)
+            must be what its producer recorded making """
+        record = self.manifest.get(stage.name)
+        if record is None or "outputs" not in record:      # Never run, or started and not finished
+            return False
+        for inp in stage.inputs:
+            current = file_signature(inp)
+            if current is None:
+                producer = self.producer(inp)
+                made = self.manifest.get(producer.name, {}).get("outputs", {}).get(inp) if producer else None
+                if made is None or made != record["inputs"].get(inp) or not self.inputs_current(producer):
+                    return False
+            elif current != record["inputs"].get(inp):
+                return False
+            else:               # Still there as used; but is it itself current (e.g. its own inputs changed)?
+                producer = self.producer(inp)
+                if producer and producer is not stage and not (
+                        self.inputs_current(producer) if producer.name in self.manifest else self.up_to_date(producer)):
+                    return False
+        return True
+
+    def up_to_date(self, stage):
+        """ Outputs are there as recorded and the inputs current; see module description """
+        if not stage.outputs or not all(os.path.isfile(out) for out in stage.outputs):
+            return False
+        record = self.manifest.get(stage.name)
+        if record is None:      # Legacy: outputs newer than the inputs, the inputs still there and the outputs good
+            newest = max((os.path.getmtime(inp) for inp in stage.inputs if os.path.isfile(inp)), default=0)
+            return all(os.path.isfile(inp) for inp in stage.inputs) and \
+                all(os.path.getmtime(out) >= newest for out in stage.outputs) and stage.good(self.check)
+        if "outputs" not in record:         # Started and never finished (crashed); its outputs may be partial
+            return False
+        return all(record["outputs"].get(out) == file_signature(out) for out in stage.outputs) and \
+            self.inputs_current(stage)
+
+    def plan(self):
+        """ Stages that must run (in declaration order); walking back from the final stages only as far as needed """
+        consumers = {stage.name: [] for stage in self.stages}
+        for stage in self.stages:
+            for dep in self.dependencies(stage):
+                consumers[dep.name].append(stage)
+
+        torun = set()
+
+        def need(stage):
+            if stage.name in torun or self.up_to_date(stage):
+                return
+            torun.add(stage.name)
+            for inp in stage.inputs:
+                dep = self.producer(inp)
+                if dep and dep is not stage and (not os.path.isfile(inp) or not self.up_to_date(dep)):
+                    need(dep)
+
+        for stage in self.stages:
+            if not consumers[stage.name]:
+                need(stage)
+
+        # A stage running means all that read its (new) outputs must run again as well
+        changed = True
+        while changed:
+            changed = False
+            for stage in self.stages:
+                if stage.name not in torun and any(dep.name in torun for dep in self.dependencies(stage)):
+                    torun.add(stage.name)
+                    changed = True
+        return [stage for stage in self.stages if stage.name in torun]
+
+    def run(self, submit, idle=None, poll_interval=0.1, estimate=None):
+        """
+        Run what plan() says is needed.  submit(stage, script) starts a stage and returns a job with finished and
+        status (commandprocessor.submit_bash_script); idle() is called while waiting (GUI pump).  Stages are started
+        as soon as their dependencies are done and their temp space fits.  Returns True if everything completed.
+        estimate(stage) is the expected seconds of a stage; of those ready, the longest is started first (so a long
+        shard is not left to run alone at the end).
+        """
+        pending = self.plan()
+        running = {}            # stage name -> (stage, job)
+        done = set()
+        expected = {}           # stage name -> estimate(stage); taken once the stage is ready (its inputs are there)
+        temp_free = shutil.disk_usage(self.temp_oFP).free if self.temp_oFP and os.path.isdir(self.temp_oFP) else 0
+
+        while pending or running:
+            # Start every pending stage whose dependencies have completed (or were not needed) and temp space fits
+            if not (self.failed or self.cancelled):
+                planned = {stage.name for stage in pending} | set(running)
+                ready = [stage for stage in pending if not any(dep.name in planned for dep in self.dependencies(stage))]
+                if estimate:
+                    ready.sort(key=lambda stage: -expected.setdefault(stage.name, estimate(stage) or 0))
+                for stage in ready:
+                    temp_used = sum(other.temp for other, _ in running.values())
+                    if running and temp_free and temp_used + stage.temp > temp_free:
+                        continue
+                    pending.remove(stage)
+                    self._start(stage)
+                    job = submit(stage, stage.script())
+                    running[stage.name] = (stage, job)
+                    self.jobs.append(job)
+            elif not running:
+                break
+
+            if idle:
+                idle()
+            time.sleep(poll_interval)
+            for name, (stage, job) in list(running.items()):
+                if not job.finished:
+                    continue
+                del running[name]
+                self.jobs.remove(job)
+                if job.status == DONE and stage.good(self.check):
+                    self._record(stage)
+                    done.add(name)
+                elif not self.cancelled:
+                    self.failed = stage
+        return not (self.failed or self.cancelled or pending)
+
+    def cancel(self):
+        self.cancelled = True
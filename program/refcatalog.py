@@ -0,0 +1,349 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) to create all the indices and the WGS Extract catalog entry of reference
+genome FASTA files in a single pass over each; replacing the samtools dict, samtools faidx, nrunscan.py and the
+md5sum / sort / grep pipelines of scripts/process_refgenomes.sh.  While the (bgzip'ed) FASTA is decompressed once, each
+sequence gives its length and MD5 (the DICT file), its offset and line layout (the FAI index) and its runs of N
+(nrunscan.NRunScanner; the _ncnt.csv and _nbin.csv files).  Each is streamed in pieces (nrunscan.fasta_blocks); no
+sequence is ever held whole.  The .wgse catalog line (md5b / md5c / md5f of the
+sorted DICT, the primary chromosome md5p / md5s, Build and mito model) is then made from those in memory; exactly as
+process_refgenomes.sh made it from the DICT file.  Multiple genomes are processed concurrently in a process pool.
+
+The BGZF compression and its .gzi index are still the job of process_refgenomes.sh (bgzip) or refdownload.py.
+
+    python3 refcatalog.py RefModel.fa.gz [RefModel.fa.gz ...] [-p processes]
+"""
+
+import sys
+import os
+import re
+import gzip
+import hashlib
+from multiprocessing import Pool
+
+import numpy as np
+
+from nrunscan import fasta_blocks, NRunScanner, NCountWriter, FASTQError, WHITESPACE
+
+# LN values of the primary chromosomes (chr1 to chr22, X, Y) in all the builds seen; alt contigs with the same length
+#  are filtered out by the SN patterns next.  Columns are the Builds:
+#   15/(33), 16/34, 17/35, 18/36, 19/37, (20)/38, hg01243 v3, chm13 v0.9, chm13 v1.1, chm13 v1.0
+#   (and for X: chm13 v0.7 X, hg002 v2 XY, hg002 v2.7 XY; no chm13 entries for Y)
+CHROMOSOME_LN = [
+    (245203898, 246127941, 245522847, 247249719, 249250621, 248956422, 248415701, 248387561, 248387328, 248387497),
+    (243315028, 243615958, 243018229, 242951149, 243199373, 242193529, 242509959, 242696759, 242696752, 242696747),
+    (199411731, 199344050, 199505740, 199501827, 198022430, 198295559, 200717518, 201106621, 201105948, 201106605),
+    (191610523, 191731959, 191411218, 191273063, 191154276, 190214555, 193408891, 193575384, 193574945, 193575430),
+    (180967295, 181034922, 180857866, 180857866, 180915260, 181538259, 182049998, 182045443, 182045439, 182045437),
+    (170740541, 170914576, 170975699, 170899992, 171115067, 170805979, 171893897, 172126875, 172126628, 172126870),
+    (158431299, 158545518, 158628139, 158821424, 159138663, 159345973, 160394084, 160567465, 160567428, 160567423),
+    (145908738, 146308819, 146274826, 146274826, 146364022, 145138636, 146097661, 146259347, 146259331, 146259322),
+    (134505819, 136372045, 138429268, 140273252, 141213431, 138394717, 149697505, 150617238, 150617247, 150617274),
+    (135480874, 135037215, 135413628, 135374737, 135534747, 133797422, 134341430, 134758139, 134758134, 134758122),
+    (134978784, 134482954, 134452384, 134452384, 135006516, 135086622, 134654341, 135129789, 135127769, 135127772),
+    (133464434, 132078379, 132449811, 132349534, 133851895, 133275309, 133439878, 133324792, 133324548, 133324781),
+    (114151656, 113042980, 114142980, 114142980, 115169878, 114364328, 113815969, 114240132, 113566686, 114240146),
+    (105311216, 105311216, 106368585, 106368585, 107349540, 107043718, 100860689, 101219190, 101161492, 101219177),
+    (100114055, 100256656, 100338915, 100338915, 102531392, 101991189, 99808683, 100338336, 99753195, 100338308),
+    (89995999, 90041932, 88827254, 88827254, 90354753, 90338345, 96296229, 96330509, 96330374, 96330493),
+    (81691216, 81860266, 78774742, 78774742, 81195210, 83257441, 83946371, 84277212, 84276897, 84277185),
+    (77753510, 76115139, 76117153, 76117153, 78077248, 80373285, 80696073, 80537682, 80542538, 80542536),
+    (63790860, 63811651, 63811651, 63811651, 59128983, 58617616, 61612450, 61707413, 61707364, 61707359),
+    (63644868, 63741868, 62435964, 62435964, 63025520, 64444167, 67262993, 66210261, 66210255, 66210247),
+    (46976537, 46976097, 46944323, 46944323, 48129895, 46709983, 44996062, 45827694, 45090682, 45827691),
+    (49476972, 49396972, 49554710, 49691432, 51304566, 50818468, 51228122, 51353916, 51324926, 51353906),
+    (152634166, 153692391, 154824264, 154913754, 155270560, 156040895, 154343774, 154259664, 154259566, 154259625,
+     154269076, 154349815, 154434329),                                                                         # chrX
+    (50961097, 50286555, 57701691, 57772954, 59373566, 57227415, 62480187, 62456832, 62460029),                # chrY
+]
+PRIMARY_LN = {length for lengths in CHROMOSOME_LN for length in lengths}
+MITO_LN = {16569, 16571, 16568}
+
+# Primary chromosome SN's (of the upper-cased DICT lines); HGP (chrN), EBI (N) and accession naming
+SN_HGP = r'SN:CHR[1-9XY](?!\w)|SN:CHR1[0-9](?!\w)|SN:CHR2[0-2](?!\w)|SN:CHRX_V0.7'
+SN_EBI = r'SN:[1-9XY](?!\w)|SN:1[0-9](?!\w)|SN:2[012](?!\w)'
+SN_ACC = r'CM0006|SN:NC_0000[0-2][0-9]|CP0682[567]|CP08656[89]|CM0349[567]|SN:CHR[XY]_HG002'
+SN_PRIMARY = f'{SN_HGP}|{SN_EBI}|{SN_ACC}'
+
+MITO_NAMING = {             # Sequence naming convention from the SN of the mito
+    "CHRM": "h", "CHRMT": "ht", "MT": "g", "NC_012920.1": "n", "J01415.2": "c", "CP068254.1": "c",
+    "CM032116.2": "c", "GI|113200490|GB|J01415.2|HUMMTCG": "c"}
+MITO_BUILD = {
+    "M5:C68F52674C9FB33AEF52DCF399755519": "37",    # rCRS build 37, 38, etc
+    "M5:D2ED829B8A1628D16CBEEE88E88E39EB": "19",    # Yoruba build 19, 18, etc
+    "M5:EC493A132AC4823AA696E37109F64972": "99",    # T2T model: chm13 v1.0, v1.1, v2.0 (and those that include it)
+    "M5:2AEA08C58600A30435E4302A82481DC0": "99",    # T2T model: chm13 v0.9
+    "M5:30F23EB261CAB50B34C0BED87EE38C7E": "99"}    # T2T model: hg01243 v3
+BUILDS = {                  # md5p (primary chromosomes LN, M5) -> Build; {mbuild} filled from the mito model
+    "13cbd449292df5bd282ff5a21d7d0b8f": "T2Tv20a",      # T2T CHM13+HG002Y v2.0 (accession; diff sort order)
+    "1e34cdea361327b59b5e46aefd9c0a5e": "HG16",         # hg 16 / NCBI 34
+    "3566ee58361e920af956992d7f0124e6": "HG15",         # hg 15 / NCBI 33
+    "4136c29467b6757938849609bedd3996": "NCB38",        # NCBI 38 all patches (GENBANK, REFSEQ)
+    "46cf0768c13ec7862c065e45f58155bf": "EBI18",        # EBI 18
+    "4bdbf8a3761d0cd03b53a398b6da026d": "HG38",         # HG38 all patches
+    "4bf6c704e4f8dd0d31a9bf305df63ed3": "THGv27",       # T2T CHM13 v1.1 with HG002 xy v2.7
+    "4d0aa9b8472b69f175d279a9ba8778a1": "HPPv11",       # HPP CHM13 v1.1 with GRCh38 Y
+    "591bb02c89ed438566ca68b077fee367": "1K37p",        # EBI GRCh37 Errored  (extra Y) (few are EBI37)
+    "5a23f5a85bd78221010561466907bf7d": "EBI37",        # EBI 37
+    "5e16e3cbdcc7b69d21420c332deecd3b": "T2Tv10",       # T2T CHM13 v1.0 (original)
+    "5f451c1014248af62b41c18fec1c3660": "T2Tv07",       # T2T CHM13 v0.7 (chr X only; not a true build)
+    "65a05319ad475cf51c929d3b55341bc2": "THGv20",       # T2T CHM13 v1.1 with HG002 xy v2
+    "7083d4ee8aa126726961ab1ae41c66c1": "THG1243v3",    # T2T HG01243 (Pr1) (accession)
+    "7a5eb72fb45c4567431651aa6f9edfef": "1K{mbuild}",   # 1K 19 / 37
+    "7cee777f1939f4028926017158ed5512": "T2Tv20",       # T2T v2.0 (CHM13 v1.1 w/ HG002 v2.7 Y) (chr name)
+    "84e78573982f3ea293bfeb54cd529309": "1K38p",        # Verily oddball GRCh38
+    "85c436650ffe85696c0fb51de4a3a74f": "THG1243v3",    # T2T HG01243 (aka PR1 Puerto Rican) (chr name)
+    "90814fe70fd8bbc59cacf2a3fd08e24c": "T2Tv09",       # T2T CHM13 v0.9
+    "a2fe6ab831d884104783f9be437ddbc0": "EBI38p",       # EBI GRCh38 Errored models
+    "a9634b94a29618dc3faf15a3060006ec": "HG18",         # hg 18 / NCBI 36
+    "b05113b52031beadfb6737bc1185960b": "HG{mbuild}",   # HG 19 / NCBI 37
+    "b7884451f3069579e5f2e885582b9434": "1K38",         # 1K 38
+    "bbd2cf1448ccc0eaa2472408fa9d514a": "THGySeqp",     # ySeq HG38 w/ HG002 v2 Y
+    "bc811d53b8a6fc404d279ab951f2be4d": "HG17",         # hg 17 / NCBI 35
+    "bee8aebc6243ff5963c30abbd738d1f6": "NCB38",        # NCBI 38 Genbank (orig top_level)
+    "c182b40ef3513ef9a1196881a4315392": "HPPv1",        # HPP CHM13 v1 with GRCh38 Y
+    "ca2e97bc5ecff43a27420eee237dbcc3": "EBI37p",       # EBI GRCh37 Errored models (extra Y)
+    "e9438f38ad1b9566c15c3c64a9419d9d": "T2Tv11",       # T2T CHM13 v1.1 (original)
+    "eec5eb2eeae44c48a31eb32647cd04f6": "EBI38",        # EBI 38
+    "f7c76dbcf8cf8b41d2c1d05c1ed58a75": "NCB37",        # NCBI GRCh37 (RefSeq)
+}
+EMPTY_MD5 = "d41d8cd98f00b204e9800998ecf8427e"
+
+
+def md5_lines(lines):
+    return hashlib.md5("".join(f'{line}\n' for line in lines).encode()).hexdigest()
+
+
+def dict_order(line):
+    """ sort -d order (LANG=POSIX): compare only the blanks and alphanumerics; the whole line if those are equal """
+    return re.sub(r'[^A-Za-z0-9 \t]', "", line), line
+
+
+def catalog_entry(fasta_FN, sequences):
+    """
+    The .wgse catalog line (as process_refgenomes.sh wrote it) and the error messages for a reference genome with the
+    (SN, LN, M5) sequences.  The md5's are of the DICT SN, LN and M5 columns; upper-cased and sorted on the SN.
+    """
+    fbn = os.path.basename(fasta_FN)
+    messages = []
+    rows = sorted((f'SN:{name}\tLN:{length}\tM5:{md5}'.upper() for name, length, md5 in sequences), key=dict_order)
+    fields = [row.split("\t") for row in rows]
+    md5b = md5_lines(f'{sn}\t{ln}' for sn, ln, _ in fields)
+    md5c = md5_lines(rows)
+    md5f = md5_lines(f'{ln}\t{m5}' for _, ln, m5 in fields)
+
+    # Primary chromosomes; LN of a known chromosome and a primary SN (alt contigs may have the same length)
+    primary = [(sn, ln, m5) for sn, ln, m5 in fields if int(ln[3:]) in PRIMARY_LN and re.search(SN_PRIMARY, sn)]
+    md5s = md5_lines(sn for sn, _, _ in primary)
+    md5p = md5_lines(f'{ln}\t{m5}' for _, ln, m5 in primary)
+
+    snct, pcnt = len(rows), len(primary)
+    ycnt = sum(int(ln[3:]) in CHROMOSOME_LN[23] for _, ln, _ in primary)
+    errp = " ***WARN: Too few SN entries (<25)***" if snct < 25 else ""
+    if pcnt == 0:
+        messages.append(f'{fbn}: ***ERROR: No Chromosomes found; unrecognized LN lengths? Build previously seen?')
+        errp += " *** ERROR:No Chromosomes ***"
+    elif ycnt != 1:
+        messages.append(f'{fbn}: ***ERROR: 1 expected, {ycnt} found: Y chromosome entries in ref model')
+        errp += f' *** ERROR:Y {ycnt}!=1 ***'
+    elif pcnt != 24:
+        messages.append(f'{fbn}: ***ERROR: 24 expected, {pcnt} found: chromosomes in primary ref model')
+        errp += f' *** ERROR:P {pcnt}!=24 ***'
+
+    # The mito gives the sequence naming convention and its model the mito Build
+    mito = [(sn, ln, m5) for sn, ln, m5 in fields if int(ln[3:]) in MITO_LN]
+    if len(mito) != 1:
+        messages.append(f'{fbn}: ***ERROR: 1 expected, {len(mito)} found: mitrochondrial entries in ref model')
+        errp += f' *** ERROR:M {len(mito)}!=1 ***'
+    chrMSN, chrMLN, chrMM5 = (mito[0][0][3:], mito[0][1], mito[0][2]) if mito else ("", "", "")
+
+    msn = MITO_NAMING.get(chrMSN)
+    if chrMSN == "CHRMT":
+        errp += " ***WARN: chrMT name is non-standard ***"
+    elif msn is None and pcnt > 0:  # A model we know; just not a mito name we know (or no mito)
+        msn = "h" if any(re.search(SN_HGP, row) for row in rows) else \
+              "g" if any(re.search(SN_EBI, row) for row in rows) else "c"
+    elif msn is None:
+        msn = "x"
+        messages.append(f'{fbn}: ***ERROR: Unregonized Sequence Naming ({rows[0] if rows else ""})')
+        errp += " ***ERROR: Unrecognized SN Name***"
+
+    mbuild = MITO_BUILD.get(chrMM5, "xx")
+    if mbuild == "xx" and chrMM5:
+        messages.append(f'{fbn}: ***ERROR: Unregonized Mitochondrial Model ({chrMM5})')
+        errp += " ***ERROR: Unrecognized Mito Model***"
+
+    build = BUILDS.get(md5p, "UNK").replace("{mbuild}", mbuild)
+    if md5p == EMPTY_MD5:
+        messages.append(f'{fbn}: ***ERROR: Unknown Build (0 chromosomes)')
+    elif md5p not in BUILDS:
+        messages.append(f'{fbn}: ***ERROR: Build Not Seen Before ({md5p})')
+        errp += " ***ERROR: Unrecognized Build Model***"
+
+    # SN of each primary chromosome (in chromosome order) and the mito
+    chrSN = [next((sn[3:] for sn, ln, _ in primary if int(ln[3:]) in lengths), "") for lengths in CHROMOSOME_LN]
+    chrSNt = "\t".join(f'"{sn}"' for sn in chrSN + [chrMSN])
+
+    line = f'"{fasta_FN}"\t{build}{msn}\t{snct}\t{md5b}\t{md5c}\t{md5f}\t{md5p}\t{md5s}\t' \
+           f'{chrMSN}\t{chrMLN}\t{chrMM5}\t"{errp}"\t{chrSNt}\n'
+    return line, messages
+
+
+class SequenceIndex:
+    """ Length and MD5 (DICT), line layout (FAI) and runs of N of one sequence; fed its lines in pieces """
+
+    def __init__(self, name, offset):
+        self.name, self.offset = name, offset
+        self.length = 0
+        self.md5 = hashlib.md5()
+        self.nruns = NRunScanner()
+        self.size = 0               # Bytes of its lines (with their line ends)
+        self.lines = 0              # Line ends seen
+        self.first = [0, 0]         # Bytes and bases of the first line until its line end is seen
+        self.width = None           # Bytes of each line (with its line end); from the first line
+        self.eol = None             # Bytes of the line end of the first line
+        self.carry = 0              # Bytes of the current line so far
+        self.tail = False           # Past the short last line (or an empty one); only empty lines may follow
+        self.uneven = False
+
+    def feed(self, block):
+        raw = block.translate(None, WHITESPACE)
+        bases = raw.upper()
+        self.length += len(bases)
+        self.md5.update(bases)
+        self.nruns.feed(re.sub(rb'\n#[^\n]*', b'', block).translate(None, WHITESPACE) if b'\n#' in block else raw)
+        self.size += len(block)
+        if self.uneven:
+            return
+
+        ends = np.flatnonzero(np.frombuffer(block, dtype=np.uint8) == ord('\n'))
+        if self.width is None:
+            part = block[:ends[0] + 1] if len(ends) else block
+            self.first[0] += len(part)
+            self.first[1] += len(part.translate(None, WHITESPACE))
+            if not len(ends):
+                return
+            self.width, self.eol = self.first[0], self.first[0] - self.first[1]
+            widths = np.diff(ends)                  # Of the lines after the first
+            self.lines += 1
+        elif len(ends):
+            widths = np.diff(ends, prepend=-1 - self.carry)
+        else:
+            self.carry += len(block)
+            return
+        self.lines += len(widths)
+        self.carry = len(block) - int(ends[-1]) - 1
+
+        if not self.tail:
+            other = np.flatnonzero(widths != self.width)
+            if not len(other):
+                return
+            if widths[other[0]] > self.width:
+                self.uneven = True
+                return
+            self.tail = True
+            widths = widths[other[0] + 1:]
+        if (widths > self.eol).any():               # A line of bases after the short one
+            self.uneven = True
+
+    def layout(self):
+        """ (line bases, line width) for the FAI entry; None if its lines are not all the same (see samtools faidx) """
+        if self.width is None:                      # A single line with no line end; at the end of the file
+            return (self.first[1], self.first[1] + 1) if self.first[1] else (0, 0)
+        linebases = self.width - self.eol
+        uneven = self.uneven or (self.carry and (self.tail or self.carry + self.eol > self.width))
+        uneven = uneven or self.size - self.length != self.lines * self.eol     # Blanks in lines or mixed line ends
+        if uneven:
+            print(f'***ERROR: Different line length in sequence {self.name}; no FAI index written.', file=sys.stderr,
+                  flush=True)
+            return None
+        return (linebases, self.width) if linebases else (0, 0)
+
+
+def catalog_genome(fasta_FN):
+    """
+    One pass over the (bgzip'ed) FASTA file fasta_FN writing its .dict, .fai, _ncnt.csv, _nbin.csv and .wgse files.
+    Returns the error messages for the catalog (as process_refgenomes.sh reported them).
+    """
+    fasta_FBS = os.path.basename(fasta_FN)
+    fasta_FPB = fasta_FN.replace(".fasta.gz", "").replace(".fna.gz", "").replace(".fa.gz", "")
+    uri = f'file://{os.path.realpath(fasta_FN)}'
+    sequences, fai = [], []
+
+    with gzip.open(fasta_FN, "rb") if fasta_FN.endswith("gz") else open(fasta_FN, "rb") as fasta_file, \
+            open(fasta_FPB + "_ncnt.csv", "w") as ncnt_file, open(fasta_FPB + "_nbin.csv", "w") as nreg_file:
+        writer = NCountWriter(fasta_FBS, ncnt_file, nreg_file)
+
+        def done(index):
+            nonlocal fai
+            sequences.append((index.name, index.length, index.md5.hexdigest()))
+            layout = index.layout() if fai is not None else None
+            if layout:
+                fai.append((index.name, index.length, index.offset + 1, *layout))
+            else:
+                fai = None
+            writer.sequence(index.nruns.result(index.name, index.length))
+
+        index = None
+        for name, offset, block in fasta_blocks(fasta_file):
+            if block is not None:
+                index.feed(block)
+                continue
+            if index:
+                done(index)
+            index = SequenceIndex(name, offset)
+        if index:
+            done(index)
+        writer.close()
+
+    with open(fasta_FPB + ".dict", "w") as dict_file:
+        dict_file.write("@HD\tVN:1.0\tSO:unsorted\n")
+        dict_file.write("".join(f'@SQ\tSN:{name}\tLN:{length}\tM5:{md5}\tUR:{uri}\n'
+                                for name, length, md5 in sequences))
+    if fai is not None:
+        with open(fasta_FN + ".fai", "w") as fai_file:
+            fai_file.write("".join("\t".join(str(field) for field in entry) + "\n" for entry in fai))
+
+    line, messages = catalog_entry(fasta_FN, sequences)
+    with open(fasta_FPB + ".wgse", "w") as wgse_file:         # Written last; it marks the genome as processed
+        wgse_file.write(line)
+    return messages
+
+
+def _catalog_task(fasta_FN):
+    try:
+        return fasta_FN, catalog_genome(fasta_FN)
+    except (FASTQError, OSError, EOFError) as err:
+        return fasta_FN, [f'{os.path.basename(fasta_FN)}: ***ERROR: {err}']
+
+
+def catalog_genomes(fasta_FNs, processes=None):
+    """ catalog_genome() of each file; concurrently in a pool of processes.  Returns {file: error messages} """
+    processes = min(processes or os.cpu_count() or 1, len(fasta_FNs)) or 1
+    results = {}
+    with Pool(processes) as pool:
+        for fasta_FN, messages in pool.imap_unordered(_catalog_task, fasta_FNs):
+            for message in messages:
+                print(message, flush=True)
+            results[fasta_FN] = messages
+    return results
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    args = sys.argv[1:]
+    processes = None
+    if len(args) >= 2 and args[-2] == "-p" and args[-1].isdigit():
+        processes, args = int(args[-1]), args[:-2]
+    if not args:
+        print(f'Usage: python3 {module} RefModel.fa.gz [RefModel.fa.gz ...] [-p processes]', file=sys.stderr,
+              flush=True)
+        print(f'   Writes RefModel.dict, RefModel.fa.gz.fai, RefModel_ncnt.csv, RefModel_nbin.csv and RefModel.wgse',
+              file=sys.stderr, flush=True)
+        exit(1)
+    catalog_genomes(args, processes)
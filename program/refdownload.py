@@ -0,0 +1,419 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) to download and process reference genomes of the library (genomes.csv);
+replacing the curl / process_refgenomes.sh sequence of get_and_process_refgenome() one genome at a time.
+
+Many genomes are queued at once.  Each is downloaded over several connections, one per byte range (segment), into a
+.part file with a .part.json record of what each segment has so far.  An interrupted download is resumed from there
+(HTTP Range requests; as curl -C).  While the segments arrive, the file is read back in order and recompressed to
+BGZF with its .gzi index (as bgzip -i); a gzip'ed, bzip2'ed or plain FASTA so never waits for the whole download
+first.  One already BGZF compressed is only walked for its .gzi index and kept as is.  A 7z archive is refused (no
+decoder), as is a download that is not a FASTA file.  As each genome is done, its DICT, FAI, N counts and catalog
+entry (refcatalog.catalog_genome) are made in a process pool while the others still download.
+
+A mirror (local folder or URL) replaces the folder part of the genomes.csv URLs; file:// URLs are read directly.
+The genomes.csv columns are read by position (as read_genomes_file in scripts/zcommon.sh); not by their titles.
+
+    python3 refdownload.py [-s NIH|EBI] [-m mirror] [-n segments] [-p processes] FinalFile [FinalFile ...]
+"""
+
+import sys
+import os
+import csv
+import json
+import gzip
+import zlib
+import bz2
+import struct
+import zipfile
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from multiprocessing import Pool
+from urllib.parse import urlparse
+from urllib.request import Request, urlopen, url2pathname, pathname2url
+
+from bgzf import BGZFWriter, write_gzi
+from refcatalog import catalog_genome
+from nrunscan import FASTQError
+
+CHUNK_SIZE = 2**20              # Bytes per read from a connection
+SEGMENT_MIN = 32 * 2**20        # Smallest segment worth a connection of its own
+RETRIES = 5                     # Per segment; each resumes where the last stopped (as curlx --retry 5)
+MIN_GENOME_BYTES = 500000000    # Smaller is an error page or a cut short file (as the old get_and_process_refgenome)
+
+# genomes.csv columns; in the order of read_genomes_file (scripts/zcommon.sh).  The first row is the titles.
+GENOME_COLUMNS = ("code", "source", "final", "initial", "url", "menu", "sncount", "snnaming", "description")
+
+
+def stream_kind(head):
+    """ bgzf, gzip, bz2, zip, 7z or plain from the first (18) bytes of a file """
+    if head[:2] == b"\x1f\x8b":
+        return "bgzf" if len(head) >= 18 and head[3] & 4 and head[12:14] == b"BC" else "gzip"
+    if head[:3] == b"BZh":
+        return "bz2"
+    if head[:6] == b"7z\xbc\xaf\x27\x1c":
+        return "7z"
+    return "zip" if head[:4] == b"PK\x03\x04" else "plain"
+
+
+def mirror_url(url, mirror):
+    """ url with its folder replaced by mirror (a local folder or a URL) """
+    if not mirror:
+        return url
+    if "://" not in mirror:
+        mirror = "file://" + pathname2url(os.path.abspath(mirror))
+    return f'{mirror.rstrip("/")}/{os.path.basename(urlparse(url).path)}'
+
+
+def open_url(url, start=0, end=None):
+    """ Readable stream of url from byte start (to end; exclusive) """
+    if url.startswith("file://"):
+        url_file = open(url2pathname(urlparse(url).path), "rb")
+        url_file.seek(start)
+        return url_file
+    headers = {"Range": f'bytes={start}-{"" if end is None else end - 1}'} if start or end is not None else {}
+    response = urlopen(Request(url, headers=headers), timeout=60)
+    if headers and response.status != 206 and start:
+        response.close()
+        raise OSError(f'Server ignored the byte range request: {url}')
+    return response
+
+
+def probe(url):
+    """ (size or None if not given, True if byte ranges can be requested) of url """
+    if url.startswith("file://"):
+        return os.path.getsize(url2pathname(urlparse(url).path)), True
+    with open_url(url, 0, 1) as response:
+        if response.status == 206 and "/" in response.headers.get("Content-Range", ""):
+            total = response.headers["Content-Range"].rsplit("/", 1)[1]
+            if total.isdigit():
+                return int(total), True
+        length = response.headers.get("Content-Length")
+        return (int(length) if length and length.isdigit() and response.status == 200 else None), False
+
+
+class GenomeDownload:
+    """ Segmented, resumable download of url into final_oFN; BGZF (re)compressed as it arrives (see module) """
+
+    def __init__(self, url, init_oFN, final_oFN, segments=4, threads=None, pool=None):
+        self.url = url
+        self.final_oFN = final_oFN
+        self.part_oFN = init_oFN + ".part"
+        self.state_oFN = self.part_oFN + ".json"
+        self.segments = segments
+        self.threads = threads
+        self.pool = pool            # Compression threads shared with the other downloads (BGZFWriter)
+        self.cond = threading.Condition()   # Signalled whenever a segment moves on (or fails)
+        self.state_lock = threading.Lock()
+        self.size = self.ranged = None
+        self.ranges, self.done, self.finished = [], [], []
+        self.error = None
+        self.resumed = 0            # Bytes already there from a previous (interrupted) run
+
+    def _plan(self):
+        self.size, self.ranged = probe(self.url)
+        try:
+            with open(self.state_oFN, "r") as f:
+                state = json.load(f)
+            if self.ranged and state["url"] == self.url and state["size"] == self.size and \
+               os.path.getsize(self.part_oFN) == self.size:
+                self.ranges, self.done = [tuple(bounds) for bounds in state["ranges"]], state["done"]
+                self.resumed = sum(self.done)
+        except (OSError, ValueError, KeyError, TypeError):
+            pass
+        if not self.ranges:
+            count = max(1, min(self.segments, self.size // SEGMENT_MIN)) if self.ranged and self.size else 1
+            bounds = [self.size * part // count for part in range(count + 1)] if self.size else [0, None]
+            self.ranges, self.done = list(zip(bounds, bounds[1:])), [0] * count
+            with open(self.part_oFN, "wb") as part_file:
+                part_file.truncate(self.size or 0)
+            self._save_state()
+        self.finished = [end is not None and done >= end - start for (start, end), done in zip(self.ranges, self.done)]
+
+    def _save_state(self):
+        if not self.ranged:
+            return                  # Cannot be resumed anyway
+        with self.cond:
+            state = {"url": self.url, "size": self.size, "ranges": self.ranges, "done": list(self.done)}
+        with self.state_lock:
+            with open(self.state_oFN + ".tmp", "w") as f:
+                json.dump(state, f)
+            os.replace(self.state_oFN + ".tmp", self.state_oFN)
+
+    def _fetch(self, segment):
+        start, end = self.ranges[segment]
+        error = OSError(f'Download stopped: {self.url}')
+        try:
+            for _ in range(RETRIES + 1):
+                if self.error or self.finished[segment]:
+                    break
+                if not self.ranged:     # Starts over from the beginning; the same bytes so a reader is not disturbed
+                    self.done[segment] = 0
+                pos = saved = start + self.done[segment]
+                try:
+                    with open_url(self.url, pos, end if self.ranged else None) as response, \
+                            open(self.part_oFN, "r+b") as part_file:
+                        part_file.seek(pos)
+                        while (end is None or pos < end) and not self.error:
+                            chunk = response.read(CHUNK_SIZE if end is None else min(CHUNK_SIZE, end - pos))
+                            if not chunk:
+                                break
+                            part_file.write(chunk)
+                            part_file.flush()
+                            pos += len(chunk)
+                            with self.cond:
+                                self.done[segment] = pos - start
+                                self.cond.notify_all()
+                            if pos - saved >= SEGMENT_MIN:
+                                self._save_state()
+                                saved = pos
+                    if end is None or pos >= end:
+                        with self.cond:
+                            self.finished[segment] = True
+                            self.cond.notify_all()
+                    else:
+                        error = OSError(f'Connection closed at byte {pos} of {end}: {self.url}')
+                except (OSError, http.client.HTTPException) as err:
+                    error = err
+                finally:
+                    self._save_state()
+        finally:
+            if not self.finished[segment]:
+                with self.cond:
+                    self.error = self.error or error
+                    self.cond.notify_all()
+
+    def _available(self, pos):
+        """ Bytes downloaded from pos on (0 at the end of the file); waits for at least one """
+        with self.cond:
+            while True:
+                if self.error:
+                    raise self.error
+                for (start, end), done, finished in zip(self.ranges, self.done, self.finished):
+                    if start <= pos and (end is None or pos < end):
+                        if start + done > pos:
+                            return start + done - pos
+                        if finished:
+                            return 0
+                        break
+                else:
+                    return 0
+                self.cond.wait()
+
+    def _chunks(self, part_file, pos=0):
+        """ The .part file content from pos on; in order, as it is downloaded """
+        part_file.seek(pos)
+        while True:
+            available = self._available(pos)
+            if not available:
+                return
+            chunk = part_file.read(min(available, CHUNK_SIZE))
+            pos += len(chunk)
+            yield chunk
+
+    def _read(self, part_file, length):
+        data = b""
+        while len(data) < length:
+            available = self._available(part_file.tell())
+            if not available:
+                break
+            data += part_file.read(min(available, length - len(data)))
+        return data
+
+    def _bgzf_index(self, part_file):
+        """ .gzi index of a BGZF file as it is downloaded; None if not BGZF throughout """
+        index, caddr, uaddr = [], 0, 0
+        while True:
+            header = self._read(part_file, 18)
+            if not header:
+                return index
+            if len(header) < 18 or stream_kind(header) != "bgzf":
+                return None
+            block = self._read(part_file, struct.unpack("<H", header[16:18])[0] + 1 - 18)
+            isize = struct.unpack("<I", block[-4:])[0]
+            if isize and caddr:
+                index.append((caddr, uaddr))
+            caddr += 18 + len(block)
+            uaddr += isize
+
+    def _recompress(self, part_file, writer):
+        part_file.seek(0)
+        kind = stream_kind(self._read(part_file, 18))
+        if kind == "7z":        # No 7z decoder in Python; process_refgenomes.sh needed the 7z command for it
+            raise ValueError("7z archives are not supported; extract it (7z e) and use its FASTA file instead")
+        if kind == "zip":       # Its members cannot be found before the central directory at the end
+            for _ in self._chunks(part_file):
+                pass
+            with zipfile.ZipFile(self.part_oFN) as archive, archive.open(archive.namelist()[0]) as member:
+                for chunk in iter(lambda: member.read(CHUNK_SIZE), b""):
+                    writer.write(chunk)
+            return
+        if kind == "plain":
+            for chunk in self._chunks(part_file):
+                writer.write(chunk)
+            return
+
+        new_decompressor = bz2.BZ2Decompressor if kind == "bz2" else lambda: zlib.decompressobj(31)
+        decompressor, ended = new_decompressor(), False
+        for chunk in self._chunks(part_file):
+            while chunk:
+                writer.write(decompressor.decompress(chunk))
+                ended = decompressor.eof
+                chunk = decompressor.unused_data if ended else b""
+                if ended:
+                    decompressor = new_decompressor()     # Next member / stream (if any)
+        if not ended:
+            raise EOFError("Compressed file ended before the end-of-stream marker")
+
+    def run(self):
+        """ Download (or resume) and BGZF (re)compress into final_oFN with its .gzi """
+        self._plan()
+        fetchers = ThreadPoolExecutor(len(self.ranges))
+        for segment in range(len(self.ranges)):
+            fetchers.submit(self._fetch, segment)
+        try:
+            with open(self.part_oFN, "rb", buffering=0) as part_file:     # No read ahead into what is not there yet
+                index = self._bgzf_index(part_file)
+                if index is None:
+                    with open(self.final_oFN + ".tmp", "wb") as out_file:
+                        writer = BGZFWriter(out_file, self.threads, self.pool)
+                        self._recompress(part_file, writer)
+                        writer.close()
+                    index = writer.index
+        except Exception as err:    # Stop the segments still downloading; the .part file is kept to resume
+            with self.cond:
+                self.error = self.error or err
+                self.cond.notify_all()
+            raise
+        finally:
+            fetchers.shutdown()
+        if not all(self.finished):
+            raise self.error or OSError("Download incomplete")
+
+        if os.path.exists(self.final_oFN + ".tmp"):
+            os.replace(self.final_oFN + ".tmp", self.final_oFN)
+            os.remove(self.part_oFN)
+        else:                       # Already BGZF; kept as downloaded
+            os.replace(self.part_oFN, self.final_oFN)
+        write_gzi(self.final_oFN + ".gzi", index)
+        if os.path.exists(self.state_oFN):
+            os.remove(self.state_oFN)
+
+
+def genome_entries(genomes_oFP, finals, server=None):
+    """
+    genomes.csv row (dict of GENOME_COLUMNS) of each final file name; from the preferred server (NIH or EBI) if it has
+    a choice.  Rows too short to have a URL are skipped.
+    """
+    notsource = {"NIH": "EBI-Alt", "EBI": "NIH-Alt"}.get(server, "none")
+    entries = {}
+    with open(os.path.join(genomes_oFP, "genomes.csv"), "r", newline="") as f:
+        rows = csv.reader(f)
+        next(rows, None)            # Titles
+        for values in rows:
+            row = dict(zip(GENOME_COLUMNS, (value.strip() for value in values)))
+            if row.get("url") and row["final"] in finals and row["source"] != notsource:
+                entries.setdefault(row["final"], row)
+    return entries
+
+
+def _installed(final_oFN):
+    special = final_oFN.replace(".fasta.gz", "").replace(".fna.gz", "").replace(".fa.gz", "") + ".wgse"
+    return os.path.isfile(special) and os.path.getmtime(special) >= os.path.getmtime(final_oFN)
+
+
+def _fasta_error(final_oFN):
+    """ Why final_oFN (BGZF) is not a reference genome FASTA file; None if it looks like one """
+    with gzip.open(final_oFN, "rb") as f:
+        if f.read(1) != b">":
+            return "Downloaded file is not a FASTA file (an error page?)"
+    if os.path.getsize(final_oFN) < MIN_GENOME_BYTES:
+        return f'Downloaded file too small ({os.path.getsize(final_oFN)} bytes)'
+    return None
+
+
+def _download(row, genomes_oFP, mirror, segments, pool):
+    final_FBS = row["final"]
+    final_oFN = os.path.join(genomes_oFP, final_FBS)
+    url = mirror_url(row["url"], mirror)
+    print(f'{final_FBS}: Downloading and processing {row.get("description") or row["code"]} from {url}', flush=True)
+    download = GenomeDownload(url, os.path.join(genomes_oFP, row["initial"] or final_FBS), final_oFN, segments,
+                              pool=pool)
+    try:
+        download.run()
+    except (OSError, EOFError, zlib.error, zipfile.BadZipFile, http.client.HTTPException) as err:
+        return [f'{final_FBS}: ***ERROR: Download failed ({err}); rerun to resume']
+    except ValueError as err:
+        return [f'{final_FBS}: ***ERROR: {err}']
+    error = _fasta_error(final_oFN)
+    if error:                       # Not cataloged; and not left to look installed
+        for bad_oFN in (final_oFN, final_oFN + ".gzi"):
+            os.remove(bad_oFN)
+        return [f'{final_FBS}: ***ERROR: {error}']
+    resumed = f' ({download.resumed} bytes resumed)' if download.resumed else ""
+    print(f'{final_FBS}: Downloaded {download.size or os.path.getsize(final_oFN)} bytes{resumed}', flush=True)
+    return []
+
+
+def download_genomes(finals, genomes_oFP=".", server=None, mirror=None, segments=4, processes=None, process=True):
+    """
+    Download and process the genomes.csv genomes with the Final File Names finals (see module).  Up to processes
+    genomes download at a time (each in segments), sharing as many compression threads, and are cataloged in a pool
+    of as many processes.  A genome that fails does not stop the others.  Returns {final: messages}.
+    """
+    entries = genome_entries(genomes_oFP, finals, server)
+    processes = processes or os.cpu_count() or 1
+    results = {final: [f'{final}: ***ERROR: Not found in genomes.csv'] for final in finals if final not in entries}
+    for final in list(entries):
+        if os.path.isfile(os.path.join(genomes_oFP, final)) and _installed(os.path.join(genomes_oFP, final)):
+            results[final] = []
+            print(f'{final}: Already installed', flush=True)
+            del entries[final]
+
+    with Pool(processes) as pool, ThreadPoolExecutor(processes) as downloads, ThreadPoolExecutor(processes) as zips:
+        futures = {downloads.submit(_download, row, genomes_oFP, mirror, segments, zips): final
+                   for final, row in entries.items()}
+        catalogs = {}
+        for future in as_completed(futures):
+            final = futures[future]
+            try:
+                results[final] = future.result()
+            except Exception as err:        # Anything unexpected; still only this genome fails
+                results[final] = [f'{final}: ***ERROR: Download failed ({err!r}); rerun to resume']
+            if not results[final] and process:
+                catalogs[final] = pool.apply_async(catalog_genome, (os.path.join(genomes_oFP, final),))
+        for final, catalog in catalogs.items():
+            try:
+                results[final] = catalog.get()
+            except (FASTQError, OSError, EOFError) as err:
+                results[final] = [f'{final}: ***ERROR: {err}']
+            except Exception as err:
+                results[final] = [f'{final}: ***ERROR: Processing failed ({err!r})']
+            if not results[final]:
+                print(f'{final}: Finished installing {entries[final]["code"]}', flush=True)
+
+    for messages in results.values():
+        for message in messages:
+            print(message, flush=True)
+    return results
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    args, options = sys.argv[1:], {}
+    while len(args) >= 2 and args[0] in ("-s", "-m", "-n", "-p"):
+        options[args[0]], args = args[1], args[2:]
+    if not args or not all(options.get(flag, "1").isdigit() for flag in ("-n", "-p")):
+        print(f'Usage: python3 {module} [-s NIH|EBI] [-m mirror] [-n segments] [-p processes] FinalFile [...]',
+              file=sys.stderr, flush=True)
+        print(f'   Downloads and processes the genomes.csv reference genomes (run in the genomes folder)',
+              file=sys.stderr, flush=True)
+        exit(1)
+    download_genomes(args, ".", options.get("-s"), options.get("-m"), int(options.get("-n", 4)),
+                     int(options["-p"]) if "-p" in options else None)
@@ -151,7 +151,6 @@ class ReferenceLibrary:
         self.FB = os.path.basename(dir_FP[:-1])  # Trick; remove trailing slash so basename returns directory name
 
         self.liftover_chain_oFN = f'{self.oFP}hg38ToHg19.over.chain.gz'
-        # Todo have chain files for T2T; can we make microarray work by creating T2T chain files then liftover result?
 
         # self.snlookup =
 
@@ -235,6 +234,16 @@ class ReferenceLibrary:
                                                   "THG1243v3", "HPPv11", "HPPv1", "T2Tv20a"] else \
                 ("error", 0)    # hg37w, T2Tv20a
 
+    def get_liftover_chain_oFN(self, build):
+        """ Chain file to lift a CombinedKit of the build to HG19 (None if not in the library) """
+        if build == 38:
+            return self.liftover_chain_oFN
+        if build == 99:     # T2T chm13v2; as named in the README
+            for FBS in ["chm13v2-hg19.over.chain.gz", "chm13v2-hg19.chain.gz", "chm13v2-hg19.chain"]:
+                if os.path.isfile(f'{self.oFP}{FBS}'):
+                    return f'{self.oFP}{FBS}'
+        return None
+
     def get_reference_vcf_qFN(self, build, sqname, ttype="FullGenome"):
         if ttype == "Yonly":  # Y-only Variants from yBrowse DB; updated daily.  Thomas Krahn suggest liftover to Build38
             FBS = "snps_hg38.vcf.gz"   if  build == 38 and sqname == "Chr" else \
@@ -248,6 +257,7 @@ class ReferenceLibrary:
                   "All_SNPs_hg19_ref.tab.gz"   if (build == 37 or  build == 19) and sqname == "Chr" else \
                   "All_SNPs_GRCh38_ref.tab.gz" if  build == 38 and sqname == "Num" else \
                   "All_SNPs_GRCh37_ref.tab.gz" if (build == 37 or  build == 19) and sqname == "Num" else \
+                  "All_SNPs_chm13v2_ref.tab.gz" if build == 99 and sqname == "Chr" else \
                   "error"  # Unknown
             return f'"{self.cma_FP}{FBS}"'  # Found in the Microarray folder
         else:  # ttype == "FullGenome" (use dbSNP)      # Found in reference_library; from https://ftp.ncbi.nlm.nih.gov/snp/latest_release/VCF/
@@ -0,0 +1,246 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Reference genome identification (module refident) from the sequence records of a BAM / CRAM (@SQ) or VCF (##contig)
+header; shared by BAMFile and VCFFile.  The header is parsed once into (SN, LN, M5) tuples.  Those are hashed exactly
+as process_refgenomes.sh / refcatalog.py hash a DICT file for the catalog (md5b of SN, LN; md5c with M5) and looked up
+in a ReferenceIndex built once from the .wgse catalog entries of the reference library genomes folder.  So a full
+header of a catalogued model is found with a single dict lookup.  Only an md5c match (names, lengths and M5) is
+exact; an md5b match (names and lengths) cannot tell apart models differing only in their sequences (hs38d1 and the
+Verily hs38d1v), so the rules still have their say.  Subset headers (Y only, MT only, ...) and models not in the
+library fall back to the Build / model rules on the lengths and names seen (what used to be substring scans of the
+header text in each class).  RefgenomeNew always comes from the rules; whether the genome is installed or not.
+
+The index is saved in the genomes folder (WGSE_refident.json) and rebuilt when a .wgse or genomes.csv file changes.
+"""
+
+import os
+import csv
+import json
+
+from refcatalog import dict_order, md5_lines
+
+INDEX_FBS = "WGSE_refident.json"
+INDEX_VERSION = 2
+
+T2T_LN = {248387561, 248387328, 248387497, 248415701, 62456832, 62460029, 62480187, 154343774, 25843790, 154259566,
+          154259625, 154269076, 154349815, 154434329}
+BUILD_LN = [        # Build, Mito model, chr1 / Y / X lengths that identify it (first match wins)
+    (38, "rCRS",   {248956422, 57227415, 156040895}),
+    (37, "rCRS",   {249250621, 59373566, 155270560}),
+    (18, "Yoruba", {247249719, 57772954, 154913754}),
+    (17, "Yoruba", {245522847, 57701691, 154824264}),
+    (16, "Yoruba", {246127941, 50286555, 153692391}),
+    (15, "Yoruba", {245203898, 50961097, 152634166}),
+]
+T2T_MODELS = [      # Refgenome, lengths (X / Y) that must all be present; for Build 99 (first match wins)
+    ("THGv20",    {62456832, 154343774}),   # CHM13 v1.1 & HG002 v2 XY
+    ("THGv27",    {62460029, 154349815}),   # CHM13 v1.1 & HG002 v2.7 XY
+    ("THG1243v3", {62480187, 154434329}),   # HG01243 v3 PR1 "Puerto Rican"
+    ("HPPv11",    {57277415, 154259566}),   # CHM13 v1.1 & GRCh38 Y
+    ("HPPv1",     {57277415, 154259625}),   # CHM13 v1 X & GRCh38 Y
+    ("THGySeqp",  {62456832, 156040895}),   # GRCh38 w/ HG002 v2 Y  (ySeq)
+    ("T2Tv20",    {62460029, 154259566}),   # CHM13 v1.1 & HG002 v2.7 Y
+    ("T2Tv11",    {154259566}),             # Must be plain CHM13 v1.1 as special Y not found
+    ("T2Tv10",    {154259625}),             # Must be plain CHM13 v1 as special Y not found
+    ("T2Tv09",    {154259664}),             # Must be plain CHM13 v0.9
+]
+
+
+def _int(value):
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return 0
+
+
+def header_records(header):
+    """ (SN, LN, M5 or None) of each @SQ (SAM / BAM / CRAM) or ##contig (VCF) line of the header; in header order """
+    sequences = []
+    for line in header.splitlines():
+        if line.startswith("@SQ\t"):
+            fields = dict(field.split(":", 1) for field in line.split("\t")[1:] if ":" in field)
+            sequences.append((fields.get("SN", ""), _int(fields.get("LN")), fields.get("M5")))
+        elif line.startswith("##contig=<"):
+            fields = dict(field.split("=", 1) for field in line[10:].rstrip().rstrip(">").split(",") if "=" in field)
+            sequences.append((fields.get("ID", ""), _int(fields.get("length")), fields.get("md5")))
+    return sequences
+
+
+def header_signatures(sequences):
+    """ (md5b, md5c) of the sequences as the catalog has them for the DICT file; md5c None without M5 on all """
+    rows = sorted((f'SN:{sn}\tLN:{ln}\tM5:{m5}'.upper() for sn, ln, m5 in sequences), key=dict_order)
+    md5b = md5_lines(row.rsplit("\t", 1)[0] for row in rows)
+    md5c = md5_lines(rows) if sequences and all(m5 for _, _, m5 in sequences) else None
+    return md5b, md5c
+
+
+class ReferenceIndex:
+    """
+    Catalog signatures of the reference genomes in a genomes folder -> (Refgenome, catalog Build); signatures by the
+    md5c and names by the md5b.  An md5b shared by models that differ is kept as None (ambiguous).
+    """
+
+    def __init__(self, genomes_oFP):
+        self.genomes_oFP = genomes_oFP
+        self.signatures = {}
+        self.names = {}
+        index_oFN = os.path.join(genomes_oFP, INDEX_FBS)
+        sources = self._sources()
+        try:
+            with open(index_oFN, "r") as f:
+                saved = json.load(f)
+            if saved.get("version") == INDEX_VERSION and saved.get("sources") == sources:
+                self.signatures = {key: tuple(value) for key, value in saved["signatures"].items()}
+                self.names = {key: value and tuple(value) for key, value in saved["names"].items()}
+                return
+        except (OSError, ValueError, AttributeError, KeyError):
+            pass
+
+        self._build()
+        try:
+            with open(index_oFN, "w") as f:
+                json.dump({"version": INDEX_VERSION, "sources": sources, "signatures": self.signatures,
+                           "names": self.names}, f)
+        except OSError:
+            pass                    # Reference library not writable; simply rebuilt next time
+
+    def _sources(self):
+        """ Catalog files (.wgse and genomes.csv) with their modification times; the index is valid while unchanged """
+        try:
+            return {entry.name: entry.stat().st_mtime_ns for entry in os.scandir(self.genomes_oFP)
+                    if entry.name.endswith(".wgse") or entry.name == "genomes.csv"}
+        except OSError:
+            return {}
+
+    def _build(self):
+        codes = {}                  # Final File Name -> Pyth Code (as in genomes.csv)
+        try:
+            with open(os.path.join(self.genomes_oFP, "genomes.csv"), "r", newline="") as f:
+                for row in csv.DictReader(f):
+                    codes.setdefault(row.get("Final File Name", ""), row.get("Pyth Code", ""))
+        except OSError:
+            pass
+        for name in sorted(self._sources()):
+            if not name.endswith(".wgse"):
+                continue
+            try:
+                with open(os.path.join(self.genomes_oFP, name), "r") as f:
+                    fields = f.readline().rstrip("\n").split("\t")
+            except OSError:
+                continue
+            if len(fields) < 6:
+                continue
+            entry = (codes.get(os.path.basename(fields[0].strip('"'))), fields[1])
+            md5b, md5c = fields[3:5]
+            self.signatures.setdefault(md5c, entry)
+            self.names[md5b] = entry if self.names.get(md5b, entry) == entry else None
+
+    def lookup(self, sequences):
+        """
+        (Refgenome code or None if not in genomes.csv, catalog Build, exact) of the sequences; exact if by the md5c.
+        None if not catalogued or the md5b (names and lengths only) is shared by more than one model.
+        """
+        if not sequences:
+            return None
+        md5b, md5c = header_signatures(sequences)
+        if md5c in self.signatures:
+            return self.signatures[md5c] + (True,)
+        return self.names[md5b] + (False,) if self.names.get(md5b) else None
+
+
+_indices = {}
+
+
+def reference_index(genomes_oFP):
+    """ The ReferenceIndex of a genomes folder; built (or loaded) once per run """
+    if genomes_oFP and genomes_oFP not in _indices:
+        _indices[genomes_oFP] = ReferenceIndex(genomes_oFP)
+    return _indices.get(genomes_oFP)
+
+
+def identify_reference(sequences, index=None, header=""):
+    """
+    Sequence naming, Build, mito model and reference genome of the header sequences (see header_records).  Returns
+    a dict of the BAMFile / VCFFile attributes SNTypeC, SNTypeM, SNCount, Build, RefMito, Refgenome and RefgenomeNew.
+    Refgenome is the catalog (index) match if there is one, unless only the names and lengths match and the rules
+    find the Verily model; otherwise by the rules on the lengths and names (which also work on subset headers).
+    RefgenomeNew is by the rules only.  header is only checked for the Verily marker.
+
+    Original, generic, major model naming comes from:
+     hg if old style "chr22/chrM" sequence names, GRCh if numeric-only
+     19 if old style hg with Yoruba, 37 if build 37 model lengths, 38 if Build 38 model lengths, ditto T2T 99
+     Number of Sequence Names in the header is a good indicator of class and other model characteristics
+    """
+    names = [sn for sn, _, _ in sequences]
+    lengths = {ln for _, ln, _ in sequences}
+    md5s = {m5 for _, _, m5 in sequences if m5}
+
+    def has(*prefixes):
+        return any(name.startswith(prefixes) for name in names)
+
+    # Determine SN names as given as opposed to relying on reference model to determine
+    result = {
+        "SNTypeC": "Chr" if has("chr") else "Num" if "1" in names else
+                   "Acc" if has("CM0", "CP", "J0", "NC_") else "Unk",
+        "SNTypeM": "MT" if has("MT", "chrMT") else "M" if has("M", "chrM") else "Unk",
+        "SNCount": len(sequences),
+        "Refgenome": None, "RefgenomeNew": None}
+    sntype, count = result["SNTypeC"], result["SNCount"]
+
+    # Possible that header has been shortened if a subset BAM file? So only use chr1, Y and X to check length
+    # If only MT or Unmapped (*) in header, then cannot tell RefGenome
+    build, mito = (99, "Custom") if lengths & T2T_LN else \
+        next(((build, mito) for build, mito, build_ln in BUILD_LN if lengths & build_ln), (0, "Unknown"))
+    # Modify Mitochondria model based on its length if Build 37 (only one with both types in releases)
+    if build == 37 and any(name.endswith(("M", "MT")) and ln == 16571 for name, ln, _ in sequences):
+        build, mito = (19, "Yoruba")
+    # Todo handling RSRS model -- look for spacers?
+    result["Build"], result["RefMito"] = build, mito
+
+    # New form is based on Major / Class mechanism in Reference Genome study: https://bit.ly/34CO0vj
+    #  Used to rely on SNCount.  But oddball, unrecognized ref genomes may have something close set by the user.
+    #  So, rely more on key items found in special ref genomes. Keep patching this.
+    refgenome = new = None
+    if build == 99:             # Used chr1, chrX or chrY lengths to determine Build99 earlier
+        # Use X and Y length to determine T2T / HPP model
+        refgenome = new = next((model for model, model_ln in T2T_MODELS if model_ln <= lengths), None)
+    elif count in [85, 86] and has("NC_007605"):
+        # hs37 class have SN:NC007605 (EBV in Numeric naming) sans human_g1k / GRCh37.primary_assembly models
+        # human_1kg model is 84 and one less SN than hs37.fa.gz; hs37d5 is 86 and one more than hs37 (hs37d5 decoy)
+        refgenome, new = "hs37d5" if has("hs37d5") else "hs37", "1k37g"
+    elif count in [85, 298] and has("chrEBV"):
+        new = "1k37h"       # 1KGenome analysis models in NCBI Genbank Archive or UCSC; but not handled yet
+    elif count == 84:       # human_g1k (if Num), GRCh37.primary_assembly.genome (if Chr)
+        refgenome = "hs37-" if sntype == "Num" else "GRCh37-" if sntype == "Chr" else None
+        new = "1K37g" if sntype == "Num" else "EBI37h" if sntype == "Chr" else None
+    elif count in [195, 456, 2580, 2581, 2841, 3366] and has("chrEBV", "EBV"):
+        # hs38DH is 3366 SN count and has SN:HLA- unique; hs38 is 195 and hs38a is 456; all uniquely have chrEBV
+        # hs38d1s is sequencing.com model made by hs38d1 with 22_KI270879v1_alt added
+        refgenome = "hs38DH"  if has("chr22_KI270879v1_alt") and count == 3366 else \
+                    "hs38d1a" if count == 2841 else \
+                    "hs38d1s" if count == 2581 and has("22_KI270879v1_alt") else \
+                    "hs38d1"  if count == 2580 else \
+                    "hs38a"   if count == 456 else \
+                    "hs38"  # if count == 195
+        new = "1k38" + ("pg" if refgenome == "hs38d1s" else "h")
+        if count == 2580 and ("a491618313b78cdca84ae9513e4f4844" in md5s or "Verily" in header):
+            refgenome, new = "hs38d1v", "1k38ph"    # Google Verily model; very different M5 on each SN than hs38d1
+    elif count == 25 and build in (19, 37):     # T2T models of this size already captured with LN fields above
+        refgenome, new = "hg37w", "EBI37ph"     # Odd WGSE v1/2 25 SN hg19 model with EBI primaries
+    elif count in [25, 93, 297, 455, 639]:     # SNCounts of 6 hg/ebi models; 2 duplicated
+        # Handle the hg (UCSC) and GRCh (EBI) models here; 297 & 639 are Patch 13 GRCh models; 25 the primary only
+        #  sequences of any Build (as in many a VCF)
+        refgenome = ("hg" if sntype == "Chr" else "GRCh") + str(build)     # Build takes into account mito 19 / 37
+        new = refgenome.replace("GRCh", "EBI") + ("g" if sntype == "Chr" else "h")
+
+    # The catalog knows the model; unless the names and lengths alone matched and the rules tell it is Verily's
+    catalogued = index.lookup(sequences) if index else None
+    if catalogued and catalogued[0] and (catalogued[2] or refgenome != "hs38d1v"):
+        refgenome = catalogued[0]
+    result["Refgenome"], result["RefgenomeNew"] = refgenome, new
+    return result
@@ -0,0 +1,157 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Resource planner (module resourceplan) for the samtools sorts (sort BAM, unalign, unmapped reads, align).  The
+    old mainwindow._adjust_mem_threads only kept the temporary file count under the MacOS limit of 256 open files,
+    split os_totmem (as found at start up) over all the threads whatever else was running, and asked the user with an
+    OK / Cancel pop-up to make sure there was enough disk space.  Here, for each sort, the planner looks at:
+
+    - The real free space of each temporary directory and the output directory (the same disk counted once).
+    - The RAM available now, and the memory and threads already declared by the jobs in the queue.
+    - The open file limit of this process (inherited by samtools) on any POSIX system; not just MacOS.
+
+    and picks the memory per thread, the thread count and the temporary directory; the fastest to write (a short timed
+    write) if more than one has the room.  A sort that would run out of disk or memory is refused, with why.
+
+    No tkinter or settings dependency here; mainwindow supplies the directories and limits and reports refusals.
+"""
+
+import os
+import time
+import shutil
+
+import psutil
+
+TEMP_MULT = 2.3             # If memory per thread is x, then the temporary files sort writes are each about x / 2.3
+CRAM_MULT = 1.95            # A CRAM is about this much smaller than the BAM it decodes to
+NAME_MULT = 1.45            # A name sort needs this much more temporary space than a coordinate sort
+RESERVED_FILES = 10         # Open files of samtools itself (inputs, outputs, libraries) beside its temporary files
+MEM_FRACTION = 0.9          # Of the RAM available now that a sort may plan to use
+MIN_MEM_PER_THREAD = 10**8  # samtools sort memory per thread not planned below (it spills a file each time it is full)
+SPEED_BYTES = 32 * 2**20    # Written (and synced) to time a temporary directory
+
+_speeds = {}                # Directory -> measured write bytes per second (once per run)
+
+
+class SortPlan:
+    """ Memory, threads and temporary directory for one samtools sort; or error (language key) and its values """
+
+    def __init__(self, mem_per_thread=0, threads=0, temp=None, temp_bytes=0, out_bytes=0, error=None, values=None):
+        self.mem_per_thread = mem_per_thread    # Bytes
+        self.threads = threads
+        self.temp = temp                        # Index of the chosen temporary directory
+        self.temp_bytes = temp_bytes            # Temporary space the sort needs
+        self.out_bytes = out_bytes              # Output directory space the result needs
+        self.error = error
+        self.values = values or {}
+
+    @property
+    def mem(self):
+        """ samtools sort -m value; rounded down to 100 million bytes when over (as settings.os_mem) """
+        mpt = self.mem_per_thread
+        return str((mpt // 10**8) * 100 if mpt > 10**8 else mpt // 10**6) + 'M'
+
+    @property
+    def total_mem(self):
+        return self.mem_per_thread * self.threads
+
+    def __repr__(self):
+        return f'SortPlan(-m {self.mem} -@ {self.threads}, temp {self.temp}, error {self.error})'
+
+
+def available_memory():
+    return psutil.virtual_memory().available
+
+
+def open_file_limit():
+    """ Soft limit on open files of this process (and so of the samtools we start); None if not known """
+    try:
+        import resource         # POSIX only
+        soft, _ = resource.getrlimit(resource.RLIMIT_NOFILE)
+    except (ImportError, OSError, ValueError):
+        return None
+    return None if soft == resource.RLIM_INFINITY else soft
+
+
+def free_space(dir_oFP):
+    try:
+        return shutil.disk_usage(dir_oFP).free
+    except OSError:
+        return 0
+
+
+def same_disk(dir1_oFP, dir2_oFP):
+    try:
+        return os.stat(dir1_oFP).st_dev == os.stat(dir2_oFP).st_dev
+    except OSError:
+        return False
+
+
+def write_speed(dir_oFP):
+    """ Bytes per second a (synced) write to the directory runs at; measured once per directory per run """
+    if dir_oFP not in _speeds:
+        test_oFN = os.path.join(dir_oFP, f'.wgse_speed_{os.getpid()}')
+        block = os.urandom(2**20)
+        try:
+            start = time.time()
+            with open(test_oFN, "wb") as test_file:
+                for _ in range(SPEED_BYTES // len(block)):
+                    test_file.write(block)
+                test_file.flush()
+                os.fsync(test_file.fileno())
+            _speeds[dir_oFP] = SPEED_BYTES / max(time.time() - start, 1e-6)
+        except OSError:
+            _speeds[dir_oFP] = 0
+        finally:
+            if os.path.exists(test_oFN):
+                os.remove(test_oFN)
+    return _speeds[dir_oFP]
+
+
+def plan_sort(file_size, file_type, sort_type, temp_oFPs, out_oFP, max_threads, max_mem, load_threads=0,
+              load_mem=0, out_bytes=None):
+    """
+    SortPlan for a samtools sort of a file_size byte BAM / CRAM (file_type) in "Coord" or "Name" order with its
+    temporary files in one of the temp_oFPs directories and the result (out_bytes; default the BAM size) written to
+    out_oFP.  max_threads and max_mem (bytes) are the platform (or user) limits; load_threads and load_mem what the
+    jobs already queued or running declared.
+    """
+    size = file_size * (CRAM_MULT if file_type == "CRAM" else 1)     # Likely BAM size if a CRAM to start
+    name_mult = NAME_MULT if sort_type == "Name" else 1
+    temp_bytes = int(size * name_mult)
+    out_bytes = int(size) if out_bytes is None else out_bytes
+    gb = {"{{APP}}": f'{sort_type} Sort', "{{SIZE}}": f'{temp_bytes / 10**9:.0f}',
+          "{{FINAL}}": f'{out_bytes / 10**9:.0f}'}
+
+    # Disk: the output, then each temporary directory with room for the temp files (and the output if the same disk)
+    out_free = free_space(out_oFP)
+    roomy = [number for number, temp_oFP in enumerate(temp_oFPs)
+             if os.path.isdir(temp_oFP) and free_space(temp_oFP) >=
+             temp_bytes + (out_bytes if same_disk(temp_oFP, out_oFP) else 0)]
+    if out_free < out_bytes or not roomy:
+        best = max(range(len(temp_oFPs)), key=lambda number: free_space(temp_oFPs[number]), default=None)
+        gb.update({"{{TEMPFREE}}": f'{(free_space(temp_oFPs[best]) if best is not None else 0) / 10**9:.0f}',
+                   "{{OUTFREE}}": f'{out_free / 10**9:.0f}'})
+        return SortPlan(temp_bytes=temp_bytes, out_bytes=out_bytes, error="errNoSpaceSort", values=gb)
+    temp = roomy[0] if len(roomy) == 1 else max(roomy, key=lambda number: write_speed(temp_oFPs[number]))
+
+    # Memory and threads: what is left beside the other jobs; fewer threads with more memory each if need be so
+    #  the temporary files fit under the open file limit.  If nothing fits beside the other jobs then plan as if
+    #  alone; the job queue holds the sort until they are done
+    files = open_file_limit()
+    for others_threads, others_mem in ((load_threads, load_mem), (0, 0)):
+        mem_budget = int(min(max_mem - others_mem if max_mem else available_memory(),
+                             available_memory() * MEM_FRACTION))
+        threads = max(1, max_threads - others_threads)
+        min_mpt = MIN_MEM_PER_THREAD
+        if files:
+            min_mpt = max(min_mpt, int(size * TEMP_MULT * name_mult / (files - RESERVED_FILES + threads)))
+        if mem_budget // threads < min_mpt:
+            threads = max(0, mem_budget) // min_mpt
+        if threads:
+            return SortPlan(mem_budget // threads, threads, temp, temp_bytes, out_bytes)
+    return SortPlan(temp=temp, temp_bytes=temp_bytes, out_bytes=out_bytes, error="errNoMemSort", values=gb)
@@ -0,0 +1,162 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Run history and learned run times (module runhistory).  The expected_time table (settings) was measured once on a
+    2 core AMD A10 with a 57 GB BAM; whatever the machine, thread count or file size, the Please Wait window and the
+    job time budgets used those numbers.  Here every finished job is recorded (script title, input size, threads,
+    memory, duration, and the time that was predicted for it) and a throughput model is fit per script title from
+    its recent successful runs:  seconds = overhead + (seconds per GB per thread) * GB / threads.  The overhead is
+    only fit when the inputs seen vary enough in size; else the time is taken as proportional to the input per thread.
+    A title never run yet (or run with no known input size) falls back to the table / the median of its runs.
+
+    Stored in a small SQLite database in the user's home area (wgse.runhistory_oFN); only the newest HISTORY_RUNS
+    runs of each title are kept.  Also a standalone script to report predicted vs actual times and purge the history:
+
+        python3 runhistory.py [--db file] report | list [title] | purge [title ... | --all]
+"""
+
+import os
+import sys
+import time
+import sqlite3
+import statistics
+
+import numpy as np
+
+HISTORY_RUNS = 100          # Runs kept per script title
+MODEL_RUNS = 20             # Most recent successful runs of a title the model is fit to
+MIN_SPREAD = 1.5            # Largest / smallest input per thread needed to fit an overhead as well as a rate
+
+
+def fit(runs):
+    """
+    Throughput model (overhead seconds, seconds per GB per thread) from a list of (size bytes, threads, seconds)
+    runs; the rate is None if none had a known input size (then the overhead is their median time). None if no runs.
+    """
+    if not runs:
+        return None
+    sized = [(size / 10**9 / max(1, threads), seconds) for size, threads, seconds in runs if size]
+    if not sized:
+        return statistics.median(seconds for _, _, seconds in runs), None
+    work = np.array([gb_per_thread for gb_per_thread, _ in sized])
+    seconds = np.array([secs for _, secs in sized])
+    if len(sized) >= 3 and work.max() >= work.min() * MIN_SPREAD:
+        rate, overhead = np.polyfit(work, seconds, 1)
+        if rate > 0 and overhead >= 0:
+            return float(overhead), float(rate)
+    return 0.0, float(np.median(seconds / work))
+
+
+def predict(model, size, threads):
+    """ Seconds the model says a run with size bytes of input on threads threads takes; None if no model """
+    if model is None:
+        return None
+    overhead, rate = model
+    if rate is None or not size:
+        return overhead if rate is None else None
+    return overhead + rate * size / 10**9 / max(1, threads)
+
+
+class RunHistory:
+    """ Store of finished job runs and the throughput model fit to them """
+
+    def __init__(self, db_oFN, max_runs=HISTORY_RUNS):
+        self.db_oFN = db_oFN
+        self.max_runs = max_runs
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_oFN, timeout=10)
+        db.execute("CREATE TABLE IF NOT EXISTS runs (id INTEGER PRIMARY KEY AUTOINCREMENT, title TEXT, "
+                   "started REAL, size INTEGER, threads INTEGER, mem INTEGER, seconds REAL, predicted REAL, "
+                   "status TEXT)")
+        return db
+
+    def record(self, title, size, threads, mem, seconds, predicted=None, status="done", started=None):
+        """ Add one finished run; then drop the oldest runs of the title past the limit """
+        try:
+            with self._connect() as db:
+                db.execute("INSERT INTO runs (title, started, size, threads, mem, seconds, predicted, status) "
+                           "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                           (title, started or time.time() - seconds, size, threads, mem, seconds, predicted, status))
+                db.execute("DELETE FROM runs WHERE title = ? AND id NOT IN "
+                           "(SELECT id FROM runs WHERE title = ? ORDER BY id DESC LIMIT ?)",
+                           (title, title, self.max_runs))
+        except sqlite3.Error:
+            pass        # A history; if it cannot be written then just move on
+
+    def runs(self, title=None):
+        """ List of (title, started, size, threads, mem, seconds, predicted, status) oldest first """
+        with self._connect() as db:
+            if title is None:
+                return db.execute("SELECT title, started, size, threads, mem, seconds, predicted, status FROM runs "
+                                  "ORDER BY id").fetchall()
+            return db.execute("SELECT title, started, size, threads, mem, seconds, predicted, status FROM runs "
+                              "WHERE title = ? ORDER BY id", (title,)).fetchall()
+
+    def model(self, title):
+        """ Throughput model (fit()) of the most recent successful runs of title; None if there are none """
+        try:
+            with self._connect() as db:
+                runs = db.execute("SELECT size, threads, seconds FROM runs WHERE title = ? AND status = 'done' "
+                                  "ORDER BY id DESC LIMIT ?", (title, MODEL_RUNS)).fetchall()
+        except sqlite3.Error:
+            return None
+        return fit(runs)
+
+    def predict(self, title, size, threads):
+        """ Learned seconds a run of title takes; None if nothing learned for it yet """
+        return predict(self.model(title), size, threads)
+
+    def purge(self, titles=None):
+        """ Remove the runs of the given titles (all if None); returns the number removed """
+        with self._connect() as db:
+            if titles is None:
+                return db.execute("DELETE FROM runs").rowcount
+            return sum(db.execute("DELETE FROM runs WHERE title = ?", (title,)).rowcount for title in titles)
+
+    def report(self):
+        """ Report lines per title: runs, model, and the predicted vs actual time of its runs """
+        lines = [f'{"Title":<22} {"Runs":>4} {"Overhead":>9} {"s/GB/thr":>9} {"Last pred":>10} {"Last actual":>11} '
+                 f'{"Mean error":>10}']
+        for title in sorted({run[0] for run in self.runs()}):
+            runs = [run for run in self.runs(title) if run[7] == "done"]
+            if not runs:
+                continue
+            model = self.model(title)
+            overhead, rate = model
+            errors = [abs(run[6] - run[5]) / run[5] for run in runs if run[6] and run[5]]
+            last = runs[-1]
+            lines.append(f'{title:<22} {len(runs):>4} {overhead:>8.0f}s '
+                         f'{"-" if rate is None else f"{rate:.0f}":>9} '
+                         f'{"-" if last[6] is None else f"{last[6]:.0f}s":>10} {last[5]:>10.0f}s '
+                         f'{"-" if not errors else f"{statistics.mean(errors):.0%}":>10}')
+        return lines
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    args = sys.argv[1:]
+    db_oFN = os.path.join(os.path.expanduser("~"), ".wgseruns.db")      # Same default as settings.runhistory_oFN
+    if len(args) > 1 and args[0] == "--db":
+        db_oFN, args = args[1], args[2:]
+    if not args or args[0] not in ("report", "list", "purge") or (args[0] == "purge" and len(args) < 2):
+        print(f'***ERROR: Unknown or missing command for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} [--db file] report | list [title] | purge [title ... | --all]',
+              file=sys.stderr, flush=True)
+        exit(1)
+
+    history = RunHistory(db_oFN)
+    if args[0] == "report":
+        print("\n".join(history.report()))
+    elif args[0] == "list":
+        for title, started, size, threads, mem, seconds, predicted, status in history.runs(*args[1:2]):
+            print(f'{time.strftime("%Y-%m-%d %H:%M", time.localtime(started))}\t{title}\t'
+                  f'{"-" if size is None else f"{size / 10**9:.2f}"} GB\t{threads} thr\t'
+                  f'{"-" if mem is None else f"{mem / 10**9:.1f}"} GB\t{seconds:.0f}s\t'
+                  f'{"-" if predicted is None else f"{predicted:.0f}s"}\t{status}')
+    else:
+        print(f'Removed {history.purge(None if args[1] == "--all" else args[1:])} runs from {db_oFN}')
@@ -61,6 +61,7 @@ yHgResult_maxh    = 750
 
 # Expected run times of various commands in seconds; for Please Wait window (used in module commandprocessor)
 # Number below based on Randy's 40x, 57GB BAM file on his 2 core, AMD A10-5700 processor using CygWin htslib 1.10
+# Only the starting point: once a command has run here, its time is learned from the run history (runhistory module)
 # Note: dictionary key name longest length is used in commandprocessor.py to set a field size.
 expected_time = {    # hours[1] * Minutes[1] * Seconds
     'GetBAMHeader':               2,  # ## samtools view -H (less than a second usually)
@@ -74,7 +75,7 @@ expected_time = {    # hours[1] * Minutes[1] * Seconds
     'GenBAMIndex':          30 * 60,  # ## samtools index
     'ButtonFastp':          45 * 60,  # ## fastp on fastq
     'ButtonFastqc':         60 * 60,  # ## fastqc on fastq
-    'ButtonMicroarrayDNA':   5 * 60,  # ## 1 to 12 aconv() calls; quick
+    'ButtonMicroarrayDNA':   2 * 60,  # ## One aconv.py run for all selected formats; quick
     'ButtonCombinedKit':    50 * 60,  # ## Samtools mpileup, bcftools call on WGS; an hour or more for single processor
     'ButtonYHaplo':         10 * 60,  # ## yleaf haplo
     'ButtonYHaplo2':         5 * 60,  # ## yleaf lookup
@@ -93,10 +94,17 @@ expected_time = {    # hours[1] * Minutes[1] * Seconds
     'CoverageStats':        45 * 60,  # ## samtools coverage to get per chromosome coverage
     'CoverageStatsWES':     60 * 60,  # ## samtools depth w/ WES BED file to get Coverage and Avg Read Depth
     'CoverageStatsPoz':     10 * 60,  # ## samtools depth w/ Poznik BED file on Y only BAM (so very quick)
-    'CoverageStatsBIN':    120 * 60,  # ## samtools depth and custom awk script (ditto CoverageStatsWES)
+    'CoverageStatsBIN':    120 * 60,  # ## samtools depth and our depthhist.py engine (ditto CoverageStatsWES)
+    'StatsBundle':         120 * 60,  # ## One decode for idxstats, body sample and WGS / WES bin coverage (CRAM, no index)
     'CreateAlignIndices':  180 * 60,  # ## bwa index on fasta file (changed to bwtsw algorithm which is fixed at 3hrs)
     'AlignCleanup':        120 * 60,  # ## Fixmate, Sort
     'AlignCleanup2':        60 * 60,  # ## Markdup, Index
+    'AlignSplit':           20 * 60,  # ## Split a FASTQ into the shard FASTQs in one pass (fastqshard.py)
+    'AlignShard':           60 * 60,  # ## bwa align, fixmate, sort of one FASTQ shard (fastqshard.py; ~4 GB of FASTQ)
+    'AlignMerge':           60 * 60,  # ## Merge sorted shards, Markdup, Index
+    'CombinedKitShard':     10 * 60,  # ## bcftools mpileup, call on one region shard of the CombinedKit targets (kitshards.py)
+    'CombinedKitMerge':      2 * 60,  # ## bcftools concat of the CombinedKit shard VCFs
+    'CombinedKitVCF':        5 * 60,  # ## CombinedKit straight from a vendor gVCF / all-sites VCF (vcfkit.py)
     'LiftoverCleanup':            5,  # ## Sort and Compress of CombinedKit file
     'AnnotatedVCF-yOnly':   10 * 60,  # ## Extract Y-only VCF from BAM and annotate
     'UnsortBAM':            10 * 60,  # ## samtools reheader (to change coord sorted to unknown) (DEBUG_MODE only)
@@ -106,7 +114,7 @@ expected_time = {    # hours[1] * Minutes[1] * Seconds
 }
 # Names used in calls to commandprocessor "run_bash_script"; called from modules mainwindow, bamfiles, microarray,
 #     and hg38tohg19; keys also defined as keys in the langstrs i8n dictionary (languages.xlsx)
-# Todo Times are adjusted relative to a BAM File Size of 60 GB.  So partial BAMs should get pared down time.
+# Learned times scale with the input (BAM) size and threads; so partial BAMs get pared down times.
 
 # Used in module bamfiles (specifically, calc_stats()
 valid_autos = ["1", "2", "3", "4", "5", "6", "7", "8", "9", "10", "11", "12",
@@ -140,7 +148,7 @@ parallelBAM = {
 
 # Same order as Valid Chromosomes; numbers originally from James Kane via GATK CallableLoci.
 # https://docs.google.com/spreadsheets/d/1S3a69mxHeiwRb2l3s_uyFK5KGjHhL9Qv1odObJBgOdQ/view#gid=477598766
-# Now from our own scan tool that generates from the reference model directly (countingNs.py).
+# Now from our own scan tool that generates from the reference model directly (nrunscan.py; was countingNs.py).
 # So refined original numbers that were different from GATK CallableLoci use by James.
 # Confirmed no N's in T2T models but minor variances in major builds except 1K hs38 >> 3 mil more.
 # Note: override chrM which actually has 1. Causes breadth of coverage to become 100.01%
@@ -234,6 +242,12 @@ seqnam = {
 }
 
 
+# Align pipeline modes (align_mode setting); first is the default.  Staged keeps the raw (unsorted) and sorted BAMs
+# as restart points, Checkpoint only the raw aligner output, Stream pipes the aligner straight into the final BAM,
+# Sharded aligns and sorts the FASTQs in pieces (fastqshard.py) that are then merged
+align_modes = ("Staged", "Checkpoint", "Stream", "Sharded")
+
+
 # Templates for sequencer ID's used in SN field of BAMs and @seqID of FASTQs; see http://bit.ly/2TfoAP2
 # relying on "ordered Dict" (Python 3.7 and later). HWI- prefix appears to be for Solexa Genome Analyzer series
 # Order similar entries from more specific to more general.
@@ -331,6 +345,9 @@ sequencers = {      # Wanted re.compile for the raw strings but import re not po
 DEBUG_MODE    = None  # Global DEBUG mode setting (similar to __debug__ removed by python -O)
 wsl_bwa_patch = None  # To bypass Win10 BWA which is single processorlanguage
 prefserver    = None  # Special as saved in settings with many of the above
+align_mode    = None  # Align pipeline; one of align_modes
+kit_parallel_verified = None  # Reference model : target list pairs the parallel CombinedKit proved identical for
+job_time_limit = None  # Kill jobs running far past their expected time (commandprocessor.job_timeout); opt in
 gui           = None  # To determine if interactive or not; wgse.window if gui
 
 # Class object instantiation points
@@ -364,6 +381,9 @@ os_totmem_saved  = 0                # User desired override of platform total me
 User_oFP     = None  # Users home area directory path (~, users/name)
 debugset_oFN = None  # type: [str]  # File name for DEBUG mode toggle
 wgseset_oFN  = None  # type: [str]  # File name for global settings
+statscache_oFN = None  # type: [str]  # BAM stats cache database (statscache module)
+progresslog_oFN = None  # type: [str]  # Job progress events (JSON lines) log; only written to if the user created it
+runhistory_oFN = None  # type: [str]  # Run history database of finished jobs (runhistory module)
 wslbwa_oFN   = None  # type: [str]  # File name for WSL BWA Patch toggle
 
 # Key paths all determined from where this settings file is located.
@@ -462,11 +482,13 @@ def init(interactive=False):
     from mainwindow import mainwindow_init
 
     # Globals we want to access from in here
-    global DEBUG_MODE, wsl_bwa_patch, prefserver, gui           # Some universal settings
+    # Some universal settings
+    global DEBUG_MODE, wsl_bwa_patch, prefserver, align_mode, kit_parallel_verified, job_time_limit, gui
     global tempf, lang, outdir, reflib, window, BAM, fonts      # Some universal class imstamces
     global os_plat, os_arch, os_threads, os_totmem, os_mem, os_pid, os_threads_proc, os_totmem_proc
     global os_slash, os_batch_FS
-    global User_oFP, debugset_oFN, wgseset_oFN, wslbwa_oFN  # , langset_oFN
+    global User_oFP, debugset_oFN, wgseset_oFN, wslbwa_oFN, statscache_oFN, progresslog_oFN
+    global runhistory_oFN  # , langset_oFN
     global prog_oFP, prog_FP, language_oFN, image_oFP, dnaImage, icon_oFP
     global install_FP, install_oFP
     global python3_FP, python3x_qFN, yleaf_FP
@@ -506,8 +528,8 @@ def init(interactive=False):
 
     set_mem_per_thread_millions(os_totmem, os_threads)      # Sets global os_mem internal to call
 
-    # Todo gather and update free disk space on temp and outputdir; do not start command if not enough left
-    #  See https://psutil.readthedocs.io/en/latest/ for additional info (e.g. psutil.disk_usage(path)['free'])
+    # Free disk space on the temporary and output directories, the RAM available and the open file limit at the time
+    #  of each samtools sort are checked by resourceplan.plan_sort (via mainwindow._plan_sort); not just here at start
 
     #
     # Stored settings set per user / run
@@ -520,6 +542,9 @@ def init(interactive=False):
     debugset_oFN  = f'{User_oFP}.wgsedebug'     # No content; just existence of file turns on debugging
     wslbwaset_oFN = f'{User_oFP}.wgsewslbwa'    # No content; just existence turns on WSL BWA patch on Win10 systems
     wgseset_oFN   = f'{User_oFP}.wgsextract'    # General settings save / restore
+    statscache_oFN = f'{User_oFP}.wgsestats.db'  # Derived BAM / CRAM stats keyed by file fingerprint
+    progresslog_oFN = f'{User_oFP}.wgseprogress.jsonl'  # Create (empty) to have job progress events appended
+    runhistory_oFN = f'{User_oFP}.wgseruns.db'  # Finished job runs; the expected times are learned from them
 
     # Start global debug messages if requested (utilities.py); start after TemporaryFiles so it can clean directory
     if os.path.exists(debugset_oFN) and os.path.isfile(debugset_oFN):
@@ -573,6 +598,9 @@ def init(interactive=False):
     DEBUG(f'WGS Extract: {__version__}')
 
     prefserver = "NIH"      # Default value; otherwise "EBI"
+    align_mode = "Staged"   # Default value; otherwise "Checkpoint", "Stream" or "Sharded" (see align_modes)
+    kit_parallel_verified = []
+    job_time_limit = False  # Default; a stalled job is only reported
 
     #
     # Setup bioinformatic, OS and other tools we need to access too
@@ -957,7 +985,8 @@ def load_settings(gui=False):
     from mainwindow import update_action_buttons
 
     global outdir, reflib, tempf, lang, BAM, fonts
-    global wgseset_oFN, prefserver, os_threads, os_totmem, os_threads_saved, os_totmem_saved, os_mem
+    global wgseset_oFN, prefserver, align_mode, kit_parallel_verified, job_time_limit
+    global os_threads, os_totmem, os_threads_saved, os_totmem_saved, os_mem
 
     settings_to_restore = {}
     if os.path.exists(wgseset_oFN):
@@ -1012,6 +1041,11 @@ def load_settings(gui=False):
 
     # Set now because BAM load / restore may caused Ref Library download request
     prefserver = settings_to_restore.get('prefserver', prefserver)
+    align_mode = settings_to_restore.get('align_mode', align_mode)
+    if align_mode not in align_modes:
+        align_mode = align_modes[0]
+    kit_parallel_verified = settings_to_restore.get('kit_parallel_verified', kit_parallel_verified)
+    job_time_limit = settings_to_restore.get('job_time_limit', job_time_limit)
 
     # Allow user override of threads and total memory (but not greater than platform returned values)
     updated = False
@@ -1062,7 +1096,7 @@ def save_settings():
     from utilities import DEBUG
 
     global outdir, BAM, reflib, tempf, lang, fonts
-    global wgseset_oFN, prefserver, os_threads, os_totmem
+    global wgseset_oFN, prefserver, align_mode, kit_parallel_verified, job_time_limit, os_threads, os_totmem
 
     # DEBUG(f'WGSE JSON Setting file: {wgseset_oFN}')
     settings_to_save = {}
@@ -1083,6 +1117,12 @@ def save_settings():
         settings_to_save['fonts.basept'] = fonts.basept
     if prefserver != 'NIH':     # Only save if not default
         settings_to_save['prefserver'] = prefserver
+    if align_mode != align_modes[0]:
+        settings_to_save['align_mode'] = align_mode
+    if kit_parallel_verified:
+        settings_to_save['kit_parallel_verified'] = kit_parallel_verified
+    if job_time_limit:          # Only save if not default
+        settings_to_save['job_time_limit'] = job_time_limit
     if os_threads_saved and os_threads_saved > 0:
         settings_to_save['os_threads_saved'] = os_threads_saved
     if os_totmem_saved and os_totmem_saved > 0:
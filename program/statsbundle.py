@@ -0,0 +1,157 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Standalone script (and importable module) for the one pass "stats bundle" of a BAM / CRAM (BAMFile.get_stats_bundle).
+A full stats session used to read the file three or four times: samtools idxstats, samtools view | head for the body
+sample (again with tail | head for Nanopore), and samtools depth for each of the WGS and WES bin coverage tables.
+For a CRAM, or any file without an index, each of those is a full decode.  The bundle decodes the file once into an
+uncompressed BAM stream that is tee'd to the samtools depth | depthhist.py consumers and to this script.
+
+This script reads the SAM text (samtools view -h) of that stream in large chunks and fills, with NumPy vector
+operations on the FLAG and RNAME columns, the per sequence mapped / unmapped counts that samtools idxstats reports
+(same four column layout). It also saves the first body lines as the read length / insert size sample files that
+BAMFile.process_bam_body() reads.  It must read the whole stream; stopping early would break the tee for the others.
+
+    samtools view -h x.bam | python3 statsbundle.py - x_idxstats.csv flags.tmp flagslong.tmp 20000 580000
+"""
+
+import sys
+import os
+
+import numpy as np
+
+from depthhist import parse_int_fields
+
+CHUNK_SIZE = 64 * 2**20     # Bytes read from the SAM stream at a time
+
+
+class StatsBundle:
+    """
+    Accumulators for one pass over the SAM text of a BAM / CRAM.  sequences is the header @SQ (SN, LN) list in order;
+    mapped / unmapped are the idxstats counts per RNAME ('*' for the unplaced, unmapped reads).
+    """
+
+    def __init__(self, numsamp=20000, lonsamp=0):
+        self.sequences = []
+        self.mapped = {}
+        self.unmapped = {}
+        self.numsamp = numsamp
+        self.lonsamp = lonsamp
+        self.sample = []            # Blocks of (whole) body lines for the body sample files
+        self.sampled = 0            # Lines saved so far in self.sample
+        self._in_header = True
+
+    def add_header_line(self, line):
+        if line.startswith(b"@SQ\t"):
+            fields = dict(field.split(b":", 1) for field in line.split(b"\t")[1:] if b":" in field)
+            if b"SN" in fields and b"LN" in fields:
+                self.sequences.append((fields[b"SN"].decode(), int(fields[b"LN"])))
+
+    def add_lines(self, data):
+        """ Add a bytes block of complete SAM body lines """
+        buf = np.frombuffer(data, dtype=np.uint8)
+        eol = np.flatnonzero(buf == 10)
+        if len(eol) == 0:
+            return
+
+        # Keep the first (numsamp + lonsamp) lines as the body sample
+        wanted = self.numsamp + self.lonsamp - self.sampled
+        if wanted > 0:
+            take = min(wanted, len(eol))
+            self.sample.append(data[:eol[take - 1] + 1])
+            self.sampled += take
+
+        # The QNAME, FLAG and RNAME columns end at the first three tabs of each line
+        tabs = np.flatnonzero(buf == 9)
+        line_starts = np.concatenate(([0], eol[:-1] + 1))
+        first = np.searchsorted(tabs, line_starts)
+        flag_tab, rname_tab, pos_tab = tabs[first], tabs[first + 1], tabs[first + 2]
+        unmapped = (parse_int_fields(buf, flag_tab + 1, rname_tab) & 0x4) != 0
+
+        # Input is normally coordinate sorted so RNAME only changes a few times per chunk.  Only decode the name
+        # where its length, byte sum or last character changes from the previous line.
+        name_len = pos_tab - rname_tab
+        name_sum = np.add.reduceat(buf, np.stack((rname_tab + 1, pos_tab), axis=1).ravel(), dtype=np.int64)[::2]
+        name_end = buf[pos_tab - 1]
+        changed = (np.diff(name_len) != 0) | (np.diff(name_sum) != 0) | (np.diff(name_end) != 0)
+        starts = np.concatenate(([0], np.flatnonzero(changed) + 1))
+        unmapped_counts = np.add.reduceat(unmapped.astype(np.int64), starts)
+        line_counts = np.diff(np.append(starts, len(eol)))
+
+        for line, lines, unmapped_count in zip(starts, line_counts, unmapped_counts):
+            name = data[rname_tab[line] + 1:pos_tab[line]].decode()
+            self.mapped[name] = self.mapped.get(name, 0) + int(lines - unmapped_count)
+            self.unmapped[name] = self.unmapped.get(name, 0) + int(unmapped_count)
+
+    def add_block(self, data):
+        """ Add a block of complete lines; leading header lines (only at the start of the stream) are split off """
+        while self._in_header and data:
+            if not data.startswith(b"@"):
+                self._in_header = False
+                break
+            cut = data.find(b"\n") + 1
+            self.add_header_line(data[:cut].rstrip(b"\r\n"))
+            data = data[cut:]
+        if data:
+            self.add_lines(data)
+
+    def add_stream(self, stream, chunk_size=CHUNK_SIZE):
+        """ Read a binary SAM text stream (e.g. sys.stdin.buffer) in large chunks; only whole lines processed """
+        remainder = b""
+        while True:
+            chunk = stream.read(chunk_size)
+            if not chunk:
+                break
+            data = remainder + chunk
+            cut = data.rfind(b"\n") + 1
+            self.add_block(data[:cut])
+            remainder = data[cut:]
+        if remainder.strip():
+            self.add_block(remainder + b"\n")
+
+    def write_idxstats(self, idxfile_oFN):
+        """ Same layout as samtools idxstats: SN, LN, mapped, unmapped; header order; then the '*' unplaced row """
+        listed = set()
+        with open(idxfile_oFN, "w") as idxfile:
+            for sname, length in self.sequences:
+                listed.add(sname)
+                idxfile.write(f'{sname}\t{length}\t{self.mapped.get(sname, 0)}\t{self.unmapped.get(sname, 0)}\n')
+            for sname in self.mapped:
+                if sname not in listed and sname != "*":
+                    idxfile.write(f'{sname}\t0\t{self.mapped[sname]}\t{self.unmapped[sname]}\n')
+            idxfile.write(f'*\t0\t0\t{self.mapped.get("*", 0) + self.unmapped.get("*", 0)}\n')
+
+    def write_samples(self, flags_oFN, flagslong_oFN=None):
+        """ First numsamp lines to flags_oFN; the following lonsamp lines (if wanted) to flagslong_oFN """
+        sample = b"".join(self.sample)
+        cut = 0
+        for _ in range(min(self.numsamp, self.sampled)):
+            cut = sample.index(b"\n", cut) + 1
+        with open(flags_oFN, "wb") as flags_file:
+            flags_file.write(sample[:cut])
+        if flagslong_oFN:
+            with open(flagslong_oFN, "wb") as flags_file:
+                flags_file.write(sample[cut:])
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) != 7:
+        print(f'***ERROR: Exactly six parameters needed for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} sam_file idxstats.csv flags.tmp flagslong.tmp numsamp lonsamp',
+              file=sys.stderr, flush=True)
+        print(f'     sam_file can be "-" to read stdin stream', file=sys.stderr, flush=True)
+        exit(1)
+
+    bundle = StatsBundle(int(sys.argv[5]), int(sys.argv[6]))
+    if sys.argv[1] == "-":
+        bundle.add_stream(sys.stdin.buffer)
+    else:
+        with open(sys.argv[1], "rb") as sam_file:
+            bundle.add_stream(sam_file)
+    bundle.write_idxstats(sys.argv[2])
+    bundle.write_samples(sys.argv[3], sys.argv[4])
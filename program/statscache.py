@@ -0,0 +1,129 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""###################################################################################################################
+    Persistent BAM / CRAM stats cache (module statscache).  Every time a BAM is (re)loaded, BAMFile re-ran the header,
+    body sample and idxstats commands; and the longer coverage runs were only reused through size / mtime checks of
+    the result files in the output directory (mtimes cannot be trusted after a CRAM / BAM conversion).  Here we key
+    all the derived BAMFile values on a content fingerprint of the file instead: its size plus a hash of the first
+    megabyte (the BGZF compressed header and first reads) and the last 64 KB (the final blocks and the BGZF EOF
+    marker).  No samtools run needed; reading it takes milliseconds.  So a known file is back in milliseconds, even
+    when moved or opened with a different output directory.
+
+    Stored in a small SQLite database in the user's home area (wgse.statscache_oFN); least recently used entries are
+    evicted past CACHE_ENTRIES.  Values are stored as JSON.  Also a standalone script to inspect and purge the cache:
+
+        python3 statscache.py [--db file] list | show fingerprint | purge [fingerprint ... | --all]
+"""
+
+import os
+import sys
+import json
+import time
+import sqlite3
+import hashlib
+
+CACHE_ENTRIES = 200         # Least recently used entries beyond this are evicted
+HEAD_BYTES = 2**20          # Compressed header (and first reads) hashed into the fingerprint
+TAIL_BYTES = 2**16          # Final blocks, including the 28 byte BGZF EOF block, hashed into the fingerprint
+
+
+def bam_fingerprint(file_oFN):
+    """ Content fingerprint of a BAM / CRAM: size plus a SHA-256 of its head and tail bytes. None if unreadable. """
+    try:
+        size = os.path.getsize(file_oFN)
+        digest = hashlib.sha256(str(size).encode())
+        with open(file_oFN, "rb") as bam_file:
+            digest.update(bam_file.read(HEAD_BYTES))
+            bam_file.seek(max(size - TAIL_BYTES, 0))
+            digest.update(bam_file.read(TAIL_BYTES))
+    except OSError:
+        return None
+    return f'{size:x}-{digest.hexdigest()[:40]}'
+
+
+class StatsCache:
+    """ Fingerprint keyed store of derived BAMFile attribute dictionaries with LRU eviction """
+
+    def __init__(self, db_oFN, max_entries=CACHE_ENTRIES):
+        self.db_oFN = db_oFN
+        self.max_entries = max_entries
+
+    def _connect(self):
+        db = sqlite3.connect(self.db_oFN, timeout=10)
+        db.execute("CREATE TABLE IF NOT EXISTS bamstats (fingerprint TEXT PRIMARY KEY, file TEXT, "
+                   "created REAL, last_used REAL, attrs TEXT)")
+        return db
+
+    def get(self, fingerprint):
+        """ Return the saved attribute dictionary (and mark it used) or None """
+        if not fingerprint:
+            return None
+        try:
+            with self._connect() as db:
+                row = db.execute("SELECT attrs FROM bamstats WHERE fingerprint = ?", (fingerprint,)).fetchone()
+                if row:
+                    db.execute("UPDATE bamstats SET last_used = ? WHERE fingerprint = ?", (time.time(), fingerprint))
+        except sqlite3.Error:
+            return None
+        return json.loads(row[0]) if row else None
+
+    def put(self, fingerprint, file_FN, attrs):
+        """ Save (replace) the attribute dictionary for fingerprint; then evict least recently used past the limit """
+        if not fingerprint:
+            return
+        now = time.time()
+        try:
+            with self._connect() as db:
+                db.execute("INSERT OR REPLACE INTO bamstats VALUES (?, ?, "
+                           "COALESCE((SELECT created FROM bamstats WHERE fingerprint = ?), ?), ?, ?)",
+                           (fingerprint, file_FN, fingerprint, now, now, json.dumps(attrs)))
+                db.execute("DELETE FROM bamstats WHERE fingerprint NOT IN "
+                           "(SELECT fingerprint FROM bamstats ORDER BY last_used DESC LIMIT ?)", (self.max_entries,))
+        except (sqlite3.Error, TypeError, ValueError):
+            pass        # A cache; if it cannot be written then just move on
+
+    def entries(self):
+        """ List of (fingerprint, file, created, last_used, attrs size) in most recently used order """
+        with self._connect() as db:
+            return db.execute("SELECT fingerprint, file, created, last_used, LENGTH(attrs) FROM bamstats "
+                              "ORDER BY last_used DESC").fetchall()
+
+    def purge(self, fingerprints=None):
+        """ Remove the given fingerprints (all if None); returns the number removed """
+        with self._connect() as db:
+            if fingerprints is None:
+                return db.execute("DELETE FROM bamstats").rowcount
+            return sum(db.execute("DELETE FROM bamstats WHERE fingerprint = ?", (fingerprint,)).rowcount
+                       for fingerprint in fingerprints)
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    args = sys.argv[1:]
+    db_oFN = os.path.join(os.path.expanduser("~"), ".wgsestats.db")     # Same default as settings.statscache_oFN
+    if len(args) > 1 and args[0] == "--db":
+        db_oFN, args = args[1], args[2:]
+    if not args or args[0] not in ("list", "show", "purge") or (args[0] == "show" and len(args) != 2) or \
+            (args[0] == "purge" and len(args) < 2):
+        print(f'***ERROR: Unknown or missing command for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} [--db file] list | show fingerprint | purge [fingerprint ... | --all]',
+              file=sys.stderr, flush=True)
+        exit(1)
+
+    cache = StatsCache(db_oFN)
+    if args[0] == "list":
+        for fingerprint, file_FN, created, last_used, size in cache.entries():
+            print(f'{fingerprint}\t{time.strftime("%Y-%m-%d %H:%M", time.localtime(last_used))}\t{size:>8}\t{file_FN}')
+    elif args[0] == "show":
+        attrs = cache.get(args[1])
+        if attrs is None:
+            print(f'***ERROR: No cache entry {args[1]}', file=sys.stderr, flush=True)
+            exit(1)
+        attrs.pop("Header", None)       # Long; and available with samtools view -H
+        print(json.dumps(attrs, indent=1))
+    else:
+        print(f'Removed {cache.purge(None if args[1] == "--all" else args[1:])} entries from {db_oFN}')
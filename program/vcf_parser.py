@@ -0,0 +1,340 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+Streaming VCF reader (module vcf_parser) for VCFFile and the VCF features: no bcftools or samtools run; a bgzip'ed
+(BGZF), gzip'ed or plain VCF is read once in order and handed back as columnar batches of up to batch_size records
+(VCFBatch: numpy arrays of the chromosome codes, positions, REF / ALT, QUAL, FILTER, the GT of one sample and the
+INFO / FORMAT fields asked for).  So memory stays bounded however large the VCF.
+
+With a region ("chrY", "chr1:1000-2000"; 1-based as bcftools), only the BGZF blocks the tabix (.tbi) or CSI (.csi)
+index gives for it are read: the index bins overlapping the region give the chunks (virtual file offsets) to seek to.
+
+    python3 vcf_parser.py file.vcf.gz [region]      (print the record count per chromosome)
+"""
+
+import sys
+import os
+import re
+import gzip
+import zlib
+import struct
+
+import numpy as np
+
+BATCH_SIZE = 65536              # Records per VCFBatch
+INT_MISSING = np.iinfo(np.int32).min    # Integer INFO / FORMAT value missing (as htslib bcf_int32_missing)
+GT_MISSING, GT_ABSENT = -1, -2  # GT allele "." ; second allele of a haploid call
+GT_SPLIT = re.compile(r"[/|]")
+
+
+class BGZFReader:
+    """ BGZF file read in (uncompressed) lines; seek and tell by virtual offset (block offset << 16 | in block) """
+
+    def __init__(self, file_oFN):
+        self.file = open(file_oFN, "rb")
+        self.block, self.coffset, self.next_coffset, self.upos = b"", 0, 0, 0
+
+    def close(self):
+        self.file.close()
+
+    def _load(self, coffset):
+        """ Decompress the block at coffset; False at the end of the file """
+        self.file.seek(coffset)
+        header = self.file.read(18)
+        if len(header) < 18:
+            self.block, self.coffset, self.next_coffset, self.upos = b"", coffset, coffset, 0
+            return False
+        bsize = struct.unpack("<H", header[16:18])[0] + 1
+        self.block = zlib.decompress(self.file.read(bsize - 18)[:-8], -15)
+        self.coffset, self.next_coffset, self.upos = coffset, coffset + bsize, 0
+        return True
+
+    def seek(self, voffset):
+        self._load(voffset >> 16)
+        self.upos = voffset & 0xffff
+
+    def tell(self):
+        return self.coffset << 16 | self.upos
+
+    def lines(self):
+        """ (virtual offset, line without the newline) from the current position on """
+        pending, start = b"", None
+        while True:
+            while self.upos >= len(self.block):     # Next block with data; the EOF marker block has none
+                if not self._load(self.next_coffset):
+                    if pending:
+                        yield start, pending
+                    return
+            if start is None:
+                start = self.tell()
+            newline = self.block.find(b"\n", self.upos)
+            if newline < 0:
+                pending += self.block[self.upos:]
+                self.upos = len(self.block)
+                continue
+            yield start, pending + self.block[self.upos:newline]
+            pending, start, self.upos = b"", None, newline + 1
+
+
+class TabixIndex:
+    """ Bins and chunks of a tabix (.tbi) or CSI (.csi) index; chunks() gives the virtual offsets of a region """
+
+    def __init__(self, index_oFN):
+        with gzip.open(index_oFN, "rb") as f:    # Both are BGZF compressed
+            data = f.read()
+        self.refs = []              # Per sequence: ({bin: (bin loffset, [(chunk begin, chunk end), ...])}, linear)
+        if data[:4] == b"TBI\1":
+            n_ref, _, _, _, _, _, _, l_nm = struct.unpack_from("<8i", data, 4)
+            self.min_shift, self.depth, names, pos = 14, 5, data[36:36 + l_nm], 36 + l_nm
+        elif data[:4] == b"CSI\1":
+            self.min_shift, self.depth, l_aux = struct.unpack_from("<3i", data, 4)
+            l_nm = struct.unpack_from("<i", data, 16 + 24)[0] if l_aux >= 28 else 0
+            names, pos = data[16 + 28:16 + 28 + l_nm], 16 + l_aux
+            n_ref = struct.unpack_from("<i", data, pos)[0]
+            pos += 4
+        else:
+            raise ValueError(f'Not a tabix or CSI index: {index_oFN}')
+        self.names = [name.decode() for name in names.split(b"\0")[:n_ref]]
+
+        csi = data[:4] == b"CSI\1"
+        for _ in range(n_ref):
+            bins = {}
+            n_bin = struct.unpack_from("<i", data, pos)[0]
+            pos += 4
+            for _ in range(n_bin):
+                if csi:
+                    bin_number, loffset, n_chunk = struct.unpack_from("<IQi", data, pos)
+                    pos += 16
+                else:
+                    (bin_number, n_chunk), loffset = struct.unpack_from("<Ii", data, pos), 0
+                    pos += 8
+                chunks = struct.unpack_from(f'<{2 * n_chunk}Q', data, pos)
+                pos += 16 * n_chunk
+                bins[bin_number] = (loffset, list(zip(chunks[::2], chunks[1::2])))
+            linear = ()
+            if not csi:
+                n_intv = struct.unpack_from("<i", data, pos)[0]
+                linear = struct.unpack_from(f'<{n_intv}Q', data, pos + 4)
+                pos += 4 + 8 * n_intv
+            self.refs.append((bins, linear))
+
+    def region_bins(self, beg, end):
+        """ Bins (all levels) overlapping the 0-based, half open region [beg, end) """
+        bins, shift, first, end = [], self.min_shift + self.depth * 3, 0, end - 1
+        for level in range(self.depth + 1):
+            bins.extend(range(first + (beg >> shift), first + (end >> shift) + 1))
+            shift -= 3
+            first += 1 << (level * 3)
+        return bins
+
+    def chunks(self, chrom, beg, end):
+        """ Merged (begin, end) virtual offset chunks holding all records of chrom overlapping [beg, end) """
+        if chrom not in self.names:
+            return []
+        bins, linear = self.refs[self.names.index(chrom)]
+        if linear:                  # Tabix: 16 kbp windows of the first record offset
+            min_offset = linear[min(beg >> 14, len(linear) - 1)]
+        else:                       # CSI: the finest bin holding beg that has records
+            region = [number for number in self.region_bins(beg, beg + 1) if number in bins]
+            min_offset = bins[region[-1]][0] if region else 0
+        chunks = sorted((max(cbeg, min_offset), cend) for number in self.region_bins(beg, end) if number in bins
+                        for cbeg, cend in bins[number][1] if cend > min_offset)
+        merged = []
+        for cbeg, cend in chunks:
+            if merged and cbeg <= merged[-1][1]:
+                merged[-1] = (merged[-1][0], max(merged[-1][1], cend))
+            else:
+                merged.append((cbeg, cend))
+        return merged
+
+
+def parse_region(region, contigs=()):
+    """
+    (chrom, 0-based begin, end) of a region "chrom", "chrom:beg" or "chrom:beg-end" (1-based, inclusive).  A region
+    that is one of the contigs is the whole sequence; even with a colon in the name (e.g. HLA-A*01:01:01:01).
+    """
+    chrom, _, span = region.rpartition(":") if region not in contigs and re.search(r":[\d,]+(-[\d,]*)?$", region) \
+        else (region, "", "")
+    beg, _, end = span.replace(",", "").partition("-")
+    return chrom, max(int(beg or 1) - 1, 0), int(end) if end else 2**31 - 1
+
+
+class VCFBatch:
+    """
+    Columnar block of VCF records.  chrom are codes into VCFParser.contigs; pos is 1-based; alt is the ALT field
+    ("" if "."); passed is FILTER PASS or "."; gt the two allele indices of the sample (GT_MISSING / GT_ABSENT);
+    info and fmt map each field asked for to its array (INT_MISSING / nan / None if missing).
+    """
+
+    def __init__(self, chrom, pos, ids, ref, alt, qual, passed, gt, phased, info, fmt):
+        self.chrom, self.pos, self.ids, self.ref, self.alt = chrom, pos, ids, ref, alt
+        self.qual, self.passed, self.gt, self.phased = qual, passed, gt, phased
+        self.info, self.fmt = info, fmt
+
+    def __len__(self):
+        return len(self.pos)
+
+
+class VCFParser:
+    """
+    Reads a VCF as VCFBatch-es (see module).  header is the text of all header lines (## and #CHROM); contigs the
+    ##contig IDs in order (other chromosomes seen are added); samples the sample names.  sample selects the GT and
+    FORMAT column; info and fmt the INFO / FORMAT fields wanted (typed by their ##INFO / ##FORMAT Type).
+    """
+
+    def __init__(self, vcf_oFN, sample=0, info=(), fmt=(), batch_size=BATCH_SIZE):
+        self.vcf_oFN = vcf_oFN
+        self.info, self.fmt, self.batch_size = tuple(info), tuple(fmt), batch_size
+        self.contigs, self.codes, self.samples = [], {}, []
+        self.types = {"INFO": {}, "FORMAT": {}}     # ID -> (Number, Type)
+        self._index = None
+
+        with open(vcf_oFN, "rb") as f:
+            head = f.read(18)
+        self.bgzf = len(head) == 18 and head[:2] == b"\x1f\x8b" and head[3] & 4 and head[12:14] == b"BC"
+        header, lines = [], self._lines()
+        for _, line in lines:
+            if not line.startswith(b"#"):
+                break
+            header.append(line.decode())
+            if line.startswith(b"#CHROM"):
+                self.samples = header[-1].split("\t")[9:]
+                break
+        lines.close()
+        self.header = "".join(f'{line}\n' for line in header)
+        for line in header:
+            if line.startswith("##contig=<"):
+                self._code(re.search(r"[<,]ID=([^,>]+)", line).group(1))
+            elif line.startswith(("##INFO=<", "##FORMAT=<")):
+                fields = dict(re.findall(r"(ID|Number|Type)=([^,>]+)", line))
+                self.types[line[2:line.index("=")]][fields.get("ID")] = (fields.get("Number"), fields.get("Type"))
+        self.sample = sample if isinstance(sample, int) else self.samples.index(sample)
+
+    def _code(self, chrom):
+        if chrom not in self.codes:
+            self.codes[chrom] = len(self.contigs)
+            self.contigs.append(chrom)
+        return self.codes[chrom]
+
+    def _lines(self, chunks=None):
+        """ (virtual offset or None, line) of the whole file or of the chunks """
+        if self.bgzf:
+            reader = BGZFReader(self.vcf_oFN)
+            try:
+                for cbeg, cend in chunks or [(0, None)]:
+                    reader.seek(cbeg)
+                    for voffset, line in reader.lines():
+                        if cend is not None and voffset >= cend:
+                            break
+                        yield voffset, line
+            finally:
+                reader.close()
+        else:
+            with gzip.open(self.vcf_oFN, "rb") if self.vcf_oFN.endswith("gz") else open(self.vcf_oFN, "rb") as f:
+                for line in f:
+                    yield None, line.rstrip(b"\r\n")
+
+    def index(self):
+        """ The TabixIndex of the VCF (file.tbi or file.csi) """
+        if self._index is None:
+            for suffix in (".tbi", ".TBI", ".csi", ".CSI"):
+                if os.path.isfile(self.vcf_oFN + suffix):
+                    self._index = TabixIndex(self.vcf_oFN + suffix)
+                    break
+            else:
+                raise FileNotFoundError(f'No tabix or CSI index for {self.vcf_oFN}')
+        return self._index
+
+    def batches(self, region=None):
+        """ VCFBatch-es of the records; all or only those overlapping region (via the index) """
+        chrom = None
+        if region and not self.bgzf:
+            raise ValueError(f'Region needs a bgzip compressed, indexed VCF: {self.vcf_oFN}')
+        if region:
+            chrom, beg, end = parse_region(region, self.contigs) if isinstance(region, str) else region
+            lines = self._lines(self.index().chunks(chrom, beg, end))
+        else:
+            lines = self._lines()
+        rows = []
+        for _, line in lines:
+            if not line or line.startswith(b"#"):
+                continue
+            fields = line.decode().split("\t")
+            if chrom is not None:   # Chunks may hold records of other sequences or outside the region
+                start = int(fields[1]) - 1
+                if fields[0] != chrom or start >= end or start + len(fields[3]) <= beg:
+                    continue
+            rows.append(fields)
+            if len(rows) >= self.batch_size:
+                yield self._batch(rows)
+                rows = []
+        if rows:
+            yield self._batch(rows)
+
+    def in_order(self, records=None):
+        """
+        True if the records (only the first records of them, if given) follow the ##contig order (other chromosomes
+        after those) and each chromosome is in position order; as bcftools and tabix need a VCF sorted
+        """
+        last, seen = -1, 0
+        for batch in self.batches():
+            keys = batch.chrom.astype(np.int64) << 32 | batch.pos.astype(np.int64)
+            if keys[0] < last or np.any(keys[1:] < keys[:-1]):
+                return False
+            last, seen = int(keys[-1]), seen + len(batch)
+            if records is not None and seen >= records:
+                break
+        return True
+
+    def _column(self, kind, key, values):
+        number, type = self.types[kind].get(key, (None, "String"))
+        if type == "Flag":
+            return np.array([value is not None for value in values], dtype=bool)
+        if number == "1" and type == "Integer":
+            return np.array([INT_MISSING if value in (None, ".") else int(value) for value in values], dtype=np.int32)
+        if number == "1" and type == "Float":
+            return np.array([np.nan if value in (None, ".") else float(value) for value in values], dtype=np.float32)
+        return np.array([None if value in (None, ".") else value for value in values], dtype=object)
+
+    def _batch(self, rows):
+        column = 9 + self.sample
+        infos = [dict(item.split("=", 1) if "=" in item else (item, "") for item in row[7].split(";"))
+                 if self.info and len(row) > 7 else {} for row in rows]
+        formats = [dict(zip(row[8].split(":"), row[column].split(":"))) if len(row) > column else {} for row in rows]
+        gt = np.full((len(rows), 2), GT_MISSING, dtype=np.int8)
+        phased = np.zeros(len(rows), dtype=bool)
+        for number, sample in enumerate(formats):
+            call = sample.get("GT", ".")
+            alleles = GT_SPLIT.split(call)
+            gt[number] = [GT_MISSING if allele == "." else int(allele) for allele in alleles[:2]] + \
+                         [GT_ABSENT] * (2 - len(alleles[:2]))
+            phased[number] = "|" in call
+        return VCFBatch(
+            np.array([self._code(row[0]) for row in rows], dtype=np.int16),
+            np.array([int(row[1]) for row in rows], dtype=np.int32),
+            np.array([row[2] for row in rows], dtype=object),
+            np.array([row[3] for row in rows], dtype=object),
+            np.array(["" if row[4] == "." else row[4] for row in rows], dtype=object),
+            np.array([np.nan if row[5] == "." else float(row[5]) for row in rows], dtype=np.float32),
+            np.array([row[6] in ("PASS", ".") for row in rows], dtype=bool),
+            gt, phased,
+            {key: self._column("INFO", key, [info.get(key) for info in infos]) for key in self.info},
+            {key: self._column("FORMAT", key, [sample.get(key) for sample in formats]) for key in self.fmt})
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) not in (2, 3):
+        print(f'Usage: python3 {module} file.vcf.gz [region]', file=sys.stderr, flush=True)
+        exit(1)
+    parser = VCFParser(sys.argv[1])
+    counts = {}
+    for batch in parser.batches(sys.argv[2] if len(sys.argv) == 3 else None):
+        for code, count in zip(*np.unique(batch.chrom, return_counts=True)):
+            counts[parser.contigs[code]] = counts.get(parser.contigs[code], 0) + int(count)
+    for chrom, count in counts.items():
+        print(f'{chrom}\t{count}')
@@ -20,14 +20,18 @@
 """
 
 import os       # for path, stat
+import zlib     # for process_vcf_header
 from math import sqrt       # for process_bam_body
 from vcf_parser import VCFParser
 
 from utilities import DEBUG, is_legal_path, nativeOS, universalOS, unquote, Error, Warning, wgse_message
 from commandprocessor import run_bash_script
 from fastqfiles import determine_sequencer
+from refident import header_records, identify_reference, reference_index
 import settings as wgse
 
+SORT_CHECK_RECORDS = 10**6  # Records of a VCF without an index looked at to tell if it is sorted (process_vcf_header)
+
 
 ######################################################################################################################
 # BAM File Processing Error Classes
@@ -96,6 +100,7 @@ class VCFFile:
         self.Primary   = False   # Set true if A, X, Y and/or MT are set
 
         self.Indexed   = False
+        self.Sorted    = False   # Records in ##contig order and by position in each (VCFParser.in_order)
 
         # todo The following values are immutable once set; could be a tuple or fixed-key dictionary instead
         self.raw_IDs      = 0
@@ -161,35 +166,26 @@ class VCFFile:
         #  files exist from a previous run, will immediately read and process them.
 
     def process_vcf_header(self):
-        """ Reads and stores BAM header. Sets BAM.CoordSorted also. Does not need BAM Index file (.bai). """
-
-        # Rewritten to process more of header; and process header in Python and not BASH AWK/GREP scripts
-        samtools = wgse.samtoolsx_qFN
-        bamhead_qFN = f'"{wgse.tempf.FP}bamheader.tmp"'
-        bamfile  = self.file_qFN
-
-        commands = f'{samtools} view -H --no-PG {bamfile} > {bamhead_qFN} \n'
-
-        run_bash_script("GetBAMHeader", commands)
+        """
+        Reads and stores the VCF header (## and #CHROM lines) with VCFParser; no samtools run.  Sets VCF.Sorted also:
+        a tabix / CSI index is only made of a sorted VCF; else the first SORT_CHECK_RECORDS records must follow the
+        ##contig order and be in position order.
+        """
 
-        bamhead_oFN = unquote(nativeOS(bamhead_qFN))
-        if not os.path.exists(bamhead_oFN) or os.path.getsize(bamhead_oFN) < 1000:  # Command success check
-            raise VCFContentError('errBAMHeader')
         try:
-            with open(bamhead_oFN, "r") as f:
-                self.Header = f.read()
-        except Exception:
+            parser = VCFParser(self.file_oFN)
+            self.Header = parser.header
+        except (OSError, EOFError, UnicodeDecodeError, zlib.error):
             raise VCFContentError('errBAMHeader')
+        if not self.Header.startswith("##fileformat=VCF"):
+            raise VCFContentError('errVCFContent')
 
-        if "SO:coordinate" in self.Header:
-            self.Sorted = True
-        elif "SO:unsorted" in self.Header:
-            self.Sorted = False
-        else:
-            DEBUG(f"ERROR: BAM coord sorted state in Header?: {self.Header[0]}")
-        DEBUG(f"Bam Coord Sorted? {self.Sorted}")
-        
         self.Indexed = self.check_for_vcf_index()
+        try:
+            self.Sorted = self.Indexed or parser.in_order(SORT_CHECK_RECORDS)
+        except (OSError, EOFError, UnicodeDecodeError, zlib.error, ValueError, IndexError):
+            self.Sorted = False     # Records that do not parse; surely not usable as sorted
+        DEBUG(f"VCF Sorted? {self.Sorted}")
 
         self.determine_reference_genome()       # Only need header available to determine reference_genome
 
@@ -586,102 +582,21 @@ class VCFFile:
          19 if old style hg with Yoruba, 37 if build 37 model lengths, 38 if Build 38 model lengths, ditto T2T 99
          Number of "contig" entries in the header is a good indicator of class and other model characteristics
 
-        NOTE: Much of this code is duplicated in the BAMFiles class call of the same name.  Should likely pull out
-        just the differences and make a single, generic call that adopts to the differences.  Maybe simply extract
-        the SN/ID and LN/length fields into separate entry and process that?
+        The header contig records are identified by refident, as BAMFile does with its SQ records: a single lookup of
+        their catalog signature in the reference library index; the Build / model rules if not catalogued.
         """
 
-        # Determine SN names as given as opposed to relying on reference model to determine
-        accession = ["##contig=<ID=CM0", "##contig=<ID=CP", "##contig=<ID=J0", "##contig=<ID=NC_"]
-        self.SNTypeC = "Chr" if "##contig=<ID=chr" in self.Header else \
-                       "Num" if "##contig=<ID=1\t" in self.Header else \
-                       "Acc" if any(x in self.Header for x in accession) else \
-                       "Unk"
-        self.SNTypeM = "MT" if "##contig=<ID=MT" in self.Header or "##contig=<ID=chrMT" in self.Header else "M"
-        self.SNCount = self.Header.count('##contig=<ID=')   # Almost sufficient for an analysis model determination
+        ident = identify_reference(header_records(self.Header), reference_index(wgse.reflib.gen_oFP), self.Header)
+        self.SNTypeC, self.SNTypeM, self.SNCount = ident["SNTypeC"], ident["SNTypeM"], ident["SNCount"]
         DEBUG(f"ID: {self.SNTypeC}, {self.SNTypeM}; ID#:{self.SNCount}")
 
-        # Possible that header has been shortened if a subset BAM file? So only use chr1, Y and X to check length
-        # If only MT or Unmapped (*) in header, then cannot tell RefGenome
-        self.Build, self.RefMito = \
-            (99, "Custom") if any(x in self.Header for x in ["length=248387561", "length=248387328", "length=248387497",
-                    "length=248415701", "length=62456832", "length=62460029", "length=62480187", "length=154343774",
-                    "length=25843790",  "length=154259566", "length=154259625", "length=154269076", "length=154349815",
-                    "length=154434329"]) else \
-            (38, "rCRS")   if any(x in self.Header for x in ["length=248956422", "length=57227415", "length=156040895"]) else \
-            (37, "rCRS")   if any(x in self.Header for x in ["length=249250621", "length=59373566", "length=155270560"]) else \
-            (18, "Yoruba") if any(x in self.Header for x in ["length=247249719", "length=57772954", "length=154913754"]) else \
-            (17, "Yoruba") if any(x in self.Header for x in ["length=245522847", "length=57701691", "length=154824264"]) else \
-            (16, "Yoruba") if any(x in self.Header for x in ["length=246127941", "length=50286555", "length=153692391"]) else \
-            (15, "Yoruba") if any(x in self.Header for x in ["length=245203898", "length=50961097", "length=152634166"]) else \
-            ( 0, "Unknown")
-
-        # Modify Mitochondria model based on its length if Build 37 (only one with both types in releases)
-        if self.Build == 37 and any(x in self.Header for x in ["M,length=16571", "MT,length=16571"]):
-            self.Build, self.RefMito = (19, "Yoruba")
-        # Todo handling RSRS model -- look for spacers?
-
+        self.Build, self.RefMito = ident["Build"], ident["RefMito"]
         DEBUG(f"Build: {self.Build:3d}")
         DEBUG(f"Ref Genome Mito: {self.RefMito}")
-
-        # New form is based on Major / Class mechanism in Reference Genome study: https://bit.ly/34CO0vj
-        #  Used to rely on SNCount.  But oddball, unrecognized ref genomes in BAMs may have something close set by user.
-        #  So, rely more on key items found in special ref genomes. Keep patching this.  Need to use the MD5sum method.
-        if self.Build == 99:        # Used chr1, chrX or chrY lengths to determine Build99 earlier
-            # Use X and Y length to determine T2T / HPP model
-            if "length=62456832" in self.Header and "length=154343774" in self.Header:  # CHM13 v1.1 & HG002 v2 XY
-                self.Refgenome = self.RefgenomeNew = "THGv20"
-            elif "length=62460029" in self.Header and "length=154349815" in self.Header:  # CHM13 v1.1 & HG002 v2.7 XY
-                self.Refgenome = self.RefgenomeNew = "THGv27"
-            elif "length=62480187" in self.Header and "length=154434329" in self.Header:  # HG01243 v3 PR1 Puerto Rican
-                self.Refgenome = self.RefgenomeNew = "THG1243v3"
-            elif "length=57277415" in self.Header and "length=154259566" in self.Header:  # CHM13 v1.1 & GRCh38 Y
-                self.Refgenome = self.RefgenomeNew = "HPPv11"
-            elif "length=57277415" in self.Header and "length=154259625" in self.Header:  # CHM13 v1 X & GRCh38 Y
-                self.Refgenome = self.RefgenomeNew = "HPPv1"
-            elif "length=62456832" in self.Header and "length=156040895" in self.Header:  # GRCh38 w/ HG002 v2 Y  (ySeq)
-                self.Refgenome = self.RefgenomeNew = "THGySeqp"
-            elif "length=62460029" in self.Header and "length=154259566" in self.Header:  # CHM13 v1.1 & HG002 v2.7 Y
-                self.Refgenome = self.RefgenomeNew = "T2Tv20"
-            elif "length=154259566" in self.Header:  # Must be plain CHM13 v1.1 as special Y not found
-                self.Refgenome = self.RefgenomeNew = "T2Tv11"
-            elif "length=154259625" in self.Header:  # Must be plain CHM13 v1 as special Y not found
-                self.Refgenome = self.RefgenomeNew = "T2Tv10"
-            elif "length=154259664" in self.Header:  # Must be plain CHM13 v0.9
-                self.Refgenome = self.RefgenomeNew = "T2Tv09"
-            else:  # Think it is T2T / HPP build but cannot recognize Y or X length
-                DEBUG(f'Unrecognized T2T model; no matching X or Y length in BAM to known models.')
-        elif "##contig=<ID=NC_007605" in self.Header and self.SNCount in [85, 86]:
-            # hs37 class have SN:NC007605 (EBV in Numeric naming) sans human_g1k / GRCh37.primary_assembly models
-            # human_1kg model is 84 and one less SN than hs37.fa.gz; hs37d5 is 86 and one more than hs37 (hs37d5 decoy)
-            self.Refgenome = "hs37d5" if "##contig=<ID=hs37d5" in self.Header else "hs37"
-            self.RefgenomeNew = "1k37g"
-        elif "##contig=<ID=chrEBV" in self.Header and self.SNCount in [85, 298]:
-            self.Refgenome = None     # 1KGenome analysis models in NCBI Genbank Archive or UCSC; but not handled yet
-            self.RefgenomeNew = "1k37h"
-        elif self.SNCount == 84:      # human_g1k (if Num), GRCh37.primary_assembly.genome (if Chr)
-            self.Refgenome = "hs37-" if self.SNTypeC == "Num" else \
-                             "GRCh37-" if self.SNTypeC == "Chr" else None
-            self.RefgenomeNew = "1K37g" if self.SNTypeC == "Num" else \
-                                "EBI37h" if self.SNTypeC == "Chr" else None
-        elif ("##contig=<ID=chrEBV" in self.Header or "##contig=<ID=EBV" in self.Header) and \
-              self.SNCount in [195, 456, 2581, 3366]:
-            # hs38DH is 3366 SN count and has SN:HLA- unique; hs38 is 195 and hs38a is 456; all uniquely have chrEBV
-            # hs38s is sequencing.com model of GCA_000001405.15_GRCh38_no_alt_plus_hs38d1.fna.gz with 22_KI270879v1_alt
-            self.Refgenome = "hs38DH"  if "##contig=<ID=chr22_KI270879v1_alt" in self.Header and self.SNCount == 3366 else \
-                             "hs38s"   if "##contig=<ID=22_KI270879v1_alt" in self.Header and self.SNCount == 2581 else \
-                             "hs38a"   if self.SNCount == 456 else \
-                             "hs38"  # if self.SNCount == 195
-            self.RefgenomeNew = "1k38" + ("pg" if self.Refgenome == "hs38s" else "h")
-        elif self.SNCount in [25, 93, 297, 455, 639]:    # SNCounts of 6 hg/ebi models; 2 duplicated
-            # Handle the hg (UCSC) and GRCh (EBI) models here
-            self.Refgenome  = "hg" if self.SNTypeC == "Chr" else "GRCh"
-            self.Refgenome += str(self.Build)   # Build already takes into account mito for 19/37 differentiation
-            self.RefgenomeNew = self.Refgenome.replace("GRCh", "EBI") + ("g" if self.SNTypeC == "Chr" else "h")
+        if ident["Refgenome"] or ident["RefgenomeNew"]:
+            self.Refgenome, self.RefgenomeNew = ident["Refgenome"], ident["RefgenomeNew"]
         DEBUG(f'Ref Genome: {self.Refgenome}, by New nomenclature: {self.RefgenomeNew}')
 
-        # Todo Mimic BAM / DICT file header duplication with md5sum to get a more reliable determination
-
         # We give up if still not set; simply ask the user
         if not self.Refgenome:  # not set yet: and (self.chrom_types["A"] > 1 or self.chrom_types["Y"] > 1):
             wgse.reflib.ask_reference_genome(self, type="VCF", inBAM=True)  # Return value in self class pointer
@@ -758,7 +673,7 @@ class VCFFile:
     def check_for_vcf_index(self):
         """ VCF Index file exists check.  """
         # todo need to add check in OUT directory, if set. And add option to use in samtools calls if located there
-        self.Indexed = os.path.isfile(self.file_oFN + ".tbi") or os.path.isfile(self.file_oFN + ".TBI")
+        self.Indexed = any(os.path.isfile(self.file_oFN + suffix) for suffix in (".tbi", ".TBI", ".csi", ".CSI"))
         # todo case sensitive check needed? how does bcftools handle?
         return self.Indexed
 
@@ -0,0 +1,216 @@
+# coding: utf8
+# Copyright (C) 2024 Randy Harr
+#
+# License: GNU General Public License v3 or later
+# A copy of GNU GPL v3 should have been included in this software package in LICENSE.txt.
+
+"""
+CombinedKit straight from a vendor VCF (module vcfkit) for microarray._button_CombinedKit.  The BAM path runs
+bcftools mpileup / call over every CombinedKit target site; about an hour.  But many a BAM comes with a genome VCF
+from the sequencing company (BAMFile.find_VCFs: Dante, Nebula, Sequencing.com) that already has a call at
+(nearly) every site.  Here that VCF is streamed once (vcf_parser) against the sorted target positions of the
+CombinedKit target list (All_SNPs_*_ref.tab.gz) and the kit written directly; about a minute.
+
+Only a gVCF or an all-sites VCF will do.  A variants only VCF says nothing of the sites it does not list; they may
+be reference or have no coverage.  In a gVCF the reference blocks (ALT only <NON_REF> or <*>, INFO END) with a
+hom-ref call and some depth are taken as hom-ref at each target site they span; the reference base comes from the
+reference genome (via its .fai).  As the mpileup / call path, only SNP calls are kept (no indels), a record
+without a call (./.) at a target site is written as -- and a site with no record (or no depth) is left out.
+
+    python3 vcfkit.py vendor.vcf.gz All_SNPs_xxx_ref.tab.gz refgenome.fa.gz head.txt CombinedKit.txt
+"""
+
+import sys
+import os
+import re
+import gzip
+
+import numpy as np
+
+from vcf_parser import VCFParser, GT_ABSENT, GT_MISSING, INT_MISSING
+
+SAMPLE_RECORDS = 10000          # Records looked at to tell an all-sites VCF from a variants only one
+BASES = ("A", "C", "G", "T")
+NO_CALL = "--"                  # As the mpileup / call path writes a ./. call (its sed of the bcftools query)
+GVCF_HEADER = re.compile(r'^##(GVCFBlock|ALT=<ID=(NON_REF|\*),)', re.MULTILINE)
+
+
+def vcf_kind(parser):
+    """ "gVCF", "all-sites" or None (variants only; cannot be used) of the VCFParser parser """
+    if GVCF_HEADER.search(parser.header) and "END" in parser.types["INFO"]:
+        return "gVCF"
+    batch = next(VCFParser(parser.vcf_oFN, batch_size=SAMPLE_RECORDS).batches(), None)
+    return "all-sites" if batch is not None and np.count_nonzero(batch.alt == "") * 2 > len(batch) else None
+
+
+def kit_chrom(chrom):
+    """ CombinedKit name of a sequence (the chr dropped; MT for M) """
+    chrom = chrom.replace("chr", "", 1)
+    return "MT" if chrom == "M" else chrom
+
+
+def kit_order(chrom):
+    """ Sort key of a CombinedKit chromosome as sort -V orders them: numbers first, then MT, X, Y """
+    return (0, int(chrom), "") if chrom.isdigit() else (1, 0, chrom)
+
+
+def kit_genotype(first, second):
+    """ Two allele bases as the CombinedKit writes them (in alphabetic order; a haploid call doubled) """
+    return "".join(sorted(first + (first if second is None else second)))
+
+
+def target_ids(tab_oFN):
+    """ {kit chromosome: (sorted target positions, their IDs)} of a (gzip'ed) CHROM POS ID tab file """
+    targets = {}
+    with gzip.open(tab_oFN, "rt") if tab_oFN.endswith("gz") else open(tab_oFN, "r") as tab:
+        for line in tab:
+            fields = line.rstrip("\n").split("\t")
+            if not line.startswith("#") and len(fields) >= 3:
+                positions, ids = targets.setdefault(kit_chrom(fields[0]), ([], []))
+                positions.append(int(fields[1]))
+                ids.append(fields[2])
+    result = {}
+    for chrom, (positions, ids) in targets.items():
+        positions, first = np.unique(np.array(positions, dtype=np.int64), return_index=True)
+        result[chrom] = (positions, np.array(ids, dtype=object)[first])
+    return result
+
+
+class ReferenceBases:
+    """ Bases at given positions of the sequences of a (gzip'ed or BGZF) FASTA file; found via its .fai index """
+
+    def __init__(self, fasta_oFN):
+        self.fasta_oFN = fasta_oFN
+        self.fai = {}
+        with open(fasta_oFN + ".fai", "r") as fai_file:
+            for line in fai_file:
+                name, length, offset, linebases, linewidth = line.split("\t")[:5]
+                self.fai[name] = (int(length), int(offset), int(linebases), int(linewidth))
+
+    def bases(self, needed):
+        """
+        {sequence name: upper case bases (bytes) at its sorted 1-based positions} of needed {name: positions}; N where
+        not in the FASTA.  A gzip file only seeks forward cheaply; so one handle read once from start to end: the
+        sequences in their .fai offset order, each in position order.
+        """
+        result = {name: bytearray(b"N" * len(positions)) for name, positions in needed.items()}
+        order = sorted((name for name in needed if name in self.fai), key=lambda name: self.fai[name][1])
+        if not order:
+            return {name: bytes(bases) for name, bases in result.items()}
+        with gzip.open(self.fasta_oFN, "rb") if self.fasta_oFN.endswith("gz") else open(self.fasta_oFN, "rb") as f:
+            for name in order:
+                length, offset, linebases, linewidth = self.fai[name]
+                for number, pos in enumerate(needed[name]):
+                    if 0 < pos <= length:
+                        f.seek(offset + (pos - 1) // linebases * linewidth + (pos - 1) % linebases)
+                        result[name][number:number + 1] = f.read(1).upper()
+        return {name: bytes(bases) for name, bases in result.items()}
+
+
+def vcf_kit(vcf_oFN, tab_oFN, fasta_oFN):
+    """
+    CombinedKit lines (ID, CHROM, POS, genotype; sorted) of the target sites with a SNP call in the gVCF or
+    all-sites VCF vcf_oFN.  fasta_oFN is the reference genome the VCF was called on (for the gVCF block bases).
+    """
+    targets = target_ids(tab_oFN)
+    parser = VCFParser(vcf_oFN, info=("END",), fmt=("DP", "MIN_DP"))
+    calls = {}          # (kit chromosome, position) -> (VCF sequence, genotype; None if reference from the FASTA)
+    for batch in parser.batches():
+        for code in np.unique(batch.chrom):
+            sequence = parser.contigs[code]
+            chrom = kit_chrom(sequence)
+            if chrom not in targets:
+                continue
+            positions, _ = targets[chrom]
+            rows = np.flatnonzero(batch.chrom == code)
+            starts = batch.pos[rows].astype(np.int64)
+            ends = np.array([INT_MISSING if end is None else int(end) for end in batch.info["END"][rows]],
+                            dtype=np.int64)         # Typed Integer only if the header has its ##INFO line
+            ends = np.where(ends == INT_MISSING, starts, ends)
+            first, last = np.searchsorted(positions, starts, "left"), np.searchsorted(positions, ends, "right")
+            for row, low, high in zip(rows[last > first], first[last > first], last[last > first]):
+                _record_calls(calls, batch, row, sequence, chrom, positions[low:high])
+
+    # Reference bases for the sites inside the gVCF reference blocks; the whole FASTA in one pass
+    needed = {}
+    for (chrom, pos), (sequence, genotype) in calls.items():
+        if genotype is None:
+            needed.setdefault(sequence, []).append(pos)
+    if needed:
+        for positions in needed.values():
+            positions.sort()
+        for sequence, bases in ReferenceBases(fasta_oFN).bases(needed).items():
+            for pos, base in zip(needed[sequence], bases.decode()):
+                if base in BASES:
+                    calls[(kit_chrom(sequence), pos)] = (sequence, base + base)
+                else:
+                    del calls[(kit_chrom(sequence), pos)]
+
+    lines = []
+    for (chrom, pos), (_, genotype) in calls.items():
+        positions, ids = targets[chrom]
+        kit_id = ids[np.searchsorted(positions, pos)]
+        lines.append((kit_order(chrom), pos, f'{kit_id}\t{chrom}\t{pos}\t{genotype}\n'))
+    lines.sort()
+    return [line for _, _, line in lines]
+
+
+def _depth(batch, row):
+    """ Depth of the call of VCF record row (FORMAT MIN_DP of a gVCF block, else DP); None if not given """
+    for key in ("MIN_DP", "DP"):
+        value = batch.fmt[key][row]
+        if value is not None and value != INT_MISSING:
+            return int(value)
+    return None
+
+
+def _record_calls(calls, batch, row, sequence, chrom, sites):
+    """
+    Add the calls of VCF record row at the (target) sites it covers; the first call of a site is kept (a no call only
+    until a later record has a call there)
+    """
+    ref, pos = batch.ref[row], int(batch.pos[row])
+    alleles = [ref] + batch.alt[row].split(",") if batch.alt[row] else [ref]
+    first, second = batch.gt[row].tolist()
+    if first < 0 or second == GT_MISSING:
+        indel = any(len(allele) != 1 for allele in alleles if not allele.startswith("<"))
+        if first == GT_MISSING and second in (GT_MISSING, GT_ABSENT) and not indel:    # ./. (or .) as call writes
+            for site in sites.tolist():
+                calls.setdefault((chrom, site), (sequence, NO_CALL))
+        return
+
+    if all(allele.startswith("<") for allele in alleles[1:]):
+        # Reference record; a gVCF block (or all-sites record) is hom-ref at every site it spans if it has depth
+        if first != 0 or second not in (0, GT_ABSENT) or _depth(batch, row) == 0:
+            return
+        base = ref[0].upper()
+        for site in sites.tolist():
+            if calls.get((chrom, site), (None, NO_CALL))[1] == NO_CALL:
+                calls[(chrom, site)] = (sequence, kit_genotype(base, base) if site == pos and base in BASES else None)
+        return
+
+    # Variant record; only SNPs (as call -V indels) and only at its own position
+    if pos not in sites or any(len(allele) != 1 for allele in alleles if not allele.startswith("<")):
+        return
+    called = [alleles[allele].upper() if allele < len(alleles) else "" for allele in (first, second) if allele >= 0]
+    if all(allele in BASES for allele in called) and calls.get((chrom, pos), (None, NO_CALL))[1] == NO_CALL:
+        calls[(chrom, pos)] = (sequence, kit_genotype(called[0], called[1] if len(called) == 2 else None))
+
+
+if __name__ == '__main__':
+    module = os.path.basename(sys.argv[0])
+    if len(sys.argv) != 6:
+        print(f'***ERROR: Wrong parameters for {module} call.', file=sys.stderr, flush=True)
+        print(f'   python3 {module} vendor.vcf.gz targets.tab.gz refgenome.fa.gz head.txt CombinedKit.txt',
+              file=sys.stderr, flush=True)
+        exit(1)
+    vcf_FN, tab_FN, fasta_FN, head_FN, kit_FN = sys.argv[1:]
+    kind = vcf_kind(VCFParser(vcf_FN))
+    if not kind:
+        print(f'***ERROR: {vcf_FN} is a variants only VCF; need a gVCF or all-sites VCF', file=sys.stderr, flush=True)
+        exit(1)
+    kit_lines = vcf_kit(vcf_FN, tab_FN, fasta_FN)
+    with open(head_FN, "r") as head_file, open(kit_FN, "w", newline="\n") as kit_file:
+        kit_file.write(head_file.read())
+        kit_file.write("".join(kit_lines))
+    print(f'CombinedKit from {kind} {os.path.basename(vcf_FN)}: {len(kit_lines):,} target sites called')
@@ -0,0 +1,75 @@
+"""
+Benchmark: microarray format generation (aconv.py) from a CombinedKit.  Simulates a CombinedKit and a set of template
+bodies of vendor size, then times generating all of them: parsing the template text each run (convert_body), the
+first run that compiles the template indices, and a run using the cached (memory mapped) indices.  Checks all three
+produce the same bytes.
+
+    python sandbox/benchmarks/bench_aconv.py [--kits N] [--lines N] [--calls N]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent.parent / "program"))
+from aconv import CalledGenotypes, convert_body, template_index, convert_indexed    # noqa: E402
+
+chroms = [str(chrom) for chrom in range(1, 23)] + ["X", "Y", "MT"]
+
+
+def simulate(work, kits, lines, calls, rng):
+    """ CombinedKit with calls at random positions; each template a mix of called and other positions """
+    chrom = rng.integers(0, len(chroms), calls)
+    pos = rng.integers(1, 250 * 10**6, calls)
+    genotypes = np.array(["AA", "AG", "CC", "CT", "GG", "TT", "A", "--"])[rng.integers(0, 8, calls)]
+    combinedkit_oFN = os.path.join(work, "sample_CombinedKit.txt")
+    with open(combinedkit_oFN, "w") as kit:
+        kit.write("# rsid\tchromosome\tposition\tgenotype\n")
+        kit.write("".join(f'rs{i}\t{chroms[c]}\t{p}\t{g}\n' for i, (c, p, g) in enumerate(zip(chrom, pos, genotypes))))
+    os.makedirs(os.path.join(work, "body"))
+    bodies = []
+    for kit in range(kits):
+        picks = rng.integers(0, calls, lines)
+        tpos = np.where(rng.random(lines) < 0.7, pos[picks], rng.integers(1, 250 * 10**6, lines))
+        body_oFN = os.path.join(work, "body", f'23andMe_V{kit + 10}.txt')
+        with open(body_oFN, "w") as body:
+            body.write("".join(f'rs{i}\t{chroms[c]}\t{p}\n' for i, (c, p) in enumerate(zip(chrom[picks], tpos))))
+        bodies.append(body_oFN)
+    return combinedkit_oFN, bodies
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--kits", type=int, default=10)
+    parser.add_argument("--lines", type=int, default=600000, help="template body lines per kit")
+    parser.add_argument("--calls", type=int, default=2000000, help="CombinedKit called sites")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        combinedkit_oFN, bodies = simulate(work, args.kits, args.lines, args.calls, np.random.default_rng(5))
+        start = time.time()
+        called = CalledGenotypes(combinedkit_oFN)
+        print(f'load CombinedKit        : {time.time() - start:6.1f} s')
+
+        results = {}
+        for label in ("parse text", "compile index", "cached index"):
+            start = time.time()
+            outputs = []
+            for body_oFN in bodies:
+                with open(body_oFN, "rb") as f:
+                    body = f.read()
+                if label == "parse text":
+                    outputs.append(convert_body("23andMe_V3", body, called))
+                else:
+                    outputs.append(convert_indexed("23andMe_V3", body, *template_index("23andMe_V3", body_oFN), called))
+            results[label] = outputs
+            print(f'{label:24}: {time.time() - start:6.1f} s for {args.kits} kits')
+        print(f'identical outputs       : {results["parse text"] == results["compile index"] == results["cached index"]}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,137 @@
+"""
+Benchmark: align pipeline modes (settings.align_mode, button_align_BAM).  Makes a random reference and a simulated
+paired-end FASTQ pair (Illumina style read names so markdup runs as in the real pipeline), then runs the Staged
+(raw and sorted BAM intermediates), Checkpoint (raw BAM only) and Stream (no intermediates) command sequences.
+Needs bwa, samtools (1.15+) and bgzip on the PATH.  Reports wall-clock time, block I/O of the child processes
+(getrusage; 512 byte blocks, only counts what reaches the disk), bytes of intermediate files written and whether
+the final BAMs hold the same records.
+
+    python sandbox/benchmarks/bench_align_stream.py [--pairs N] [--reflen N] [--threads N] [--keep dir]
+"""
+import argparse
+import gzip
+import os
+import random
+import resource
+import shutil
+import subprocess
+import tempfile
+import time
+
+READ_LENGTH = 150
+INSERT_SIZE = 400
+COMPLEMENT = str.maketrans("ACGT", "TGCA")
+
+
+def make_reference(ref_oFN, length, rng):
+    with open(ref_oFN, "w") as ref:
+        ref.write(">chr1\n")
+        sequence = "".join(rng.choice("ACGT") for _ in range(length))
+        for pos in range(0, length, 60):
+            ref.write(sequence[pos:pos + 60] + "\n")
+    return sequence
+
+
+def make_fastqs(sequence, pairs, r1_oFN, r2_oFN, rng):
+    """ Paired reads with 1% errors; every 20th pair is a duplicate of the one before """
+    quality = "I" * READ_LENGTH
+    with gzip.open(r1_oFN, "wt", compresslevel=1) as r1, gzip.open(r2_oFN, "wt", compresslevel=1) as r2:
+        start = 0
+        for pair in range(pairs):
+            if pair % 20:
+                start = rng.randrange(len(sequence) - INSERT_SIZE)
+            fragment = list(sequence[start:start + INSERT_SIZE])
+            for _ in range(INSERT_SIZE // 100):
+                fragment[rng.randrange(INSERT_SIZE)] = rng.choice("ACGT")
+            fragment = "".join(fragment)
+            name = f'@A00123:8:HABCDXX:1:{1101 + pair // 50000}:{pair % 30000 + 1000}:{pair % 997 + 1000}'
+            r1.write(f'{name} 1:N:0:1\n{fragment[:READ_LENGTH]}\n+\n{quality}\n')
+            r2.write(f'{name} 2:N:0:1\n{fragment[-READ_LENGTH:].translate(COMPLEMENT)[::-1]}\n+\n{quality}\n')
+
+
+def mode_commands(mode, tools, files, threads):
+    """ Same command sequences button_align_BAM puts in its pipeline stages for each align_mode """
+    bwa, samtools, bgzip = tools
+    ref, r1, r2, raw, srt, final, report, temp = files
+    bwa_mem = f'{bwa} mem -t {threads} -R "@RG\\tID:1\\tSM:WGSE\\tLB:lb" {ref} {r1} {r2} |'
+    markdup = f'{samtools} markdup -f {report} -d 2500 -@ {threads} -T {temp}'
+    sort = f'{samtools} sort -T {temp} -m 500M -@ {threads}'
+    if mode == "Staged":
+        return [f'{bwa_mem} {bgzip} -@ {threads} > {raw}',
+                f'{samtools} fixmate -m -O bam -@ {threads} {raw} - | {sort} -o {srt} -',
+                f'{markdup} {srt} {final} && {samtools} index {final}']
+    cleanup = f'{samtools} fixmate -u -m %s - | {sort} -u - | {markdup} - {final} && {samtools} index {final}'
+    if mode == "Checkpoint":
+        return [f'{bwa_mem} {bgzip} -@ {threads} > {raw}', cleanup % raw]
+    return [f'{bwa_mem} ' + cleanup % "-"]
+
+
+def run_mode(mode, tools, files, threads):
+    raw, srt = files[3], files[4]
+    before = resource.getrusage(resource.RUSAGE_CHILDREN)
+    start = time.time()
+    for commands in mode_commands(mode, tools, files, threads):
+        subprocess.run(["bash", "-o", "pipefail", "-c", commands], check=True, stderr=subprocess.DEVNULL)
+    elapsed = time.time() - start
+    after = resource.getrusage(resource.RUSAGE_CHILDREN)
+    intermediate = 0
+    for inter in (raw, srt):        # The pipeline removes them at the very end
+        if os.path.isfile(inter):
+            intermediate += os.path.getsize(inter)
+            os.remove(inter)
+    return elapsed, after.ru_inblock - before.ru_inblock, after.ru_oublock - before.ru_oublock, intermediate
+
+
+def bam_records(samtools, bam_oFN):
+    view = subprocess.run([samtools, "view", bam_oFN], stdout=subprocess.PIPE, text=True, check=True).stdout
+    return sorted("\t".join(line.split("\t")[:11]) for line in view.splitlines())     # Mandatory SAM fields
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pairs", type=int, default=200000)
+    parser.add_argument("--reflen", type=int, default=2000000)
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--bwa", default="bwa")
+    parser.add_argument("--samtools", default="samtools")
+    parser.add_argument("--bgzip", default="bgzip")
+    parser.add_argument("--keep", help="work directory to use (and keep) instead of a temporary one")
+    args = parser.parse_args()
+
+    tools = (args.bwa, args.samtools, args.bgzip)
+    for tool in tools:
+        if not shutil.which(tool):
+            parser.error(f'{tool} not found on the PATH')
+
+    rng = random.Random(42)
+    work = args.keep or tempfile.mkdtemp()
+    os.makedirs(work, exist_ok=True)
+    try:
+        ref, r1, r2 = (os.path.join(work, name) for name in ("ref.fa", "sim_R1.fastq.gz", "sim_R2.fastq.gz"))
+        sequence = make_reference(ref, args.reflen, rng)
+        make_fastqs(sequence, args.pairs, r1, r2, rng)
+        subprocess.run([args.bwa, "index", ref], check=True, stderr=subprocess.DEVNULL)
+        print(f'{args.pairs} read pairs ({os.path.getsize(r1) + os.path.getsize(r2)} bytes of FASTQ), '
+              f'{args.reflen} bp reference, {args.threads} threads')
+
+        finals = {}
+        for mode in ("Staged", "Checkpoint", "Stream"):
+            final = os.path.join(work, f'{mode}.bam')
+            files = (ref, r1, r2, os.path.join(work, "sim_raw.bam"), os.path.join(work, "sim_sorted.bam"), final,
+                     os.path.join(work, f'{mode}_markdup.txt'), work + os.sep)
+            elapsed, inblock, oublock, intermediate = run_mode(mode, tools, files, args.threads)
+            finals[mode] = final
+            print(f'{mode:10}: {elapsed:8.1f} s  read {inblock * 512 / 10**6:9.1f} MB  '
+                  f'written {oublock * 512 / 10**6:9.1f} MB  intermediates {intermediate / 10**6:9.1f} MB  '
+                  f'final {os.path.getsize(final) / 10**6:7.1f} MB')
+
+        staged = bam_records(args.samtools, finals["Staged"])
+        for mode in ("Checkpoint", "Stream"):
+            print(f'{mode + " records identical":28}: {bam_records(args.samtools, finals[mode]) == staged}')
+    finally:
+        if not args.keep:
+            shutil.rmtree(work, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
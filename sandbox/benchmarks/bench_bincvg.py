@@ -0,0 +1,93 @@
+"""
+Benchmark: WGS bin coverage (BAMFile.get_bincvg_stats).  Times the original single samtools depth -aa | awk pipe,
+the single pipe into the NumPy depthhist.py engine, and the parallel per region engine in program/bincoverage.py.
+Needs samtools (1.13+) and awk on the PATH and a coordinate sorted, indexed BAM or CRAM.  Reports wall-clock time
+of each and whether the tables agree with the awk one (rows compared unordered).
+
+    python sandbox/benchmarks/bench_bincvg.py sample.bam [--threads N] [--skip-serial]
+"""
+import argparse
+import os
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+program_dir = Path(__file__).resolve().parent.parent.parent / "program"
+if str(program_dir) not in sys.path:
+    sys.path.insert(0, str(program_dir))
+
+import settings as wgse
+from bincoverage import header_sequences, depth_command, parallel_depth_commands, merge_bincvg_parts
+from depthhist import BINCVG_HEADER
+
+SERIAL_AWK = """'{ names[$1]=$1 ; if($3==0){zero[$1]++} else {nz[$1]++ ; sumnz[$1]+=$3 ;
+  if($3>7){nI[$1]++ ; sumnI[$1]+=$3} else {if($3>3){n7[$1]++ ; sumn7[$1]+=$3} else
+  {n3[$1]++ ; sumn3[$1]+=$3} } } } END {
+  for (x in names) { totalbc = zero[x]+nz[x]+1 ;
+    printf("%s\\t%d\\t%d\\t%d\\t%f\\t%f\\t%f\\t%d\\t%d\\t%d\\t%d\\t%d\\t%d\\t%d\\n",
+    x,zero[x],nz[x],sumnz[x],nz[x]/totalbc,sumnz[x]/(nz[x]+1),sumnz[x]/totalbc,
+    totalbc-1,n3[x],sumn3[x],n7[x],sumn7[x],nI[x],sumnI[x]) } }'"""
+
+
+def run_bash(commands):
+    start = time.time()
+    subprocess.run(["bash", "-c", commands], check=True)
+    return time.time() - start
+
+
+def table_rows(csv_oFN):
+    with open(csv_oFN) as table:
+        return sorted(line for line in table.read().splitlines()[1:] if line)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("bam")
+    parser.add_argument("--threads", type=int, default=os.cpu_count())
+    parser.add_argument("--samtools", default="samtools")
+    parser.add_argument("--skip-serial", action="store_true", help="only time the parallel engine")
+    args = parser.parse_args()
+
+    wgse.samtoolsx_qFN = f'"{args.samtools}"'
+    wgse.python3x_qFN = f'"{sys.executable}"'
+    wgse.prog_FP = f'{program_dir}/'
+    bam_qFN = f'"{args.bam}"'
+    header = subprocess.run([args.samtools, "view", "-H", args.bam], stdout=subprocess.PIPE, text=True,
+                            check=True).stdout
+    sequences = header_sequences(header)
+
+    with tempfile.TemporaryDirectory() as work:
+        work_FP = work + "/"
+        serial_oFN = f'{work_FP}serial_bincvg.csv'
+        numpy_oFN = f'{work_FP}numpy_bincvg.csv'
+        parallel_oFN = f'{work_FP}parallel_bincvg.csv'
+
+        if not args.skip_serial:
+            header_line = "\\t".join(BINCVG_HEADER)
+            serial_time = run_bash(f'( printf "{header_line}\\n" ; {args.samtools} depth -aa {bam_qFN} | '
+                                   f'awk {SERIAL_AWK} ) > "{serial_oFN}"')
+            print(f"serial   (awk)           : {serial_time:10.1f} s")
+            numpy_time = run_bash(depth_command(bam_qFN, "-aa", f'{work_FP}numpy_bincvg.npz', numpy_oFN))
+            print(f"serial   (depthhist)     : {numpy_time:10.1f} s")
+
+        commands, parts = parallel_depth_commands(bam_qFN, sequences, args.threads, work_FP)
+        start = time.time()
+        run_bash(commands)
+        merge_bincvg_parts(parts, parallel_oFN, sequences)
+        parallel_time = time.time() - start
+        print(f"parallel ({args.threads:3d} workers)  : {parallel_time:10.1f} s")
+
+        if not args.skip_serial:
+            print(f"speedup over awk         : {serial_time / numpy_time:10.2f} x (depthhist), "
+                  f"{serial_time / parallel_time:.2f} x (parallel)")
+            # -aa emits zero-only rows for sequences without reads; process_bincvg_stats() skips them anyway
+            serial = [row for row in table_rows(serial_oFN) if row.split("\t")[2] != "0"]
+            for label, table_oFN in (("depthhist", numpy_oFN), ("parallel", parallel_oFN)):
+                rows = [row for row in table_rows(table_oFN) if row.split("\t")[2] != "0"]
+                print(f"{label + ' table identical':25}: {serial == rows}")
+
+
+if __name__ == '__main__':
+    main()
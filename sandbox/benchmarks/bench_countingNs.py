@@ -0,0 +1,88 @@
+"""
+Benchmark: N run scan of a reference model (scripts/process_refgenomes.sh).  Times the original line by line
+countingNs.py against the NumPy nrunscan.py engine on the same FASTA and compares their _ncnt.csv and _nbin.csv.
+Without a FASTA, a random genome with runs of N's is simulated (a DICT file is written for it; no samtools needed).
+The bucket lists differ where a run of N's crosses buckets (countingNs.py put the whole run in its last bucket).
+
+    python sandbox/benchmarks/bench_countingNs.py [RefModel.fa.gz] [--processes N] [--size Mbp]
+"""
+import argparse
+import gzip
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import numpy as np
+
+program_dir = Path(__file__).resolve().parent.parent.parent / "program"
+
+
+def simulate_reference(fasta_oFN, dict_oFN, size_mbp, rng):
+    """ Chromosomes of random bases with N gaps of all sizes (as in the GRCh models) """
+    lengths = [int(size_mbp * 10**6 * share) for share in (0.25, 0.2, 0.15, 0.15, 0.1, 0.1, 0.05)]
+    with gzip.open(fasta_oFN, "wb", compresslevel=1) as fasta, open(dict_oFN, "w") as seqdict:
+        seqdict.write("@HD\tVN:1.0\tSO:unsorted\n")
+        for index, length in enumerate(lengths, 1):
+            sequence = bytearray(np.frombuffer(b'ACGT', dtype=np.uint8)[rng.integers(0, 4, length)].tobytes())
+            for _ in range(length // 20000):
+                start = int(rng.integers(length))
+                size = int(rng.choice((1, 2, 10, 100, 500, 10000, 50000, 200000)))
+                sequence[start:start + size] = b'N' * len(sequence[start:start + size])
+            fasta.write(f'>chr{index}\n'.encode())
+            for pos in range(0, length, 60):
+                fasta.write(bytes(sequence[pos:pos + 60]) + b'\n')
+            seqdict.write(f'@SQ\tSN:chr{index}\tLN:{length}\tM5:0\tUR:file:{fasta_oFN}\n')
+
+
+def run(command):
+    start = time.time()
+    subprocess.run(command, check=True, stdout=subprocess.DEVNULL)
+    return time.time() - start
+
+
+def read_rows(csv_oFN):
+    with open(csv_oFN) as csv:
+        return [line.split("\t") for line in csv.read().splitlines() if not line.startswith("#")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("fasta", nargs="?", help="gzip'ed reference model with its .dict next to it")
+    parser.add_argument("--processes", type=int, default=os.cpu_count())
+    parser.add_argument("--size", type=int, default=300, help="Mbp of simulated genome (without a FASTA)")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as work:
+        fasta_oFN = os.path.join(work, "model.fa.gz")
+        if args.fasta:
+            fasta_FPB = args.fasta.replace(".fasta.gz", "").replace(".fna.gz", "").replace(".fa.gz", "")
+            shutil.copy(args.fasta, fasta_oFN)          # Keep the outputs out of the reference library
+            shutil.copy(fasta_FPB + ".dict", os.path.join(work, "model.dict"))
+        else:
+            simulate_reference(fasta_oFN, os.path.join(work, "model.dict"), args.size, np.random.default_rng(7))
+
+        results = {}
+        for label, command in (("countingNs.py", [sys.executable, str(program_dir / "countingNs.py"), fasta_oFN]),
+                               ("nrunscan.py", [sys.executable, str(program_dir / "nrunscan.py"), fasta_oFN,
+                                                str(args.processes)])):
+            elapsed = run(command)
+            results[label] = {suffix: read_rows(os.path.join(work, f'model_{suffix}.csv'))
+                              for suffix in ("ncnt", "nbin")}
+            print(f'{label:14}: {elapsed:8.1f} s')
+            if label == "countingNs.py":
+                serial = elapsed
+        print(f'speedup       : {serial / elapsed:8.1f} x ({args.processes} processes)')
+
+        old, new = results["countingNs.py"], results["nrunscan.py"]
+        print(f'nbin identical: {old["nbin"] == new["nbin"]}')
+        print(f'ncnt stats identical (columns 1-8): {[row[:8] for row in old["ncnt"]] == [row[:8] for row in new["ncnt"]]}')
+        buckets = sum(row[8:] != other[8:] for row, other in zip(old["ncnt"], new["ncnt"]))
+        print(f'sequences with different bucket lists: {buckets} of {len(new["ncnt"]) - 1}')
+
+
+if __name__ == '__main__':
+    main()
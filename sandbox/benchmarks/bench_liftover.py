@@ -0,0 +1,58 @@
+"""
+Benchmark: CombinedKit liftover.  Times pyliftover's per position convert_coordinate (as hg38tohg19.py used) against
+the batched liftover.ChainMap on random positions of the primary sequences, and checks both give the same results.
+Uses the chain file shipped in base_reference/ unless one is given.
+
+    python sandbox/benchmarks/bench_liftover.py [chain_file] [--positions N]
+"""
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+from pyliftover import LiftOver
+
+repo_dir = Path(__file__).resolve().parent.parent.parent
+sys.path.insert(0, str(repo_dir / "program"))
+from liftover import ChainMap       # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("chain", nargs="?", default=str(repo_dir / "base_reference" / "hg38ToHg19.over.chain.gz"))
+    parser.add_argument("--positions", type=int, default=2000000, help="total positions (a CombinedKit is ~2M)")
+    args = parser.parse_args()
+
+    start = time.time()
+    chains = ChainMap(args.chain)
+    print(f'ChainMap load      : {time.time() - start:6.1f} s')
+    start = time.time()
+    lifter = LiftOver(args.chain)
+    print(f'pyliftover load    : {time.time() - start:6.1f} s')
+
+    rng = np.random.default_rng(11)
+    sources = [chrom for chrom in chains.sources if "_" not in chrom]
+    per_chrom = args.positions // len(sources)
+    queries = {chrom: rng.integers(0, chains.sources[chrom][0][-1], per_chrom) for chrom in sources}
+
+    start = time.time()
+    batched = {chrom: chains.convert(chrom, positions) for chrom, positions in queries.items()}
+    print(f'ChainMap convert   : {time.time() - start:6.1f} s')
+
+    start = time.time()
+    single = {chrom: [lifter.convert_coordinate(chrom, int(pos)) for pos in positions]
+              for chrom, positions in queries.items()}
+    print(f'pyliftover convert : {time.time() - start:6.1f} s')
+
+    differ = 0
+    for chrom in sources:
+        codes, lifted = batched[chrom]
+        for result, code, new in zip(single[chrom], codes.tolist(), lifted.tolist()):
+            expect = (result[0][0], result[0][1]) if result else None
+            differ += expect != ((chains.targets[code], new) if code >= 0 else None)
+    print(f'different results  : {differ} of {per_chrom * len(sources)}')
+
+
+if __name__ == '__main__':
+    main()
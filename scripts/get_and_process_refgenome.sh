@@ -7,7 +7,7 @@
 #
 # Only used in python reference_library.py now. Library_common uses get_and_process_refgenome() function.
 #
-# Todo Change to a Python function and make a Reference Library manager tab in the main program.
+# The download and processing itself is program/refdownload.py.  Todo a Reference Library manager tab in the program.
 #
 # Part of the Reference Genome package in WGS Extract (https://wgsextract.github.io/)
 # Copyright (c) 2021-23 Randy Harr
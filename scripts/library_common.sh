@@ -78,27 +78,30 @@ select rg in "${option[@]}"; do
       ;;
 
     "Recommended (@US NIH)")
+      recommended=()
       for ((i=1 ; i<${#menopt[@]} ; i++)); do    # Go through all the menu options added by genomes.csv
         if [[ "hs38 (Nebula) (@NIH) (Rec)" == "${menopt[$i]}" ||
               "hs37d5 (Dante) (@NIH) (Rec)" == "${menopt[$i]}" ||
               "T2T_v2.0 (PGP/HPP chrN) (Rec)" == "${menopt[$i]}" ]]; then
-          get_and_process_refgenome "$i"
+          recommended+=( "$i" )
           menu_cnt+=1
         fi
       done
+      get_and_process_refgenome "${recommended[@]}"     # All three downloaded together
       echo "Finished with Recommended (@US NIH)."
       ;;
 
     "Recommended (@EU EBI)")
+      recommended=()
       for ((i=1 ; i<${#menopt[@]} ; i++)); do    # Go through all the menu options added by genomes.csv
         if [[ "hs38 (Nebula) (@EBI) (Rec)" == "${menopt[$i]}" ||
               "hs37d5 (Dante) (@EBI) (Rec)" == "${menopt[$i]}" ||
               "T2T_v2.0 (PGP/HPP chrN) (Rec)" == "${menopt[$i]}" ]]; then
-          get_and_process_refgenome "$i"
-          echo
+          recommended+=( "$i" )
           menu_cnt+=1
         fi
       done
+      get_and_process_refgenome "${recommended[@]}"     # All three downloaded together
       echo "Finished with Recommended (@EU EBI)."
       ;;
 
@@ -418,55 +418,23 @@ read_genomes_file() {
 export -f read_genomes_file
 
 
-# Implements the body of get_and_process_refgenome.sh call
+# Implements the body of get_and_process_refgenome.sh call (and the Library command); program/refdownload.py does the
+#  work: all genomes at once, in parallel segments, resuming an interrupted download and recompressing as it arrives
 get_and_process_refgenome() {
-  # Parameter: index to genomes.csv arrays
-
-  _filesizebad() { # parameters: file name, min size ; returns true if smaller than min size (or does not exist)
-    local size=0    # size of 0 if file does not exist; so returns true
-    [[ -f "$1" ]] && { [[ $OSTYPE =~ darwin ]] && size=$(stat -f %z "$1") || size=$(stat -c %s "$1") ; }
-    ((size < $2))   # Trick, returning result of test as function return status
-  }
+  # Parameters: one or more indices to genomes.csv arrays
+  local -a files=()
+  local i prefer=""
 
   echo
-  echo "Downloading and Processing ${descr[$1]}"
+  for i in "$@"; do
+    echo "Downloading and Processing ${descr[$i]}"
+    files+=( "${finalf[$i]}" )
+    [[ "${server[$i]}" == "NIH-Alt" ]] && prefer="NIH"      # Same row as chosen here when in genomes.csv twice
+    [[ "${server[$i]}" == "EBI-Alt" ]] && prefer="EBI"
+  done
   cdx "${reflibdir}genomes/"
 
-  [ -f "${finalf[$1]}" ] && rmx "${finalf[$1]}"
-  [ -f "${initf[$1]}"  ] && rmx "${initf[$1]}"
-
-  # To get around exclanations embedded in MS Onedrive URLs; no spaces in params so no escaped double quotes needed
-  echo "DEBUG: Downloading from URL: ${gurl[$1]}"
-  echo "DEBUG: Destination path: $(pwd)/${initf[$1]}"
-  echo "DEBUG: Executing command: curlx -o ${initf[$1]} ${gurl[$1]}"
-
-  IFS=" " read -ra cmd <<<"curlx -o ${initf[$1]} ${gurl[$1]}"
-  "${cmd[@]}"
-
-  if [ -f "${initf[$1]}" ]; then
-     echo "DEBUG: File exists at destination: ${initf[$1]}"
-     ls -l "${initf[$1]}"
-  else
-     echo "DEBUG: File NOT found at destination: ${initf[$1]}"
-  fi
-
-  if _filesizebad "${initf[$1]}" 500000000; then
-    echo "*** Error downloading ${initf[$1]}"
-    [ -f "${initf[$1]}" ] && rmx "${initf[$1]}"
-    return
-  fi
-
-  chmod 774 "${initf[$1]}"                        # Cygwin64 BASH is occassionally setting 060 permissions for genomes?
-  ${bashx} "$process_refgenomes" "${initf[$1]}"
-
-  if _filesizebad "${finalf[$1]}" 500000000; then
-    echo "*** Error processing ${finalf[$1]}"
-    [ -f "${finalf[$1]}" ] && rmx "${finalf[$1]}"
-    [ -f "${initf[$1]}"  ] && rmx "${initf[$1]}"
-    return
-  fi
-
-  echo "${finalf[$1]}: Finished installing ${pytcode[$1]}, SN Cnt: ${sncnt[$1]}, SN Style: ${snnam[$1]}"
+  "$pythonx" "${owgse_FP}/program/refdownload.py" ${prefer:+-s "$prefer"} "${files[@]}"
 }
 export -f get_and_process_refgenome
 
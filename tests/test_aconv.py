@@ -0,0 +1,93 @@
+import unittest
+import sys
+import os
+import zipfile
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from program.aconv import CalledGenotypes, convert_body, generate_kits, template_index, compile_templates
+
+
+class TestAconv(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        work = self.tmpdir.name
+        self.templates = os.path.join(work, "raw_file_templates") + os.sep
+        os.makedirs(self.templates + "head")
+        os.makedirs(self.templates + "body")
+        self.combinedkit = os.path.join(work, "sample_CombinedKit.txt")
+        with open(self.combinedkit, "w") as kit:
+            kit.write("# This data file generated by WGS Extract\n# rsid\tchromosome\tposition\tgenotype\n"
+                      "rs1\t1\t100\tAG\nrs2\t1\t200\tCC\nrs3\tX\t100\tT\nrs4\tMT\t50\tA\nrs2b\t1\t200\tCT\n")
+        self.target = os.path.join(work, "sample")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write(self, name, text):
+        with open(self.templates + name, "w", newline="") as f:
+            f.write(text)
+
+    def test_lookup(self):
+        called = CalledGenotypes(self.combinedkit)
+        body = b"rs1\t1\t100\r\nrs9\t1\t101\nrs3\tX\t100\nrs2\t1\t200\nrs5\t2\t100\nrs7\tMT\t50\n"
+        self.assertEqual(convert_body("23andMe_V3", body, called),
+                         b"rs1\t1\t100\tAG\nrs9\t1\t101\t--\nrs3\tX\t100\tT\nrs2\t1\t200\tCT\n"   # Last call wins
+                         b"rs5\t2\t100\t--\nrs7\tMT\t50\tA\n")
+        self.assertEqual(convert_body("FTDNA_V2", b'"rs1","1","100"\n"rs0","1","0"\n', called),
+                         b'"rs1","1","100"\tAG\n"rs0","1","0","--"\n')     # No position: composed line
+
+    def test_generate_multi_part_zip(self):
+        self.write("head/Ancestry_V2.txt", "#AncestryDNA\r\nrsid\tchromosome\tposition\tallele1\tallele2\n")
+        self.write("body/Ancestry_V2_1.txt", "rs1\t1\t100\n")
+        self.write("body/Ancestry_V2_2.txt", "rs3\tX\t100\nrs8\t1\t300\n")
+        for part in range(3, 6):
+            self.write(f'body/Ancestry_V2_{part}.txt', "")
+        self.write("head/MyHeritage_V1.csv", "RSID,CHROMOSOME,POSITION,RESULT\n")
+        self.write("body/MyHeritage_V1.csv", '"rs4","MT","50"\n')
+
+        created = generate_kits(["Ancestry_V2", "MyHeritage_V1", "1240K"], self.combinedkit, self.target,
+                                self.templates)
+        self.assertEqual(created, [f'{self.target}_Ancestry_V2.zip', f'{self.target}_MyHeritage_V1.zip'])
+        with zipfile.ZipFile(created[0]) as zipf:
+            self.assertEqual(zipf.namelist(), ["sample_Ancestry_V2.txt"])
+            self.assertEqual(zipf.read("sample_Ancestry_V2.txt"),
+                             b"#AncestryDNA\nrsid\tchromosome\tposition\tallele1\tallele2\n"
+                             b"rs1\t1\t100\tAG\nrs3\tX\t100\tT\nrs8\t1\t300\t00\n")
+        with zipfile.ZipFile(created[1]) as zipf:
+            self.assertEqual(zipf.read("sample_MyHeritage_V1.csv"),
+                             b'RSID,CHROMOSOME,POSITION,RESULT\n"rs4","MT","50"\tA\n')
+
+    def test_template_index_cached_and_rebuilt(self):
+        self.write("body/23andMe_V3.txt", "rs1\t1\t100\nrs3\tX\t100\n")
+        body_oFN = self.templates + "body/23andMe_V3.txt"
+        index, chroms = template_index("23andMe_V3", body_oFN)
+        self.assertEqual(chroms, [b"1", b"X"])
+        self.assertEqual(index["pos"].tolist(), [100, 100])
+        self.assertTrue(os.path.isfile(self.templates + "index/23andMe_V3.txt.npy"))
+
+        index, chroms = template_index("23andMe_V3", body_oFN)
+        self.assertIsInstance(index, np.memmap)          # From the cache
+        self.assertEqual(index["start"].tolist(), [0, 10])
+
+        self.write("body/23andMe_V3.txt", "rs3\tX\t100\nrs4\tMT\t50\nrs5\t2\t7\n")
+        index, chroms = template_index("23andMe_V3", body_oFN)
+        self.assertEqual(chroms, [b"X", b"MT", b"2"])
+        self.assertEqual(index["end"].tolist(), [9, 19, 27])
+
+        self.write("body/Ancestry_V2_1.txt", "rs1\t1\t100\n")
+        self.write("body/Genera.txt", "rs1\t1\t100\n")
+        self.assertEqual(compile_templates(self.templates), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+import unittest
+from unittest.mock import MagicMock
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+# Mock settings and utilities before importing bincoverage
+mock_wgse = MagicMock()
+mock_utilities = MagicMock()
+mock_utilities.nativeOS.side_effect = lambda path: path
+
+sys.modules['settings'] = mock_wgse
+sys.modules['utilities'] = mock_utilities
+
+from program.bincoverage import header_sequences, plan_depth_regions, merge_bincvg_parts
+
+
+class TestPlanDepthRegions(unittest.TestCase):
+
+    def test_regions_cover_every_base_once(self):
+        sequences = [("chr1", 248956422), ("chr2", 242193529), ("chrM", 16569)] + \
+                    [(f"chrUn_{i}", 1000 + i) for i in range(200)]
+        plan = plan_depth_regions(sequences, 8)
+        self.assertLessEqual(len(plan), 8)
+
+        covered = {}
+        for regions in plan:
+            for sname, start, end in regions:
+                covered[sname] = covered.get(sname, 0) + end - start
+        self.assertEqual(covered, dict(sequences))
+
+    def test_balanced_load(self):
+        sequences = [(str(i), 100000000 - i * 3000000) for i in range(1, 23)]
+        loads = [sum(end - start for _, start, end in regions) for regions in plan_depth_regions(sequences, 6)]
+        self.assertLess(max(loads) / min(loads), 1.25)
+
+    def test_header_sequences(self):
+        header = "@HD\tVN:1.6\tSO:coordinate\n@SQ\tSN:chr1\tLN:1000\n@SQ\tSN:HLA-A*01:01\tLN:20\tM5:abc\n@PG\tID:bwa\n"
+        self.assertEqual(header_sequences(header), [("chr1", 1000), ("HLA-A*01:01", 20)])
+
+
+class TestMergeBincvgParts(unittest.TestCase):
+
+    def test_merge_sums_parts(self):
+        from program.depthhist import DepthHistogram
+
+        with tempfile.TemporaryDirectory() as tmp:
+            part1 = DepthHistogram()
+            part1.add_lines(b"chr2\t1\t0\nchr2\t2\t3\nchr2\t3\t9\nchr1\t1\t5\n")
+            part1.save(os.path.join(tmp, "p1.npz"))
+            part2 = DepthHistogram()
+            part2.add_lines(b"chr2\t4\t1\nchr2\t5\t0\n")
+            part2.save(os.path.join(tmp, "p2.npz"))
+            covfile = os.path.join(tmp, "out_bincvg.csv")
+
+            parts = [os.path.join(tmp, "p1.npz"), os.path.join(tmp, "p2.npz")]
+            written = merge_bincvg_parts(parts, covfile, [("chr1", 1), ("chr2", 5)])
+            self.assertEqual(written, 2)
+            self.assertTrue(os.path.isfile(os.path.join(tmp, "out_bincvg.npz")))
+            with open(covfile) as f:
+                lines = f.read().splitlines()
+
+        self.assertTrue(lines[0].startswith("chr\tzero\tnonzero\tsum nz"))
+        self.assertEqual(lines[1].split("\t")[0], "chr1")
+        self.assertEqual(lines[2].split("\t"),
+                         ["chr2", "2", "3", "13", f"{3 / 6:f}", f"{13 / 4:f}", f"{13 / 6:f}", "5",
+                          "2", "4", "0", "0", "1", "9"])
+
+    def test_missing_part_fails(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            self.assertEqual(merge_bincvg_parts([os.path.join(tmp, "nope.npz")], os.path.join(tmp, "o.csv")), 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sys
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import numpy as np
+
+from program.bodysample import plan_sample_regions, parse_sam_columns, Welford
+
+
+class TestPlanSampleRegions(unittest.TestCase):
+
+    def test_regions_follow_weights(self):
+        primaries = [("chr1", 1000000, 300), ("chr2", 1000000, 100), ("chrY", 500000, 0)]
+        regions = plan_sample_regions(primaries, 100, 0, 20000)
+        self.assertEqual(len(regions), 100)
+        names = [sname for sname, _, _ in regions]
+        self.assertEqual(names.count("chr1"), 75)
+        self.assertEqual(names.count("chr2"), 25)
+        for sname, start, end in regions:
+            self.assertGreaterEqual(start, 1)
+            self.assertLessEqual(end, 1000000)
+
+    def test_rounds_sample_new_positions(self):
+        primaries = [("1", 10000000, 1)]
+        first = set(plan_sample_regions(primaries, 50, 0, 1000))
+        second = set(plan_sample_regions(primaries, 50, 1, 1000))
+        self.assertFalse(first & second)
+
+
+class TestParseSamColumns(unittest.TestCase):
+
+    def test_columns_match_split(self):
+        lines = [
+            "r1\t99\tchr1\t100\t60\t5M\t=\t300\t205\tACGTA\tIIIII\tNM:i:0",
+            "r1\t147\tchr1\t300\t60\t5M\t=\t100\t-205\tACGTA\tIIIII",
+            "r2\t2048\tchr1\t400\t0\t3M\tchr2\t10\t0\tACG\tIII\tSA:Z:x",
+            "r3\t4\t*\t0\t0\t*\t*\t0\t0\t*\t*",
+        ]
+        columns = parse_sam_columns(("\n".join(lines) + "\n").encode())
+        fields = [line.split("\t") for line in lines]
+        self.assertEqual(columns["flag"].tolist(), [int(f[1]) for f in fields])
+        self.assertEqual(columns["tlen"].tolist(), [int(f[8]) for f in fields])
+        self.assertEqual(columns["rnext_eq"].tolist(), [f[6] == "=" for f in fields])
+        self.assertEqual(columns["seqlen"].tolist(), [len(f[9]) for f in fields])
+
+    def test_reads_capped_per_region(self):
+        regions = [("chr2", 5001, 6000), ("chr1", 101, 1100), ("chr1", 5001, 6000)]
+        positions = [("chr1", 90)] + [("chr1", 200 + i) for i in range(5)] + [("chr1", 5500 + i) for i in range(2)] \
+            + [("chr10", 5500)] + [("chr2", 5100 + i) for i in range(4)]     # In file (sort) order, as view -M
+        lines = [f'r{number}\t{number}\t{sname}\t{pos}\t60\t4M\t=\t1\t0\tACGT\tIIII'
+                 for number, (sname, pos) in enumerate(positions)]
+        columns = parse_sam_columns(("\n".join(lines) + "\n").encode(), regions, 3)
+        # First 3 of each region; the read starting before its region is in it; chr10 is in none
+        self.assertEqual(columns["flag"].tolist(), [0, 1, 2, 6, 7, 9, 10, 11])
+        self.assertEqual(len(parse_sam_columns(("\n".join(lines) + "\n").encode(), regions)["flag"]), 12)
+
+
+class TestWelford(unittest.TestCase):
+
+    def test_batches_match_numpy(self):
+        rng = np.random.default_rng(7)
+        values = rng.normal(400, 90, 5000)
+        stat = Welford()
+        for batch in np.array_split(values, 7):
+            stat.add_batch(batch)
+        self.assertEqual(stat.count, 5000)
+        self.assertAlmostEqual(stat.mean, values.mean(), places=9)
+        self.assertAlmostEqual(stat.stddev, values.std(ddof=1), places=9)
+        self.assertTrue(stat.converged((stat.mean, stat.stddev), 0.001))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+import unittest
+import sys
+import io
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from program.depthhist import DepthHistogram, DEPTH_CAP
+
+
+def awk_counts(lines):
+    """ Reference implementation of the original awk bucket script """
+    counts = {}
+    for line in lines:
+        name, _, depth = line.split("\t")
+        depth = int(depth)
+        row = counts.setdefault(name, [0] * 9)
+        if depth == 0:
+            row[0] += 1
+            continue
+        row[1] += 1
+        row[2] += depth
+        bucket = 7 if depth > 7 else 5 if depth > 3 else 3
+        row[bucket] += 1
+        row[bucket + 1] += depth
+    return counts
+
+
+class TestDepthHistogram(unittest.TestCase):
+
+    def setUp(self):
+        self.lines = []
+        for name, length in (("chr1", 3000), ("chr11", 40), ("chr21", 40), ("HLA-A*01:01", 25)):
+            self.lines += [f"{name}\t{pos}\t{(pos * 7) % 13 + (DEPTH_CAP + 5 if pos % 97 == 0 else 0)}"
+                           for pos in range(1, length + 1)]
+        self.lines += ["chr12\t1000\t5", "chr21\t1001\t7"]     # Different sequences with consecutive positions
+
+    def test_matches_awk_buckets_across_chunks(self):
+        histogram = DepthHistogram()
+        histogram.add_stream(io.BytesIO(("\n".join(self.lines) + "\n").encode()), chunk_size=777)
+
+        for name, (zero, nz, sumnz, n3, sumn3, n7, sumn7, nI, sumnI) in awk_counts(self.lines).items():
+            counts, sums = histogram.bucket_table(name)
+            self.assertEqual(counts, [zero, n3, n7, nI], name)
+            self.assertEqual(sums, [0, sumn3, sumn7, sumnI], name)
+            self.assertEqual(sum(counts[1:]), nz)
+            self.assertEqual(sum(sums), sumnz)
+
+    def test_save_load_rebucket(self):
+        histogram = DepthHistogram()
+        histogram.add_lines(("\n".join(self.lines) + "\n").encode())
+        with tempfile.TemporaryDirectory() as tmp:
+            histogram.save(os.path.join(tmp, "h.npz"))
+            loaded = DepthHistogram.load(os.path.join(tmp, "h.npz"))
+        self.assertEqual(list(loaded.hist), list(histogram.hist))
+        counts, _ = loaded.bucket_table("chr1", (1, 5, 10, DEPTH_CAP))
+        self.assertEqual(sum(counts), 3000)
+        self.assertEqual(counts[-1], 3000 // 97)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+import sys
+import os
+import gzip
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program import fastqshard
+from program.fastqshard import split_fastq, shard_names, shard_count, MAX_SHARDS
+
+
+def fastq_records(count, mate, length=50):
+    return [f'@read{i}/{mate}\n{"ACGT"[i % 4] * (length + i % 7)}\n+\n{"I" * (length + i % 7)}\n'
+            for i in range(count)]
+
+
+class TestFastqShard(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.r1 = os.path.join(self.tmpdir.name, "sample_R1.fastq.gz")
+        self.r2 = os.path.join(self.tmpdir.name, "sample_R2.fastq")
+        self.reads1 = fastq_records(1003, 1)
+        self.reads2 = fastq_records(1003, 2, length=60)     # Different record sizes; blocks must count reads
+        with gzip.open(self.r1, "wt") as r1:
+            r1.write("".join(self.reads1))
+        with open(self.r2, "w") as r2:
+            r2.write("".join(self.reads2))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def split(self, fastq_oFN, shards, block_reads=10):
+        """ Reads (4 line records) of each shard split_fastq writes """
+        out_oFNs = shard_names(fastq_oFN + "_out", shards)
+        split_fastq(fastq_oFN, out_oFNs, block_reads, threads=2)
+        result = []
+        for out_oFN in out_oFNs:
+            with gzip.open(out_oFN, "rt") as out_file:
+                lines = out_file.read().splitlines(keepends=True)
+            result.append(["".join(lines[line:line + 4]) for line in range(0, len(lines), 4)])
+        return result
+
+    def test_shards_cover_reads_once_and_keep_pairs(self):
+        original_chunk = fastqshard.CHUNK_SIZE
+        fastqshard.CHUNK_SIZE = 777            # Force each block to span many reads of the file
+        try:
+            shards1, shards2 = self.split(self.r1, 3), self.split(self.r2, 3)
+        finally:
+            fastqshard.CHUNK_SIZE = original_chunk
+        for mates1, mates2 in zip(shards1, shards2):
+            self.assertEqual(len(mates1), len(mates2))
+            for mate1, mate2 in zip(mates1, mates2):
+                self.assertEqual(mate1.split("/")[0], mate2.split("/")[0])
+        self.assertEqual(sorted(sum(shards1, [])), sorted(self.reads1))
+
+    def test_blocks_dealt_round_robin(self):
+        first, second = self.split(self.r1, 2, block_reads=100)
+        self.assertTrue(first[0].startswith("@read0/"))
+        self.assertTrue(first[100].startswith("@read200/"))
+        self.assertTrue(second[0].startswith("@read100/"))
+        self.assertEqual(len(first) + len(second), 1003)
+        with open(shard_names(self.r1 + "_out", 2)[0], "rb") as f:
+            self.assertEqual(f.read(4), b"\x1f\x8b\x08\x04")    # BGZF (gzip with the extra field)
+
+    def test_truncated_fastq_rejected(self):
+        with open(self.r2, "w") as r2:
+            r2.write("".join(self.reads2[:5]) + "@read5/2\nACGT\n")
+        with self.assertRaises(ValueError):
+            self.split(self.r2, 2)
+        self.assertFalse(any(os.path.exists(name) for name in shard_names(self.r2 + "_out", 2)))
+
+    def test_shard_count(self):
+        self.assertEqual(shard_count(1), 2)
+        self.assertEqual(shard_count(30 * 10**9), 8)
+        self.assertEqual(shard_count(10**15), MAX_SHARDS)
+
+
+if __name__ == '__main__':
+    unittest.main()
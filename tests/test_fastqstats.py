@@ -0,0 +1,136 @@
+import unittest
+import sys
+import os
+import gzip
+import random
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import program.fastqstats as fastqstats
+from program.fastqstats import fastq_kind, fastq_stats, sidecar_stats, read_sidecar, report_current, record_report
+from program.bgzf import BGZFWriter
+
+
+def fastq(reads, seed=3):
+    """ FASTQ text of reads reads of 100 to 151 bases; and its (lengths, sequence bytes, quality bytes) """
+    rand = random.Random(seed)
+    lines, lengths, seqs, quals = [], [], b"", b""
+    for number in range(reads):
+        length = rand.choice((100, 150, 151, 151, 151))
+        seq = bytes(rand.choice(b"ACGTTGCAN") for _ in range(length))
+        qual = bytes(rand.randint(35, 73) for _ in range(length))
+        lines.append(b"@A00123:8:H7:1:%d:%d:1000 1:N:0:ACGT\n%s\n+\n%s\n" % (number // 7, number, seq, qual))
+        lengths.append(length)
+        seqs += seq
+        quals += qual
+    return b"".join(lines), (lengths, seqs, quals)
+
+
+class TestFASTQStats(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = fastqstats.TASK_BYTES, fastqstats.CHUNK_SIZE, fastqstats.SAMPLE_BYTES
+        fastqstats.TASK_BYTES, fastqstats.CHUNK_SIZE = 50000, 33333      # Many pieces; cut inside the lines
+        self.data, self.expect = fastq(3000)
+
+    def tearDown(self):
+        fastqstats.TASK_BYTES, fastqstats.CHUNK_SIZE, fastqstats.SAMPLE_BYTES = self.saved
+        self.tmpdir.cleanup()
+
+    def write(self, name, kind, data):
+        path = os.path.join(self.tmpdir.name, name)
+        with open(path, "wb") as f:
+            if kind == "bgzf":
+                writer = BGZFWriter(f)
+                writer.write(data)
+                writer.close()
+            else:
+                f.write(gzip.compress(data) if kind == "gzip" else data)
+        return path
+
+    def check(self, stats, lengths, seqs, quals):
+        self.assertEqual(stats.lengths.tolist(), np.bincount(lengths).tolist())
+        self.assertEqual(stats.bases.tolist(), np.bincount(np.frombuffer(seqs, np.uint8), minlength=256).tolist())
+        self.assertEqual(stats.quals.tolist(), np.bincount(np.frombuffer(quals, np.uint8), minlength=256).tolist())
+        self.assertAlmostEqual(stats.avg_read_length, np.mean(lengths))
+        self.assertAlmostEqual(stats.read_length_stddev, np.std(lengths, ddof=1))
+
+    def test_exact_every_kind(self):
+        for kind in ("plain", "gzip", "bgzf"):
+            path = self.write(f'reads_{kind}.fastq', kind, self.data)
+            self.assertEqual(fastq_kind(path), kind)
+            stats = fastq_stats(path, exact=True, processes=2)
+            self.assertTrue(stats.exact)
+            self.assertEqual(stats.reads, 3000)
+            self.assertEqual(stats.seqid, "A00123:8:H7:1:0:0:1000 1:N:0:ACGT")
+            self.check(stats, *self.expect)
+
+        # Windows line ends and no line end at the very end
+        path = self.write("crlf.fastq", "gzip", self.data.replace(b"\n", b"\r\n")[:-2])
+        stats = fastq_stats(path, exact=True, processes=2)
+        self.assertEqual(stats.reads, 3000)
+        self.check(stats, *self.expect)
+        self.assertAlmostEqual(stats.gc, (self.expect[1].count(b"G") + self.expect[1].count(b"C")) /
+                               sum(self.expect[1].count(base) for base in (b"A", b"C", b"G", b"T")))
+
+    def test_quick_estimate(self):
+        fastqstats.SAMPLE_BYTES = 4096          # So the file is sampled; not read whole
+        for kind in ("plain", "bgzf", "gzip"):
+            path = self.write(f'reads_{kind}.fastq', kind, self.data)
+            stats = fastq_stats(path)
+            self.assertFalse(stats.exact)
+            self.assertLess(abs(stats.reads - 3000), 3000 * (0.05 if kind != "gzip" else 0.15), kind)
+            self.assertGreater(stats.sampled, 100)
+            self.assertLess(stats.sampled, 3000)
+            self.assertEqual(stats.seqid, "A00123:8:H7:1:0:0:1000 1:N:0:ACGT")
+            self.assertLess(abs(stats.avg_read_length - np.mean(self.expect[0])), 5)
+            self.assertAlmostEqual(stats.q30, np.mean(np.frombuffer(self.expect[2], np.uint8) >= 63), delta=0.05)
+
+    def test_sidecar(self):
+        path = self.write("reads.fastq.gz", "bgzf", self.data)
+        stats = sidecar_stats(path, exact=True, processes=2)
+        record = read_sidecar(path)
+        self.assertEqual((record["stats"]["reads"], record["stats"]["exact"]), (3000, True))
+        self.assertAlmostEqual(record["stats"]["avg_read_length"], stats.avg_read_length)
+
+        def no_scan(*args):
+            raise AssertionError("FASTQ scanned again")
+        fastqstats.fastq_stats, saved = no_scan, fastqstats.fastq_stats
+        try:
+            again = sidecar_stats(path)                     # An exact sidecar serves a quick request too
+            self.check(again, *self.expect)
+            self.assertEqual(again.seqid, stats.seqid)
+            os.utime(path, ns=(1, 1))                       # A copy (same content); still current
+            self.check(sidecar_stats(path, exact=True), *self.expect)
+            self.assertEqual(read_sidecar(path)["key"]["mtime"], 1)
+        finally:
+            fastqstats.fastq_stats = saved
+
+        report = os.path.join(self.tmpdir.name, "reads_fastqc.html")
+        self.assertFalse(report_current([path], "fastqc", report))
+        with open(report, "w") as f:
+            f.write("<html></html>")
+        record_report([path], "fastqc", report)
+        self.assertTrue(report_current([path], "fastqc", report))
+        self.assertEqual(read_sidecar(path, histograms=True)["lengths"].tolist(), stats.lengths.tolist())
+
+        self.write("reads.fastq.gz", "bgzf", self.data[:-1000] + b"\n" * 1000)    # Other content
+        os.utime(path, ns=(2, 2))
+        self.assertIsNone(read_sidecar(path))
+        self.assertFalse(report_current([path], "fastqc", report))
+        self.assertNotEqual(sidecar_stats(path, exact=True).reads, 3000)     # Scanned again
+
+
+if __name__ == '__main__':
+    unittest.main()
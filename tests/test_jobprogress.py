@@ -0,0 +1,94 @@
+import unittest
+import sys
+import os
+import json
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import program.jobprogress as jobprogress
+from program.jobprogress import ProgressMonitor
+from program.jobqueue import Job, JobQueue, DONE
+
+
+def python(code):
+    return [sys.executable, "-c", code]
+
+
+class TestJobProgress(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.saved = jobprogress.SAMPLE_INTERVAL, jobprogress.LOG_INTERVAL, jobprogress.STALL_TIME
+        jobprogress.SAMPLE_INTERVAL, jobprogress.LOG_INTERVAL = 0.1, 0
+
+    def tearDown(self):
+        jobprogress.SAMPLE_INTERVAL, jobprogress.LOG_INTERVAL, jobprogress.STALL_TIME = self.saved
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def run_job(self, command, monitor):
+        events = []
+        queue = JobQueue()
+        job = queue.submit(Job("test", command, monitor=monitor))
+        queue.wait([job], idle=lambda: events.append(monitor.latest) if monitor.latest else None)
+        return job, [event for event in events if event["status"] == "running"]
+
+    def test_input_read_and_log(self):
+        with open(self.path("input.bin"), "wb") as f:
+            f.write(b"\0" * 10**6)
+        small = self.path("small.bin")
+        with open(small, "wb") as f:
+            f.write(b"\0" * 1000)
+        # Reads the input slowly (and a small side file); the largest file read is taken as the input
+        reader = python(f'import time\nside = open({small!r}, "rb")\n'
+                        f'with open({self.path("input.bin")!r}, "rb") as f:\n'
+                        f'    while f.read(50000):\n        time.sleep(0.05)\n')
+        monitor = ProgressMonitor(log_oFN=self.path("progress.jsonl"))
+        job, events = self.run_job(reader, monitor)
+        self.assertEqual(job.status, DONE)
+        percents = [event["percent"] for event in events if event["percent"] is not None]
+        self.assertGreater(len(percents), 3)
+        self.assertEqual(percents, sorted(percents))
+        self.assertTrue(all(0 < percent < 1 for percent in percents[:-1]))
+        self.assertTrue(all(event["total"] == 10**6 for event in events if event["total"]))
+        self.assertTrue(any(event["rate"] and event["eta"] is not None for event in events))
+        self.assertEqual((monitor.latest["status"], monitor.latest["percent"]), (DONE, 1.0))
+
+        with open(self.path("progress.jsonl")) as f:
+            logged = [json.loads(line) for line in f]
+        self.assertEqual(logged[-1]["status"], DONE)
+        self.assertGreater(len(logged), 3)
+
+        # Declared inputs; a file the job never opens leaves it at 0%
+        monitor = ProgressMonitor(inputs=[small, self.path("input.bin")])
+        self.run_job(python(f'open({self.path("input.bin")!r}, "rb").read(); import time; time.sleep(0.5)'), monitor)
+        self.assertEqual(monitor.latest["total"], 10**6 + 1000)
+
+    def test_tool_progress_and_stall(self):
+        jobprogress.STALL_TIME = 0.5
+        printer = python('import sys, time\nfor done in (12.5, 42.25):\n'
+                         '    sys.stderr.write(f" {done:>7.2f}% aligned; time left is 1:00:00\\r")\n'
+                         '    sys.stderr.flush()\n'
+                         '    time.sleep(0.3)\ntime.sleep(1.2)\n')
+        monitor = ProgressMonitor()
+        job, events = self.run_job(printer, monitor)
+        self.assertEqual(job.status, DONE)
+        self.assertEqual(monitor.tool_percent, 0.4225)
+        self.assertIn(0.125, [event["percent"] for event in events])
+        self.assertTrue(events[-1]["stalled"])                  # Sleeping; no I/O nor CPU
+        self.assertFalse(events[0]["stalled"])
+        self.assertIsNotNone(events[-1]["eta"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import sys
+import time
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.jobqueue import Job, JobQueue, RUNNING, DONE, FAILED, CANCELLED, TIMEOUT
+
+
+def sleeper(seconds, code=0):
+    return [sys.executable, "-c", f"import time, sys; time.sleep({seconds}); sys.exit({code})"]
+
+
+class TestJobQueue(unittest.TestCase):
+
+    def test_runs_concurrently_within_threads(self):
+        queue = JobQueue(max_threads=4)
+        jobs = [queue.submit(Job(f"j{i}", sleeper(0.5), threads=2)) for i in range(4)]
+        time.sleep(0.2)
+        self.assertEqual([job.status for job in jobs].count(RUNNING), 2)
+        start = time.time()
+        queue.wait(jobs)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertTrue(all(job.status == DONE for job in jobs))
+
+    def test_memory_limit_and_oversized_job(self):
+        queue = JobQueue(max_threads=8, max_mem=100)
+        big = queue.submit(Job("big", sleeper(0.3), mem=500))         # More than the machine; runs alone
+        small = queue.submit(Job("small", sleeper(0.1), mem=10))
+        time.sleep(0.1)
+        self.assertEqual((big.status, small.status), (RUNNING, "queued"))
+        queue.wait([big, small])
+        self.assertGreaterEqual(small.start_time, big.end_time)
+
+    def test_cancel_timeout_failure_and_callbacks(self):
+        queue = JobQueue(max_threads=8)
+        seen = []
+        running = queue.submit(Job("cancel", sleeper(30), callback=lambda job, status: seen.append((job.id, status))))
+        slow = queue.submit(Job("slow", sleeper(30), timeout=0.3))
+        fail = queue.submit(Job("fail", sleeper(0, code=3)))
+        time.sleep(0.2)
+        queue.cancel(running)
+        queue.wait([running, slow, fail])
+        self.assertEqual((running.status, slow.status, fail.status), (CANCELLED, TIMEOUT, FAILED))
+        self.assertEqual(fail.returncode, 3)
+        self.assertEqual([status for _, status in seen], ["queued", RUNNING, CANCELLED])
+
+    def test_unexpected_error_fails_job(self):
+        class BrokenMonitor:
+            latest = None
+
+            def feed(self, data):
+                pass
+
+            def poll(self, job):
+                raise RuntimeError("broken")
+
+            def finish(self, job, status):
+                raise RuntimeError("broken")
+
+        queue = JobQueue()
+        job = queue.submit(Job("broken", sleeper(30), monitor=BrokenMonitor()))
+        start = time.time()
+        queue.wait([job])
+        self.assertEqual(job.status, FAILED)
+        self.assertIsInstance(job.error, RuntimeError)
+        self.assertLess(time.time() - start, 5)                         # Killed; not left running
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import unittest
+import sys
+import os
+import gzip
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from program.kitshards import target_sites, header_sequences, plan_shards, write_regions, compare_vcfs
+
+
+class TestKitShards(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.tab = os.path.join(self.tmpdir.name, "All_SNPs_hg38_ref.tab.gz")
+        rows = [("chr1", pos) for pos in range(1000, 101000, 100)] + [("chr2", pos) for pos in range(50, 5050, 10)] + \
+            [("chrUn_KI270742v1", 77), ("chrM", 73), ("chrM", 73), ("chr1_KI270706v1_random", 12)]
+        with gzip.open(self.tab, "wt") as tab:
+            tab.write("#CHROM\tPOS\tID\n")
+            tab.write("".join(f'{chrom}\t{pos}\trs{index}\n' for index, (chrom, pos) in enumerate(rows)))
+        self.header = "@HD\tVN:1.6\tSO:coordinate\n" + "".join(
+            f'@SQ\tSN:{sn}\tLN:1000000\n' for sn in ("chrM", "chr1", "chr2", "chrUn_KI270742v1")) + "@PG\tID:bwa\n"
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_plan_covers_every_target_once_in_header_order(self):
+        sites = target_sites(self.tab)
+        sequences = header_sequences(self.header)
+        self.assertEqual(sequences, ["chrM", "chr1", "chr2", "chrUn_KI270742v1"])
+        plan = plan_shards(sites, sequences, 8)
+        self.assertLessEqual(len(plan), 8)
+
+        covered = [(sn, int(pos)) for shard in plan for sn, start, end in shard
+                   for pos in sites[sn] if start <= pos <= end]
+        expected = [(sn, int(pos)) for sn in sequences for pos in sites[sn]]
+        self.assertEqual(covered, expected)         # Each once, in BAM header order (chrM duplicate removed)
+
+        sizes = [sum(int(((sites[sn] >= start) & (sites[sn] <= end)).sum()) for sn, start, end in shard)
+                 for shard in plan]
+        self.assertEqual(len(set(sizes[:-1])), 1)       # Equal shards; the last takes the remainder
+        self.assertLessEqual(sizes[-1], sizes[0])
+
+    def test_plan_without_sequences_and_empty(self):
+        sites = target_sites(self.tab)
+        plan = plan_shards(sites, [], 3)
+        self.assertEqual(plan[0][0][0], "chr1")
+        self.assertEqual(plan[-1][-1], ("chr1_KI270706v1_random", 12, 12))
+        self.assertEqual(plan_shards(sites, ["chr5"], 3), [])
+
+    def test_write_regions(self):
+        regions_oFN = os.path.join(self.tmpdir.name, "shard000.regions")
+        write_regions([("chr1", 1000, 5000), ("chr2", 50, 50)], regions_oFN)
+        with open(regions_oFN) as regions:
+            self.assertEqual(regions.read(), "chr1\t1000\t5000\nchr2\t50\t50\n")
+
+    def test_compare_ignores_headers(self):
+        records = [f'chr1\t{pos}\t.\tA\tG\t50\t.\tDP=9\tGT\t0/1' for pos in range(10, 100, 10)]
+        serial = os.path.join(self.tmpdir.name, "serial.vcf.gz")
+        parallel = os.path.join(self.tmpdir.name, "parallel.vcf.gz")
+        with gzip.open(serial, "wt") as vcf:
+            vcf.write("##bcftools_callCommand=call -o serial\n#CHROM\n" + "".join(f'{rec}\n' for rec in records))
+        with gzip.open(parallel, "wt") as vcf:
+            vcf.write("##bcftools_concatCommand=concat\n#CHROM\n" + "".join(f'{rec}\n' for rec in records))
+        self.assertEqual(compare_vcfs(serial, parallel), (0, []))
+
+        with gzip.open(parallel, "wt") as vcf:
+            vcf.write("#CHROM\n" + "".join(f'{rec}\n' for rec in records[:3] + records[4:]))
+        differ, examples = compare_vcfs(serial, parallel)
+        self.assertEqual(differ, len(records) - 3)    # Everything after a missing record is out of step
+        self.assertEqual(examples[0], (records[3], records[4]))
+
+
+if __name__ == '__main__':
+    unittest.main()
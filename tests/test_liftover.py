@@ -0,0 +1,86 @@
+import unittest
+import sys
+import os
+import gzip
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.liftover import ChainMap, LiftoverCache
+
+# chrA 0-based source blocks: [100,150) -> chrB 1000+ ; gap; [170,200) -> chrB 1060+ (chain 1, score 500)
+#  [140,160) -> chrC minus strand (chain 2, score 900; overlaps the first block of chain 1)
+#  [190,210) -> chrB 5000+ (chain 3, score 500; tie with chain 1 which comes first in the file)
+CHAIN = """#comment
+chain 500 chrA 1000 + 100 200 chrB 10000 + 1000 1090 1
+50\t20\t10
+30
+
+chain 900 chrA 1000 + 140 160 chrC 500 - 10 30 2
+20
+
+chain 500 chrA 1000 + 190 210 chrB 10000 + 5000 5020 3
+20
+"""
+
+
+class TestLiftover(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.chain = os.path.join(self.tmpdir.name, "AToB.over.chain.gz")
+        with gzip.open(self.chain, "wt") as chain:
+            chain.write(CHAIN)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def lift(self, chains, chrom, positions):
+        codes, lifted = chains.convert(chrom, positions)
+        return [(chains.targets[code], int(new)) if code >= 0 else None for code, new in zip(codes, lifted)]
+
+    def test_blocks_overlaps_and_strand(self):
+        chains = ChainMap(self.chain)
+        positions = [99, 100, 139, 140, 159, 160, 165, 170, 189, 190, 199, 200, 209, 210]
+        self.assertEqual(self.lift(chains, "chrA", positions), [
+            None, ("chrB", 1000), ("chrB", 1039),
+            ("chrC", 500 - 1 - 10), ("chrC", 500 - 1 - 29),     # Higher score wins; minus strand from the end
+            None, None, ("chrB", 1060), ("chrB", 1079),
+            ("chrB", 1080), ("chrB", 1089),                        # Tie in score; first chain in the file
+            ("chrB", 5010), ("chrB", 5019), None])
+
+    def test_unknown_chromosome(self):
+        chains = ChainMap(self.chain)
+        self.assertEqual(self.lift(chains, "chrZ", [5, 150]), [None, None])
+
+    def test_cache_lookup_and_invalidation(self):
+        targets = os.path.join(self.tmpdir.name, "All_SNPs_A_ref.tab.gz")
+        with gzip.open(targets, "wt") as tab:
+            tab.write("A\t100\nA\t145\nA\t165\nA\t100\n")
+        cache = LiftoverCache(self.chain, targets)
+        self.assertTrue(os.path.isfile(cache.cache_oFN))
+        self.assertEqual(cache.unliftable(), [("chrA", 165)])
+
+        cache = LiftoverCache(self.chain, targets)
+        self.assertIsNone(cache.chains)                     # From the cache file; chain file not loaded
+        self.assertEqual(self.lift(cache, "chrA", [145, 100, 165]), [("chrC", 500 - 1 - 15), ("chrB", 1000), None])
+        self.assertEqual(self.lift(cache, "chrA", [190]), [("chrB", 1080)])    # Not a target site
+        self.assertIsNotNone(cache.chains)
+
+        with gzip.open(targets, "wt") as tab:
+            tab.write("chrA\t199\n")
+        cache = LiftoverCache(self.chain, targets)
+        self.assertIsNotNone(cache.chains)                  # Target list changed; rebuilt
+        self.assertEqual(cache.unliftable(), [])
+        self.assertEqual(cache.sources["chrA"][0].tolist(), [199])
+
+
+if __name__ == '__main__':
+    unittest.main()
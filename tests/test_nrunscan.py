@@ -0,0 +1,106 @@
+import unittest
+import sys
+import io
+import os
+import gzip
+import tempfile
+import subprocess
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from program import nrunscan
+from program.nrunscan import fasta_sequences, scan_sequence, count_Ns, FASTQError, NRUN_SIZE
+
+
+def fasta_text(sequences, width=60):
+    return "".join(f'>{name} some description\n' +
+                   "".join(seq[pos:pos + width] + "\n" for pos in range(0, len(seq), width))
+                   for name, seq in sequences)
+
+
+class TestNRunScan(unittest.TestCase):
+
+    def setUp(self):
+        self.seq1 = "N" * 400 + "ACGT" * 500 + "N" * 3 + "ACGTN" + "ACGT" * 100 + "N" * 1000 + "ACGTAC" + "n" * 50
+        self.seq2 = "ACGT" * 2000 + "N" * 301
+
+    def test_splits_sequences_across_chunks(self):
+        original_chunk = nrunscan.CHUNK_SIZE
+        nrunscan.CHUNK_SIZE = 7             # Headers and line ends land on chunk boundaries
+        try:
+            text = "#comment\n" + fasta_text([("chr1", self.seq1), ("chr2", self.seq2)])
+            sequences = list(fasta_sequences(io.BytesIO(text.encode())))
+        finally:
+            nrunscan.CHUNK_SIZE = original_chunk
+        self.assertEqual([name for name, _ in sequences], ["chr1", "chr2"])
+        self.assertEqual(sequences[0][1].translate(None, b'\n').decode(), self.seq1)
+        self.assertEqual(sequences[1][1].translate(None, b'\n').decode(), self.seq2)
+
+    def test_runs_and_buckets(self):
+        body = "".join(self.seq1[pos:pos + 60] + "\n" for pos in range(0, len(self.seq1), 60)).encode()
+        result = scan_sequence(("chr1", body, len(self.seq1)))
+        self.assertEqual(result["bases"], len(self.seq1))
+        self.assertEqual(result["Ncnt"], 400 + 3 + 1 + 1000)      # Lower case n is not counted
+        self.assertEqual(result["starts"], [0, 2408 + 400])
+        self.assertEqual(result["lengths"], [400, 1000])
+        self.assertEqual(result["smlNregs"], 2)
+        bucksize = result["bucksize"]
+        self.assertEqual(bucksize, round(len(self.seq1) / 1000))
+        # Each run whole in the bucket of the base past its end (as countingNs.py); only buckets with 2+ N's listed
+        self.assertEqual(result["buckets"], [(400 // bucksize, 400), (2403 // bucksize, 3), (3808 // bucksize, 1000)])
+
+    def test_writes_ncnt_and_nbin(self):
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta_oFN = os.path.join(tmpdir, "model.fa.gz")
+            with gzip.open(fasta_oFN, "wt") as fasta:
+                fasta.write(fasta_text([("chr1", self.seq1), ("chrUn", "ACGT" * 10), ("chr2", self.seq2)]))
+            with open(os.path.join(tmpdir, "model.dict"), "w") as seqdict:
+                seqdict.write(f'@HD\tVN:1.0\n@SQ\tSN:chr1\tLN:{len(self.seq1)}\tM5:x\n'
+                              f'@SQ\tSN:chr2\tLN:{len(self.seq2)}\tM5:y\n')
+            count_Ns(fasta_oFN, processes=2)
+            with open(os.path.join(tmpdir, "model_ncnt.csv")) as ncnt:
+                rows = ncnt.read().splitlines()
+            with open(os.path.join(tmpdir, "model_nbin.csv")) as nbin:
+                regions = nbin.read().splitlines()[2:]
+
+        self.assertEqual(rows[2].split("\t")[:8], ["chr1", f'{len(self.seq1):,}', "1,404", "2", "700", "11", "2",
+                                                   str(round(len(self.seq1) / 1000))])
+        self.assertEqual(rows[3].split("\t")[:4], ["chr2", "8,301", "301", "1"])
+        self.assertEqual(rows[-1], f'2\t{len(self.seq1) + len(self.seq2):,}\t1,705\t3\t\t\t2')
+        self.assertEqual(regions, ["chr1\t1\t0\t400", "chr1\t2\t2,808\t1,000", "chr2\t1\t8,000\t301"])
+
+    def test_same_outputs_as_countingNs(self):
+        # Runs crossing bucket edges, ending on one, ending the sequence; lines of 60 within buckets of 120 bases
+        seq1 = "ACGT" * 25 + "N" * 500 + "ACGT" * 5 + "N" * 100 + "AC" * 10 + "N" * 2 + "A" * 118 + "N" * 301
+        seq1 += "ACGTAC" * ((120000 - len(seq1) - 480) // 6)
+        seq1 += "A" * (120000 - len(seq1) - 480) + "N" * 480
+        seq2 = "N" * 120 + "ACGT" * 30000 + "N" * 77 + "C" * 43
+        outputs = []
+        with tempfile.TemporaryDirectory() as tmpdir:
+            fasta_oFN = os.path.join(tmpdir, "model.fa.gz")
+            with gzip.open(fasta_oFN, "wt") as fasta:
+                fasta.write(fasta_text([("chr1", seq1), ("chr2", seq2)]))
+            with open(os.path.join(tmpdir, "model.dict"), "w") as seqdict:
+                seqdict.write(f'@HD\tVN:1.0\n@SQ\tSN:chr1\tLN:{len(seq1)}\tM5:x\n@SQ\tSN:chr2\tLN:{len(seq2)}\tM5:y\n')
+            for script in ("countingNs.py", "nrunscan.py"):
+                subprocess.run([sys.executable, str(repo_root / "program" / script), fasta_oFN], check=True,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+                outputs.append([])
+                for name in ("model_ncnt.csv", "model_nbin.csv"):
+                    with open(os.path.join(tmpdir, name)) as out:
+                        outputs[-1].append(out.read())
+        self.assertIn("\t120\t600\t6\t", outputs[0][0])    # Run of 500 counted whole in the bucket past its end
+        self.assertEqual(outputs[1], outputs[0])
+
+    def test_rejects_fastq(self):
+        with self.assertRaises(FASTQError):
+            list(fasta_sequences(io.BytesIO(b'@read1\nACGT\n+\nIIII\n')))
+
+
+if __name__ == '__main__':
+    unittest.main()
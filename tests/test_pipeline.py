@@ -0,0 +1,115 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.jobqueue import Job, JobQueue
+from program.pipeline import Pipeline, Stage
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.dir = self.tmp.name
+        self.queue = JobQueue(max_threads=4)
+        self.ran = []
+        with open(self.path("in.txt"), "w") as f:
+            f.write("data\n")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.dir, name)
+
+    def submit(self, stage, script):
+        self.ran.append(stage.name)
+        return self.queue.submit(Job(stage.title, ["bash", "-c", script], threads=stage.threads))
+
+    def build(self):
+        """ in -> a ; index (independent) ; a + index -> b ; b -> final """
+        pipeline = Pipeline("test", self.path("manifest.json"), self.dir)
+        pipeline.add(Stage("a", "A", f'cat "{self.path("in.txt")}" > "{self.path("a.txt")}"',
+                           inputs=[self.path("in.txt")], outputs=[self.path("a.txt")]))
+        pipeline.add(Stage("index", "I", f'echo idx > "{self.path("index.txt")}"', outputs=[self.path("index.txt")]))
+        pipeline.add(Stage("b", "B", f'cat "{self.path("a.txt")}" "{self.path("index.txt")}" > "{self.path("b.txt")}"',
+                           inputs=[self.path("a.txt"), self.path("index.txt")], outputs=[self.path("b.txt")]))
+        pipeline.add(Stage("final", "F", f'wc -l < "{self.path("b.txt")}" > "{self.path("final.txt")}"',
+                           inputs=[self.path("b.txt")], outputs=[self.path("final.txt")]))
+        return pipeline
+
+    def test_runs_in_dependency_order_then_nothing(self):
+        self.assertTrue(self.build().run(self.submit, poll_interval=0.01))
+        self.assertEqual(set(self.ran[:2]), {"a", "index"})             # Independent; started together
+        self.assertEqual(self.ran[2:], ["b", "final"])
+        with open(self.path("final.txt")) as f:
+            self.assertEqual(f.read().strip(), "2")
+
+        self.ran = []
+        self.assertTrue(self.build().run(self.submit, poll_interval=0.01))
+        self.assertEqual(self.ran, [])
+
+    def test_longest_ready_stage_first(self):
+        estimates = {"A": 10, "I": 600}
+        self.assertTrue(self.build().run(self.submit, poll_interval=0.01,
+                                         estimate=lambda stage: estimates.get(stage.title)))
+        self.assertEqual(self.ran, ["index", "a", "b", "final"])
+
+    def test_removed_intermediates_are_not_remade(self):
+        self.build().run(self.submit, poll_interval=0.01)
+        os.remove(self.path("a.txt"))
+        os.remove(self.path("b.txt"))
+        self.ran = []
+        self.assertEqual(self.build().plan(), [])
+
+    def test_changed_input_and_resume_after_failure(self):
+        self.build().run(self.submit, poll_interval=0.01)
+        os.remove(self.path("b.txt"))
+        with open(self.path("in.txt"), "a") as f:
+            f.write("more\n")
+        os.utime(self.path("in.txt"), (0, 10**9 * 2))
+        self.assertEqual([stage.name for stage in self.build().plan()], ["a", "b", "final"])
+
+        # Make b fail; a is recorded so the next run resumes at b
+        pipeline = self.build()
+        pipeline.stages[2].commands = "exit 1"
+        self.assertFalse(pipeline.run(self.submit, poll_interval=0.01))
+        self.assertEqual(pipeline.failed.name, "b")
+        self.assertEqual([stage.name for stage in self.build().plan()], ["b", "final"])
+
+    def test_partial_outputs_not_reused(self):
+        # A failed script (here a failure early in a pipe) is not done; even though its output looks plausible
+        pipeline = self.build()
+        pipeline.stages[0].commands = f'false | cat "{self.path("in.txt")}" > "{self.path("a.txt")}"'
+        self.assertFalse(pipeline.run(self.submit, poll_interval=0.01))
+        self.assertEqual(pipeline.failed.name, "a")
+        self.assertTrue(os.path.getsize(self.path("a.txt")) > 0)
+        self.assertEqual([stage.name for stage in self.build().plan()], ["a", "b", "final"])
+
+        # Crashed while writing: started in the manifest, never recorded; the partial output is made again
+        os.remove(self.path("manifest.json"))
+        self.assertTrue(self.build().run(self.submit, poll_interval=0.01))
+        pipeline = self.build()
+        pipeline._start(pipeline.stages[0])
+        self.assertEqual([stage.name for stage in pipeline.plan()], ["a", "b", "final"])
+
+        # No manifest (an older run): newer outputs are used only if they pass the check
+        os.remove(self.path("manifest.json"))
+        self.assertEqual(self.build().plan(), [])
+        pipeline = self.build()
+        pipeline.check = lambda stage: not stage.outputs[0].endswith("final.txt")
+        self.assertEqual([stage.name for stage in pipeline.plan()], ["final"])
+
+
+if __name__ == '__main__':
+    unittest.main()
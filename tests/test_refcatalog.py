@@ -0,0 +1,117 @@
+import unittest
+import sys
+import os
+import gzip
+import hashlib
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import nrunscan                                     # The one refcatalog uses
+from program.refcatalog import catalog_entry, catalog_genome, catalog_genomes, CHROMOSOME_LN
+
+
+def hg38_sequences(mito="chrM", y=True):
+    names = [f'chr{num}' for num in range(1, 23)] + ["chrX"] + (["chrY"] if y else [])
+    sequences = [(name, CHROMOSOME_LN[index][5], f'{index:032x}') for index, name in enumerate(names)]
+    sequences.append(("chr1_KI270706v1_random", 175055, "f" * 32))
+    sequences.append(("chrUn_GL000195v1", CHROMOSOME_LN[0][5], "e" * 32))    # Chromosome length; not its SN
+    return sequences + ([(mito, 16569, "c68f52674c9fb33aef52dcf399755519")] if mito else [])
+
+
+class TestRefCatalog(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = os.path.join(self.tmpdir.name, "model.fa.gz")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def write_fasta(self, text, fasta=None):
+        with gzip.open(fasta or self.fasta, "wt", newline="") as f:
+            f.write(text)
+
+    def read(self, name):
+        with open(os.path.join(self.tmpdir.name, name)) as f:
+            return f.read()
+
+    def test_dict_fai_and_ncnt_in_one_pass(self):
+        self.write_fasta(">chr1 description\nACGTN\nNNNac\nG\n>chrM\r\nACGT\r\nAC\r\n")
+        original_chunk = nrunscan.CHUNK_SIZE
+        nrunscan.CHUNK_SIZE = 7             # Offsets still right with headers across chunks
+        try:
+            catalog_genome(self.fasta)
+        finally:
+            nrunscan.CHUNK_SIZE = original_chunk
+
+        uri = f'file://{os.path.realpath(self.fasta)}'
+        self.assertEqual(self.read("model.dict"),
+                         "@HD\tVN:1.0\tSO:unsorted\n"
+                         f'@SQ\tSN:chr1\tLN:11\tM5:{hashlib.md5(b"ACGTNNNNACG").hexdigest()}\tUR:{uri}\n'
+                         f'@SQ\tSN:chrM\tLN:6\tM5:{hashlib.md5(b"ACGTAC").hexdigest()}\tUR:{uri}\n')
+        self.assertEqual(self.read("model.fa.gz.fai"), "chr1\t11\t18\t5\t6\nchrM\t6\t39\t4\t6\n")
+        self.assertIn("\nchr1\t11\t4\t0\t0\t0\t1\t", self.read("model_ncnt.csv"))
+        self.assertTrue(self.read("model.wgse").startswith(f'"{self.fasta}"\tUNKx\t2\t'))
+
+    def test_single_line_sequence_and_any_chunk_size(self):
+        # A sequence on one line between others (short alts, mito-style contigs) keeps the FAI; whatever the chunks
+        chr1, chr2 = "ACGTN" * 24, "NNAC" * 20 + "GT"
+        self.write_fasta(f'>chr1\n{chr1[:60]}\n{chr1[60:]}\n>chrS\nACGTACGT\n>chr2\n{chr2[:60]}\n{chr2[60:]}')
+        original_chunk = nrunscan.CHUNK_SIZE
+        try:
+            for chunk in (3, 7, 61, 2**20):
+                nrunscan.CHUNK_SIZE = chunk
+                catalog_genome(self.fasta)
+                self.assertEqual(self.read("model.fa.gz.fai"), "chr1\t120\t6\t60\t61\n"
+                                                               "chrS\t8\t134\t8\t9\n"
+                                                               "chr2\t82\t149\t60\t61\n", chunk)
+                self.assertIn(f'SN:chr2\tLN:82\tM5:{hashlib.md5(chr2.encode()).hexdigest()}', self.read("model.dict"))
+                self.assertIn("\nchr1\t120\t24\t0\t0\t0\t24\t", self.read("model_ncnt.csv"))
+                os.remove(self.fasta + ".fai")
+        finally:
+            nrunscan.CHUNK_SIZE = original_chunk
+
+    def test_uneven_lines_no_fai(self):
+        for text in (">chr1\nACGT\nAC\nACGT\n", ">chr1\nACGT\nACGTA\nAC\n", ">chr1\nACGT\r\nACGTA\nAC\n",
+                     ">chr1\nACGT\nACGT\n\nAC\n>chr2\nAC\n"):
+            self.write_fasta(text)
+            catalog_genome(self.fasta)
+            self.assertFalse(os.path.exists(self.fasta + ".fai"), text)
+        self.assertIn("SN:chr1\tLN:10\t", self.read("model.dict"))
+
+    def test_catalog_entry(self):
+        line, messages = catalog_entry("hg38.fa.gz", hg38_sequences())
+        fields = line.rstrip("\n").split("\t")
+        self.assertEqual(fields[0], '"hg38.fa.gz"')
+        self.assertEqual(fields[1:3], ["UNKh", "27"])
+        self.assertEqual(fields[8:11], ["CHRM", "LN:16569", "M5:C68F52674C9FB33AEF52DCF399755519"])
+        self.assertEqual(fields[12:], [f'"CHR{num}"' for num in range(1, 23)] + ['"CHRX"', '"CHRY"', '"CHRM"'])
+        self.assertEqual(messages, [f'hg38.fa.gz: ***ERROR: Build Not Seen Before ({fields[6]})'])
+
+        line, messages = catalog_entry("ebi.fa.gz", [(name.replace("chr", ""), length, md5) for name, length, md5
+                                                     in hg38_sequences(mito=None, y=False)])
+        self.assertEqual(line.split("\t")[1], "UNKg")
+        self.assertEqual(messages[:2], ["ebi.fa.gz: ***ERROR: 1 expected, 0 found: Y chromosome entries in ref model",
+                                        "ebi.fa.gz: ***ERROR: 1 expected, 0 found: mitrochondrial entries in ref model"])
+
+    def test_genomes_in_a_pool(self):
+        other = os.path.join(self.tmpdir.name, "other.fasta.gz")
+        self.write_fasta(">1\nACGT\n")
+        self.write_fasta("@read1\nACGT\n+\nIIII\n", other)
+        results = catalog_genomes([self.fasta, other], 2)
+        self.assertEqual(results[self.fasta][1], "model.fa.gz: ***ERROR: 1 expected, 0 found: mitrochondrial "
+                                                 "entries in ref model")
+        self.assertIn("FASTQ", results[other][0])
+        self.assertFalse(os.path.exists(os.path.join(self.tmpdir.name, "other.wgse")))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,194 @@
+import unittest
+import sys
+import os
+import bz2
+import gzip
+import json
+import random
+import struct
+import tempfile
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import program.refdownload as refdownload
+from program.bgzf import BGZFWriter
+from program.refdownload import GenomeDownload, download_genomes, stream_kind
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """ Serves the files of the server with byte Range support (http.server has none); counts the bytes sent """
+
+    def do_GET(self):
+        data = self.server.files.get(self.path)
+        if data is None:
+            self.send_error(404)
+            return
+        start, end = 0, len(data)
+        if "Range" in self.headers:
+            first, last = self.headers["Range"].split("=")[1].split("-")
+            start, end = int(first), (int(last) + 1 if last else len(data))
+            self.send_response(206)
+            self.send_header("Content-Range", f'bytes {start}-{end - 1}/{len(data)}')
+        else:
+            self.send_response(200)
+        self.send_header("Content-Length", str(end - start))
+        self.end_headers()
+        self.wfile.write(data[start:end])
+        self.server.sent += end - start
+
+    def log_message(self, *args):
+        pass
+
+
+def fasta(lines):
+    rand = random.Random(7)
+    return b">chr1\n" + b"".join(bytes(rand.choice(b"ACGT") for _ in range(60)) + b"\n" for _ in range(lines))
+
+
+def bgzf_blocks(data):
+    """ (offset, block size, uncompressed size) of each BGZF block """
+    blocks, pos = [], 0
+    while pos < len(data):
+        assert stream_kind(data[pos:pos + 18]) == "bgzf"
+        size = struct.unpack("<H", data[pos + 16:pos + 18])[0] + 1
+        blocks.append((pos, size, struct.unpack("<I", data[pos + size - 4:pos + size])[0]))
+        pos += size
+    return blocks
+
+
+class TestRefDownload(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.folder = self.tmpdir.name
+        self.server = ThreadingHTTPServer(("127.0.0.1", 0), RangeHandler)
+        self.server.files, self.server.sent = {}, 0
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.base = f'http://127.0.0.1:{self.server.server_port}'
+        self.segment_min = refdownload.SEGMENT_MIN
+        refdownload.SEGMENT_MIN = 20000        # So the small test files still come in segments
+        self.min_genome_bytes = refdownload.MIN_GENOME_BYTES
+        refdownload.MIN_GENOME_BYTES = 1000    # And still pass as genomes
+
+    def tearDown(self):
+        refdownload.SEGMENT_MIN = self.segment_min
+        refdownload.MIN_GENOME_BYTES = self.min_genome_bytes
+        self.server.shutdown()
+        self.server.server_close()
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.folder, name)
+
+    def read(self, name):
+        with open(self.path(name), "rb") as f:
+            return f.read()
+
+    def check_bgzf(self, name, content):
+        data = self.read(name)
+        self.assertEqual(gzip.decompress(data), content)
+        blocks = bgzf_blocks(data)
+        self.assertEqual(blocks[-1][2], 0)                  # EOF block
+        index = [(offset, sum(isize for _, _, isize in blocks[:number]))
+                 for number, (offset, _, isize) in enumerate(blocks) if number and isize]
+        gzi = self.read(name + ".gzi")
+        self.assertEqual(gzi, struct.pack("<Q", len(index)) + b"".join(struct.pack("<QQ", *entry) for entry in index))
+
+    def test_gzip_recompressed_in_segments(self):
+        content = fasta(5000)
+        self.server.files["/genomes/model.fa.gz"] = gzip.compress(content)
+        download = GenomeDownload(f'{self.base}/genomes/model.fa.gz', self.path("model.fa.gz"),
+                                  self.path("model.fa.gz"), segments=3)
+        download.run()
+        self.assertEqual(len(download.ranges), 3)
+        self.check_bgzf("model.fa.gz", content)
+        self.assertGreater(len(bgzf_blocks(self.read("model.fa.gz"))), 3)
+        self.assertFalse(os.path.exists(self.path("model.fa.gz.part")))
+        self.assertFalse(os.path.exists(self.path("model.fa.gz.part.json")))
+
+    def test_bzip2_recompressed(self):
+        content = fasta(3000)
+        self.server.files["/model.fa.bz2"] = bz2.compress(content[:70000]) + bz2.compress(content[70000:])
+        download = GenomeDownload(f'{self.base}/model.fa.bz2', self.path("model.fa.bz2"), self.path("model.fa.gz"))
+        download.run()
+        self.check_bgzf("model.fa.gz", content)
+
+    def test_7z_rejected(self):
+        self.server.files["/model.7z"] = b"7z\xbc\xaf\x27\x1c" + bytes(30000)
+        download = GenomeDownload(f'{self.base}/model.7z', self.path("model.7z"), self.path("model.fa.gz"))
+        with self.assertRaisesRegex(ValueError, "7z archives are not supported"):
+            download.run()
+        self.assertFalse(os.path.exists(self.path("model.fa.gz")))
+
+    def test_resume_interrupted_download(self):
+        content = fasta(4000)
+        self.server.files["/model.fa"] = content
+        url = f'{self.base}/model.fa'
+        half = len(content) // 2
+        with open(self.path("model.fa.part"), "wb") as part:        # As left by an interrupted run
+            part.write(content[:30000] + bytes(len(content) - 30000))
+        with open(self.path("model.fa.part.json"), "w") as state:
+            json.dump({"url": url, "size": len(content), "ranges": [[0, half], [half, len(content)]],
+                       "done": [30000, 0]}, state)
+
+        download = GenomeDownload(url, self.path("model.fa"), self.path("model.fa.gz"))
+        download.run()
+        self.assertEqual(download.resumed, 30000)
+        self.assertEqual(self.server.sent, 1 + len(content) - 30000)   # Probe byte and what was missing
+        self.check_bgzf("model.fa.gz", content)
+
+    def test_genomes_from_mirror_folder(self):
+        mirror = os.path.join(self.folder, "mirror")
+        os.mkdir(mirror)
+        plain, bgzf = fasta(300), fasta(2000)
+        with open(os.path.join(mirror, "plain.fasta"), "wb") as f:
+            f.write(plain)
+        with open(os.path.join(mirror, "bgzf.fa.gz"), "wb") as f:
+            writer = BGZFWriter(f)
+            writer.write(bgzf)
+            writer.close()
+        with open(self.path("genomes.csv"), "w") as f:
+            # Read by column position, as zcommon.sh does; the titles do not matter
+            f.write("Code,Server,Final,Initial,Where,Menu,Count,Naming,About\n"
+                    "plain,NIH-Alt,plain.fasta.gz,plain.fasta,https://nih.example/x/plain.fasta,P,1,Chr,Plain\n"
+                    '"plain",EBI-Alt,plain.fasta.gz,plain.fasta,https://ebi.example/y/plain.fasta,P,1,Chr,"Plain, EB"\n'
+                    "bgzf,WGSE,bgzf.fa.gz,bgzf.fa.gz,https://wgse.example/bgzf.fa.gz,B,1,Chr,BGZF\n"
+                    "gone,WGSE,gone.fa.gz,gone.fa.gz,https://wgse.example/gone.fa.gz,G,1,Chr,Gone\n"
+                    "html,WGSE,html.fa.gz,html.fa.gz,https://wgse.example/html.fa.gz,H,1,Chr,HTML\n"
+                    "tiny,WGSE,tiny.fa.gz,tiny.fa,https://wgse.example/tiny.fa,T,1,Chr,Tiny\n")
+        with open(os.path.join(mirror, "html.fa.gz"), "wb") as f:     # An error page served as the genome
+            f.write(gzip.compress(b"<html><body>" + b"Not found " * 2000 + b"</body></html>\n"))
+        with open(os.path.join(mirror, "tiny.fa"), "wb") as f:
+            f.write(b">chr1\nACGT\n")
+
+        results = download_genomes(["plain.fasta.gz", "bgzf.fa.gz", "gone.fa.gz", "missing.fa.gz", "html.fa.gz",
+                                    "tiny.fa.gz"], self.folder, "EBI", mirror, processes=2)
+        for final in ("plain.fasta.gz", "bgzf.fa.gz"):     # Downloaded; then cataloged (only a chr1 in them)
+            self.assertIn("***ERROR: No Chromosomes found", results[final][0])
+        self.assertIn("***ERROR", results["gone.fa.gz"][0])    # Not in the mirror; the others still finish
+        self.assertIn("Not found", results["missing.fa.gz"][0])
+        self.assertIn("not a FASTA file", results["html.fa.gz"][0])      # Neither cataloged nor kept
+        self.assertIn("too small", results["tiny.fa.gz"][0])
+        for bad in ("html.fa.gz", "html.fa.gz.gzi", "html.wgse", "tiny.fa.gz", "tiny.wgse"):
+            self.assertFalse(os.path.exists(self.path(bad)))
+        self.check_bgzf("plain.fasta.gz", plain)
+        with open(os.path.join(mirror, "bgzf.fa.gz"), "rb") as f:
+            self.assertEqual(self.read("bgzf.fa.gz"), f.read())     # Already BGZF; kept as is
+        self.check_bgzf("bgzf.fa.gz", bgzf)
+        self.assertTrue(os.path.isfile(self.path("plain.wgse")))
+        self.assertTrue(os.path.isfile(self.path("bgzf.dict")))
+
+        self.assertEqual(download_genomes(["bgzf.fa.gz"], self.folder, mirror=mirror), {"bgzf.fa.gz": []})
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,154 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.refcatalog import catalog_entry, CHROMOSOME_LN
+from program.refident import INDEX_FBS, ReferenceIndex, header_records, identify_reference
+
+
+def hg38_sequences():
+    names = [f'chr{num}' for num in range(1, 23)] + ["chrX", "chrY"]
+    sequences = [(name, CHROMOSOME_LN[index][5], f'{index:032x}') for index, name in enumerate(names)]
+    return sequences + [("chrM", 16569, "c68f52674c9fb33aef52dcf399755519")]
+
+
+def hs38_sequences(count, md5s=None):
+    """ An hs38 class model of count sequences (chrEBV and filler added to hg38); M5 md5s (a function of the index) """
+    sequences = hg38_sequences() + [("chrEBV", 171823, None)]
+    sequences += [(f'chrUn_KI27{num:04d}v1', 1000 + num, None) for num in range(count - len(sequences))]
+    return [(sn, ln, md5s(index) if md5s else m5) for index, (sn, ln, m5) in enumerate(sequences)]
+
+
+def bam_header(sequences):
+    return "@HD\tVN:1.6\tSO:coordinate\n" + \
+           "".join(f'@SQ\tSN:{sn}\tLN:{ln}\tM5:{m5}\tUR:file:///ref.fa\n' for sn, ln, m5 in sequences) + \
+           "@PG\tID:bwa\tPN:bwa\n"
+
+
+def vcf_header(sequences):
+    return "##fileformat=VCFv4.2\n" + \
+           "".join(f'##contig=<ID={sn},length={ln}{f",md5={m5}" if m5 else ""}>\n' for sn, ln, m5 in sequences) + \
+           "#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\n"
+
+
+class TestRefIdent(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.genomes = self.tmpdir.name
+        line, _ = catalog_entry(os.path.join(self.genomes, "hg38.fa.gz"), hg38_sequences())
+        with open(os.path.join(self.genomes, "hg38.wgse"), "w") as f:
+            f.write(line)
+        with open(os.path.join(self.genomes, "genomes.csv"), "w") as f:
+            f.write("Pyth Code,Source,Final File Name,Initial File Name\nhg38,UCSC,hg38.fa.gz,hg38.fa.gz\n")
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_bam_and_vcf_headers_parse_alike(self):
+        sequences = hg38_sequences()
+        self.assertEqual(header_records(bam_header(sequences)), sequences)
+        self.assertEqual(header_records(vcf_header(sequences)), sequences)
+        self.assertEqual(header_records("##contig=<ID=1,length=249250621>\n"), [("1", 249250621, None)])
+
+    def test_catalogued_model(self):
+        index = ReferenceIndex(self.genomes)
+        for header in (bam_header(hg38_sequences()), vcf_header(hg38_sequences())):
+            ident = identify_reference(header_records(header), index, header)
+            self.assertEqual((ident["Refgenome"], ident["Build"], ident["RefMito"]), ("hg38", 38, "rCRS"))
+            self.assertEqual((ident["SNTypeC"], ident["SNTypeM"], ident["SNCount"]), ("Chr", "M", 25))
+
+        # Without the M5 fields; still the same model by its names and lengths
+        ident = identify_reference([(sn, ln, None) for sn, ln, _ in hg38_sequences()], index)
+        self.assertEqual(ident["Refgenome"], "hg38")
+
+    def test_subset_header_by_rules(self):
+        index = ReferenceIndex(self.genomes)
+        ident = identify_reference(header_records(vcf_header(hg38_sequences()[23:24])), index)     # chrY only
+        self.assertEqual((ident["Build"], ident["RefMito"], ident["SNCount"]), (38, "rCRS", 1))
+        self.assertIsNone(ident["Refgenome"])
+
+        sequences = [(str(num), CHROMOSOME_LN[num - 1][4], None) for num in range(1, 23)] + \
+                    [("X", CHROMOSOME_LN[22][4], None), ("Y", CHROMOSOME_LN[23][4], None), ("MT", 16571, None)]
+        sequences += [(f'GL0002{num:02d}.1', 1000, None) for num in range(84 - len(sequences))]
+        ident = identify_reference(sequences, index)
+        self.assertEqual((ident["SNTypeC"], ident["SNTypeM"], ident["Build"]), ("Num", "MT", 19))
+        self.assertEqual((ident["Refgenome"], ident["RefgenomeNew"]), ("hs37-", "1K37g"))
+
+    def catalog(self, models):
+        """ Catalog (.wgse files and genomes.csv) of {code: sequences} in the genomes folder """
+        rows = ""
+        for code, sequences in models.items():
+            line, _ = catalog_entry(os.path.join(self.genomes, f'{code}.fa.gz'), sequences)
+            with open(os.path.join(self.genomes, f'{code}.wgse'), "w") as f:
+                f.write(line)
+            rows += f'{code},NIH,{code}.fa.gz,{code}.fa.gz\n'
+        with open(os.path.join(self.genomes, "genomes.csv"), "w") as f:
+            f.write("Pyth Code,Source,Final File Name,Initial File Name\n" + rows)
+        return ReferenceIndex(self.genomes)
+
+    def test_names_only_match_keeps_rules(self):
+        hs38d1 = hs38_sequences(2580, lambda index: f'{index:032x}')
+        verily = hs38_sequences(2580, lambda index: "a491618313b78cdca84ae9513e4f4844" if index == 24 else
+                                f'{index + 5000:032x}')     # Same names and lengths; other M5 (the Verily one)
+
+        # Only hs38d1 installed: a Verily BAM matches it by names and lengths alone; the M5 rule still finds Verily
+        index = self.catalog({"hs38d1": hs38d1})
+        ident = identify_reference(header_records(bam_header(verily)), index)
+        self.assertEqual((ident["Refgenome"], ident["RefgenomeNew"]), ("hs38d1v", "1k38ph"))
+        ident = identify_reference(hs38d1, index)
+        self.assertEqual((ident["Refgenome"], ident["RefgenomeNew"]), ("hs38d1", "1k38h"))
+
+        # Both installed: exact by the M5; without M5 the names and lengths are ambiguous so left to the rules
+        index = self.catalog({"hs38d1": hs38d1, "hs38d1v": verily})
+        self.assertEqual(index.lookup(verily), ("hs38d1v", index.lookup(verily)[1], True))
+        self.assertIsNone(index.lookup([(sn, ln, None) for sn, ln, _ in verily]))
+        ident = identify_reference([(sn, ln, None) for sn, ln, _ in verily], index, "@CO\tVerily pipeline\n")
+        self.assertEqual(ident["Refgenome"], "hs38d1v")
+
+    def test_refgenome_new_by_rules_only(self):
+        installed = identify_reference(hg38_sequences(), ReferenceIndex(self.genomes))
+        self.assertEqual(installed["Refgenome"], "hg38")
+        self.assertEqual(installed["RefgenomeNew"], identify_reference(hg38_sequences())["RefgenomeNew"])
+        self.assertEqual(installed["RefgenomeNew"], "hg38g")
+
+    def test_vcf_contig_counts(self):
+        # The VCF rules are the BAM ones: hs38d1 (2580) and hs38d1a (2841) are known; 2581 is hs38d1s (was hs38s)
+        for count, refgenome, new in ((2580, "hs38d1", "1k38h"), (2841, "hs38d1a", "1k38h"), (195, "hs38", "1k38h")):
+            ident = identify_reference(header_records(vcf_header(hs38_sequences(count))))
+            self.assertEqual((ident["SNCount"], ident["Refgenome"], ident["RefgenomeNew"]), (count, refgenome, new))
+        sequences = [(sn.replace("chr", ""), ln, m5) for sn, ln, m5 in hs38_sequences(2580)]
+        ident = identify_reference(header_records(vcf_header(sequences + [("22_KI270879v1_alt", 267, None)])))
+        self.assertEqual((ident["SNTypeC"], ident["Refgenome"], ident["RefgenomeNew"]), ("Num", "hs38d1s", "1k38pg"))
+
+        # 25 contigs: the odd hg37w model only if Build 37 (or 19); else the primary sequences of the Build
+        ident = identify_reference(header_records(vcf_header(hg38_sequences())))
+        self.assertEqual((ident["Refgenome"], ident["RefgenomeNew"]), ("hg38", "hg38g"))
+        sequences = [(f'chr{num}', CHROMOSOME_LN[num - 1][4], None) for num in range(1, 23)] + \
+                    [("chrX", CHROMOSOME_LN[22][4], None), ("chrY", CHROMOSOME_LN[23][4], None), ("chrM", 16569, None)]
+        ident = identify_reference(header_records(vcf_header(sequences)))
+        self.assertEqual((ident["Build"], ident["Refgenome"], ident["RefgenomeNew"]), (37, "hg37w", "EBI37ph"))
+
+    def test_index_saved_and_rebuilt(self):
+        ReferenceIndex(self.genomes)
+        index_file = os.path.join(self.genomes, INDEX_FBS)
+        self.assertTrue(os.path.isfile(index_file))
+
+        with open(os.path.join(self.genomes, "genomes.csv"), "w") as f:
+            f.write("Pyth Code,Source,Final File Name,Initial File Name\nhg38p,UCSC,hg38.fa.gz,hg38.fa.gz\n")
+        os.utime(os.path.join(self.genomes, "genomes.csv"), ns=(1, 1))     # Changed; even on a coarse clock
+        self.assertEqual(ReferenceIndex(self.genomes).lookup(hg38_sequences())[0], "hg38p")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,78 @@
+import unittest
+import sys
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+import program.resourceplan as resourceplan
+from program.resourceplan import SortPlan, plan_sort, free_space
+
+GB = 10**9
+
+
+class TestResourcePlan(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdirs = [tempfile.TemporaryDirectory() for _ in range(2)]
+        self.temps = [tmpdir.name for tmpdir in self.tmpdirs]
+        self.saved = resourceplan.available_memory, resourceplan.open_file_limit
+        resourceplan.available_memory = lambda: 16 * GB
+        resourceplan.open_file_limit = lambda: None
+
+    def tearDown(self):
+        resourceplan.available_memory, resourceplan.open_file_limit = self.saved
+        for tmpdir in self.tmpdirs:
+            tmpdir.cleanup()
+
+    def test_disk_space(self):
+        free = free_space(self.temps[0])
+        plan = plan_sort(free // 4, "BAM", "Coord", self.temps, self.temps[0], 4, 8 * GB)
+        self.assertIsNone(plan.error)
+        self.assertIn(plan.temp, (0, 1))
+        self.assertEqual((plan.threads, plan.mem, plan.total_mem), (4, "2000M", 8 * GB))
+
+        # Name sort of a CRAM needs more room than the same size BAM; and the output counts on the same disk too
+        plan = plan_sort(free // 3, "CRAM", "Name", self.temps, self.temps[0], 4, 8 * GB)
+        self.assertEqual(plan.error, "errNoSpaceSort")
+        self.assertEqual(plan.temp_bytes, int(free // 3 * resourceplan.CRAM_MULT * resourceplan.NAME_MULT))
+        self.assertEqual(plan.values["{{APP}}"], "Name Sort")
+        plan = plan_sort(GB, "BAM", "Coord", self.temps + ["/no/such/dir"], self.temps[0], 4, 8 * GB, out_bytes=free)
+        self.assertEqual(plan.error, "errNoSpaceSort")
+        self.assertEqual(plan.values["{{OUTFREE}}"], f'{free_space(self.temps[0]) / GB:.0f}')
+
+    def test_memory_threads(self):
+        plan = plan_sort(GB, "BAM", "Coord", self.temps[:1], self.temps[0], 8, 32 * GB)
+        self.assertEqual((plan.threads, plan.mem_per_thread), (8, int(16 * GB * resourceplan.MEM_FRACTION) // 8))
+
+        # Few open files allowed: fewer threads with more memory each so the temporary files fit
+        resourceplan.open_file_limit = lambda: 14
+        plan = plan_sort(2 * GB, "BAM", "Coord", self.temps[:1], self.temps[0], 8, 2 * GB, out_bytes=0)
+        self.assertLess(plan.threads, 8)
+        self.assertGreater(plan.threads, 0)
+        temp_files = 2 * GB * resourceplan.TEMP_MULT / plan.mem_per_thread     # Less the blocks kept in memory
+        self.assertLessEqual(temp_files + resourceplan.RESERVED_FILES, 14 + 8)
+
+        # Other jobs take most of the memory; use what is left, else plan as if alone (queue holds the sort back)
+        resourceplan.open_file_limit = lambda: None
+        plan = plan_sort(GB, "BAM", "Coord", self.temps[:1], self.temps[0], 8, 8 * GB, load_threads=6, load_mem=6 * GB)
+        self.assertEqual((plan.threads, plan.total_mem), (2, 2 * GB))
+        plan = plan_sort(GB, "BAM", "Coord", self.temps[:1], self.temps[0], 8, 8 * GB, load_threads=8, load_mem=8 * GB)
+        self.assertEqual((plan.threads, plan.total_mem), (8, 8 * GB))
+
+        resourceplan.available_memory = lambda: 5 * 10**7
+        self.assertEqual(plan_sort(GB, "BAM", "Coord", self.temps[:1], self.temps[0], 8, 0).error, "errNoMemSort")
+
+    def test_mem_string(self):
+        self.assertEqual(SortPlan(1234567890, 2).mem, "1200M")
+        self.assertEqual(SortPlan(76543210, 2).mem, "76M")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,67 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.runhistory import RunHistory, fit, predict
+
+GB = 10**9
+
+
+class TestRunHistory(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.history = RunHistory(os.path.join(self.tmpdir.name, "runs.db"), max_runs=5)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def test_fit(self):
+        # 60 s overhead plus 100 s per GB per thread
+        runs = [(size * GB, threads, 60 + 100 * size / threads) for size, threads in ((10, 2), (40, 4), (60, 2))]
+        overhead, rate = fit(runs)
+        self.assertAlmostEqual(overhead, 60)
+        self.assertAlmostEqual(rate, 100)
+        self.assertAlmostEqual(predict((overhead, rate), 20 * GB, 8), 60 + 250)
+
+        # Inputs all about the same size; just proportional
+        self.assertEqual(fit([(50 * GB, 2, 2500), (50 * GB, 2, 2700)]), (0.0, 104.0))
+        # No input size known; the median time
+        self.assertEqual(fit([(0, 4, 10), (0, 4, 30), (0, 2, 12)]), (12, None))
+        self.assertEqual(predict((12, None), 5 * GB, 4), 12)
+        self.assertIsNone(predict((0.0, 104.0), 0, 4))
+        self.assertIsNone(fit([]))
+
+    def test_store_and_report(self):
+        self.assertIsNone(self.history.predict("GenSortedBAM", 30 * GB, 4))
+        self.history.record("GenSortedBAM", 30 * GB, 4, 8 * GB, 1500, predicted=1800)
+        self.history.record("GenSortedBAM", 30 * GB, 4, 8 * GB, 20, status="failed")      # Not learned from
+        self.assertAlmostEqual(self.history.predict("GenSortedBAM", 60 * GB, 8), 1500)
+        self.assertAlmostEqual(self.history.predict("GenSortedBAM", 15 * GB, 4), 750)
+
+        for seconds in range(10, 70, 10):
+            self.history.record("GetBAMHeader", 0, 4, 0, seconds)
+        self.assertEqual([run[5] for run in self.history.runs("GetBAMHeader")], [20, 30, 40, 50, 60])   # Newest 5
+        self.assertEqual(self.history.predict("GetBAMHeader", 0, 4), 40)
+
+        report = self.history.report()
+        self.assertEqual(len(report), 3)
+        self.assertTrue(report[1].startswith("GenSortedBAM"))
+        self.assertIn("1800s", report[1])
+        self.assertIn("20%", report[1])         # Predicted 1800 s for 1500 s
+        self.assertEqual(self.history.purge(["GetBAMHeader"]), 5)
+        self.assertEqual(len(self.history.runs()), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,58 @@
+import unittest
+import sys
+import io
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.statsbundle import StatsBundle
+
+HEADER = b"@HD\tVN:1.6\tSO:coordinate\n@SQ\tSN:chr1\tLN:1000\n@SQ\tSN:chr2\tLN:500\n@SQ\tSN:chr12\tLN:50\n" \
+         b"@PG\tID:bwa\tPN:bwa\n"
+
+
+class TestStatsBundle(unittest.TestCase):
+
+    def setUp(self):
+        self.body = []
+        self.expected = {}
+        for name in ("chr1", "chr2", "chr12", "*"):
+            for i in range(500):
+                flag = 4 if name == "*" or i % 3 == 0 else 99 if i % 2 else 147
+                self.body.append(f"r{i}\t{flag}\t{name}\t{i + 1}\t60\t4M\t=\t5\t100\tACGT\tIIII\tRG:Z:1\n")
+                mapped, unmapped = self.expected.get(name, (0, 0))
+                self.expected[name] = (mapped + (0 if flag & 4 else 1), unmapped + (1 if flag & 4 else 0))
+
+    def test_idxstats_and_samples(self):
+        bundle = StatsBundle(numsamp=100, lonsamp=250)
+        bundle.add_stream(io.BytesIO(HEADER + "".join(self.body).encode()), chunk_size=1000)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            idxfile = os.path.join(tmp, "x_idxstats.csv")
+            bundle.write_idxstats(idxfile)
+            bundle.write_samples(os.path.join(tmp, "flags.tmp"), os.path.join(tmp, "flagslong.tmp"))
+            with open(idxfile) as f:
+                rows = [line.split("\t") for line in f.read().splitlines()]
+            with open(os.path.join(tmp, "flags.tmp")) as f:
+                flags = f.readlines()
+            with open(os.path.join(tmp, "flagslong.tmp")) as f:
+                flagslong = f.readlines()
+
+        self.assertEqual([row[:2] for row in rows], [["chr1", "1000"], ["chr2", "500"], ["chr12", "50"], ["*", "0"]])
+        for row in rows[:3]:
+            self.assertEqual((int(row[2]), int(row[3])), self.expected[row[0]])
+        self.assertEqual(rows[3][2:], ["0", "500"])
+        self.assertEqual(flags, self.body[:100])
+        self.assertEqual(flagslong, self.body[100:350])
+
+
+if __name__ == '__main__':
+    unittest.main()
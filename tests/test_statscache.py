@@ -0,0 +1,46 @@
+import unittest
+import sys
+import os
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+
+from program.statscache import StatsCache, bam_fingerprint
+
+
+class TestBamFingerprint(unittest.TestCase):
+
+    def test_content_not_name(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            first, second, other = (os.path.join(tmp, name) for name in ("a.bam", "b.bam", "c.bam"))
+            for name, tail in ((first, b"EOF"), (second, b"EOF"), (other, b"eof")):
+                with open(name, "wb") as f:
+                    f.write(b"\x1f\x8b" + bytes(300000) + tail)
+            self.assertEqual(bam_fingerprint(first), bam_fingerprint(second))
+            self.assertNotEqual(bam_fingerprint(first), bam_fingerprint(other))
+            self.assertIsNone(bam_fingerprint(os.path.join(tmp, "missing.bam")))
+
+
+class TestStatsCache(unittest.TestCase):
+
+    def test_put_get_evict_purge(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = StatsCache(os.path.join(tmp, "stats.db"), max_entries=2)
+            cache.put("fp1", "/a.bam", {"ReadType": "Paired", "stats_chroms": [["1", "chr1", 1000]]})
+            cache.put("fp2", "/b.bam", {"ReadType": "Single"})
+            self.assertEqual(cache.get("fp1")["stats_chroms"], [["1", "chr1", 1000]])    # fp1 now most recent
+            cache.put("fp3", "/c.bam", {"ReadType": "Single"})
+            self.assertIsNone(cache.get("fp2"))
+            self.assertEqual([entry[0] for entry in cache.entries()], ["fp3", "fp1"])
+            self.assertEqual(cache.purge(["fp1"]), 1)
+            self.assertEqual(cache.purge(), 1)
+            self.assertEqual(cache.entries(), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,188 @@
+import unittest
+import sys
+import os
+import gzip
+import struct
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.bgzf import bgzf_block, BGZF_EOF
+from program.vcf_parser import VCFParser, INT_MISSING, GT_ABSENT, GT_MISSING, parse_region
+
+HEADER = """##fileformat=VCFv4.2
+##contig=<ID=chr1,length=248956422>
+##contig=<ID=chr2,length=242193529>
+##contig=<ID=chrY,length=57227415>
+##INFO=<ID=DP,Number=1,Type=Integer,Description="Depth">
+##INFO=<ID=AF,Number=A,Type=Float,Description="Allele Frequency">
+##INFO=<ID=DB,Number=0,Type=Flag,Description="dbSNP">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=GQ,Number=1,Type=Integer,Description="Genotype Quality">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE1\tSAMPLE2
+"""
+POSITIONS = {"chr1": [1000, 5000, 20000, 100000, 1000000, 5000000, 5000100], "chr2": [10, 70000, 3000000],
+             "chrY": [2781480, 2781481]}
+
+
+def record(chrom, pos, number):
+    gt = ["0/1", "1|1", "./.", "1", "0/0"][number % 5]
+    info = f'DP={number};AF=0.5;DB' if number % 2 else "DP=."
+    return f'{chrom}\t{pos}\trs{number}\tA\t{"G" if number % 3 else "."}\t{number}.5\t' \
+           f'{"PASS" if number % 4 else "LowQual"}\t{info}\tGT:GQ\t{gt}:{number}\t0/0:.\n'
+
+
+def reg2bin(beg, end, min_shift=14, depth=5):
+    end, shift, first = end - 1, min_shift, ((1 << depth * 3) - 1) // 7
+    for level in range(depth, 0, -1):
+        if beg >> shift == end >> shift:
+            return first + (beg >> shift)
+        shift += 3
+        first -= 1 << ((level - 1) * 3)
+    return 0
+
+
+def index_bytes(records, csi):
+    """ Tabix or CSI index (min_shift 14, depth 5) of (chrom, beg, end, virtual begin, virtual end) records """
+    names = list(dict.fromkeys(chrom for chrom, *_ in records))
+    body = b""
+    for name in names:
+        bins, linear = {}, {}
+        for chrom, beg, end, vbeg, vend in records:
+            if chrom != name:
+                continue
+            chunks = bins.setdefault(reg2bin(beg, end), [])
+            if chunks and chunks[-1][1] == vbeg:
+                chunks[-1][1] = vend
+            else:
+                chunks.append([vbeg, vend])
+            for window in range(beg >> 14, ((end - 1) >> 14) + 1):
+                linear.setdefault(window, vbeg)
+        body += struct.pack("<i", len(bins))
+        for number, chunks in bins.items():
+            body += struct.pack("<IQi", number, chunks[0][0], len(chunks)) if csi else \
+                struct.pack("<Ii", number, len(chunks))
+            body += b"".join(struct.pack("<QQ", *chunk) for chunk in chunks)
+        if not csi:
+            windows = [linear.get(window, 0) for window in range(max(linear) + 1)]
+            body += struct.pack(f'<i{len(windows)}Q', len(windows), *windows)
+    names = b"".join(name.encode() + b"\0" for name in names)
+    tabix = struct.pack("<7i", 2, 1, 2, 0, ord("#"), 0, len(names)) + names
+    if csi:
+        return gzip.compress(b"CSI\1" + struct.pack("<3i", 14, 5, len(tabix)) + tabix +
+                             struct.pack("<i", len(set(chrom for chrom, *_ in records))) + body)
+    return gzip.compress(b"TBI\1" + struct.pack("<i", len(set(chrom for chrom, *_ in records))) + tabix + body)
+
+
+class TestVCFParser(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.vcf = os.path.join(self.tmpdir.name, "sample.vcf.gz")
+        self.lines = [record(chrom, pos, number) for number, (chrom, pos) in
+                      enumerate((chrom, pos) for chrom, positions in POSITIONS.items() for pos in positions)]
+
+        # Two records per BGZF block (the header in its own); the last record split over two blocks
+        blocks = [HEADER.encode()] + ["".join(self.lines[start:start + 2]).encode()
+                                      for start in range(0, len(self.lines), 2)]
+        blocks[-1:] = [blocks[-1][:10], blocks[-1][10:]]
+        ustarts, caddrs = [0], [0]
+        with open(self.vcf, "wb") as f:
+            for data in blocks:
+                block = bgzf_block(data)
+                f.write(block)
+                ustarts.append(ustarts[-1] + len(data))
+                caddrs.append(caddrs[-1] + len(block))
+            f.write(BGZF_EOF)
+
+        def voffset(upos):
+            block = max(number for number, ustart in enumerate(ustarts) if ustart <= upos)
+            return caddrs[block] << 16 | upos - ustarts[block]
+
+        self.records, upos = [], len(HEADER)
+        for line in self.lines:
+            chrom, pos = line.split("\t")[:2]
+            self.records.append((chrom, int(pos) - 1, int(pos), voffset(upos), voffset(upos + len(line))))
+            upos += len(line)
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def all_records(self, parser, region=None):
+        return [(parser.contigs[code], int(pos)) for batch in parser.batches(region)
+                for code, pos in zip(batch.chrom, batch.pos)]
+
+    def test_header_and_columns(self):
+        parser = VCFParser(self.vcf, sample="SAMPLE1", info=("DP", "AF", "DB"), fmt=("GQ",), batch_size=4)
+        self.assertTrue(parser.header.startswith("##fileformat=VCFv4.2\n##contig"))
+        self.assertTrue(parser.header.endswith("SAMPLE2\n"))
+        self.assertEqual(parser.samples, ["SAMPLE1", "SAMPLE2"])
+        self.assertEqual(parser.contigs, ["chr1", "chr2", "chrY"])
+
+        batches = list(parser.batches())
+        self.assertEqual([len(batch) for batch in batches], [4, 4, 4])
+        batch = batches[0]
+        self.assertEqual(batch.pos.tolist(), [1000, 5000, 20000, 100000])
+        self.assertEqual(batch.ids.tolist(), ["rs0", "rs1", "rs2", "rs3"])
+        self.assertEqual(batch.alt.tolist(), ["", "G", "G", ""])
+        self.assertEqual(batch.qual.tolist(), [0.5, 1.5, 2.5, 3.5])
+        self.assertEqual(batch.passed.tolist(), [False, True, True, True])
+        self.assertEqual(batch.gt.tolist(), [[0, 1], [1, 1], [GT_MISSING, GT_MISSING], [1, GT_ABSENT]])
+        self.assertEqual(batch.phased.tolist(), [False, True, False, False])
+        self.assertEqual(batch.info["DP"].tolist(), [INT_MISSING, 1, INT_MISSING, 3])
+        self.assertEqual(batch.info["AF"].tolist(), [None, "0.5", None, "0.5"])     # Number=A; kept as text
+        self.assertEqual(batch.info["DB"].tolist(), [False, True, False, True])
+        self.assertEqual(batch.fmt["GQ"].dtype, np.int32)
+        self.assertEqual(batches[2].chrom.tolist(), [1, 1, 2, 2])
+
+        self.assertEqual(self.all_records(VCFParser(self.vcf, sample=1)),
+                         [(chrom, pos) for chrom, positions in POSITIONS.items() for pos in positions])
+        self.assertTrue(VCFParser(self.vcf, batch_size=4).in_order())
+
+    def test_regions_through_tabix_and_csi(self):
+        for suffix, csi in ((".tbi", False), (".csi", True)):
+            with open(self.vcf + suffix, "wb") as f:
+                f.write(index_bytes(self.records, csi))
+            parser = VCFParser(self.vcf)
+            self.assertEqual(self.all_records(parser, "chr1:4000-150000"),
+                             [("chr1", 5000), ("chr1", 20000), ("chr1", 100000)])
+            self.assertEqual(self.all_records(parser, "chr1:5000001"), [("chr1", 5000100)])
+            self.assertEqual(self.all_records(parser, "chr2"), [("chr2", 10), ("chr2", 70000), ("chr2", 3000000)])
+            self.assertEqual(self.all_records(parser, ("chrY", 2781480, 2781481)), [("chrY", 2781481)])  # Split
+            self.assertEqual(self.all_records(parser, "chrX"), [])
+            self.assertGreater(parser.index().chunks("chr2", 0, 100)[0][0] >> 16, 0)   # Seeks past chr1
+            os.remove(self.vcf + suffix)
+
+    def test_parse_region(self):
+        self.assertEqual(parse_region("chr1:1,000-2,000"), ("chr1", 999, 2000))
+        self.assertEqual(parse_region("chrY"), ("chrY", 0, 2**31 - 1))
+        self.assertEqual(parse_region("HLA-A*01:01:01:01", ["HLA-A*01:01:01:01"]), ("HLA-A*01:01:01:01", 0, 2**31 - 1))
+        self.assertEqual(parse_region("HLA-A*01:01:01:01"), ("HLA-A*01:01:01", 0, 2**31 - 1))
+
+    def test_plain_vcf(self):
+        plain = os.path.join(self.tmpdir.name, "plain.vcf")
+        with open(plain, "w") as f:
+            f.write(HEADER.replace("##contig=<ID=chr2,length=242193529>\n", "") + "".join(self.lines))
+        parser = VCFParser(plain)
+        self.assertEqual(len(self.all_records(parser)), len(self.lines))
+        self.assertEqual(parser.contigs, ["chr1", "chrY", "chr2"])      # chr2 added when seen
+        self.assertFalse(VCFParser(plain, batch_size=4).in_order())     # chr2 records before chrY ones
+        self.assertTrue(VCFParser(plain, batch_size=4).in_order(records=4))     # Only as far as looked
+        with open(plain, "w") as f:
+            f.write(HEADER + "".join(self.lines[:3] + self.lines[4:5] + self.lines[3:4] + self.lines[5:]))
+        self.assertFalse(VCFParser(plain, batch_size=4).in_order())     # Positions out of order across batches
+        with self.assertRaises(ValueError):
+            list(parser.batches("chr1"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,100 @@
+import unittest
+import sys
+import os
+import gzip
+import tempfile
+from pathlib import Path
+
+# Ensure repo root is in sys.path
+current_file = Path(__file__).resolve()
+repo_root = current_file.parent.parent
+if str(repo_root) not in sys.path:
+    sys.path.insert(0, str(repo_root))
+if str(repo_root / "program") not in sys.path:
+    sys.path.append(str(repo_root / "program"))     # Sibling modules import each other as top-level names
+
+from program.vcf_parser import VCFParser
+from program.vcfkit import vcf_kind, vcf_kit, ReferenceBases
+
+SEQUENCES = {"chr1": "ACGTTGCAAC" * 12, "chr2": "GGATCCTTAA" * 6, "chrM": "CATG" * 5, "chrY": "TTAGGC" * 5}
+HEADER = """##fileformat=VCFv4.2
+##ALT=<ID=NON_REF,Description="Any other allele">
+##INFO=<ID=END,Number=1,Type=Integer,Description="End of the reference block">
+##FORMAT=<ID=GT,Number=1,Type=String,Description="Genotype">
+##FORMAT=<ID=DP,Number=1,Type=Integer,Description="Depth">
+##FORMAT=<ID=MIN_DP,Number=1,Type=Integer,Description="Minimum depth in the block">
+#CHROM\tPOS\tID\tREF\tALT\tQUAL\tFILTER\tINFO\tFORMAT\tSAMPLE
+"""
+GVCF = [
+    "chr1\t1\t.\tA\t<NON_REF>\t.\t.\tEND=20\tGT:MIN_DP\t0/0:12",     # Targets 1 (its REF), 5, 18 (FASTA)
+    "chr1\t21\t.\tA\tT,<NON_REF>\t50\tPASS\t.\tGT:DP\t0/1:20",         # Het; written in alphabetic order
+    "chr1\t22\t.\tC\t<NON_REF>\t.\t.\tEND=60\tGT:MIN_DP\t0/0:0",      # No depth; target 30 left out
+    "chr1\t61\t.\tA\tAT,<NON_REF>\t50\tPASS\t.\tGT:DP\t1/1:20",        # Indel on a target; left out
+    "chr1\t62\t.\tC\t<NON_REF>\t.\t.\tEND=120\tGT:MIN_DP\t0/0:8",     # Target 65 (FASTA, second line)
+    "chr1\t121\t.\tG\tA,<NON_REF>\t50\tPASS\t.\tGT:DP\t./.:3",         # No call; -- as mpileup / call writes it
+    "chr2\t1\t.\tG\t<NON_REF>\t.\t.\tEND=60\tGT:MIN_DP\t0/0:30",      # Targets 9 and 60
+    "chrM\t3\t.\tT\tC,<NON_REF>\t50\tPASS\t.\tGT:DP\t1/1:500",
+    "chrY\t2\t.\tT\tG,<NON_REF>\t50\tPASS\t.\tGT:DP\t1:15",            # Haploid; doubled
+]
+TARGETS = [("chr1", 1, "rs1"), ("chr1", 5, "rs5"), ("chr1", 18, "rs18"), ("chr1", 21, "rs21"), ("chr1", 30, "rs30"),
+           ("chr1", 61, "rs61"), ("chr1", 65, "rs65"), ("chr1", 121, "rs121"), ("chr1", 500, "rs500"),
+           ("chr2", 60, "rs260"), ("chr2", 9, "rs209"), ("chrM", 3, "rs3027"), ("chrY", 2, "rsY2"),
+           ("chr3", 100, "rs3")]
+
+
+class TestVCFKit(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.TemporaryDirectory()
+        self.fasta = self.path("ref.fa.gz")
+        fasta, fai = b"", ""
+        for name, bases in SEQUENCES.items():
+            fasta += f'>{name}\n'.encode()
+            fai += f'{name}\t{len(bases)}\t{len(fasta)}\t60\t61\n'
+            fasta += b"".join(bases[start:start + 60].encode() + b"\n" for start in range(0, len(bases), 60))
+        with open(self.fasta, "wb") as f:
+            f.write(gzip.compress(fasta))
+        with open(self.fasta + ".fai", "w") as f:
+            f.write(fai)
+        with open(self.path("targets.tab.gz"), "wb") as f:
+            f.write(gzip.compress("".join(f'{chrom}\t{pos}\t{rsid}\n' for chrom, pos, rsid in TARGETS).encode()))
+
+    def tearDown(self):
+        self.tmpdir.cleanup()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir.name, name)
+
+    def write_vcf(self, name, header, records):
+        with open(self.path(name), "wb") as f:
+            f.write(gzip.compress((header + "".join(f'{record}\n' for record in records)).encode()))
+        return self.path(name)
+
+    def test_kit_from_gvcf(self):
+        vcf = self.write_vcf("sample.g.vcf.gz", HEADER, GVCF)
+        self.assertEqual(vcf_kind(VCFParser(vcf)), "gVCF")
+        self.assertEqual(vcf_kit(vcf, self.path("targets.tab.gz"), self.fasta), [
+            "rs1\t1\t1\tAA\n", "rs5\t1\t5\tTT\n", "rs18\t1\t18\tAA\n", "rs21\t1\t21\tAT\n", "rs65\t1\t65\tTT\n",
+            "rs121\t1\t121\t--\n", "rs209\t2\t9\tAA\n", "rs260\t2\t60\tAA\n", "rs3027\tMT\t3\tCC\n",
+            "rsY2\tY\t2\tGG\n"])
+
+    def test_reference_bases(self):
+        # Asked for out of FASTA order; read in one forward pass all the same
+        bases = ReferenceBases(self.fasta).bases({"chrY": [1, 30, 31], "chr3": [5], "chr1": [1, 61, 120]})
+        self.assertEqual(bases, {"chrY": b"TCN", "chr3": b"N", "chr1": b"AAC"})
+
+    def test_vcf_kinds(self):
+        plain_header = HEADER.replace(HEADER.splitlines()[1] + "\n", "")
+        all_sites = self.write_vcf("all.vcf.gz", plain_header, [
+            "chr1\t1\t.\tA\t.\t.\t.\t.\tGT\t0/0", "chr1\t2\t.\tC\t.\t.\t.\t.\tGT\t0/0",
+            "chr1\t3\t.\tG\tA\t30\t.\t.\tGT\t0/1", "chr1\t5\t.\tT\t.\t.\t.\t.\tGT\t./."])
+        self.assertEqual(vcf_kind(VCFParser(all_sites)), "all-sites")
+        self.assertEqual(vcf_kit(all_sites, self.path("targets.tab.gz"), self.fasta),
+                         ["rs1\t1\t1\tAA\n", "rs5\t1\t5\t--\n"])
+
+        variants = self.write_vcf("variants.vcf.gz", plain_header, GVCF[1::2])
+        self.assertIsNone(vcf_kind(VCFParser(variants)))
+
+
+if __name__ == '__main__':
+    unittest.main()